@@ -0,0 +1,272 @@
+"""
+Content-addressed cache of ``/upload`` analyses.
+
+CLIs often upload the same SPM file again — most often after picking the wrong
+from/to station — and each upload paid for the full analysis. The result of
+``analysis_pipeline.analyse_upload`` depends only on the file's bytes, the
+upload parameters and the reference data, so it is cached under a key built
+from the file's SHA-256 (``upload_spool``), its suffix, train_number,
+from_station, to_station and ``ReferenceData.version``. train_type is not in
+the key: the analysis derives it from train_number and the reference data,
+which already are.
+
+On a hit ``/upload`` skips the analysis and stores the cached result under a
+new run_id, as it would a fresh one; staff lookups, the duplicate-run check
+and the chart payload still run, since they depend on more than the file.
+
+Layout per entry, in ``CACHE_DIR`` — the same split as ``run_store``:
+
+==========================  ====================================================
+``{key}.df.parquet``        the result's ``df``
+``{key}.source_df.parquet`` its ``source_df``, when present
+``{key}.result.pkl``        the rest of the result dict
+``index.sqlite3``           the index: each entry's size and last use, shared
+                            by every process using ``CACHE_DIR``
+``index.lock``              serializes index writes across processes
+==========================  ====================================================
+
+Entries are evicted least recently used first once they pass
+``CACHE_MAX_BYTES``. The budget is for ``CACHE_DIR`` as a whole, not per
+process: uvicorn workers sharing the directory share the index too, as
+run_store's do, so one worker's entries count against the others' and any
+worker's hit refreshes an entry for all of them. The index is a
+``sqlite_index.SqliteIndex``; ``put`` and the evictions it makes hold its
+``write_lock``. ``get`` reads the files without it, so an entry another
+worker evicts mid-read is a miss.
+
+``rehydrate`` reconciles the index with the files; main.py calls it at
+startup. ``SPM_ANALYSIS_CACHE_DIR`` and ``SPM_ANALYSIS_CACHE_MB`` (default
+512, 0 disables the cache) configure it. As with run_store's sidecars, the
+pickles are this service's own files; never load anything here another
+program wrote.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import polars as pl
+
+from sqlite_index import SqliteIndex, bump_counter, unlink_quietly, write_atomic
+
+# --- configuration -----------------------------------------------------------
+
+CACHE_DIR = Path(
+    os.getenv("SPM_ANALYSIS_CACHE_DIR") or (Path(tempfile.gettempdir()) / "spm_analysis_cache")
+)
+CACHE_MAX_BYTES = int(float(os.getenv("SPM_ANALYSIS_CACHE_MB", "512")) * 1024 * 1024)
+
+# Upload parameters that change the analysis; see analysis_pipeline.analyse_upload.
+KEY_PARAMS = ("train_number", "from_station", "to_station")
+
+# Result entries stored as Parquet rather than pickled.
+FRAME_KEYS = ("df", "source_df")
+
+INDEX_NAME = "index.sqlite3"
+LOCK_NAME = "index.lock"
+
+_COUNTERS = ("hits", "misses", "stores", "evictions")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key       TEXT PRIMARY KEY,
+    bytes     INTEGER NOT NULL,
+    used_at   REAL NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value)
+    VALUES ('hits', 0), ('misses', 0), ('stores', 0), ('evictions', 0);
+"""
+
+_INDEX = SqliteIndex(CACHE_DIR / INDEX_NAME, CACHE_DIR / LOCK_NAME, _SCHEMA)
+_db = _INDEX.connect
+_write_lock = _INDEX.write_lock
+_transaction = _INDEX.transaction
+
+
+# --- keys and paths ----------------------------------------------------------
+
+def cache_key(
+    sha256: str, params: Dict[str, Any], reference_version: str, suffix: str = ""
+) -> str:
+    """The entry key for a file digest, its upload parameters and the reference data."""
+    fields = {name: (params.get(name) or "").strip() or None for name in KEY_PARAMS}
+    fields.update(sha256=sha256, suffix=suffix.lower(), reference_version=reference_version)
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def _parquet_path(key: str, name: str = "df") -> Path:
+    return CACHE_DIR / f"{key}.{name}.parquet"
+
+
+def _result_path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.result.pkl"
+
+
+def _remove_files(key: str) -> None:
+    for name in FRAME_KEYS:
+        unlink_quietly(_parquet_path(key, name))
+    unlink_quietly(_result_path(key))
+
+
+# --- reading and writing -----------------------------------------------------
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """The cached analysis result for ``key`` (counted as a hit), or None (a miss)."""
+    row = _db().execute("SELECT stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        with _transaction() as db:
+            bump_counter(db, "misses")
+        return None
+    # The files are read outside any lock; an eviction meanwhile makes this a miss.
+    try:
+        with _result_path(key).open("rb") as fh:
+            result = pickle.load(fh)
+        for name in result.pop("_frames"):
+            result[name] = pl.read_parquet(_parquet_path(key, name))
+    except Exception:
+        with _write_lock():
+            with _transaction() as db:
+                # Unless another put replaced the entry since it was looked up
+                gone = db.execute(
+                    "DELETE FROM entries WHERE key = ? AND stored_at = ?", (key, row[0])
+                ).rowcount
+                bump_counter(db, "misses")
+            if gone:
+                _remove_files(key)
+        return None
+    with _transaction() as db:
+        db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+        bump_counter(db, "hits")
+    return result
+
+
+def put(key: str, result: Dict[str, Any]) -> bool:
+    """
+    Cache an analysis result, evicting least recently used entries to keep
+    CACHE_DIR within CACHE_MAX_BYTES. Returns False when the cache is disabled
+    or the entry alone is over the budget.
+    """
+    if CACHE_MAX_BYTES <= 0:
+        return False
+    frames = {k: result[k] for k in FRAME_KEYS if result.get(k) is not None}
+    rest = {k: v for k, v in result.items() if k not in frames}
+    rest["_frames"] = list(frames)
+    blob = pickle.dumps(rest, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with _write_lock():
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with _transaction() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        _remove_files(key)
+        for name, frame in frames.items():
+            write_atomic(_parquet_path(key, name), lambda p: frame.write_parquet(p))
+        write_atomic(_result_path(key), lambda p: p.write_bytes(blob))
+        size = len(blob) + sum(_parquet_path(key, name).stat().st_size for name in frames)
+        if size > CACHE_MAX_BYTES:
+            _remove_files(key)
+            return False
+        now = time.time()
+        with _transaction() as db:
+            db.execute(
+                "INSERT INTO entries (key, bytes, used_at, stored_at) VALUES (?, ?, ?, ?)",
+                (key, size, now, now),
+            )
+            bump_counter(db, "stores")
+            evicted = _evict(db, CACHE_MAX_BYTES)
+        for old in evicted:
+            _remove_files(old)
+        return True
+
+
+def _evict(db: sqlite3.Connection, max_bytes: int) -> List[str]:
+    """Delete least recently used index rows until the rest fit; returns their keys."""
+    (total,) = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+    evicted = []
+    for key, size in db.execute("SELECT key, bytes FROM entries ORDER BY used_at").fetchall():
+        if total <= max_bytes:
+            break
+        evicted.append(key)
+        total -= size
+    db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+    bump_counter(db, "evictions", len(evicted))
+    return evicted
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Hit/miss/store/eviction counters since the index was made, plus current
+    size. Shared by every process using CACHE_DIR.
+    """
+    db = _db()
+    entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+    counters = dict(db.execute("SELECT name, value FROM counters"))
+    return {
+        **{name: counters.get(name, 0) for name in _COUNTERS},
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": CACHE_MAX_BYTES,
+    }
+
+
+# --- housekeeping ------------------------------------------------------------
+
+def rehydrate() -> int:
+    """
+    Reconcile the index with the files on disk: drop entries whose files are
+    gone and half-written files, index complete entries it lacks (last used at
+    their mtime), then evict down to the budget. Called at startup. Returns
+    the entry count.
+    """
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with _write_lock():
+            with _transaction() as db:
+                indexed = {key for (key,) in db.execute("SELECT key FROM entries")}
+                for key in indexed:
+                    if not (_result_path(key).exists() and _parquet_path(key).exists()):
+                        db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        _remove_files(key)
+                for path in CACHE_DIR.glob("*.result.pkl"):
+                    key = path.name[: -len(".result.pkl")]
+                    if key in indexed:
+                        continue
+                    try:
+                        result_stat, df_stat = path.stat(), _parquet_path(key).stat()
+                    except OSError:
+                        unlink_quietly(path)
+                        continue
+                    size = result_stat.st_size + df_stat.st_size
+                    source = _parquet_path(key, "source_df")
+                    size += source.stat().st_size if source.exists() else 0
+                    db.execute(
+                        "INSERT INTO entries (key, bytes, used_at, stored_at) VALUES (?, ?, ?, ?)",
+                        (key, size, result_stat.st_mtime, result_stat.st_mtime),
+                    )
+                for stray in CACHE_DIR.glob("*.parquet"):
+                    if not _result_path(stray.name.split(".")[0]).exists():
+                        unlink_quietly(stray)
+                evicted = _evict(db, CACHE_MAX_BYTES)
+                (entries,) = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+            for key in evicted:
+                _remove_files(key)
+    except (OSError, sqlite3.Error):
+        return 0
+    return entries
+
+
+def clear_all() -> None:
+    """Wipe the index, the counters and the directory. Tests only."""
+    _INDEX.reset(CACHE_DIR)
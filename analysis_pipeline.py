@@ -0,0 +1,887 @@
+"""
+The /upload analysis, as a pure function that can run in a worker process.
+
+``upload_spm_file`` used to do all of this inline in an ``async def``: parsing,
+cumulative distance, ISD halt matching, PSR, overspeed, platform entry and brake
+feel. On a long fast-corridor run that is seconds of CPU with the single uvicorn
+worker blocked, so ``/chart_data`` and the reports pages stopped answering for
+everyone while one CLI uploaded a file.
+
+Everything the analysis needs is reached through ``analyse_upload`` — a
+module-level function taking only picklable arguments, so a
+``ProcessPoolExecutor`` can run it. Each worker loads the reference data once, in
+``init_worker``. Nothing here touches the database, ``run_store`` or FastAPI; the
+HTTP handler keeps the I/O (spooling the upload, staff/CLI lookups, the
+duplicate-run check, storing the result).
+
+``SPM_ANALYSIS_WORKERS`` sizes the pool (default 2). ``0`` runs the analysis on
+the threadpool instead — handy for local debugging, where breakpoints and prints
+in a spawned child are a nuisance.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from brakefeel_detector import BrakeFeelDetector
+from corridor_loader import CorridorManager
+import log_config
+from halt_detection import HaltDetector, calculate_cumulative_distance
+from platform_entry_speed import PlatformEntryCalculator
+from spm_columns import DAY_SECONDS, TIME_SECONDS_COL, SpmColumns, format_time_seconds, with_time_seconds
+from spm_ingest import clean_numeric, find_spm_columns, read_spm_csv, read_spm_excel
+from stage_memo import StageMemo, StageTrace, frame_fingerprint, stage_key
+from psr_mps import PSRMPSCalculator, detect_violations, detect_overspeed_events, get_overspeed_summary
+from reference_data import ReferenceData, get_reference_data
+
+logger = logging.getLogger(__name__)
+
+DATA_ROOT = Path(__file__).parent
+
+ANALYSIS_WORKERS = int(os.getenv("SPM_ANALYSIS_WORKERS", "2"))
+
+EMPTY_OVERSPEED_SUMMARY = {
+    'total_events': 0,
+    'by_severity': {'minor': 0, 'moderate': 0, 'severe': 0, 'critical': 0},
+    'max_excess_overall': 0,
+    'max_speed_overall': 0,
+    'total_duration': 0,
+}
+
+
+class AnalysisInputError(ValueError):
+    """The uploaded file cannot be analysed as it stands. The handler maps this to a 400."""
+
+
+@dataclass
+class AnalysisContext:
+    """Reference data and detectors, built once per process."""
+
+    reference_data: ReferenceData
+    corridor_manager: CorridorManager
+    psr_calculator: PSRMPSCalculator
+    halt_detector: HaltDetector
+    brakefeel_detector: BrakeFeelDetector
+    entry_calculator: PlatformEntryCalculator
+
+
+_CONTEXT: Optional[AnalysisContext] = None
+
+# Stage outputs of recent analyses in this process; see stage_memo.py.
+STAGES = StageMemo()
+
+
+def load_context(data_root: Path = DATA_ROOT) -> AnalysisContext:
+    """Detectors over the process's ReferenceData, loaded eagerly so no upload pays for it."""
+    data_root = Path(data_root)
+    reference_dir = str(data_root / "reference_data")
+    reference = get_reference_data(data_root)
+
+    return AnalysisContext(
+        reference_data=reference,
+        corridor_manager=reference.corridor_manager,
+        psr_calculator=PSRMPSCalculator(reference_data_dir=reference_dir, reference_data=reference),
+        # speed=0, distance=0. Tolerance set to 350m to handle wheel diameter
+        # variations and GPS inaccuracies.
+        halt_detector=HaltDetector(speed_threshold=0.0, min_halt_duration_seconds=1),
+        brakefeel_detector=BrakeFeelDetector(),
+        entry_calculator=PlatformEntryCalculator(reference_data_dir=reference_dir, reference_data=reference),
+    )
+
+
+def init_worker(data_root: str) -> None:
+    """ProcessPoolExecutor initializer: set up logging and preload the reference data in this worker."""
+    global _CONTEXT
+    log_config.setup_logging()
+    _CONTEXT = load_context(Path(data_root))
+
+
+def get_context() -> AnalysisContext:
+    """The process-wide context; built on first use when running without a pool."""
+    global _CONTEXT
+    if _CONTEXT is None:
+        _CONTEXT = load_context(DATA_ROOT)
+    return _CONTEXT
+
+
+def create_executor(
+    workers: int = ANALYSIS_WORKERS, data_root: Path = DATA_ROOT
+) -> Optional[Executor]:
+    """
+    The pool ``/upload`` submits to, or None when ``workers`` is 0.
+
+    Uses spawn, not fork: by the time this runs the server already has threads
+    (the DB pool, anyio's threadpool) and forking a threaded process is unsafe.
+    """
+    if workers <= 0:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(str(data_root),),
+    )
+
+
+# --- parsing -----------------------------------------------------------------
+
+def read_spm_file(path: Path) -> pl.DataFrame:
+    """
+    Read an SPM CSV/Excel export into a clean frame.
+
+    Columns on return: Date, Time, Speed, Distance (Float64), time_s (Int64,
+    see spm_columns.with_time_seconds), cumulative_distance.
+    Raises AnalysisInputError when the Date/Speed/Distance columns cannot be found.
+    """
+    return calculate_cumulative_distance(parse_spm_file(path), distance_col="Distance")
+
+
+def parse_spm_file(path: Path) -> pl.DataFrame:
+    """``read_spm_file`` without the cumulative_distance column: the parse stage."""
+    path = Path(path)
+
+    if path.suffix == '.csv':
+        # One lazy scan: layout sniffed from the first bytes, only the needed
+        # columns read, non-numeric Speed/Distance rows already dropped.
+        df = read_spm_csv(path)
+    else:
+        # One workbook load; the header row is found among its first rows.
+        df = read_spm_excel(path)
+
+    # Find the required columns (case-insensitive)
+    found = find_spm_columns(df.columns)
+    date_col, time_col = found.get('Date'), found.get('Time')
+    speed_col, distance_col = found.get('Speed'), found.get('Distance')
+
+    if not date_col or not speed_col or not distance_col:
+        raise AnalysisInputError(
+            f"Could not find required columns. Found columns: {df.columns}. Need at least: Date, Speed, Distance"
+        )
+
+    # Select only the columns we need
+    selected_cols = [date_col, speed_col, distance_col]
+    if time_col:
+        selected_cols.insert(1, time_col)
+
+    df = df.select(selected_cols)
+
+    # Rename to standard names
+    if time_col:
+        df = df.rename({
+            date_col: 'Date',
+            time_col: 'Time',
+            speed_col: 'Speed',
+            distance_col: 'Distance'
+        })
+    else:
+        df = df.rename({
+            date_col: 'DateTime',
+            speed_col: 'Speed',
+            distance_col: 'Distance'
+        })
+
+        # Split DateTime into Date and Time columns, in polars. time_s counts
+        # from midnight of the first sample, so it needs no rollover guess.
+        parsed = _parse_datetime_column(df["DateTime"])
+        day_start = parsed.drop_nulls().dt.truncate("1d")
+        df = df.with_columns(
+            parsed.dt.strftime('%Y-%m-%d').alias('Date'),
+            parsed.dt.strftime('%H:%M:%S').alias('Time'),
+            ((parsed - day_start[0]).dt.total_seconds() if len(day_start)
+             else pl.Series([None] * len(df), dtype=pl.Int64)).alias(TIME_SECONDS_COL),
+        ).select(['Date', 'Time', 'Speed', 'Distance', TIME_SECONDS_COL])
+
+    # Clean data: drop rows whose Speed/Distance is not a plain number (header
+    # rows caught in the data). A no-op for CSVs, already cleaned in the scan.
+    df = clean_numeric(df)
+
+    # Clean data: Force distance=0 when speed=0 (at halt, distance can't be >0)
+    df = df.with_columns([
+        pl.when(pl.col("Speed") == 0)
+          .then(0)
+          .otherwise(pl.col("Distance"))
+          .alias("Distance")
+    ])
+
+    if TIME_SECONDS_COL not in df.columns:
+        df = with_time_seconds(df)
+    return df
+
+
+def _parse_datetime_column(values: pl.Series) -> pl.Series:
+    """
+    A combined date-time column as polars Datetime. Strings are parsed with
+    polars' format inference; if that fails on any value, the whole column
+    goes through pd.to_datetime as it always did (it knows more formats).
+    """
+    if isinstance(values.dtype, pl.Datetime):
+        return values
+    if values.dtype == pl.Date:
+        return values.cast(pl.Datetime)
+    text = values.cast(pl.Utf8).str.strip_chars()
+    try:
+        parsed = text.str.to_datetime(strict=False)
+        if parsed.null_count() == text.null_count():
+            return parsed
+    except pl.exceptions.ComputeError:
+        pass
+    return pl.from_pandas(pd.to_datetime(text.to_pandas(), errors='coerce')).cast(pl.Datetime("us"))
+
+
+# --- analysis ----------------------------------------------------------------
+
+def generate_abnormality_text(
+    overspeed_events: List[Dict],
+    platform_entry_data: Dict[str, Dict],
+    brake_tests: List[Dict]
+) -> str:
+    """
+    Generate abnormality text from analysis results.
+    Format matches the manual daily SPM analysis CSV.
+    """
+    remarks = []
+
+    # 1. PSR/MPS Violations (overspeed events)
+    for event in overspeed_events:
+        # Format: "PSR 85 VIOLATION MOMENTARY BETWEEN DI-TNA 91 KMPH FOR 7 SEC"
+        psr = event.get('psr_value', 0)
+        max_speed = event.get('max_speed', 0)
+        duration = event.get('duration', 0)
+        start_km = event.get('start_km', 0)
+        end_km = event.get('end_km', 0)
+        remarks.append(
+            f"PSR {psr} VIOLATION MOMENTARY AT {start_km}-{end_km} KM, {max_speed} KMPH FOR {duration} SEC"
+        )
+
+    # 2. Platform Entry Speed > 45 kmph
+    pf_entry_violations = []
+    for station, data in platform_entry_data.items():
+        entry_speed = data.get('entry_speed')
+        if entry_speed and entry_speed > 45:
+            pf_entry_violations.append(f"{station}-{int(entry_speed)}")
+    if pf_entry_violations:
+        if len(pf_entry_violations) > 5:
+            remarks.append("PF ENTRY SPEED MORE THAN 45 KMPH AT MANY STN")
+        else:
+            remarks.append(f"PF ENTRY SPEED MORE THAN 45 KMPH AT {','.join(pf_entry_violations)}")
+
+    # 3. Mid Platform Speed > 30 kmph (at 130m from halt)
+    mid_pf_violations = []
+    for station, data in platform_entry_data.items():
+        mid_pf = data.get('mid_platform_speed')
+        if mid_pf and mid_pf > 30:
+            mid_pf_violations.append(f"{station}-{int(mid_pf)}")
+    if mid_pf_violations:
+        if len(mid_pf_violations) > 5:
+            remarks.append("MID PF SPEED MORE THAN 30 KMPH AT MANY STN")
+        else:
+            remarks.append(f"MID PF SPEED MORE THAN 30 KMPH AT {','.join(mid_pf_violations)}")
+
+    # 4. One Coach Before Speed > 15 kmph
+    one_coach_violations = []
+    for station, data in platform_entry_data.items():
+        one_coach = data.get('one_coach_speed')
+        if one_coach and one_coach > 15:
+            one_coach_violations.append(f"{station}-{int(one_coach)}")
+    if one_coach_violations:
+        if len(one_coach_violations) > 5:
+            remarks.append("ONE COACH BEFORE SPEED MORE THAN 15 KMPH AT MANY STN")
+        else:
+            remarks.append(f"ONE COACH BEFORE SPEED MORE THAN 15 KMPH AT {','.join(one_coach_violations)}")
+
+    # 5. Brake Feel Test
+    if not brake_tests:
+        remarks.append("NO BRAKE FEEL TEST DONE")
+
+    # If no issues found
+    if not remarks:
+        return "NO ABNORMALITY"
+
+    return "\n".join(remarks)
+
+
+def _overspeed_stage(columns: SpmColumns, psr_values: List[Any]):
+    """Violations (individual points), overspeed events (grouped, threshold PSR+3) and their summary."""
+    violations = detect_violations(columns, psr_values)
+    overspeed_events = detect_overspeed_events(columns, psr_values, threshold_offset=3, min_duration=7)
+    return violations, overspeed_events, get_overspeed_summary(overspeed_events)
+
+
+def _window_rows(
+    columns: SpmColumns,
+    platform_entry_data: Dict[str, Dict[str, Any]],
+    halting_station_map: Dict[str, float],
+    train_type: Optional[str],
+    entry_calculator: PlatformEntryCalculator,
+):
+    """station_window_rows and window_point_rows (no run_id yet) for the platform entry results."""
+    station_window_rows = []
+    window_point_rows = []
+    distance_samples = list(halting_station_map.values())
+    if not distance_samples:
+        distance_samples = columns.cumulative_distance.tolist()
+    use_meter_scale = entry_calculator._is_meter_scale(distance_samples) if distance_samples else False
+
+    for station_name, station_info in platform_entry_data.items():
+        halt_km = station_info.get("halt_distance")
+        halt_distance_raw = halting_station_map.get(station_name)
+        if halt_km is None or halt_distance_raw is None:
+            continue
+
+        platform_length_km = station_info.get("platform_length_km")
+        platform_length_m = int(round(platform_length_km * 1000)) if platform_length_km is not None else None
+
+        station_window_rows.append((
+            station_name,
+            halt_km,
+            platform_length_m,
+            "isd",
+            station_info.get("section"),
+            station_info.get("entry_speed"),
+            station_info.get("mid_platform_speed"),
+            station_info.get("one_coach_speed"),
+            station_info.get("entry_gap_m"),
+            station_info.get("mid_gap_m"),
+            station_info.get("one_coach_gap_m"),
+            train_type
+        ))
+
+        entry_distance_km = station_info.get("entry_distance")
+        if entry_distance_km is None:
+            continue
+
+        entry_distance_raw = entry_distance_km * (1000.0 if use_meter_scale else 1.0)
+        start_distance = min(entry_distance_raw, halt_distance_raw)
+        end_distance = max(entry_distance_raw, halt_distance_raw)
+        # Samples from the first one at/after start_distance up to (not
+        # including) the next one past end_distance that is not the first.
+        window = np.flatnonzero(columns.cumulative_distance >= start_distance)
+        past_end = columns.cumulative_distance[window] > end_distance
+        if len(window):
+            past_end[0] = False
+            if past_end.any():
+                window = window[:int(np.argmax(past_end))]
+
+        for seq, idx in enumerate(window.tolist()):
+            cd_val = float(columns.cumulative_distance[idx])
+            psr_val = columns.psr[idx] if columns.psr is not None else None
+            if isinstance(psr_val, (list, tuple)):
+                psr_val = next((v for v in psr_val if v is not None), None)
+            psr_float = None if psr_val is None else float(psr_val)
+
+            if columns.time_s is not None and not np.isnan(columns.time_s[idx]):
+                time_str = format_time_seconds(columns.time_s[idx])
+            else:
+                time_val = columns.time[idx]
+                time_str = str(time_val) if time_val is not None else ""
+            window_point_rows.append((
+                station_name,
+                seq,
+                cd_val / 1000.0 if use_meter_scale else cd_val,
+                float(columns.speed[idx]),
+                psr_float,
+                time_str
+            ))
+    return station_window_rows, window_point_rows
+
+
+def analyse_frame(
+    df: pl.DataFrame,
+    *,
+    train_number: Optional[str] = None,
+    from_station: Optional[str] = None,
+    to_station: Optional[str] = None,
+    halts: Optional[List[Dict[str, Any]]] = None,
+    ctx: Optional[AnalysisContext] = None,
+    frame_key: Optional[str] = None,
+    trace: Optional[StageTrace] = None,
+) -> Dict[str, Any]:
+    """
+    Run corridor resolution, halt matching, PSR, overspeed, platform entry and
+    brake feel over a frame from ``read_spm_file``.
+
+    Returns a dict whose ``df`` is the (possibly trimmed) frame with a PSR column
+    added. ``from_station``/``to_station`` come back resolved: when the caller
+    left them blank they are filled from the matched halts.
+
+    ``halts`` are the raw halts of ``df`` (HaltDetector.detect_halts) from an
+    earlier analysis of the same frame; they do not depend on the train or the
+    stations, so a re-analysis passes them back instead of detecting again.
+    The result's ``raw_halts`` are the ones used, None when no corridor was
+    resolved and halts were never needed; its ``frame_key`` is the key below.
+
+    ``station_window_rows`` and ``window_point_rows`` are returned WITHOUT the
+    leading run_id — the run does not have an id yet; the handler prefixes it.
+
+    Each stage goes through STAGES (stage_memo.py). ``frame_key`` identifies
+    ``df`` for it (``frame_fingerprint(df)`` when not given); ``trace`` collects
+    the stages for the one "Stages:" line logged at the end and for the result's
+    ``stage_timings``, (stage, outcome, ms) tuples the handler adds to the
+    request's timings (timing.py).
+    """
+    ctx = ctx or get_context()
+    frame_key = frame_key or frame_fingerprint(df)
+    trace = trace if trace is not None else StageTrace()
+    version = ctx.reference_data.version
+    trimmed_key = frame_key
+    psr_key = None
+    corridor_manager = ctx.corridor_manager
+    psr_calculator = ctx.psr_calculator
+    halt_detector = ctx.halt_detector
+    entry_calculator = ctx.entry_calculator
+
+    # Resolve corridor if train number is provided
+    corridor_info = None
+    train_type = None
+    ordered_stations = []
+    station_km_map = {}
+    halting_station_map = {}
+    psr_values = []
+    violations = []
+    overspeed_events = []
+    overspeed_summary = EMPTY_OVERSPEED_SUMMARY
+    platform_entry_data: Dict[str, Dict[str, Any]] = {}
+
+    if train_number:
+        corridor_info = corridor_manager.resolve_corridor(
+            train_number, from_station or "", to_station or ""
+        )
+
+        # Determine train type (fast/slow/thb)
+        if corridor_info:
+            corridor_name = corridor_info.get('corridor', '')
+            train_code = corridor_manager.get_train_code(train_number)
+
+            # Determine train type from train code prefix (primary source)
+            prefix = str(train_code).strip()[:3] if train_code else None
+
+            if corridor_name and 'THB' in corridor_name.upper():
+                train_type = 'thb'
+            elif prefix and prefix in corridor_manager.FAST_PREFIXES:
+                train_type = 'fast'
+            else:
+                train_type = 'slow'
+
+            # Validate against corridor name (double-check for consistency)
+            if corridor_name and 'FAST' in corridor_name.upper() and train_type != 'fast':
+                logger.warning("Mismatch: train_type=%s but corridor=%s", train_type, corridor_name)
+            elif corridor_name and 'LOCAL' in corridor_name.upper() and train_type == 'fast':
+                logger.warning("Mismatch: train_type=%s but corridor=%s", train_type, corridor_name)
+
+            # Get corridor data for PSR calculation
+            logger.debug("Looking for corridor: '%s'", corridor_name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available corridors: %s", list(corridor_manager.corridors.keys()))
+
+            corridor_data = corridor_manager.corridors.get(corridor_name)
+            if corridor_data:
+                logger.debug("Corridor found! Stations: %s...", corridor_data.stations[:5])  # First 5 stations
+
+                # Determine which stations to use for PSR calculation
+                all_stations = corridor_data.stations
+
+                # Filter to from/to range if provided
+                # psr_stations will be used for PSR calculation (all corridor stations)
+                # ordered_stations will be used for halt matching (may be filtered later)
+                if from_station and to_station and from_station in all_stations and to_station in all_stations:
+                    from_idx = all_stations.index(from_station)
+                    to_idx = all_stations.index(to_station)
+                    if from_idx < to_idx:
+                        psr_stations = all_stations[from_idx:to_idx+1]
+                    else:
+                        psr_stations = all_stations[to_idx:from_idx+1][::-1]
+                    logger.debug("Target station range from form: %s→%s (%s stations)", from_station, to_station, len(psr_stations))
+                else:
+                    psr_stations = all_stations
+                    logger.debug("Using all %s corridor stations (no from/to provided)", len(psr_stations))
+
+                ordered_stations = psr_stations  # Initialize ordered_stations for halt matching
+
+                # Use official KM map based on train type (like GAS app)
+                # These are hardcoded reference values, NOT calculated from corridor CSV
+                logger.debug("Loading official station KM map for train_type=%s...", train_type)
+                station_km_map = ctx.reference_data.station_km_map(train_type)
+
+                logger.debug("Loaded official KM map with %s stations (for PSR officialKM)", len(station_km_map))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("First 5 station KMs: %s", list(station_km_map.items())[:5])
+                    logger.debug("Last 5 station KMs: %s", list(station_km_map.items())[-5:])
+                if from_station and from_station in station_km_map:
+                    logger.debug("Target from_station %s at %.0fm", from_station, station_km_map[from_station])
+                if to_station and to_station in station_km_map:
+                    logger.debug("Target to_station %s at %.0fm", to_station, station_km_map[to_station])
+
+                # Detect halts using ISD-based matching (GAS approach)
+                logger.debug("Detecting halts in SPM data...")
+
+                # Step 1: Detect raw halts (speed=0, distance=0). They depend
+                # on the frame only, so given halts share the stage's key.
+                halts_key = stage_key("halts", frame_key)
+                if halts is None:
+                    halts = STAGES.run("halts", halts_key, lambda: halt_detector.detect_halts(
+                        df,
+                        speed_col='Speed',
+                        cum_dist_col='cumulative_distance'
+                    ), trace)
+                else:
+                    trace.add("halts", "given")
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    halt_distances = [f"{h['cumulative_distance']:.0f}m" for h in halts[:10]]
+                    logger.debug("Detected %s raw halts at: %s", len(halts), halt_distances)
+
+                # Step 2: Match halts using ISD pattern matching
+                # For FAST trains, get nominated halts from Fast Locals.csv
+                fast_train_halts = None
+                semi_fast_info = None
+                slow_corridor_data = None
+                if train_type == 'fast':
+                    fast_train_halts = corridor_manager.get_train_halts(train_number)
+                    if fast_train_halts:
+                        logger.debug("FAST train detected - using nominated halts: %s", fast_train_halts)
+                        # Check if this is a semi-fast train (has slow-only markers)
+                        semi_fast_info = corridor_manager.detect_semi_fast(fast_train_halts)
+                        if semi_fast_info:
+                            logger.debug("SEMI-FAST train detected!")
+                            logger.debug("Change point: %s", semi_fast_info['change_point'])
+                            logger.debug("Slow markers found: %s", semi_fast_info['markers_found'])
+                            # Load the corresponding slow corridor for ISD matching after change point
+                            slow_corridor_name = corridor_name.replace('_FAST', '_LOCAL') if corridor_name else None
+                            if slow_corridor_name:
+                                slow_corridor_data = corridor_manager.corridors.get(slow_corridor_name)
+                                if slow_corridor_data:
+                                    logger.debug("SEMI-FAST: Loaded slow corridor %s with %s stations", slow_corridor_name, len(slow_corridor_data.stations))
+                                else:
+                                    logger.warning("SEMI-FAST: Slow corridor %s not found", slow_corridor_name)
+                    else:
+                        logger.debug("FAST train %s not found in Fast Locals.csv, using corridor stations", train_number)
+
+                logger.debug("Matching halts to stations using ISD algorithm...")
+                isd_key = stage_key(
+                    "isd_match", halts_key, version, corridor_name, from_station, to_station,
+                    fast_train_halts, semi_fast_info, slow_corridor_data.name if slow_corridor_data else None,
+                )
+                halt_result = STAGES.run("isd_match", isd_key, lambda: halt_detector.match_halts_using_isd(
+                    halts,
+                    corridor_data,
+                    from_station=from_station,
+                    to_station=to_station,
+                    max_isd_diff=120.0,  # 150m ISD tolerance
+                    max_cd_diff=300.0,   # 300m cumulative distance tolerance
+                    fast_train_halts=fast_train_halts,
+                    slow_corridor_data=slow_corridor_data,
+                    semi_fast_info=semi_fast_info
+                ), trace)
+
+                # Extract halting stations and ordered stations from result
+                halting_station_map = halt_result['halting_stations']
+                ordered_stations = halt_result['ordered_stations']
+
+                logger.debug("Matched %s/%s halts to stations", len(halting_station_map), len(halts))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Halting stations: %s", list(halting_station_map.keys()))
+                logger.debug("Ordered stations after halt matching: %s stations", len(ordered_stations))
+                logger.debug("Ordered stations list: %s", ordered_stations)
+
+                # Track whether stations were explicitly provided by user (before auto-detection)
+                user_provided_from = bool(from_station)
+                user_provided_to = bool(to_station)
+                user_provided_both = user_provided_from and user_provided_to
+
+                # Determine the actual from/to stations based on what was matched
+                if (not from_station or not to_station) and ordered_stations and len(ordered_stations) >= 2:
+                    # If from/to not provided, use first/last from ordered stations
+                    from_station = ordered_stations[0]
+                    to_station = ordered_stations[-1]
+
+                    logger.debug("Using detected halt range: %s→%s (%s stations)", from_station, to_station, len(ordered_stations))
+
+                # Adjust/filter SPM data based on whether user provided explicit stations
+                if halting_station_map:
+                    # Determine start and end positions
+                    if user_provided_both and from_station in halting_station_map and to_station in halting_station_map:
+                        # User explicitly requested specific segment - filter both start AND end
+                        start_dist = halting_station_map[from_station]
+                        end_dist = halting_station_map[to_station]
+
+                        logger.debug("User requested segment: %s (%.0fm) → %s (%.0fm)", from_station, start_dist, to_station, end_dist)
+                        logger.debug("Filtering data to show only this segment")
+
+                        original_len = len(df)
+
+                        # Filter both start and end
+                        df = df.filter(
+                            (pl.col('cumulative_distance') >= start_dist) &
+                            (pl.col('cumulative_distance') <= end_dist)
+                        )
+                        trimmed_key = stage_key("trim", frame_key, start_dist, end_dist)
+                    else:
+                        # Auto-detected or partial - only filter start, keep full journey
+                        start_dist = min(halting_station_map.values())
+
+                        logger.debug("Auto-detected or partial station selection")
+                        logger.debug("Adjusting to start from 0 (was %.0fm), keeping full journey", start_dist)
+
+                        original_len = len(df)
+
+                        # Only filter start point
+                        df = df.filter(pl.col('cumulative_distance') >= start_dist)
+                        trimmed_key = stage_key("trim", frame_key, start_dist, None)
+
+                    # Adjust cumulative distances to start from 0
+                    df = df.with_columns([
+                        (pl.col('cumulative_distance') - start_dist).alias('cumulative_distance')
+                    ])
+
+                    adjusted_end = float(df['cumulative_distance'].max())
+                    logger.debug("Result: %s rows (was %s), spanning 0 to %.0fm", len(df), original_len, adjusted_end)
+
+                    # Adjust halting_station_map positions to match adjusted data
+                    adjusted_halting_map = {}
+                    for station, halt_dist in halting_station_map.items():
+                        adjusted_halting_map[station] = halt_dist - start_dist
+                    halting_station_map = adjusted_halting_map
+
+                    logger.debug("Adjusted halting stations: %s", halting_station_map)
+
+                    # Adjust station_km_map for PSR calculation
+                    # Use psr_stations (all corridor stations) not ordered_stations (halt-filtered)
+                    adjusted_station_km_map = {}
+                    missing_stations = []
+                    for station in psr_stations:
+                        if station in station_km_map:
+                            adjusted_station_km_map[station] = station_km_map[station] - start_dist
+                        else:
+                            missing_stations.append(station)
+
+                    logger.debug("Adjusted station KM map for PSR: %s stations", len(adjusted_station_km_map))
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("First 5: %s", list(adjusted_station_km_map.items())[:5])
+                        logger.debug("Last 5: %s", list(adjusted_station_km_map.items())[-5:])
+                    if missing_stations:
+                        logger.debug("Missing from station_km_map: %s", missing_stations)
+                else:
+                    # No halts matched - use original data
+                    adjusted_station_km_map = station_km_map
+                    logger.debug("No halts matched - using original data")
+
+                # Calculate PSR/MPS values
+                try:
+                    logger.debug("Starting PSR calculation for train_type=%s...", train_type)
+                    logger.debug("Using %s corridor stations for PSR (not just halting stations)", len(psr_stations))
+                    psr_key = stage_key(
+                        "psr", trimmed_key, version, psr_stations, adjusted_station_km_map,
+                        halting_station_map, train_type, semi_fast_info,
+                    )
+                    psr_values = STAGES.run("psr", psr_key, lambda: psr_calculator.speed_limits_for_distances(
+                        df['cumulative_distance'].to_numpy(),
+                        psr_stations,  # Use all corridor stations, not just halting stations
+                        adjusted_station_km_map,
+                        halting_station_map,
+                        train_type,
+                        semi_fast_info=semi_fast_info
+                    ), trace)
+
+                    logger.debug("PSR calculation complete! Got %s values", len(psr_values))
+                    logger.debug("Sample PSR values: %s", psr_values[:10])
+
+                    # Add PSR values to dataframe as a new column
+                    # Use pl.Series to properly add the list as a column
+                    df = df.with_columns([
+                        pl.Series('PSR', psr_values)
+                    ])
+
+                    # The frame's Speed column, not the row dicts: those have a
+                    # capital 'Speed' key and the detectors read 'speed', so
+                    # every sample used to count as 0 km/h here.
+                    violations, overspeed_events, overspeed_summary = STAGES.run(
+                        "overspeed", stage_key("overspeed", trimmed_key, psr_key),
+                        lambda: _overspeed_stage(SpmColumns.from_frame(df), psr_values), trace,
+                    )
+                    logger.debug("Found %s individual violations", len(violations))
+                    logger.debug("Found %s overspeed events", len(overspeed_events))
+
+                except Exception:
+                    logger.exception("Could not calculate PSR/MPS")
+                    # Continue without PSR data
+
+    # One columnar view of the final frame for everything below; no row dicts.
+    columns = SpmColumns.from_frame(df)
+
+    # Platform entry and brake feel read Speed/Time/Distance, not PSR, so they
+    # are keyed by the trimmed frame.
+    platform_key = None
+    if halting_station_map and ordered_stations:
+        try:
+            platform_key = stage_key(
+                "platform_entry", trimmed_key, version, halting_station_map, ordered_stations, train_type,
+            )
+            platform_entry_data = STAGES.run("platform_entry", platform_key, lambda: entry_calculator.calculate_platform_entry_speeds(
+                halting_station_map,
+                ordered_stations,
+                columns,
+                train_type or "slow"
+            ), trace)
+        except Exception:
+            logger.exception("Could not calculate platform entry speeds")
+            platform_entry_data = {}
+
+    # Detect brake feel tests
+    brake_tests = []
+    if len(columns):
+        brake_tests = STAGES.run("bft", stage_key("bft", trimmed_key), lambda: [
+            {
+                "start_index": test.start_index,
+                "max_speed": test.max_speed,
+                "lowest_speed": test.lowest_speed,
+                "speed_drop": test.speed_drop,
+            }
+            for test in ctx.brakefeel_detector.detect_from_columns(columns)
+        ][:1], trace)  # Only first test
+
+    # Generate abnormality text for daily summary
+    abnormality_text = generate_abnormality_text(
+        overspeed_events,
+        platform_entry_data,
+        brake_tests
+    )
+    logger.debug("Abnormality: %s...", abnormality_text[:100])
+
+    # Departure / arrival / running time.
+    #
+    # Computed HERE, before the run is stored, not just before the response.
+    # These three values feed the PDF's metadata grid, and the server has no
+    # other way to recover them once the request ends — the Time and time_s
+    # columns are in the frame, but nothing downstream repeats this arithmetic.
+    start_time = None
+    end_time = None
+    duration = None
+    if "Time" in df.columns and len(df) > 0:
+        first_time = df["Time"][0]
+        last_time = df["Time"][-1]
+        if first_time:
+            start_time = str(first_time)
+        if last_time:
+            end_time = str(last_time)
+
+        # Running time from time_s, which already counts past midnight
+        time_s = df[TIME_SECONDS_COL] if TIME_SECONDS_COL in df.columns else None
+        if (start_time and end_time and time_s is not None
+                and time_s[0] is not None and time_s[-1] is not None):
+            total_secs = int(time_s[-1] - time_s[0])
+            if total_secs < 0:
+                total_secs += DAY_SECONDS
+            hours = total_secs // 3600
+            mins = (total_secs % 3600) // 60
+            secs = total_secs % 60
+            duration = f"{hours:02d}:{mins:02d}:{secs:02d}"
+
+    station_window_rows = []
+    window_point_rows = []
+    if platform_entry_data:
+        station_window_rows, window_point_rows = STAGES.run(
+            "window_points",
+            stage_key("window_points", trimmed_key, psr_key, platform_key, halting_station_map, train_type),
+            lambda: _window_rows(columns, platform_entry_data, halting_station_map, train_type, entry_calculator),
+            trace,
+        )
+
+    logger.info("Stages: %s", trace)
+
+    return {
+        "df": df,
+        "from_station": from_station,
+        "to_station": to_station,
+        "corridor_info": corridor_info,
+        "train_type": train_type,
+        "halting_stations": halting_station_map,
+        "ordered_stations": ordered_stations,
+        "psr_calculated": len(psr_values) > 0,
+        "violations": violations,
+        "overspeed_events": overspeed_events,
+        "overspeed_summary": overspeed_summary,
+        "platform_entry_data": platform_entry_data,
+        "brake_tests": brake_tests,
+        "abnormality_text": abnormality_text,
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": duration,
+        "station_window_rows": station_window_rows,
+        "window_point_rows": window_point_rows,
+        "raw_halts": halts,
+        "frame_key": frame_key,
+        "stage_timings": list(trace.steps),
+    }
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analyse_upload(path: str, params: Dict[str, Any], file_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pool entry point: parse the uploaded file at ``path`` and analyse it.
+
+    ``params`` carries train_number, from_station and to_station. Returns the
+    ``analyse_frame`` dict plus ``source_df``, the parsed frame before any
+    trimming, which ``reanalyse_frame`` starts from; the polars frames pickle
+    back to the parent cheaply.
+
+    ``file_sha256`` (upload_spool's digest; hashed here when not given) keys
+    the parse stage, so the same file with other parameters is not parsed again.
+    """
+    path = Path(path)
+    trace = StageTrace()
+    parse_key = stage_key("parse", file_sha256 or _file_sha256(path), path.suffix.lower())
+    parsed = STAGES.run("parse", parse_key, lambda: parse_spm_file(path), trace)
+    frame_key = stage_key("cumulative_distance", parse_key)
+    df = STAGES.run(
+        "cumulative_distance", frame_key,
+        lambda: calculate_cumulative_distance(parsed, distance_col="Distance"), trace,
+    )
+    result = analyse_frame(
+        df,
+        train_number=params.get("train_number"),
+        from_station=params.get("from_station"),
+        to_station=params.get("to_station"),
+        frame_key=frame_key,
+        trace=trace,
+    )
+    result["source_df"] = df
+    return result
+
+
+def reanalyse_frame(
+    df: pl.DataFrame,
+    params: Dict[str, Any],
+    halts: Optional[List[Dict[str, Any]]] = None,
+    frame_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Pool entry point for POST /runs/{run_id}/reanalyze: ``analyse_frame`` over a
+    stored source frame with new ``params``, reusing its raw ``halts`` if known.
+    ``frame_key`` is the first analysis's, so its memoized stages still match.
+    """
+    return analyse_frame(
+        df,
+        train_number=params.get("train_number"),
+        from_station=params.get("from_station"),
+        to_station=params.get("to_station"),
+        halts=halts,
+        frame_key=frame_key,
+    )
@@ -4,6 +4,10 @@ from dataclasses import dataclass
 from typing import List, Optional, Sequence
 from datetime import datetime
 
+import numpy as np
+
+from spm_columns import SpmColumns, as_columns
+
 
 @dataclass
 class BrakeFeelTest:
@@ -22,6 +26,57 @@ class BrakeFeelTest:
     duration: float
 
 
+def _floats(values: Sequence[float]) -> np.ndarray:
+    """float64 array, None as 0 (the scalar code's ``float(v or 0)``)."""
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    if any(v is None for v in values):
+        values = [0.0 if v is None else v for v in values]
+    return np.asarray(values, dtype=np.float64)
+
+
+def _parse_clock(text: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(text.strip(), "%H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _drop_starts(speeds: np.ndarray, follow_end: int, margin: float = 2.0) -> np.ndarray:
+    """
+    For every start i, the first j >= i (j < follow_end) whose speed is more
+    than ``margin`` below the running max of speeds[i..j] — where the scalar
+    peak-following loop stops with a drop. ``len(speeds)`` where there is none.
+
+    A sample j is such a drop for exactly the starts i <= prev(j), prev(j)
+    being the last k < j with speeds[j] < speeds[k] - margin. prev comes from a
+    binary-lifting walk over a sparse table of range maxima; the answer for i
+    is then the smallest j with prev(j) >= i, a suffix minimum.
+    """
+    n = len(speeds)
+    # Compared as the scalar loop does, speeds[j] < speeds[k] - margin; x - margin
+    # is monotonic in floating point too, so its range max is max(x) - margin.
+    levels = [speeds - margin]  # levels[l][x] = max over [x, x + 2**l)
+    while (1 << len(levels)) <= n:
+        half = 1 << (len(levels) - 1)
+        levels.append(np.maximum(levels[-1][:-half], levels[-1][half:]))
+
+    pos = np.arange(n)  # no drop below any of [pos, j): walked back as far as possible
+    for level in reversed(range(len(levels))):
+        start = pos - (1 << level)
+        ok = start >= 0
+        block = np.full(n, np.inf)
+        block[ok] = levels[level][start[ok]]
+        pos = np.where(ok & ~(speeds < block), start, pos)
+    prev = pos - 1
+
+    first = np.full(n + 1, n, dtype=np.int64)
+    j = np.arange(n)
+    valid = (prev >= 0) & (j < follow_end)
+    np.minimum.at(first, prev[valid], j[valid])
+    return np.minimum.accumulate(first[::-1])[::-1][:n]
+
+
 class BrakeFeelDetector:
     """
     Detects brake feel tests based on speed/time profiles.
@@ -57,6 +112,22 @@ class BrakeFeelDetector:
         cumulative = [float(s.get("cumulative_distance", 0.0) or 0.0) for s in samples]
         return self.detect(speeds, times, distances, cumulative)
 
+    def detect_from_columns(self, columns: "SpmColumns") -> List[BrakeFeelTest]:
+        """
+        detect_from_samples for an SpmColumns (or a polars frame). Durations
+        come from the parsed ``time_s`` column when there is one.
+        """
+        columns = as_columns(columns)
+        times = columns.time
+        if columns.time_s is not None:
+            times = np.where(np.isnan(columns.time_s), None, columns.time_s).tolist()
+        return self.detect(
+            columns.speed.tolist(),
+            times,
+            columns.distance.tolist(),
+            columns.cumulative_distance.tolist(),
+        )
+
     def detect(
         self,
         speeds: Sequence[float],
@@ -64,173 +135,191 @@ class BrakeFeelDetector:
         distances: Sequence[float],
         cumulative: Sequence[float],
     ) -> List[BrakeFeelTest]:
+        """
+        The first brake feel test in the run, as a one-item list (or []).
+
+        Same result as the original sample-by-sample scan (kept in the tests
+        as the reference), found with array work: the drop
+        each start sample would follow its peak to is computed for every
+        sample at once (``_drop_starts``), a rolling minimum over the 30-sample
+        braking window rules out drops that cannot reach ``min_speed_drop``,
+        and only the surviving starts get the exact scalar checks.
+        """
         if not speeds:
             return []
 
         end_idx = self._find_analysis_end_index(speeds, distances, cumulative)
-        sliced_speeds = list(map(float, speeds[:end_idx]))
-        sliced_times = list(times[:end_idx])
-        times_sec = self._convert_times_to_seconds(sliced_times)
-        cleaned = self._clean_speed_data(sliced_speeds, times_sec)
-
-        if not cleaned["speeds"]:
+        raw = np.array(list(map(float, speeds[:end_idx])), dtype=np.float64)
+
+        # _clean_speed_data: every converted time is a float, so only negative
+        # and NaN speeds are dropped
+        keep = raw >= 0
+        original_idx = np.flatnonzero(keep).tolist()
+        speeds_clean = raw[keep]
+        found = self._scan(speeds_clean)
+        if found is None:
             return []
 
-        tests: List[BrakeFeelTest] = []
-        speeds_clean = cleaned["speeds"]
-        times_clean = cleaned["times"]
-        original_idx = cleaned["indices"]
-
-        # Scan for BFT pattern: find where speed drops significantly within a short window
-        # BFT characteristics:
-        # 1. Speed is in valid range (15-40 kmph) before braking
-        # 2. Rapid drop of >= 5 kmph within ~15 seconds
-        # 3. Recovery after the drop
-
-        i = 0
-        bft_window_passed = False  # Track if we've passed the BFT window (speed exceeded 40)
-
-        while i < len(speeds_clean) - 20:
-            current_speed = speeds_clean[i]
-
-            # Skip if speed not in valid range (below 15)
-            if current_speed < self.min_speed_for_test:
-                i += 1
-                continue
-
-            # If speed exceeds max (40 kmph), BFT window has passed
-            # Once speed crosses 40, BFT should have been done - stop searching entirely
-            if current_speed > self.max_speed_for_test:
-                if not bft_window_passed:
-                    bft_window_passed = True
-                    # BFT not done before 40 kmph - no valid BFT in this run
-                    break
-                i += 1
-                continue
-
-            # Look ahead for a rapid speed drop pattern
-            # Follow the rising trend until speed actually starts dropping (find true peak)
-            peak_speed = current_speed
-            peak_index = i
-            exceeded_max = False
-            found_peak = False
-
-            # Follow speed until it stops rising (no artificial limit - follow until drop detected)
-            drop_start_index = i
-            for j in range(i, len(speeds_clean) - 15):  # Need 15 samples after for braking check
-                if speeds_clean[j] > self.max_speed_for_test:
-                    # Speed exceeded max limit - BFT should have happened before this
-                    exceeded_max = True
-                    break
-                if speeds_clean[j] > peak_speed:
-                    peak_speed = speeds_clean[j]
-                    peak_index = j
-                elif speeds_clean[j] < peak_speed - 2:
-                    # Speed dropped by more than 2 kmph from peak, we found the peak
-                    found_peak = True
-                    drop_start_index = j  # Remember where the drop started
-                    break
-
-            # Skip if speed exceeded max (BFT didn't happen in time)
-            if exceeded_max:
-                i += 1
-                continue
-
-            # Skip if no clear peak found (still rising at end of data)
-            if not found_peak:
-                i += 1
-                continue
+        sliced_times = list(times[:end_idx])
+        (start_index, end_index, peak_index, lowest_index, peak_speed,
+         lowest_speed, recovery_speed) = found
+        values = speeds_clean.tolist()
+        start_idx = original_idx[start_index]
+        end_idx_final = original_idx[end_index]
+        duration = (
+            self._time_seconds_at(sliced_times, end_idx_final)
+            - self._time_seconds_at(sliced_times, start_idx)
+        )
+        return [
+            BrakeFeelTest(
+                start_index=start_idx,
+                end_index=end_idx_final,
+                max_speed_index=original_idx[peak_index],
+                braking_start_index=original_idx[peak_index],
+                lowest_speed_index=original_idx[lowest_index],
+                recovery_index=end_idx_final,
+                start_speed=values[start_index],
+                max_speed=peak_speed,
+                braking_start_speed=peak_speed,
+                lowest_speed=lowest_speed,
+                recovery_speed=recovery_speed,
+                speed_drop=peak_speed - lowest_speed,
+                duration=duration,
+            )
+        ]
+
+    def _scan(self, speeds: np.ndarray) -> Optional[tuple]:
+        """
+        The main loop of the scalar scan over cleaned speeds. Returns
+        (start, end, peak, lowest) indices and (peak, lowest, recovery) speeds
+        of the first test, or None.
+
+        In the scalar loop a start i follows the speed from i until it exceeds
+        the max test speed (nothing can be found after that: the loop ends
+        there), runs out of data (likewise) or first drops more than 2 below
+        its running peak, at drop_start[i]. drop_start never decreases with i,
+        and within a run of starts sharing one drop_start, later starts see a
+        lower-or-equal peak, no earlier: if the first fails the drop or
+        duration check, all of them do. So one start per drop is checked.
+        """
+        n = len(speeds)
+        limit = n - 20              # the scalar while-loop bound
+        follow_end = n - 15         # the scalar peak-following bound
+        if limit <= 0:
+            return None
+
+        over = speeds > self.max_speed_for_test
+        first_over = np.flatnonzero(over[:limit])
+        scan_end = int(first_over[0]) if len(first_over) else limit
+        starts = np.flatnonzero(speeds[:scan_end] >= self.min_speed_for_test)
+        if not len(starts):
+            return None
+
+        drop_start = _drop_starts(speeds, follow_end)
+        index = np.arange(n)
+        next_over = np.where(over & (index < follow_end), index, n)
+        next_over = np.minimum.accumulate(next_over[::-1])[::-1]
+
+        # Lowest speed the braking window after a drop could reach, vs the
+        # most the peak can be (the sample before the drop is within 2 of it).
+        window = np.lib.stride_tricks.sliding_window_view(
+            np.append(speeds, np.full(29, np.inf)), 30
+        ).min(axis=1)
+        previous = np.append(np.inf, speeds[:-1])
+        can_drop = previous + 2 - window >= self.min_speed_drop - 1e-9
+
+        values = speeds.tolist()
+        start_drops = drop_start[starts]
+        k = 0
+        while k < len(starts):
+            i = int(starts[k])
+            drop = int(drop_start[i])
+            if drop >= follow_end or next_over[i] <= drop:
+                return None         # exceeded max, or no drop before the data ends
+            if can_drop[drop]:
+                result = self._check_drop(values, i, drop, speeds)
+                if isinstance(result, tuple):
+                    return result
+                if result is not None:
+                    # no recovery: the scalar loop resumes after the lowest point
+                    k = int(np.searchsorted(starts, result + 1))
+                    continue
+            k = int(np.searchsorted(start_drops, drop, side="right"))
+        return None
 
-            # Now follow the drop from where it started until speed recovers
-            # Start from drop_start_index (where we detected the drop), not peak_index
-            lowest_speed = speeds_clean[drop_start_index]
-            lowest_index = drop_start_index
-            max_braking_window = 30  # Safety limit
-
-            for j in range(drop_start_index, min(drop_start_index + max_braking_window, len(speeds_clean))):
-                if speeds_clean[j] < lowest_speed:
-                    lowest_speed = speeds_clean[j]
-                    lowest_index = j
-                elif speeds_clean[j] > lowest_speed + 2:
-                    # Speed started recovering (increased by more than 2 kmph), stop tracking
+    def _check_drop(self, values: List[float], i: int, drop_start_index: int, speeds: np.ndarray):
+        """
+        The scalar loop body from a found drop on. Returns the test tuple for
+        ``_scan``, the lowest index when braking found no recovery or halt, or
+        None when the drop or duration check fails.
+        """
+        peak_index = i + int(np.argmax(speeds[i:drop_start_index]))
+        peak_speed = values[peak_index]
+
+        lowest_speed = values[drop_start_index]
+        lowest_index = drop_start_index
+        for j in range(drop_start_index, min(drop_start_index + 30, len(values))):
+            if values[j] < lowest_speed:
+                lowest_speed = values[j]
+                lowest_index = j
+            elif values[j] > lowest_speed + 2:
+                break
+
+        if peak_speed - lowest_speed < self.min_speed_drop:
+            return None
+        if lowest_index - peak_index < 3:
+            return None
+
+        recovery = self._find_recovery_phase(values, lowest_index, lowest_speed)
+        halt_index = None
+        if not recovery:
+            for j in range(lowest_index, min(lowest_index + 10, len(values))):
+                if values[j] == 0:
+                    halt_index = j
                     break
-
-            speed_drop = peak_speed - lowest_speed
-
-            # Check if this is a valid BFT drop
-            if speed_drop < self.min_speed_drop:
-                i += 1
-                continue
-
-            # Verify it's a real braking event (not just noise)
-            # Check that drop happened continuously, not scattered
-            drop_duration = lowest_index - peak_index
-            if drop_duration < 3:  # Too fast, might be noise
-                i += 1
+            if halt_index is None:
+                return lowest_index
+
+        start_index = peak_index
+        for j in range(peak_index - 1, max(-1, peak_index - 30), -1):
+            if values[j] < values[start_index]:
+                start_index = j
+            if values[j] <= 0:
+                break
+
+        if recovery:
+            return (start_index, recovery.end_index, peak_index, lowest_index,
+                    peak_speed, lowest_speed, recovery.end_speed)
+        return (start_index, halt_index, peak_index, lowest_index,
+                peak_speed, lowest_speed, 0.0)
+
+    def _time_seconds_at(self, times: Sequence[Optional[str]], index: int) -> float:
+        """_convert_times_to_seconds(times)[index], converting only what it needs."""
+        entry = times[index]
+        if entry is None:
+            return float(index)
+        if isinstance(entry, (int, float)):
+            return float(entry)
+        text = str(entry)
+        if text.startswith("T+"):
+            try:
+                return float(text[2:-1])
+            except ValueError:
+                return float(index)
+        parsed = _parse_clock(text)
+        if parsed is None:
+            return float(index)
+        # Clock times count from the first one that parses
+        for earlier in times[:index]:
+            if earlier is None or isinstance(earlier, (int, float)):
                 continue
-
-            # Look for recovery after braking OR train came to halt
-            recovery = self._find_recovery_phase(speeds_clean, lowest_index, lowest_speed)
-
-            # Check if train came to halt (speed = 0) after braking
-            came_to_halt = False
-            halt_index = lowest_index
-            if not recovery:
-                # Look for halt within a few samples after lowest point
-                for j in range(lowest_index, min(lowest_index + 10, len(speeds_clean))):
-                    if speeds_clean[j] == 0:
-                        came_to_halt = True
-                        halt_index = j
-                        break
-
-            # Valid BFT if either recovery or halt
-            if not recovery and not came_to_halt:
-                i = lowest_index + 1
+            earlier = str(earlier)
+            if earlier.startswith("T+"):
                 continue
-
-            # Find the start of this BFT sequence
-            start_index = peak_index
-            for j in range(peak_index - 1, max(-1, peak_index - 30), -1):
-                if speeds_clean[j] < speeds_clean[start_index]:
-                    start_index = j
-                if speeds_clean[j] <= 0:
-                    break
-
-            start_idx = original_idx[start_index]
-
-            # End index and recovery speed depend on whether recovery or halt
-            if recovery:
-                end_idx_final = original_idx[recovery.end_index]
-                recovery_speed = recovery.end_speed
-                duration = times_clean[recovery.end_index] - times_clean[start_index]
-            else:
-                # Came to halt
-                end_idx_final = original_idx[halt_index]
-                recovery_speed = 0.0
-                duration = times_clean[halt_index] - times_clean[start_index]
-
-            tests.append(
-                BrakeFeelTest(
-                    start_index=start_idx,
-                    end_index=end_idx_final,
-                    max_speed_index=original_idx[peak_index],
-                    braking_start_index=original_idx[peak_index],
-                    lowest_speed_index=original_idx[lowest_index],
-                    recovery_index=end_idx_final,
-                    start_speed=speeds_clean[start_index],
-                    max_speed=peak_speed,
-                    braking_start_speed=peak_speed,
-                    lowest_speed=lowest_speed,
-                    recovery_speed=recovery_speed,
-                    speed_drop=speed_drop,
-                    duration=duration,
-                )
-            )
-
-            # Only detect first BFT
-            break
-
-        return tests
+            base = _parse_clock(earlier)
+            if base is not None:
+                return (parsed - base).total_seconds()
+        return 0.0
 
     def _find_analysis_end_index(
         self,
@@ -238,24 +327,25 @@ class BrakeFeelDetector:
         distances: Sequence[float],
         cumulative: Sequence[float],
     ) -> int:
-        min_distance = 0.7
+        """
+        Where the analysis stops: the first stationary sample (no speed, no
+        distance) past the distance threshold, plus padding. The original
+        per-sample loop also tracked the previous such sample, but it was
+        always None at the first one, so it always returned there.
+        """
         use_meters = max(cumulative or [0]) > 100
-        threshold = 700.0 if use_meters else min_distance
-        last_cum = None
-
+        threshold = 700.0 if use_meters else 0.7
         padding = max(10, self.braking_noise_tolerance + int(self.stabilization_period) + 5)
-        total_len = len(speeds)
-
-        for idx, (speed, distance, cum) in enumerate(zip(speeds, distances, cumulative)):
-            speed = float(speed or 0)
-            distance = float(distance or 0)
-            cum = float(cum or 0)
-            if speed == 0 and distance == 0:
-                if (use_meters and cum >= threshold) or (not use_meters and cum >= threshold):
-                    if last_cum is None or abs(cum - last_cum) > (200 if use_meters else 0.2):
-                        return min(total_len, idx + 1 + padding)
-                    last_cum = cum
-        return total_len
+        n = min(len(speeds), len(distances), len(cumulative))
+        stationary = (
+            (_floats(speeds[:n]) == 0)
+            & (_floats(distances[:n]) == 0)
+            & (_floats(cumulative[:n]) >= threshold)
+        )
+        hits = np.flatnonzero(stationary)
+        if len(hits):
+            return min(len(speeds), int(hits[0]) + 1 + padding)
+        return len(speeds)
 
     def _convert_times_to_seconds(self, times: Sequence[Optional[str]]) -> List[float]:
         seconds = []
@@ -295,7 +385,7 @@ class BrakeFeelDetector:
                 time = float(time)
             except (TypeError, ValueError):
                 continue
-            if speed < 0:
+            if not speed >= 0:  # negative or NaN
                 continue
             cleaned["speeds"].append(speed)
             cleaned["times"].append(time)
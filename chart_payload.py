@@ -0,0 +1,380 @@
+"""
+The /chart_data payload: built once per run, stored gzipped next to the frame.
+
+The chart page re-requests a run's payload every time the reviewer reloads it,
+and each PDF build needs it too. Rebuilding it means reading the Parquet frame,
+building one dict per sample, running brake feel and platform entry detection
+and matching the station markers — for a payload that never changes unless the
+run's metadata does.
+
+``store_chart_payload`` runs at upload time and writes the ``rows`` payload
+(the original shape and the default) as gzipped JSON through
+``run_store.put_chart_payload``. The other FORMATS are derived from it the
+first time one is asked for, and stored the same way: ``columnar`` (parallel
+arrays instead of a dict per sample, gzipped JSON) and ``arrow`` (the frame as
+an Arrow IPC stream with zstd-compressed buffers, not gzipped).
+``get_chart_payload`` returns the stored bytes and an ETag; ``/chart_data``
+sends them as they are. ``run_store.update_meta`` deletes the stored payloads
+and the next read rebuilds them; so does a reference data change (the files
+are tagged with the ReferenceData version).
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import polars as pl
+
+import metrics
+import run_store
+import timing
+from brakefeel_detector import BrakeFeelDetector
+from platform_entry_speed import PlatformEntryCalculator
+from reference_data import get_reference_data
+from report_model import nearest_sample_indices
+from spm_columns import SpmColumns
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# Arrow's own IPC buffer compression, which IPC readers undo themselves: ~13x
+# smaller than the uncompressed stream, where gzipping it meant a second pass.
+ARROW_COMPRESSION = "zstd" if HAVE_PYARROW and pa.Codec.is_available("zstd") else None
+
+# Compression level 6: ~10x smaller than the raw JSON for ~1/3 of level 9's CPU
+GZIP_LEVEL = 6
+
+# rows: the original shape, samples as one dict per point (the default).
+# columnar: samples as parallel arrays. arrow: the frame as an Arrow IPC stream.
+FORMATS = ("rows", "columnar", "arrow")
+MEDIA_TYPES = {
+    "rows": "application/json",
+    "columnar": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Formats stored gzipped; arrow is stored and sent as its IPC stream.
+GZIPPED_FORMATS = ("rows", "columnar")
+
+_BRAKEFEEL_DETECTOR = BrakeFeelDetector()
+
+
+def build_chart_payload(run_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the chart payload consumed by ui/spm.html and by the PDF renderer.
+
+    Extracted from the body of POST /chart_data so the on-screen report and the
+    generated PDF are provably fed from the same computation. `run_data` is a
+    run_store meta dict plus a "frame" key holding the samples
+    (run_store.load_run_frame).
+
+    Normally called once per run, by store_chart_payload; requests read the
+    stored bytes through get_chart_payload.
+    """
+    # Work on columns; the only per-sample dicts built are the ones returned.
+    columns = SpmColumns.from_frame(run_data["frame"])
+    timestamps = [f"{t}" if t else f"T+{idx}s" for idx, t in enumerate(columns.time)]
+    distances = [round(d, 2) for d in columns.distance.tolist()]
+    cumulative = [round(c, 2) for c in columns.cumulative_distance.tolist()]
+    speeds = columns.speed.tolist()
+    psr_column = columns.psr if columns.psr is not None else [None] * len(columns)
+
+    # Convert stored data to chart format
+    samples = []
+    first_halt_index = run_data.get("first_halt_index")
+    for idx in range(len(columns)):
+        sample = {
+            "timestamp": timestamps[idx],
+            "distance": distances[idx],
+            "cumulative_distance": cumulative[idx],
+            "speed": speeds[idx],
+            "station": "",  # Could be enriched with station data from corridor_loader
+        }
+
+        # Add PSR/MPS if available
+        psr_val = psr_column[idx]
+        if psr_val is not None:
+            # Handle both single values and potential list wrapping
+            if isinstance(psr_val, (list, tuple)) and len(psr_val) > 0:
+                psr_val = psr_val[0]  # Unwrap if it's a list
+            if psr_val is not None:
+                sample["psr"] = float(psr_val)
+
+        samples.append(sample)
+
+    # The brake detector sees exactly what the chart plots: rounded distances,
+    # T+n placeholders for missing times (time_s, when the run has it, for durations).
+    chart_columns = SpmColumns(
+        speed=columns.speed,
+        distance=np.array(distances, dtype=np.float64),
+        cumulative_distance=np.array(cumulative, dtype=np.float64),
+        time=timestamps,
+        time_s=columns.time_s,
+    )
+
+    # Detect brake feel tests (using per-sample speeds)
+    with timing.span("chart_payload.brake_feel"):
+        brake_tests = [
+            {
+                "start_index": test.start_index,
+                "end_index": test.end_index,
+                "max_speed_index": test.max_speed_index,
+                "lowest_speed_index": test.lowest_speed_index,
+                "recovery_index": test.recovery_index,
+                "braking_start_index": test.braking_start_index,
+                "start_speed": test.start_speed,
+                "max_speed": test.max_speed,
+                "braking_start_speed": test.braking_start_speed,
+                "lowest_speed": test.lowest_speed,
+                "recovery_speed": test.recovery_speed,
+                "speed_drop": test.speed_drop,
+                "duration": test.duration,
+            }
+            for test in _BRAKEFEEL_DETECTOR.detect_from_columns(chart_columns)
+        ][:1]
+
+    # Prepare station markers for chart visualization
+    # Map each station to its nearest sample index for chart positioning
+    halting_stations = run_data.get("halting_stations", {})
+    ordered_stations = run_data.get("ordered_stations", [])
+    train_type = run_data.get("train_type", "slow")
+    station_markers = []
+
+    # Calculate platform entry speeds
+    platform_entry_data = {}
+    if ordered_stations and halting_stations:
+        with timing.span("chart_payload.platform_entry"):
+            try:
+                entry_calculator = PlatformEntryCalculator(reference_data=get_reference_data())
+                platform_entry_data = entry_calculator.calculate_platform_entry_speeds(
+                    halting_stations,
+                    ordered_stations,
+                    columns,
+                    train_type
+                )
+            except Exception:
+                logger.exception("Could not calculate platform entry speeds")
+
+    # The sample closest to each halt distance (first one on a tie), in one pass
+    marker_indices = nearest_sample_indices(
+        chart_columns.cumulative_distance, list(halting_stations.values())
+    )
+    for (station_name, halt_dist_km), closest_idx in zip(halting_stations.items(), marker_indices):
+
+        # Get platform entry speeds if available
+        entry_speed = None
+        mid_platform_speed = None
+        one_coach_speed = None
+        if station_name in platform_entry_data:
+            entry_speed = platform_entry_data[station_name].get('entry_speed')
+            mid_platform_speed = platform_entry_data[station_name].get('mid_platform_speed')
+            one_coach_speed = platform_entry_data[station_name].get('one_coach_speed')
+
+        station_markers.append({
+            "station": station_name,
+            "distance": round(halt_dist_km, 2),
+            "sample_index": closest_idx,
+            "platform_entry_speed": round(entry_speed, 1) if entry_speed is not None else None,
+            "mid_platform_speed": round(mid_platform_speed, 1) if mid_platform_speed is not None else None,
+            "one_coach_speed": round(one_coach_speed, 1) if one_coach_speed is not None else None
+        })
+        if first_halt_index is None or closest_idx < first_halt_index:
+            first_halt_index = closest_idx
+
+    # Ensure the chart shows the starting station even if no halt was detected there
+    start_station = run_data.get("from_station") or (ordered_stations[0] if ordered_stations else None)
+    if start_station and all(marker["station"] != start_station for marker in station_markers):
+        first_sample = samples[0] if samples else None
+        start_distance = first_sample["cumulative_distance"] if first_sample else 0.0
+        station_markers.insert(0, {
+            "station": start_station,
+            "distance": round(float(start_distance), 2),
+            "sample_index": 0,
+            "platform_entry_speed": 0.0,  # starting point speed is effectively 0 km/h
+            "mid_platform_speed": None,
+            "one_coach_speed": None
+        })
+
+    if first_halt_index is None:
+        # First stationary sample after the first with zero distance
+        at_rest = (chart_columns.speed == 0) & (
+            (chart_columns.distance == 0) | (chart_columns.cumulative_distance == 0)
+        )
+        candidates = np.flatnonzero(at_rest[1:])
+        if len(candidates):
+            first_halt_index = int(candidates[0]) + 1
+
+    return {
+        "samples": samples,
+        "run_id": run_data["run_id"],
+        "metadata": {
+            "staff_id": run_data.get("staff_id"),
+            "from_station": run_data.get("from_station"),
+            "to_station": run_data.get("to_station"),
+            "train_number": run_data.get("train_number"),
+            "train_type": run_data.get("train_type"),
+            "date_of_working": run_data.get("date_of_working"),
+            "analysed_by": run_data.get("analysed_by"),
+            "unit_number": run_data.get("unit_number"),
+            "notes": run_data.get("notes"),
+        },
+        "halting_stations": halting_stations,
+        "station_markers": station_markers,
+        "brake_tests": brake_tests,
+        "first_halt_index": first_halt_index,
+        "platform_entry_data": platform_entry_data,
+        "violations": run_data.get("violations", []),
+        "violation_count": run_data.get("violation_count", 0),
+        "overspeed_events": run_data.get("overspeed_events", []),
+        "overspeed_summary": run_data.get("overspeed_summary", {}),
+    }
+
+
+def _default(value: Any) -> Any:
+    """numpy scalars and arrays for the JSON encoder."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _nan_to_none(value: Any) -> Any:
+    if isinstance(value, float):
+        return None if value != value or value in (float("inf"), float("-inf")) else value
+    if isinstance(value, dict):
+        return {k: _nan_to_none(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_nan_to_none(v) for v in value]
+    return value
+
+
+def _json_bytes(payload: Dict[str, Any]) -> bytes:
+    """Compact JSON. NaN/inf become null, as they would have to for any JSON client."""
+    return json.dumps(_nan_to_none(payload), default=_default, separators=(",", ":")).encode()
+
+
+def encode_payload(payload: Dict[str, Any]) -> bytes:
+    """Gzipped JSON (see _json_bytes)."""
+    # mtime=0: identical payloads give identical bytes, hence identical ETags
+    return gzip.compress(_json_bytes(payload), compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def decode_payload(data: bytes) -> Dict[str, Any]:
+    return json.loads(gzip.decompress(data))
+
+
+def to_columnar(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The payload with ``samples`` (one dict per point, keys repeated on every
+    point) replaced by ``series``: parallel arrays, psr null where unknown.
+    The always-empty ``station`` field is dropped.
+    """
+    samples = payload.get("samples") or []
+    columnar = {k: v for k, v in payload.items() if k != "samples"}
+    columnar["format"] = "columnar"
+    columnar["series"] = {
+        key: [sample[key] for sample in samples]
+        for key in ("timestamp", "distance", "cumulative_distance", "speed")
+    }
+    columnar["series"]["psr"] = [sample.get("psr") for sample in samples]
+    return columnar
+
+
+def encode_arrow(frame: pl.DataFrame, payload: Dict[str, Any]) -> bytes:
+    """
+    The stored frame as an Arrow IPC stream, written straight from the frame's
+    buffers (ARROW_COMPRESSION compressed). Everything in the payload but the
+    samples travels as JSON in the schema metadata, key ``spm.chart_payload``.
+    """
+    if not HAVE_PYARROW:
+        raise RuntimeError("format=arrow needs pyarrow")
+    rest = {k: v for k, v in payload.items() if k != "samples"}
+    table = frame.to_arrow()
+    table = table.replace_schema_metadata({"spm.chart_payload": _json_bytes(rest)})
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def payload_etag(data: bytes) -> str:
+    return '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+
+
+def _tag(fmt: str = "rows") -> str:
+    return f"{get_reference_data().version}.{fmt}"
+
+
+def store_chart_payload(
+    run_id: str, meta: Dict[str, Any], df: pl.DataFrame, generation: Optional[int] = None
+) -> Optional[bytes]:
+    """
+    Build, encode and store a run's rows payload; the other formats are
+    derived from it on first request. Returns the stored bytes, or None when
+    the run was dropped or its meta changed meanwhile (nothing is stored then,
+    so a stale payload cannot outlive update_meta).
+    """
+    if generation is None:
+        generation = run_store.meta_generation(run_id)
+        if generation is None:
+            return None
+    with timing.span("chart_payload.build", rows=len(df)):
+        payload = build_chart_payload(dict(meta, frame=df))
+    with timing.span("chart_payload.encode"):
+        data = encode_payload(payload)
+    if not run_store.put_chart_payload(run_id, _tag(), data, generation):
+        return None
+    return data
+
+
+def get_chart_payload(run_id: str, fmt: str = "rows") -> Tuple[bytes, str]:
+    """
+    (body, ETag) for a run in one of FORMATS, building and storing it if it is
+    not stored yet. The body is gzipped for GZIPPED_FORMATS. Raises KeyError
+    when the run is gone, ValueError for an unknown format and RuntimeError
+    for arrow without pyarrow.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "arrow" and not HAVE_PYARROW:
+        raise RuntimeError("format=arrow needs pyarrow")
+    tag = _tag(fmt)
+    data = run_store.get_chart_payload(run_id, tag)
+    metrics.CHART_PAYLOAD.inc(result="miss" if data is None else "hit")
+    if data is None:
+        generation = run_store.meta_generation(run_id)
+        data = _build(run_id, fmt)
+        if generation is not None:
+            run_store.put_chart_payload(run_id, tag, data, generation)
+    return data, payload_etag(data)
+
+
+def _build(run_id: str, fmt: str) -> bytes:
+    """A format's body: rows from the frame and meta, the others from rows."""
+    if fmt == "rows":
+        with timing.span("run_store.load_run_frame"):
+            run_data = run_store.load_run_frame(run_id)  # KeyError when expired
+        with timing.span("chart_payload.build", rows=len(run_data["frame"])):
+            payload = build_chart_payload(run_data)
+        with timing.span("chart_payload.encode"):
+            return encode_payload(payload)
+
+    payload = decode_payload(get_chart_payload(run_id)[0])
+    if fmt == "columnar":
+        with timing.span("chart_payload.encode"):
+            return encode_payload(to_columnar(payload))
+    with timing.span("run_store.get_frame"):
+        frame = run_store.get_frame(run_id)
+    with timing.span("chart_payload.encode"):
+        return encode_arrow(frame, payload)
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import csv
+import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -300,33 +303,41 @@ class CorridorManager:
                 stations = [station.strip().upper() for station in halts.split(",") if station.strip()]
                 self.fast_halt_map[key] = stations
 
-    def load_train_corridor_map(self, csv_name: str = "train_corridor_map.csv") -> None:
-        """Load train corridor map with From/To stations for each train."""
-        path = self.data_root / csv_name
-        if not path.exists():
-            print(f"[WARNING] {csv_name} not found at {path}")
-            return
-        with path.open(newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                train_code = row.get("TrainCode", "").strip()
-                train_name = row.get("Train", "").strip()
-                if not train_code:
-                    continue
-                # Store by both train code and train name for flexible lookup
-                entry = {
-                    "train": train_name,
-                    "train_code": train_code,
-                    "from_station": row.get("FromExpected", "").strip().upper(),
-                    "to_station": row.get("ToExpected", "").strip().upper(),
-                    "direction": row.get("Direction", "").strip().upper(),
-                    "route": row.get("Route", "").strip().upper(),
-                    "type": int(row.get("Type", 0) or 0),  # 0=Single, 1=Slow, 2=Fast
-                }
-                self.train_corridor_map[train_code] = entry
-                if train_name:
-                    self.train_corridor_map[train_name.upper()] = entry
-        print(f"✓ Loaded {len(self.train_corridor_map)} train corridor entries")
+    def load_train_corridor_map(
+        self, csv_name: str = "train_corridor_map.csv", rows: Optional[Iterable[Mapping[str, str]]] = None
+    ) -> None:
+        """
+        Load train corridor map with From/To stations for each train.
+
+        ``rows`` are the CSV's rows already read (reference_data passes the copy
+        it owns); without them the file is read here.
+        """
+        if rows is None:
+            path = self.data_root / csv_name
+            if not path.exists():
+                logger.warning("%s not found at %s", csv_name, path)
+                return
+            with path.open(newline="") as f:
+                rows = list(csv.DictReader(f))
+        for row in rows:
+            train_code = row.get("TrainCode", "").strip()
+            train_name = row.get("Train", "").strip()
+            if not train_code:
+                continue
+            # Store by both train code and train name for flexible lookup
+            entry = {
+                "train": train_name,
+                "train_code": train_code,
+                "from_station": row.get("FromExpected", "").strip().upper(),
+                "to_station": row.get("ToExpected", "").strip().upper(),
+                "direction": row.get("Direction", "").strip().upper(),
+                "route": row.get("Route", "").strip().upper(),
+                "type": int(row.get("Type", 0) or 0),  # 0=Single, 1=Slow, 2=Fast
+            }
+            self.train_corridor_map[train_code] = entry
+            if train_name:
+                self.train_corridor_map[train_name.upper()] = entry
+        logger.info("Loaded %s train corridor entries", len(self.train_corridor_map))
 
     def lookup_train(self, train_number: str) -> Optional[Dict]:
         """Lookup train info by train number or code. Returns From/To/Direction/Type."""
@@ -2,15 +2,21 @@
 Database Connection Configuration
 Handles MySQL connection pooling and configuration
 """
+import logging
 import os
+import time
 from typing import Optional
 import mysql.connector
 from mysql.connector import pooling
 from dotenv import load_dotenv
 
+import metrics
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 load_dotenv()
-print("ENV MYSQL_HOST =", os.getenv("MYSQL_HOST"))
+logger.debug("ENV MYSQL_HOST = %s", os.getenv("MYSQL_HOST"))
 # Database configuration from environment
 DB_CONFIG = {
     "host": os.getenv("MYSQL_HOST", "127.0.0.1"),
@@ -41,10 +47,10 @@ def init_connection_pool(pool_size: int = 5) -> bool:
             pool_size=pool_size,
             **DB_CONFIG
         )
-        print(f"[DB] ✓ Connection pool initialized ({pool_size} connections)")
+        logger.info("Connection pool initialized (%s connections)", pool_size)
         return True
     except mysql.connector.Error as e:
-        print(f"[DB] ✗ Failed to create connection pool: {e}")
+        logger.error("Failed to create connection pool: %s", e)
         return False
 
 
@@ -52,14 +58,23 @@ def get_db_connection():
     """
     Get a database connection from the pool (or create new if pool not initialized)
 
+    Checkout time and failures go to /metrics.
+
     Returns:
         MySQL connection object
     """
-    if connection_pool:
-        return connection_pool.get_connection()
-    else:
-        # Fallback: direct connection (for testing or desktop app)
-        return mysql.connector.connect(**DB_CONFIG)
+    started = time.perf_counter()
+    try:
+        if connection_pool:
+            conn = connection_pool.get_connection()
+        else:
+            # Fallback: direct connection (for testing or desktop app)
+            conn = mysql.connector.connect(**DB_CONFIG)
+    except Exception as exc:
+        metrics.DB_CHECKOUT_FAILURES.inc(error=type(exc).__name__)
+        raise
+    metrics.DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+    return conn
 
 
 def test_connection() -> bool:
@@ -78,17 +93,16 @@ def test_connection() -> bool:
         conn.close()
 
         if result and result[0] == 1:
-            print("[DB] ✓ Connection test successful!")
+            logger.info("Connection test successful!")
             return True
         else:
-            print("[DB] ✗ Connection test returned unexpected result")
+            logger.error("Connection test returned unexpected result")
             return False
     except mysql.connector.Error as e:
-        print(f"[DB] ✗ Connection test failed: {e}")
-        print("[DB] Make sure SSH tunnel is running: ./start-ssh-tunnel.sh")
+        logger.error("Connection test failed: %s (make sure SSH tunnel is running: ./start-ssh-tunnel.sh)", e)
         return False
     except Exception as e:
-        print(f"[DB] ✗ Unexpected error during connection test: {e}")
+        logger.error("Unexpected error during connection test: %s", e)
         return False
 
 
@@ -0,0 +1,218 @@
+"""
+Largest-Triangle-Three-Buckets downsampling for the speed charts.
+
+A run is 10-30k samples; the speed chart is about 1000 px wide. LTTB keeps the
+points that carry the line's shape (per bucket, the one forming the largest
+triangle with the previous pick and the next bucket's mean), so a 1500-point
+line is visually the full one. The charts plot against sample index, so that
+is x here too; station markers and BFT spans stay positioned by sample_index.
+
+LTTB alone can still step over a feature the report is about, so
+``feature_indices`` lists the samples that must survive exactly — overspeed
+start/peak/end, every BFT index, both ends of each halt, station markers,
+violations and both sides of every PSR step — and ``downsample_indices``
+unions them into the picks.
+
+Used by GET /runs/{run_id}/series (``series_window``, a distance window of the
+stored frame, for zooming) and by pdf_report.render_speed_profile.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import polars as pl
+
+from report_model import nearest_sample_indices
+from spm_columns import SpmColumns
+
+DEFAULT_MAX_POINTS = 1500
+
+# normalise_distances' main-chart threshold: a run reaching past it is in metres.
+METRES_THRESHOLD = 200.0
+
+# Indices on a brake test dict (chart_payload.build_chart_payload) worth keeping.
+BFT_INDEX_KEYS = (
+    "start_index", "end_index", "max_speed_index", "lowest_speed_index",
+    "recovery_index", "braking_start_index",
+)
+
+
+def lttb_indices(y: Sequence[float], max_points: int) -> np.ndarray:
+    """Sample indices LTTB picks from ``y`` (x = index); always includes both ends."""
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    n = len(y)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])
+
+    buckets = max_points - 2
+    # Bucket i covers edges[i]:edges[i+1] of the n-2 interior points; the point
+    # after the last bucket is the final sample.
+    edges = (np.arange(buckets + 1) * (n - 2) / buckets).astype(np.int64) + 1
+    next_edges = np.append(edges[1:], n)
+    x = np.arange(n, dtype=np.float64)
+    avg_x = (next_edges[:-1] + next_edges[1:] - 1) / 2.0
+    avg_y = np.add.reduceat(y, next_edges[:-1]) / np.diff(next_edges)
+
+    picks = np.empty(max_points, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for i, (lo, hi) in enumerate(zip(edges[:-1].tolist(), edges[1:].tolist())):
+        ya = y[a]
+        area = np.abs((a - avg_x[i]) * (y[lo:hi] - ya) - (a - x[lo:hi]) * (avg_y[i] - ya))
+        a = lo + int(area.argmax())
+        picks[i + 1] = a
+    return picks
+
+
+def _psr_array(psr: Sequence[Any], n: int) -> np.ndarray:
+    values = np.full(n, np.nan)
+    for i, v in enumerate(psr[:n]):
+        if isinstance(v, (list, tuple)):
+            v = next((x for x in v if x is not None), None)
+        if v is not None:
+            values[i] = float(v)
+    return values
+
+
+def feature_indices(
+    speed: Sequence[float],
+    psr: Optional[Sequence[Any]] = None,
+    *,
+    brake_tests: Iterable[Dict[str, Any]] = (),
+    overspeed_events: Iterable[Dict[str, Any]] = (),
+    station_markers: Iterable[Dict[str, Any]] = (),
+    violations: Iterable[Dict[str, Any]] = (),
+) -> np.ndarray:
+    """Sorted, unique sample indices a downsampled chart must not drop."""
+    speed = np.nan_to_num(np.asarray(speed, dtype=np.float64))
+    n = len(speed)
+    keep: List[int] = []
+
+    for event in overspeed_events or []:
+        start, end = event.get("start_index"), event.get("end_index")
+        if start is None or end is None or start >= n or end < 0:
+            continue
+        start, end = max(start, 0), min(end, n - 1)
+        keep += [start, end, start + int(np.argmax(speed[start:end + 1]))]
+
+    for test in brake_tests or []:
+        keep += [test[key] for key in BFT_INDEX_KEYS if test.get(key) is not None]
+
+    keep += [m["sample_index"] for m in station_markers or [] if m.get("sample_index") is not None]
+    keep += [v["index"] for v in violations or [] if v.get("index") is not None]
+
+    # Halts: first and last sample of every run at zero speed.
+    stopped = np.concatenate(([False], speed == 0, [False])).astype(np.int8)
+    edges = np.diff(stopped)
+    keep += np.flatnonzero(edges == 1).tolist()
+    keep += (np.flatnonzero(edges == -1) - 1).tolist()
+
+    # PSR steps: the last sample before a change and the first after it, so the
+    # band keeps its vertical edges.
+    if psr is not None and n > 1:
+        values = _psr_array(psr, n)
+        same = (values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))
+        steps = np.flatnonzero(~same)
+        keep += steps.tolist() + (steps + 1).tolist()
+
+    keep_arr = np.asarray(keep, dtype=np.int64)
+    return np.unique(keep_arr[(keep_arr >= 0) & (keep_arr < n)])
+
+
+def downsample_indices(
+    speed: Sequence[float], max_points: int, keep: Sequence[int] = ()
+) -> np.ndarray:
+    """
+    LTTB picks plus ``keep``, sorted. The LTTB budget is what ``keep`` leaves of
+    ``max_points``; when ``keep`` alone is larger, every kept index is still
+    returned, so the result can exceed ``max_points``.
+    """
+    n = len(speed)
+    if n <= max_points:
+        return np.arange(n)
+    keep = np.unique(np.concatenate((np.asarray(keep, dtype=np.int64), [0, n - 1])))
+    budget = max_points - len(keep)
+    if budget < 3:
+        return keep
+    return np.union1d(keep, lttb_indices(speed, budget + 2))
+
+
+def series_window(
+    frame: pl.DataFrame,
+    meta: Dict[str, Any],
+    from_km: Optional[float] = None,
+    to_km: Optional[float] = None,
+    max_points: int = DEFAULT_MAX_POINTS,
+) -> Dict[str, Any]:
+    """
+    Downsampled speed and PSR for the samples of a stored run (its run_store
+    frame and meta) whose cumulative distance lies in [from_km, to_km] (either
+    end open when None).
+
+    Distances are sniffed for metres over the whole run with the main chart's
+    200 threshold, so a window does not change units. Cumulative distance only
+    grows, so the window is one searchsorted slice of the frame, and only that
+    slice is converted. The features kept come from the meta: overspeed events,
+    violations and brake tests as analysed at upload, and the station markers'
+    samples. Raises ValueError when from_km > to_km.
+    """
+    if from_km is not None and to_km is not None and from_km > to_km:
+        raise ValueError("from_km must not be greater than to_km")
+
+    # Rounded as the chart payload rounds them, so the window matches the chart
+    cum = np.round(frame["cumulative_distance"].cast(pl.Float64).fill_null(0.0).to_numpy(), 2)
+    km = cum / 1000.0 if len(cum) and cum.max() > METRES_THRESHOLD else cum
+    lo = int(np.searchsorted(km, from_km, side="left")) if from_km is not None else 0
+    hi = int(np.searchsorted(km, to_km, side="right")) if to_km is not None else len(km)
+    hi = max(hi, lo)
+
+    series: Dict[str, List[Any]] = {"index": [], "timestamp": [], "cumulative_km": [], "speed": [], "psr": []}
+    result = {
+        "run_id": meta.get("run_id"),
+        "from_km": from_km,
+        "to_km": to_km,
+        "max_points": max_points,
+        "total_points": hi - lo,
+        "returned_points": 0,
+        "series": series,
+    }
+    if hi == lo:
+        return result
+
+    window = SpmColumns.from_frame(frame.slice(lo, hi - lo))
+    speed = window.speed
+    psr = window.psr if window.psr is not None else [None] * len(window)
+
+    def shifted(items: Iterable[Dict[str, Any]], keys: Sequence[str]) -> List[Dict[str, Any]]:
+        out = []
+        for item in items or []:
+            moved = {k: item[k] - lo for k in keys if item.get(k) is not None}
+            if moved and min(moved.values()) < hi - lo and max(moved.values()) >= 0:
+                out.append(moved)
+        return out
+
+    halts = meta.get("halting_stations") or {}
+    markers = [{"sample_index": i} for i in nearest_sample_indices(cum, list(halts.values()))]
+    keep = feature_indices(
+        speed, psr,
+        brake_tests=shifted(meta.get("brake_tests"), BFT_INDEX_KEYS),
+        overspeed_events=[e for e in shifted(meta.get("overspeed_events"), ("start_index", "end_index"))
+                          if "start_index" in e and "end_index" in e],
+        station_markers=shifted(markers, ("sample_index",)),
+        violations=shifted(meta.get("violations"), ("index",)),
+    )
+    picks = downsample_indices(speed, max_points, keep)
+
+    psr_values = _psr_array(psr, len(psr))
+    for i in picks.tolist():
+        series["index"].append(lo + i)
+        series["timestamp"].append(f"{window.time[i]}" if window.time[i] else f"T+{lo + i}s")
+        series["cumulative_km"].append(round(float(km[lo + i]), 4))
+        series["speed"].append(float(speed[i]))
+        series["psr"].append(None if np.isnan(psr_values[i]) else float(psr_values[i]))
+    result["returned_points"] = len(picks)
+    return result
@@ -5,9 +5,15 @@ Detects where a train stopped (speed = 0) and matches those positions
 with known stations from corridor data.
 """
 
+import logging
 from typing import List, Dict, Tuple, Optional, TYPE_CHECKING
+import numpy as np
 import polars as pl
 
+from spm_columns import SpmColumns
+
+logger = logging.getLogger(__name__)
+
 if TYPE_CHECKING:
     from corridor_loader import CorridorData
 
@@ -39,13 +45,18 @@ class HaltDetector:
         This handles cases where SPM instruments skip recording during halts.
 
         Args:
-            spm_data: Polars DataFrame with speed and distance data
+            spm_data: Polars DataFrame with speed and distance data, or SpmColumns
+                (the column names are then ignored)
             speed_col: Name of speed column
             cum_dist_col: Name of cumulative distance column
 
         Returns:
             List of halt dictionaries with cumulative_distance
         """
+        if isinstance(spm_data, SpmColumns):
+            halt_distances = np.unique(spm_data.cumulative_distance[spm_data.speed == 0])
+            return [{'cumulative_distance': float(d)} for d in halt_distances]
+
         if speed_col not in spm_data.columns or cum_dist_col not in spm_data.columns:
             return []
 
@@ -138,10 +149,13 @@ class HaltDetector:
                 })
 
         # Debug: Log unmatched halts
-        if unmatched_halts:
-            print(f"[DEBUG HALT] {len(unmatched_halts)} unmatched halts (tolerance={max_distance_tolerance}m):")
+        if unmatched_halts and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s unmatched halts (tolerance=%sm):", len(unmatched_halts), max_distance_tolerance)
             for um in unmatched_halts[:5]:  # Show first 5
-                print(f"  Halt at {um['halt_dist']:.0f}m → nearest: {um['nearest_station']} at {um['nearest_official']:.0f}m (Δ={um['distance_to_nearest']:.0f}m)")
+                logger.debug(
+                    "  Halt at %.0fm → nearest: %s at %.0fm (Δ=%.0fm)",
+                    um['halt_dist'], um['nearest_station'], um['nearest_official'], um['distance_to_nearest'],
+                )
 
         return halting_station_map
 
@@ -197,14 +211,14 @@ class HaltDetector:
         # Get corridor stations and all records (for ISDs)
         all_stations = corridor_data.stations
         if not corridor_data.records:
-            print("[DEBUG ISD] No corridor records found")
+            logger.debug("No corridor records found")
             return {}
 
         # Keep all records for best-match ISD lookup
         all_records = corridor_data.records
         # Use first record for cumulative distances (station positions)
         corridor_cumulative = all_records[0].cumulative_distances
-        print(f"[DEBUG ISD] Loaded {len(all_records)} corridor records for ISD matching")
+        logger.debug("Loaded %s corridor records for ISD matching", len(all_records))
 
         # Setup slow corridor data for semi-fast trains
         slow_all_stations = None
@@ -214,8 +228,8 @@ class HaltDetector:
             slow_all_stations = slow_corridor_data.stations
             slow_all_records = slow_corridor_data.records
             change_point = semi_fast_info['change_point'].upper()
-            print(f"[DEBUG ISD] SEMI-FAST: Using slow corridor after {change_point}")
-            print(f"[DEBUG ISD] SEMI-FAST: Slow corridor has {len(slow_all_stations)} stations, {len(slow_all_records)} records")
+            logger.debug("SEMI-FAST: Using slow corridor after %s", change_point)
+            logger.debug("SEMI-FAST: Slow corridor has %s stations, %s records", len(slow_all_stations), len(slow_all_records))
 
         # Calculate ISDs from SPM halts
         halt_cumulative = [h['cumulative_distance'] for h in halts]
@@ -224,14 +238,14 @@ class HaltDetector:
             isd = halt_cumulative[i] - halt_cumulative[i-1]
             halt_isds.append(isd)
 
-        print(f"[DEBUG ISD] Detected {len(halts)} halts with {len(halt_isds)} ISDs")
-        print(f"[DEBUG ISD] SPM ISDs (first 5): {[f'{isd:.0f}m' for isd in halt_isds[:5]]}")
+        logger.debug("Detected %s halts with %s ISDs", len(halts), len(halt_isds))
+        logger.debug("SPM ISDs (first 5): %s", [f'{isd:.0f}m' for isd in halt_isds[:5]])
 
         # Determine starting station
         if from_station:
             start_station = from_station.upper()
             if start_station not in all_stations:
-                print(f"[DEBUG ISD] from_station '{start_station}' not in corridor, using first halt as unknown start")
+                logger.debug("from_station '%s' not in corridor, using first halt as unknown start", start_station)
                 start_station = None
         else:
             start_station = None
@@ -241,19 +255,19 @@ class HaltDetector:
             try:
                 start_idx = all_stations.index(start_station)
             except ValueError:
-                print(f"[DEBUG ISD] Station {start_station} not found in corridor")
+                logger.debug("Station %s not found in corridor", start_station)
                 return {}
         else:
             start_idx = 0
             start_station = all_stations[0]
-            print(f"[DEBUG ISD] No from_station specified, assuming first station: {start_station}")
+            logger.debug("No from_station specified, assuming first station: %s", start_station)
 
         if to_station:
             end_station = to_station.upper()
             try:
                 end_idx = all_stations.index(end_station)
             except ValueError:
-                print(f"[DEBUG ISD] to_station '{end_station}' not found in corridor")
+                logger.debug("to_station '%s' not found in corridor", end_station)
                 end_idx = len(all_stations) - 1
         else:
             end_idx = len(all_stations) - 1
@@ -288,8 +302,8 @@ class HaltDetector:
                     else:
                         branch_stations = list(reversed(all_stations[first_nom_idx+1:start_idx+1]))
                     ordered_stations = branch_stations + ordered_stations
-                    print(f"[DEBUG ISD] FAST TRAIN: Prepended {len(branch_stations)} branch stations")
-                    print(f"[DEBUG ISD] Branch (start): {', '.join(branch_stations)}")
+                    logger.debug("FAST TRAIN: Prepended %s branch stations", len(branch_stations))
+                    logger.debug("Branch (start): %s", ', '.join(branch_stations))
 
             # Check if to_station is in nominated halts
             # If not, append corridor stations from last nominated halt to to_station
@@ -306,11 +320,11 @@ class HaltDetector:
                     else:
                         branch_stations_end = list(reversed(all_stations[end_idx_actual:last_nom_idx]))
                     ordered_stations = ordered_stations + branch_stations_end
-                    print(f"[DEBUG ISD] FAST TRAIN: Appended {len(branch_stations_end)} branch stations")
-                    print(f"[DEBUG ISD] Branch (end): {', '.join(branch_stations_end)}")
+                    logger.debug("FAST TRAIN: Appended %s branch stations", len(branch_stations_end))
+                    logger.debug("Branch (end): %s", ', '.join(branch_stations_end))
 
-            print(f"[DEBUG ISD] FAST TRAIN: Using {len(ordered_stations)} total halts")
-            print(f"[DEBUG ISD] Halts: {', '.join(ordered_stations)}")
+            logger.debug("FAST TRAIN: Using %s total halts", len(ordered_stations))
+            logger.debug("Halts: %s", ', '.join(ordered_stations))
         else:
             # LOCAL trains: use all stations in range
             if direction == "forward":
@@ -318,7 +332,7 @@ class HaltDetector:
             else:
                 ordered_stations = list(reversed(all_stations[end_idx:start_idx + 1]))
 
-        print(f"[DEBUG ISD] Route: {ordered_stations[0]} → {ordered_stations[-1]} ({len(ordered_stations)} stations, {direction})")
+        logger.debug("Route: %s → %s (%s stations, %s)", ordered_stations[0], ordered_stations[-1], len(ordered_stations), direction)
 
         # Build station_km_map from corridor cumulative distances
         station_km_map = {}
@@ -345,15 +359,15 @@ class HaltDetector:
             distance_tolerance = max(expected_distance * 0.2, 3000.0)
             distance_diff = abs(spm_total_distance - expected_distance)
 
-            print(f"[DEBUG ISD] Corridor distance {from_station}→{to_station}: {expected_distance:.0f}m")
-            print(f"[DEBUG ISD] SPM total distance: {spm_total_distance:.0f}m")
-            print(f"[DEBUG ISD] Difference: {distance_diff:.0f}m (tolerance: {distance_tolerance:.0f}m)")
+            logger.debug("Corridor distance %s→%s: %.0fm", from_station, to_station, expected_distance)
+            logger.debug("SPM total distance: %.0fm", spm_total_distance)
+            logger.debug("Difference: %.0fm (tolerance: %.0fm)", distance_diff, distance_tolerance)
 
             if distance_diff <= distance_tolerance:
                 # SPM data matches corridor distance - recording starts AT from_station
                 matched_stations[start_station] = halt_cumulative[0]
                 start_halt_idx = 0
-                print(f"[DEBUG ISD] Match 1/{len(halts)}: First halt at {halt_cumulative[0]:.0f}m → {start_station} (recording starts here)")
+                logger.debug("Match 1/%s: First halt at %.0fm → %s (recording starts here)", len(halts), halt_cumulative[0], start_station)
             else:
                 # SPM data is longer - recording starts BEFORE from_station
                 # Find halt near from_station's corridor position
@@ -370,15 +384,15 @@ class HaltDetector:
                 if best_diff <= 250:
                     matched_stations[start_station] = halt_cumulative[best_halt_idx]
                     start_halt_idx = best_halt_idx
-                    print(f"[DEBUG ISD] Match 1/{len(halts)}: Halt at {halt_cumulative[best_halt_idx]:.0f}m → {start_station} (found in middle, Δ={best_diff:.0f}m)")
+                    logger.debug("Match 1/%s: Halt at %.0fm → %s (found in middle, Δ=%.0fm)", len(halts), halt_cumulative[best_halt_idx], start_station, best_diff)
                 else:
-                    print(f"[DEBUG ISD] Warning: from_station {start_station} not found within 250m of any halt (closest: {best_diff:.0f}m)")
+                    logger.warning("from_station %s not found within 250m of any halt (closest: %.0fm)", start_station, best_diff)
                     return {}
         else:
             # No from/to provided or not in corridor - first halt matches first station
             matched_stations[start_station] = halt_cumulative[0]
             start_halt_idx = 0
-            print(f"[DEBUG ISD] Match 1/{len(halts)}: First halt at {halt_cumulative[0]:.0f}m → {start_station} (auto-detected)")
+            logger.debug("Match 1/%s: First halt at %.0fm → %s (auto-detected)", len(halts), halt_cumulative[0], start_station)
 
         # If only one halt or we're at the last halt, return early
         if len(halts) == 1 or start_halt_idx >= len(halt_cumulative) - 1:
@@ -573,7 +587,10 @@ class HaltDetector:
 
                     # If this halt has smaller ISD diff, it's a better match
                     if forward_diff < best_match['isd_diff'] and forward_diff <= max_isd_diff:
-                        print(f"[DEBUG ISD] Forward-look: Better match at {forward_position:.0f}m (Δ={forward_diff:.0f}m) vs {best_match['halt_position']:.0f}m (Δ={best_match['isd_diff']:.0f}m)")
+                        logger.debug(
+                            "Forward-look: Better match at %.0fm (Δ=%.0fm) vs %.0fm (Δ=%.0fm)",
+                            forward_position, forward_diff, best_match['halt_position'], best_match['isd_diff'],
+                        )
                         best_match['halt_idx'] = forward_halt_idx
                         best_match['isd_diff'] = forward_diff
                         best_match['accumulated_isd'] = forward_accumulated
@@ -585,11 +602,16 @@ class HaltDetector:
                 actual_cd = best_match['halt_position']
                 matched_stations[best_match['station']] = actual_cd
 
-                print(f"[DEBUG ISD] Match {len(matched_stations)}/{len(halts)}: Halt at {actual_cd:.0f}m → {best_match['station']} (ISD Δ={best_match['isd_diff']:.0f}m, expected={best_match['expected_isd']:.0f}m, actual={best_match['accumulated_isd']:.0f}m, record={best_match['record_idx'] + 1})")
+                logger.debug(
+                    "Match %s/%s: Halt at %.0fm → %s (ISD Δ=%.0fm, expected=%.0fm, actual=%.0fm, record=%s)",
+                    len(matched_stations), len(halts), actual_cd, best_match['station'],
+                    best_match['isd_diff'], best_match['expected_isd'], best_match['accumulated_isd'],
+                    best_match['record_idx'] + 1,
+                )
 
                 if best_match['station_idx'] > current_station_idx + 1:
                     skipped = ordered_stations[current_station_idx + 1:best_match['station_idx']]
-                    print(f"[DEBUG ISD]   (Skipped stations: {', '.join(skipped)})")
+                    logger.debug("  (Skipped stations: %s)", ', '.join(skipped))
 
                 # Update state - skip to halt after the matched one
                 current_station_idx = best_match['station_idx']
@@ -598,18 +620,18 @@ class HaltDetector:
             else:
                 # No match found - log and move to next halt
                 halt_isd = halt_cumulative[halt_idx] - halt_cumulative[halt_idx - 1]
-                print(f"[DEBUG ISD] Halt {halt_idx + 1}/{len(halts)} at {halt_cumulative[halt_idx]:.0f}m: No match (ISD={halt_isd:.0f}m, accumulated={accumulated_isd:.0f}m)")
+                logger.debug("Halt %s/%s at %.0fm: No match (ISD=%.0fm, accumulated=%.0fm)", halt_idx + 1, len(halts), halt_cumulative[halt_idx], halt_isd, accumulated_isd)
 
-                if candidates_tried:
-                    print(f"[DEBUG ISD]   Tried candidates (best match from {len(all_records)} records):")
+                if candidates_tried and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Tried candidates (best match from %s records):", len(all_records))
                     for c in candidates_tried:
                         rec_info = f", record={c['record_idx'] + 1}" if c.get('record_idx') is not None else ""
-                        print(f"[DEBUG ISD]     - {c['station']}: expected={c['expected_isd']:.0f}m, diff={c['isd_diff']:.0f}m (max allowed={max_isd_diff:.0f}m{rec_info})")
+                        logger.debug("  - %s: expected=%.0fm, diff=%.0fm (max allowed=%.0fm%s)", c['station'], c['expected_isd'], c['isd_diff'], max_isd_diff, rec_info)
 
                 halt_idx += 1
 
-        print(f"[DEBUG ISD] ✓ Matched {len(matched_stations)}/{len(halts)} halts to stations")
-        print(f"[DEBUG ISD] Stations matched: {list(matched_stations.keys())}")
+        logger.debug("Matched %s/%s halts to stations", len(matched_stations), len(halts))
+        logger.debug("Stations matched: %s", list(matched_stations.keys()))
 
         # Return both matched stations and ordered station list (for platform entry calculations)
         return {
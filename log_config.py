@@ -0,0 +1,148 @@
+"""
+Logging for the API and the analysis workers.
+
+The analysis modules used to ``print`` dozens of ``[DEBUG]`` lines per upload,
+some of them building large strings (the ordered station list, the halting
+map, station KM slices, PSR samples) on every run, and each one a synchronous
+write to stdout that pm2 then stored. They now log through per-module loggers
+(``logging.getLogger(__name__)``) with %-style arguments, so a DEBUG line that
+is switched off costs a level check; the few payloads that take work to build
+are behind ``logger.isEnabledFor(logging.DEBUG)``.
+
+``setup_logging`` puts a ``QueueHandler`` on the root logger: a request thread
+only formats the message and enqueues the record, and a ``QueueListener``
+thread does the writing to stdout. Each record carries the ``run_id`` bound
+in its context (``bind_run_id``), so every line of one upload — including the
+analysis pool's, see ``run_with_run_id`` — can be picked out of the log.
+
+``SPM_LOG_LEVEL`` (default INFO) and ``SPM_LOG_FORMAT`` (``json``, the
+default: one object per line with ts, level, logger, run_id, msg and exc; or
+``text``) configure it.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, TextIO, TypeVar
+
+T = TypeVar("T")
+
+LOG_LEVEL = os.getenv("SPM_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("SPM_LOG_FORMAT", "json").lower()
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(run_id)s] %(message)s"
+
+# Libraries that log every multipart chunk or HTTP call at DEBUG; kept at
+# WARNING so SPM_LOG_LEVEL=DEBUG shows this app's lines.
+QUIET_LOGGERS = ("python_multipart", "multipart", "httpx", "httpcore", "asyncio", "matplotlib", "PIL", "urllib3")
+
+RUN_ID: ContextVar[Optional[str]] = ContextVar("spm_run_id", default=None)
+
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_run_id(run_id: Optional[str]) -> None:
+    """Tag the log records of the current context (a request, a worker call) with ``run_id``."""
+    RUN_ID.set(run_id)
+
+
+def run_with_run_id(run_id: Optional[str], fn: Callable[..., T], *args: Any) -> T:
+    """
+    ``fn(*args)`` with ``run_id`` bound. A context does not cross into a
+    ProcessPoolExecutor worker, so main submits this instead of ``fn``.
+    """
+    bind_run_id(run_id)
+    try:
+        return fn(*args)
+    finally:
+        bind_run_id(None)
+
+
+class RunIdFilter(logging.Filter):
+    """Copy the bound run_id onto each record, in the thread that logged it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = RUN_ID.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, run_id, msg and, if any, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Merge the message args and render the traceback before enqueueing (the
+    args may not survive to the listener thread), but leave the layout to the
+    listener's formatter; the stock prepare() formats the whole line here.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    level: Optional[str] = None, fmt: Optional[str] = None, stream: Optional[TextIO] = None
+) -> None:
+    """
+    Route the root logger through a queue to ``stream`` (stdout). Called at
+    import by main and by each analysis worker; later calls do nothing.
+    """
+    global _LISTENER
+    if _LISTENER is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if (fmt or LOG_FORMAT) == "text":
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RunIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or LOG_LEVEL)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _LISTENER = logging.handlers.QueueListener(records, output)
+    _LISTENER.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write out what is queued and stop the listener thread."""
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
@@ -1,26 +1,38 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Query, Request
 from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pathlib import Path
 from typing import Optional, List, Dict, Any, Tuple
 import polars as pl
 import pandas as pd
-import tempfile
 import os
+import asyncio
+import gzip
+import logging
 import threading
 import uuid
 import re
+import time
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from spm_db import insert_run, insert_station_windows, insert_window_points, find_existing_run, delete_run_cascade
 import run_store
+import analysis_cache
+import log_config
+import metrics
+import profiling
+import timing
 from corridor_loader import CorridorManager
-from psr_mps import PSRMPSCalculator, detect_violations, detect_overspeed_events, get_overspeed_summary
-from halt_detection import HaltDetector, calculate_cumulative_distance
-from platform_entry_speed import PlatformEntryCalculator
-from brakefeel_detector import BrakeFeelDetector
-from station_km_maps import get_station_km_map_for_train_type
+from chart_payload import GZIPPED_FORMATS, MEDIA_TYPES, decode_payload, get_chart_payload, store_chart_payload
+from downsample import DEFAULT_MAX_POINTS, series_window
+from upload_spool import UploadTooLarge, spool_upload
+from psr_mps import detect_overspeed_events_multi, get_overspeed_summary
+from reference_data import get_reference_data
+from analysis_pipeline import (
+    ANALYSIS_WORKERS, AnalysisInputError, analyse_upload, create_executor, reanalyse_frame,
+    get_context as get_analysis_context,
+)
 from spm_db import (
     get_run, get_points, list_runs, get_runs_by_date, get_staff_list, get_cli_list,
     get_staff_by_hrms, get_cli_by_cms_id, get_braking_analysis_data, get_stations_with_braking_data,
@@ -29,6 +41,9 @@ from spm_db import (
     get_motorman_working_history, get_motorman_abnormalities, get_available_sections, get_available_stations
 )
 
+logger = logging.getLogger(__name__)
+log_config.setup_logging()
+
 # app = FastAPI(title="SPM Analysis API")
 ROOT_PATH = os.getenv("ROOT_PATH", "")
 app = FastAPI(
@@ -46,8 +61,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser's network panel show the stage timings cross-origin too
+    expose_headers=["Server-Timing", profiling.FILE_HEADER],
 )
 
+
+@app.middleware("http")
+async def server_timing_header(request: Request, call_next):
+    """
+    Send the spans a request recorded (timing.py) as a Server-Timing header,
+    and observe its latency into /metrics under the matched route's template
+    (so /runs/{run_id}, not one series per run). With profiling.py switched
+    on, a request that asks for it is profiled and its file named in a header.
+    """
+    if profiling.ENABLED:
+        with profiling.armed(request.headers) as profile:
+            response = await _timed_request(request, call_next)
+        if profile is not None:
+            route = getattr(request.scope.get("route"), "path", None)
+            name = await run_in_threadpool(profiling.finish, profile, route)
+            if name:
+                response.headers[profiling.FILE_HEADER] = name
+        return response
+    return await _timed_request(request, call_next)
+
+
+async def _timed_request(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    metrics.HTTP_IN_PROGRESS.inc()
+    try:
+        with timing.collect() as spans:
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.HTTP_IN_PROGRESS.dec()
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            elapsed,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+    if spans:
+        response.headers["Server-Timing"] = timing.server_timing(spans, elapsed)
+    return response
+
 # Stored motorman PDF reports. Served by an explicit route below rather than
 # app.mount(StaticFiles): with root_path set (ROOT_PATH=/spm/sub-spm in .env) a
 # Mount only matches the prefixed path, so /reports/... 404s on localhost while
@@ -60,16 +120,12 @@ REPORTS_DIR.mkdir(exist_ok=True)
 # Maximum PDFs to keep per motorman
 MAX_MOTORMAN_REPORTS = 20
 
-# Initialize corridor manager
+# Replaced on startup by the ReferenceData registry's loaded manager
 corridor_manager = CorridorManager(DATA_ROOT)
 
-# Initialize PSR/MPS calculator
-psr_calculator = PSRMPSCalculator(reference_data_dir=str(DATA_ROOT / "reference_data"))
-
-# Initialize halt detector (speed=0, distance=0)
-# Tolerance set to 350m to handle wheel diameter variations and GPS inaccuracies
-halt_detector = HaltDetector(speed_threshold=0.0, min_halt_duration_seconds=1)
-brakefeel_detector = BrakeFeelDetector()
+# /upload runs its parse + analysis here (analysis_pipeline.analyse_upload).
+# Created on startup; None when SPM_ANALYSIS_WORKERS=0 (threadpool instead).
+analysis_executor = None
 
 # Uploaded runs live in run_store (Parquet on disk, 1h TTL, 20-run cap).
 # This replaced an unbounded in-RAM dict that never evicted and grew to 1.3 GB
@@ -99,93 +155,41 @@ def extract_hq_from_cms_id(cms_id: str) -> str:
     return hq_map.get(prefix, hq_map.get(prefix[:3], prefix[:3]))
 
 
-def generate_abnormality_text(
-    overspeed_events: List[Dict],
-    platform_entry_data: Dict[str, Dict],
-    brake_tests: List[Dict]
-) -> str:
-    """
-    Generate abnormality text from analysis results.
-    Format matches the manual daily SPM analysis CSV.
-    """
-    remarks = []
-
-    # 1. PSR/MPS Violations (overspeed events)
-    for event in overspeed_events:
-        # Format: "PSR 85 VIOLATION MOMENTARY BETWEEN DI-TNA 91 KMPH FOR 7 SEC"
-        psr = event.get('psr_value', 0)
-        max_speed = event.get('max_speed', 0)
-        duration = event.get('duration', 0)
-        start_km = event.get('start_km', 0)
-        end_km = event.get('end_km', 0)
-        remarks.append(
-            f"PSR {psr} VIOLATION MOMENTARY AT {start_km}-{end_km} KM, {max_speed} KMPH FOR {duration} SEC"
-        )
-
-    # 2. Platform Entry Speed > 45 kmph
-    pf_entry_violations = []
-    for station, data in platform_entry_data.items():
-        entry_speed = data.get('entry_speed')
-        if entry_speed and entry_speed > 45:
-            pf_entry_violations.append(f"{station}-{int(entry_speed)}")
-    if pf_entry_violations:
-        if len(pf_entry_violations) > 5:
-            remarks.append("PF ENTRY SPEED MORE THAN 45 KMPH AT MANY STN")
-        else:
-            remarks.append(f"PF ENTRY SPEED MORE THAN 45 KMPH AT {','.join(pf_entry_violations)}")
-
-    # 3. Mid Platform Speed > 30 kmph (at 130m from halt)
-    mid_pf_violations = []
-    for station, data in platform_entry_data.items():
-        mid_pf = data.get('mid_platform_speed')
-        if mid_pf and mid_pf > 30:
-            mid_pf_violations.append(f"{station}-{int(mid_pf)}")
-    if mid_pf_violations:
-        if len(mid_pf_violations) > 5:
-            remarks.append("MID PF SPEED MORE THAN 30 KMPH AT MANY STN")
-        else:
-            remarks.append(f"MID PF SPEED MORE THAN 30 KMPH AT {','.join(mid_pf_violations)}")
-
-    # 4. One Coach Before Speed > 15 kmph
-    one_coach_violations = []
-    for station, data in platform_entry_data.items():
-        one_coach = data.get('one_coach_speed')
-        if one_coach and one_coach > 15:
-            one_coach_violations.append(f"{station}-{int(one_coach)}")
-    if one_coach_violations:
-        if len(one_coach_violations) > 5:
-            remarks.append("ONE COACH BEFORE SPEED MORE THAN 15 KMPH AT MANY STN")
-        else:
-            remarks.append(f"ONE COACH BEFORE SPEED MORE THAN 15 KMPH AT {','.join(one_coach_violations)}")
-
-    # 5. Brake Feel Test
-    if not brake_tests:
-        remarks.append("NO BRAKE FEEL TEST DONE")
-
-    # If no issues found
-    if not remarks:
-        return "NO ABNORMALITY"
-
-    return "\n".join(remarks)
-
-
 @app.on_event("startup")
 async def startup_event():
-    """Load corridor data on startup"""
-    corridor_manager.load_default_corridors()
-    corridor_manager.load_train_lookup()
-    corridor_manager.load_fast_halts("Fast Locals.csv")
-    corridor_manager.load_train_corridor_map()
-    print(f"✓ Loaded {len(corridor_manager.corridors)} corridors")
-    print(f"✓ Loaded {len(corridor_manager.train_code_map)} train codes")
-    print(f"✓ Loaded {len(corridor_manager.fast_halt_map)} fast train halt patterns")
-    print(f"✓ Loaded {len(corridor_manager.train_corridor_map)} train corridor entries")
+    """Load reference data on startup"""
+    # Corridors, train lookups, segment limits, ISD, sheds: read once, here. A
+    # bad segments file stops startup rather than leaving part of every
+    # affected run without a PSR.
+    global corridor_manager
+    reference = get_reference_data(DATA_ROOT)
+    corridor_manager = reference.corridor_manager
+    logger.info("Reference data version %s", reference.version)
+    logger.info("Loaded %s corridors", len(corridor_manager.corridors))
+    logger.info("Loaded %s train codes", len(corridor_manager.train_code_map))
+    logger.info("Loaded %s fast train halt patterns", len(corridor_manager.fast_halt_map))
+    logger.info("Loaded %s train corridor entries", len(corridor_manager.train_corridor_map))
     run_store.cleanup_orphans()
-    print(f"✓ Run store at {run_store.RUNS_DIR} ({len(run_store.list_index())} runs recovered)")
+    logger.info("Run store at %s (%s runs recovered)", run_store.RUNS_DIR, len(run_store.list_index()))
+    logger.info("Analysis cache at %s (%s entries)", analysis_cache.CACHE_DIR, analysis_cache.rehydrate())
+    global analysis_executor
+    analysis_executor = create_executor(ANALYSIS_WORKERS)
+    if analysis_executor is None:
+        get_analysis_context()  # preload here rather than on the first upload
+        logger.info("Upload analysis on the threadpool (SPM_ANALYSIS_WORKERS=0)")
+    else:
+        logger.info("Upload analysis pool: %s workers", ANALYSIS_WORKERS)
     from db_config import get_db_connection
     cn = get_db_connection()
     cn.close()
-    print("✓ DB connection OK")
+    logger.info("DB connection OK")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the analysis workers"""
+    if analysis_executor is not None:
+        analysis_executor.shutdown(wait=False, cancel_futures=True)
+
 
 @app.get("/")
 async def root():
@@ -194,6 +198,7 @@ async def root():
         "status": "running",
         "corridors_loaded": len(corridor_manager.corridors),
         "train_codes_loaded": len(corridor_manager.train_code_map),
+        "reference_data_version": get_reference_data(DATA_ROOT).version,
     }
 
 
@@ -247,8 +252,7 @@ async def api_db_test():
         success = test_connection()
         return {"connected": success}
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Database connection test failed")
         return {"connected": False, "error": str(e)}
 
 
@@ -259,8 +263,7 @@ async def api_get_staff():
         staff = get_staff_list(designation_id=8)
         return {"staff": staff}
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Could not load staff list")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -271,8 +274,7 @@ async def api_get_cli():
         cli = get_cli_list()
         return {"cli": cli}
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Could not load CLI list")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -322,10 +324,10 @@ async def detect_date_from_file(file: UploadFile = File(...)):
     if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = Path(tmp.name)
+    try:
+        tmp_path = (await spool_upload(file, suffix=Path(file.filename).suffix)).path
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
     try:
         # Read just first few rows to detect date
@@ -383,6 +385,256 @@ async def detect_date_from_file(file: UploadFile = File(...)):
         tmp_path.unlink(missing_ok=True)
 
 
+async def _in_threadpool(fn, *args):
+    """run_in_threadpool, inside the request's profile when profiling.py armed one."""
+    if profiling.ENABLED:
+        return await run_in_threadpool(profiling.call, fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+
+async def _run_analysis(fn, *args):
+    """
+    Run an analysis_pipeline entry point in the pool, or on the threadpool when
+    there is none. A profiled request runs it on the threadpool too, so the
+    analysis lands in its profile.
+    """
+    if analysis_executor is None or (profiling.ENABLED and profiling.active()):
+        return await _in_threadpool(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        analysis_executor, log_config.run_with_run_id, log_config.RUN_ID.get(), fn, *args,
+    )
+
+
+async def _timed_analysis(fn, *args) -> Dict[str, Any]:
+    """
+    _run_analysis under an "analysis" span, adding the result's per-stage
+    timings (analysis_pipeline) to the request's. They are popped, so a
+    cached result does not carry them.
+    """
+    with timing.span("analysis") as analysis_span:
+        result = await _run_analysis(fn, *args)
+        analysis_span.rows = len(result["df"])
+    for stage, outcome, ms in result.pop("stage_timings", None) or ():
+        timing.record(f"analysis.{stage}", ms / 1000, desc=outcome)
+        # Counted here rather than read from STAGES.stats(): each pool worker
+        # has its own memo, but every trace comes back to this process.
+        metrics.STAGE_MEMO.inc(stage=stage, outcome=outcome)
+    return result
+
+
+def _new_run_id() -> str:
+    """A run ID for an upload, bound to the request's log records (log_config)."""
+    # UUID suffix prevents collisions when multiple users upload simultaneously
+    run_id = f"RUN_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    log_config.bind_run_id(run_id)
+    return run_id
+
+
+async def _store_analysed_run(
+    run_id: str,
+    result: Dict[str, Any],
+    params: Dict[str, Any],
+    form: Dict[str, Any],
+    analysis_cached: bool = False,
+) -> Dict[str, Any]:
+    """
+    Store an analysis_pipeline result as new run ``run_id`` and build the
+    /upload response. ``params`` are the analysis parameters (train_number,
+    from_station, to_station as requested); ``form`` the rest of the upload
+    form plus filename and file_sha256. Shared by /upload and
+    /runs/{run_id}/reanalyze.
+    """
+    filename = form.get("filename")
+    staff_id = form.get("staff_id")
+    train_number = params.get("train_number")
+    date_of_working = form.get("date_of_working")
+    analysed_by = form.get("analysed_by")
+    unit_number = form.get("unit_number")
+    notes = form.get("notes")
+
+    # Lookup staff details for motorman name and HQ
+    motorman_name = ""
+    motorman_cms_id = ""
+    motorman_hq = ""
+    nominated_cli_name = ""
+    nominated_cli_cms_id = ""
+    if staff_id:
+        with timing.span("db.get_staff_by_hrms"):
+            staff_details = await _in_threadpool(get_staff_by_hrms, staff_id)
+        if staff_details:
+            motorman_name = staff_details.get("staff_name", "")
+            motorman_cms_id = staff_details.get("cms_id", "")
+            motorman_hq = extract_hq_from_cms_id(motorman_cms_id)
+            nominated_cli_name = staff_details.get("nominated_cli_name", "")
+            nominated_cli_cms_id = staff_details.get("cli_cms_id", "")
+
+    # Lookup CLI name for analysed_by (Done By CLI)
+    analysed_by_name = ""
+    if analysed_by:
+        with timing.span("db.get_cli_by_cms_id"):
+            cli_details = await _in_threadpool(get_cli_by_cms_id, analysed_by)
+        if cli_details:
+            analysed_by_name = cli_details.get("cli_name", "")
+
+    df = result["df"]
+    # Blank from/to come back filled from the matched halts
+    from_station = result["from_station"]
+    to_station = result["to_station"]
+    corridor_info = result["corridor_info"]
+    train_type = result["train_type"]
+    halting_station_map = result["halting_stations"]
+    ordered_stations = result["ordered_stations"]
+    violations = result["violations"]
+    overspeed_events = result["overspeed_events"]
+    overspeed_summary = result["overspeed_summary"]
+    platform_entry_data = result["platform_entry_data"]
+    brake_tests = result["brake_tests"]
+    abnormality_text = result["abnormality_text"]
+    start_time = result["start_time"]
+    end_time = result["end_time"]
+    duration = result["duration"]
+
+    # Prepare run_row for DB insert (will be saved on confirm)
+    run_row = {
+        "run_id": run_id,
+        "uploaded_by_user_id": None,
+        "original_filename": filename,
+        "date_of_working": date_of_working,
+        "train_number": train_number,
+        "unit_no": unit_number,
+        "from_station": from_station,
+        "to_station": to_station,
+        "motorman_hrms_id": staff_id,
+        "motorman_cms_id": motorman_cms_id or None,
+        "nom_cli_cms_id": nominated_cli_cms_id or None,
+        "done_by_cli_cms_id": analysed_by or None,
+        "abnormality_noticed": abnormality_text,
+        "max_speed": float(df["Speed"].max()),
+        "avg_speed": float(df["Speed"].mean()),
+        "total_distance": float(df["Distance"].sum()),
+    }
+
+    # Check if there's an existing run with same date+train+from+to
+    with timing.span("db.find_existing_run"):
+        existing_run_id = await _in_threadpool(
+            find_existing_run, date_of_working, train_number, from_station, to_station,
+        )
+    existing_analysis_date = None
+    if existing_run_id:
+        with timing.span("db.get_run"):
+            existing_run = await _in_threadpool(get_run, existing_run_id)
+        if existing_run and existing_run.get('analysis_date'):
+            # Convert UTC to IST (+05:30) for display
+            utc_date = existing_run['analysis_date']
+            if hasattr(utc_date, 'strftime'):
+                ist_date = utc_date + timedelta(hours=5, minutes=30)
+                existing_analysis_date = ist_date.strftime('%d-%m-%Y %H:%M')
+            else:
+                existing_analysis_date = str(utc_date)
+
+    # The worker has no run_id yet; the DB rows get it prefixed here.
+    station_window_rows = [(run_id,) + row for row in result["station_window_rows"]]
+    window_point_rows = [(run_id,) + row for row in result["window_point_rows"]]
+
+    # Store the run: frame to Parquet, everything else to a pickle sidecar.
+    # Nothing is written to the DB yet — that happens on Confirm & Save.
+    # `data` (the sample rows) is deliberately absent from meta; it IS the frame.
+    meta = {
+        "run_id": run_id,
+        "confirmed": False,  # Not saved to DB yet
+        "existing_run_id": existing_run_id,  # For duplicate handling on confirm
+        "existing_analysis_date": existing_analysis_date,  # When the duplicate was analyzed
+        "filename": filename,
+        "file_sha256": form.get("file_sha256"),
+        "staff_id": staff_id,
+        "motorman_name": motorman_name,
+        "motorman_hq": motorman_hq,
+        "nominated_cli_name": nominated_cli_name,
+        "from_station": from_station,
+        "to_station": to_station,
+        "train_number": train_number,
+        "date_of_working": date_of_working,
+        "analysed_by": analysed_by,
+        "analysed_by_name": analysed_by_name,
+        "unit_number": unit_number,
+        "train_type": train_type,
+        "notes": notes,
+        "uploaded_at": datetime.now().isoformat(),
+        "corridor_info": corridor_info,
+        "halting_stations": halting_station_map,
+        "ordered_stations": ordered_stations,
+        "violations": violations,
+        "violation_count": len(violations),
+        "overspeed_events": overspeed_events,
+        "overspeed_summary": overspeed_summary,
+        "brake_tests": brake_tests,
+        "abnormality_text": abnormality_text,
+        "row_count": len(df),
+        "max_speed": float(df["Speed"].max()),
+        "total_distance": float(df["Distance"].sum()),
+        "platform_entry_data": platform_entry_data,
+        "run_row": run_row,  # Store for DB insert on confirm
+        "station_window_rows": station_window_rows,
+        "window_point_rows": window_point_rows,
+        # Needed by the PDF metadata grid; see analysis_pipeline.analyse_frame.
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": duration,
+        # What POST /runs/{run_id}/reanalyze starts from, with the source frame.
+        "analysis_params": dict(params),
+        "raw_halts": result.get("raw_halts"),
+        "frame_key": result.get("frame_key"),
+    }
+    with timing.span("run_store.put_run", rows=len(df)):
+        await _in_threadpool(run_store.put_run, run_id, df, meta, result.get("source_df"))
+
+    # Build the chart payload now, once; /chart_data and the PDF serve it
+    try:
+        await _in_threadpool(store_chart_payload, run_id, meta, df)
+    except Exception as payload_error:
+        # /chart_data builds it on first request instead
+        logger.error("Could not build chart payload for %s: %s", run_id, payload_error)
+
+    # NOTE: DB insert moved to /api/confirm/{run_id} endpoint
+    # Data is only saved when user clicks "Confirm & Save"
+
+    return {
+        "success": True,
+        "run_id": run_id,
+        "has_existing_duplicate": existing_run_id is not None,
+        "existing_analysis_date": existing_analysis_date,
+        "rows_processed": len(df),
+        "analysis_cached": analysis_cached,
+        "motorman_name": motorman_name,
+        "motorman_hq": motorman_hq,
+        "nominated_cli_name": nominated_cli_name,
+        "corridor_info": corridor_info,
+        "train_type": train_type,
+        "halts_detected": len(halting_station_map),
+        "halting_stations": list(halting_station_map.keys()),
+        "violation_count": len(violations),
+        "violations_summary": {
+            "critical": len([v for v in violations if v['severity'] == 'critical']),
+            "severe": len([v for v in violations if v['severity'] == 'severe']),
+            "moderate": len([v for v in violations if v['severity'] == 'moderate']),
+            "minor": len([v for v in violations if v['severity'] == 'minor']),
+        },
+        "summary": {
+            "max_speed": float(df["Speed"].max()),
+            "avg_speed": float(df["Speed"].mean()),
+            "total_distance": float(df["Distance"].sum()),
+            "psr_calculated": result["psr_calculated"],
+        },
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": duration,
+        "overspeed_events": overspeed_events,
+        "overspeed_summary": overspeed_summary,
+        "abnormality_text": abnormality_text,
+    }
+
+
 @app.post("/upload")
 async def upload_spm_file(
     file: UploadFile = File(...),
@@ -412,720 +664,53 @@ async def upload_spm_file(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = Path(tmp.name)
+    # The run ID is chosen now so the analysis's log lines carry it
+    run_id = _new_run_id()
 
+    # Save uploaded file temporarily, a chunk at a time
     try:
-        # Lookup staff details for motorman name and HQ
-        motorman_name = ""
-        motorman_cms_id = ""
-        motorman_hq = ""
-        nominated_cli_name = ""
-        nominated_cli_cms_id = ""
-        if staff_id:
-            staff_details = get_staff_by_hrms(staff_id)
-            if staff_details:
-                motorman_name = staff_details.get("staff_name", "")
-                motorman_cms_id = staff_details.get("cms_id", "")
-                motorman_hq = extract_hq_from_cms_id(motorman_cms_id)
-                nominated_cli_name = staff_details.get("nominated_cli_name", "")
-                nominated_cli_cms_id = staff_details.get("cli_cms_id", "")
-
-        # Lookup CLI name for analysed_by (Done By CLI)
-        analysed_by_name = ""
-        if analysed_by:
-            cli_details = get_cli_by_cms_id(analysed_by)
-            if cli_details:
-                analysed_by_name = cli_details.get("cli_name", "")
-
-        # Read file using Pandas (more reliable for Excel) then convert to Polars
-        if tmp_path.suffix == '.csv':
-            # Try with headers first
-            df_test = pl.read_csv(tmp_path, n_rows=1)
-            first_row = df_test.row(0)
+        with timing.span("spool"):
+            spooled = await spool_upload(file, suffix=Path(file.filename).suffix)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    tmp_path = spooled.path
 
-            # Check if first row looks like headers (contains non-numeric text in speed/distance columns)
-            has_headers = True
-            try:
-                # If we can't convert the values to float, they're likely headers
-                if len(first_row) >= 2:
-                    float(str(first_row[1]))  # Try speed column
-                    float(str(first_row[2]) if len(first_row) > 2 else "0")  # Try distance column
-                    has_headers = False  # If no error, first row is data
-            except (ValueError, TypeError):
-                has_headers = True  # First row is headers
-
-            # Read CSV with or without headers
-            if has_headers:
-                df = pl.read_csv(tmp_path)
-            else:
-                df = pl.read_csv(tmp_path, has_header=False, new_columns=['Date', 'Speed', 'Distance'])
-        else:
-            # Try reading Excel with different options to find the data
-            pandas_df = None
-            # Try different header rows (sometimes data starts after metadata)
-            for header_row in [0, 1, 2, 3, 4, 5]:
-                try:
-                    test_df = pd.read_excel(tmp_path, header=header_row)
-                    # Check if this row has the columns we need
-                    cols_lower = [str(c).lower() for c in test_df.columns]
-                    if any('date' in c for c in cols_lower) or any('speed' in c for c in cols_lower):
-                        pandas_df = test_df
-                        break
-                except:
-                    continue
-
-            if pandas_df is None:
-                # If no headers found, try reading without headers
-                pandas_df = pd.read_excel(tmp_path, header=None)
-
-                # Detect format: 3 columns (DateTime, Speed, Distance) or 4 columns (Date, Time, Speed, Distance)
-                if len(pandas_df.columns) >= 4:
-                    # Check if column 2 (index 1) looks like time by checking if it's numeric (speed)
-                    # If it's numeric, we have 3 columns (DateTime combined)
-                    # If it's not numeric, we have 4 columns (Date and Time separate)
-                    try:
-                        second_col_val = pandas_df.iloc[0, 1]
-                        # Try to convert to float - if it works, it's likely Speed (3-column format)
-                        float(second_col_val)
-                        # 3-column format: DateTime, Speed, Distance
-                        pandas_df.columns = ['Date', 'Speed', 'Distance'] + list(pandas_df.columns[3:])
-                    except (ValueError, TypeError):
-                        # Second column is not numeric - likely Time (4-column format)
-                        pandas_df.columns = ['Date', 'Time', 'Speed', 'Distance'] + list(pandas_df.columns[4:])
-                elif len(pandas_df.columns) >= 3:
-                    pandas_df.columns = ['Date', 'Speed', 'Distance'] + list(pandas_df.columns[3:])
-                else:
-                    pandas_df.columns = ['Date', 'Speed', 'Distance'][:len(pandas_df.columns)]
-
-            df = pl.from_pandas(pandas_df)
-
-        # Normalize column names (case-insensitive matching)
-        df_cols_lower = {c.lower(): c for c in df.columns}
-
-        # Try to find the required columns (case-insensitive)
-        date_col = next((v for k, v in df_cols_lower.items() if 'date' in k), None)
-        time_col = next((v for k, v in df_cols_lower.items() if 'time' in k and 'date' not in k), None)
-        speed_col = next((v for k, v in df_cols_lower.items() if 'speed' in k), None)
-        distance_col = next((v for k, v in df_cols_lower.items() if 'distance' in k or 'dist' in k), None)
-
-        if not date_col or not speed_col or not distance_col:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Could not find required columns. Found columns: {df.columns}. Need at least: Date, Speed, Distance"
-            )
-
-        # Select only the columns we need
-        selected_cols = [date_col, speed_col, distance_col]
-        if time_col:
-            selected_cols.insert(1, time_col)
-
-        df = df.select(selected_cols)
-
-        # Rename to standard names
-        if time_col:
-            df = df.rename({
-                date_col: 'Date',
-                time_col: 'Time',
-                speed_col: 'Speed',
-                distance_col: 'Distance'
-            })
-        else:
-            df = df.rename({
-                date_col: 'DateTime',
-                speed_col: 'Speed',
-                distance_col: 'Distance'
-            })
-
-            # Split DateTime into Date and Time columns
-            # Convert to pandas for easier datetime parsing
-            temp_df = df.to_pandas()
-
-            # Parse datetime and split
-            temp_df['DateTime'] = pd.to_datetime(temp_df['DateTime'], errors='coerce')
-            temp_df['Date'] = temp_df['DateTime'].dt.strftime('%Y-%m-%d')
-            temp_df['Time'] = temp_df['DateTime'].dt.strftime('%H:%M:%S')
-            temp_df = temp_df.drop(columns=['DateTime'])
-
-            # Convert back to polars
-            df = pl.from_pandas(temp_df)
-
-        # Clean data: remove any rows that have non-numeric values in Speed/Distance
-        # This handles cases where header rows might be included in data
-        df = df.filter(
-            pl.col("Speed").cast(pl.Utf8).str.contains(r"^\d+\.?\d*$") &
-            pl.col("Distance").cast(pl.Utf8).str.contains(r"^\d+\.?\d*$")
-        )
-
-        # Process the data
-        df = df.with_columns([
-            pl.col("Speed").cast(pl.Float64),
-            pl.col("Distance").cast(pl.Float64),
-        ])
-
-        # Clean data: Force distance=0 when speed=0 (at halt, distance can't be >0)
-        df = df.with_columns([
-            pl.when(pl.col("Speed") == 0)
-              .then(0)
-              .otherwise(pl.col("Distance"))
-              .alias("Distance")
-        ])
-
-        # Calculate cumulative distance
-        df = calculate_cumulative_distance(df, distance_col="Distance")
-
-        # Resolve corridor if train number is provided
-        corridor_info = None
-        train_type = None
-        ordered_stations = []
-        station_km_map = {}
-        halting_station_map = {}
-        psr_values = []
-        violations = []
-        overspeed_events = []
-        overspeed_summary = {'total_events': 0, 'by_severity': {'minor': 0, 'moderate': 0, 'severe': 0, 'critical': 0}, 'max_excess_overall': 0, 'max_speed_overall': 0, 'total_duration': 0}
-        platform_entry_data: Dict[str, Dict[str, Any]] = {}
-        entry_calculator: Optional[PlatformEntryCalculator] = None
-
-        if train_number:
-            corridor_info = corridor_manager.resolve_corridor(
-                train_number, from_station or "", to_station or ""
-            )
-
-            # Determine train type (fast/slow/thb)
-            if corridor_info:
-                corridor_name = corridor_info.get('corridor', '')
-                train_code = corridor_manager.get_train_code(train_number)
-
-                # Determine train type from train code prefix (primary source)
-                prefix = str(train_code).strip()[:3] if train_code else None
-
-                if corridor_name and 'THB' in corridor_name.upper():
-                    train_type = 'thb'
-                elif prefix and prefix in corridor_manager.FAST_PREFIXES:
-                    train_type = 'fast'
-                else:
-                    train_type = 'slow'
-
-                # Validate against corridor name (double-check for consistency)
-                if corridor_name and 'FAST' in corridor_name.upper() and train_type != 'fast':
-                    print(f"[WARNING] Mismatch: train_type={train_type} but corridor={corridor_name}")
-                elif corridor_name and 'LOCAL' in corridor_name.upper() and train_type == 'fast':
-                    print(f"[WARNING] Mismatch: train_type={train_type} but corridor={corridor_name}")
-
-                # Get corridor data for PSR calculation
-                print(f"[DEBUG] Looking for corridor: '{corridor_name}'")
-                print(f"[DEBUG] Available corridors: {list(corridor_manager.corridors.keys())}")
-
-                corridor_data = corridor_manager.corridors.get(corridor_name)
-                if corridor_data:
-                    print(f"[DEBUG] Corridor found! Stations: {corridor_data.stations[:5]}...")  # First 5 stations
-
-                    # Determine which stations to use for PSR calculation
-                    all_stations = corridor_data.stations
-
-                    # Filter to from/to range if provided
-                    # psr_stations will be used for PSR calculation (all corridor stations)
-                    # ordered_stations will be used for halt matching (may be filtered later)
-                    if from_station and to_station and from_station in all_stations and to_station in all_stations:
-                        from_idx = all_stations.index(from_station)
-                        to_idx = all_stations.index(to_station)
-                        if from_idx < to_idx:
-                            psr_stations = all_stations[from_idx:to_idx+1]
-                        else:
-                            psr_stations = all_stations[to_idx:from_idx+1][::-1]
-                        print(f"[DEBUG] Target station range from form: {from_station}→{to_station} ({len(psr_stations)} stations)")
-                    else:
-                        psr_stations = all_stations
-                        print(f"[DEBUG] Using all {len(psr_stations)} corridor stations (no from/to provided)")
-
-                    ordered_stations = psr_stations  # Initialize ordered_stations for halt matching
-
-                    # Use official KM map based on train type (like GAS app)
-                    # These are hardcoded reference values, NOT calculated from corridor CSV
-                    print(f"[DEBUG] Loading official station KM map for train_type={train_type}...")
-                    station_km_map = get_station_km_map_for_train_type(train_type)
-
-                    print(f"[DEBUG] Loaded official KM map with {len(station_km_map)} stations (for PSR officialKM)")
-                    print(f"[DEBUG] First 5 station KMs: {list(station_km_map.items())[:5]}")
-                    print(f"[DEBUG] Last 5 station KMs: {list(station_km_map.items())[-5:]}")
-                    if from_station and from_station in station_km_map:
-                        print(f"[DEBUG] Target from_station {from_station} at {station_km_map[from_station]:.0f}m")
-                    if to_station and to_station in station_km_map:
-                        print(f"[DEBUG] Target to_station {to_station} at {station_km_map[to_station]:.0f}m")
-
-                    # Detect halts using ISD-based matching (GAS approach)
-                    print(f"[DEBUG] Detecting halts in SPM data...")
-
-                    # Step 1: Detect raw halts (speed=0, distance=0)
-                    halts = halt_detector.detect_halts(
-                        df,
-                        speed_col='Speed',
-                        cum_dist_col='cumulative_distance'
-                    )
-
-                    halt_distances = [f"{h['cumulative_distance']:.0f}m" for h in halts]
-                    print(f"[DEBUG] Detected {len(halts)} raw halts at: {halt_distances[:10]}")
-
-                    # Step 2: Match halts using ISD pattern matching
-                    # For FAST trains, get nominated halts from Fast Locals.csv
-                    fast_train_halts = None
-                    semi_fast_info = None
-                    slow_corridor_data = None
-                    if train_type == 'fast':
-                        fast_train_halts = corridor_manager.get_train_halts(train_number)
-                        if fast_train_halts:
-                            print(f"[DEBUG] FAST train detected - using nominated halts: {fast_train_halts}")
-                            # Check if this is a semi-fast train (has slow-only markers)
-                            semi_fast_info = corridor_manager.detect_semi_fast(fast_train_halts)
-                            if semi_fast_info:
-                                print(f"[DEBUG] SEMI-FAST train detected!")
-                                print(f"[DEBUG]   Change point: {semi_fast_info['change_point']}")
-                                print(f"[DEBUG]   Slow markers found: {semi_fast_info['markers_found']}")
-                                # Load the corresponding slow corridor for ISD matching after change point
-                                slow_corridor_name = corridor_name.replace('_FAST', '_LOCAL') if corridor_name else None
-                                if slow_corridor_name:
-                                    slow_corridor_data = corridor_manager.corridors.get(slow_corridor_name)
-                                    if slow_corridor_data:
-                                        print(f"[DEBUG] SEMI-FAST: Loaded slow corridor {slow_corridor_name} with {len(slow_corridor_data.stations)} stations")
-                                    else:
-                                        print(f"[WARNING] SEMI-FAST: Slow corridor {slow_corridor_name} not found")
-                        else:
-                            print(f"[DEBUG] FAST train {train_number} not found in Fast Locals.csv, using corridor stations")
-
-                    print(f"[DEBUG] Matching halts to stations using ISD algorithm...")
-                    halt_result = halt_detector.match_halts_using_isd(
-                        halts,
-                        corridor_data,
-                        from_station=from_station,
-                        to_station=to_station,
-                        max_isd_diff=120.0,  # 150m ISD tolerance
-                        max_cd_diff=300.0,   # 300m cumulative distance tolerance
-                        fast_train_halts=fast_train_halts,
-                        slow_corridor_data=slow_corridor_data,
-                        semi_fast_info=semi_fast_info
-                    )
-
-                    # Extract halting stations and ordered stations from result
-                    halting_station_map = halt_result['halting_stations']
-                    ordered_stations = halt_result['ordered_stations']
-
-                    print(f"[DEBUG] Matched {len(halting_station_map)}/{len(halts)} halts to stations")
-                    print(f"[DEBUG] Halting stations: {list(halting_station_map.keys())}")
-                    print(f"[DEBUG] Ordered stations after halt matching: {len(ordered_stations)} stations")
-                    print(f"[DEBUG] Ordered stations list: {ordered_stations}")
-
-                    # Track whether stations were explicitly provided by user (before auto-detection)
-                    user_provided_from = bool(from_station)
-                    user_provided_to = bool(to_station)
-                    user_provided_both = user_provided_from and user_provided_to
-
-                    # Determine the actual from/to stations based on what was matched
-                    if (not from_station or not to_station) and ordered_stations and len(ordered_stations) >= 2:
-                        # If from/to not provided, use first/last from ordered stations
-                        from_station = ordered_stations[0]
-                        to_station = ordered_stations[-1]
-
-                        print(f"[DEBUG] Using detected halt range: {from_station}→{to_station} ({len(ordered_stations)} stations)")
-
-                    # Adjust/filter SPM data based on whether user provided explicit stations
-                    if halting_station_map:
-                        # Determine start and end positions
-                        if user_provided_both and from_station in halting_station_map and to_station in halting_station_map:
-                            # User explicitly requested specific segment - filter both start AND end
-                            start_dist = halting_station_map[from_station]
-                            end_dist = halting_station_map[to_station]
-
-                            print(f"[DEBUG] User requested segment: {from_station} ({start_dist:.0f}m) → {to_station} ({end_dist:.0f}m)")
-                            print(f"[DEBUG] Filtering data to show only this segment")
-
-                            # Get actual end before adjustment
-                            actual_end = float(df['cumulative_distance'].max())
-                            original_len = len(df)
-
-                            # Filter both start and end
-                            df = df.filter(
-                                (pl.col('cumulative_distance') >= start_dist) &
-                                (pl.col('cumulative_distance') <= end_dist)
-                            )
-                        else:
-                            # Auto-detected or partial - only filter start, keep full journey
-                            start_dist = min(halting_station_map.values())
-
-                            print(f"[DEBUG] Auto-detected or partial station selection")
-                            print(f"[DEBUG] Adjusting to start from 0 (was {start_dist:.0f}m), keeping full journey")
-
-                            # Get actual end before adjustment
-                            actual_end = float(df['cumulative_distance'].max())
-                            original_len = len(df)
-
-                            # Only filter start point
-                            df = df.filter(pl.col('cumulative_distance') >= start_dist)
-
-                        # Adjust cumulative distances to start from 0
-                        df = df.with_columns([
-                            (pl.col('cumulative_distance') - start_dist).alias('cumulative_distance')
-                        ])
-
-                        adjusted_end = float(df['cumulative_distance'].max())
-                        print(f"[DEBUG] Result: {len(df)} rows (was {original_len}), spanning 0 to {adjusted_end:.0f}m")
-
-                        # Adjust halting_station_map positions to match adjusted data
-                        adjusted_halting_map = {}
-                        for station, halt_dist in halting_station_map.items():
-                            adjusted_halting_map[station] = halt_dist - start_dist
-                        halting_station_map = adjusted_halting_map
-
-                        print(f"[DEBUG] Adjusted halting stations: {halting_station_map}")
-
-                        # Adjust station_km_map for PSR calculation
-                        # Use psr_stations (all corridor stations) not ordered_stations (halt-filtered)
-                        adjusted_station_km_map = {}
-                        missing_stations = []
-                        for station in psr_stations:
-                            if station in station_km_map:
-                                adjusted_station_km_map[station] = station_km_map[station] - start_dist
-                            else:
-                                missing_stations.append(station)
-
-                        print(f"[DEBUG] Adjusted station KM map for PSR: {len(adjusted_station_km_map)} stations")
-                        print(f"[DEBUG] First 5: {list(adjusted_station_km_map.items())[:5]}")
-                        print(f"[DEBUG] Last 5: {list(adjusted_station_km_map.items())[-5:]}")
-                        if missing_stations:
-                            print(f"[DEBUG] Missing from station_km_map: {missing_stations}")
-                    else:
-                        # No halts matched - use original data
-                        adjusted_station_km_map = station_km_map
-                        print(f"[DEBUG] No halts matched - using original data")
-
-                    # Calculate PSR/MPS values
-                    try:
-                        print(f"[DEBUG] Starting PSR calculation for train_type={train_type}...")
-                        print(f"[DEBUG] Using {len(psr_stations)} corridor stations for PSR (not just halting stations)")
-                        spm_data_dicts = df.to_dicts()
-                        psr_values = psr_calculator.process_train_speed_limits(
-                            spm_data_dicts,
-                            psr_stations,  # Use all corridor stations, not just halting stations
-                            adjusted_station_km_map,
-                            halting_station_map,
-                            train_type,
-                            semi_fast_info=semi_fast_info
-                        )
-
-                        print(f"[DEBUG] PSR calculation complete! Got {len(psr_values)} values")
-                        print(f"[DEBUG] Sample PSR values: {psr_values[:10]}")
-
-                        # Add PSR values to dataframe as a new column
-                        # Use pl.Series to properly add the list as a column
-                        df = df.with_columns([
-                            pl.Series('PSR', psr_values)
-                        ])
-
-                        # Detect violations (individual points)
-                        violations = detect_violations(spm_data_dicts, psr_values)
-                        print(f"[DEBUG] Found {len(violations)} individual violations")
-
-                        # Detect overspeed events (grouped, with threshold=PSR+3)
-                        overspeed_events = detect_overspeed_events(spm_data_dicts, psr_values, threshold_offset=3, min_duration=7)
-                        overspeed_summary = get_overspeed_summary(overspeed_events)
-                        print(f"[DEBUG] Found {len(overspeed_events)} overspeed events")
-
-                    except Exception as psr_error:
-                        print(f"[ERROR] Could not calculate PSR/MPS: {psr_error}")
-                        import traceback
-                        traceback.print_exc()
-                        # Continue without PSR data
-
-        spm_rows = df.to_dicts()
-
-        if halting_station_map and ordered_stations:
-            entry_samples_for_calc = [
-                {
-                    "cumulative_distance": float(row.get("cumulative_distance") or 0.0),
-                    "speed": float(row.get("Speed") or 0.0)
-                }
-                for row in spm_rows
-            ]
-            try:
-                if entry_calculator is None:
-                    entry_calculator = PlatformEntryCalculator()
-                platform_entry_data = entry_calculator.calculate_platform_entry_speeds(
-                    halting_station_map,
-                    ordered_stations,
-                    entry_samples_for_calc,
-                    train_type or "slow"
-                )
-            except Exception as entry_error:
-                print(f"[ERROR] Could not calculate platform entry speeds: {entry_error}")
-                import traceback
-                traceback.print_exc()
-                platform_entry_data = {}
-
-        # Detect brake feel tests
-        brake_tests = []
-        if spm_rows:
-            samples_for_brake = [
-                {"speed": float(row.get("Speed") or 0), "timestamp": row.get("Time", "")}
-                for row in spm_rows
-            ]
-            brake_tests = [
-                {
-                    "start_index": test.start_index,
-                    "max_speed": test.max_speed,
-                    "lowest_speed": test.lowest_speed,
-                    "speed_drop": test.speed_drop,
-                }
-                for test in brakefeel_detector.detect_from_samples(samples_for_brake)
-            ][:1]  # Only first test
-
-        # Generate abnormality text for daily summary
-        abnormality_text = generate_abnormality_text(
-            overspeed_events,
-            platform_entry_data,
-            brake_tests
-        )
-        print(f"[DEBUG] Abnormality: {abnormality_text[:100]}...")
-
-        # Generate run ID with UUID to prevent collisions when multiple users upload simultaneously
-        run_id = f"RUN_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-
-        # Prepare run_row for DB insert (will be saved on confirm)
-        run_row = {
-            "run_id": run_id,
-            "uploaded_by_user_id": None,
-            "original_filename": file.filename,
-            "date_of_working": date_of_working,
+    try:
+        # Parse and analyse off the event loop. In a worker process by default, so
+        # a long run no longer stalls /chart_data and the reports pages for
+        # everyone else; see analysis_pipeline.py.
+        params = {
             "train_number": train_number,
-            "unit_no": unit_number,
             "from_station": from_station,
             "to_station": to_station,
-            "motorman_hrms_id": staff_id,
-            "motorman_cms_id": motorman_cms_id or None,
-            "nom_cli_cms_id": nominated_cli_cms_id or None,
-            "done_by_cli_cms_id": analysed_by or None,
-            "abnormality_noticed": abnormality_text,
-            "max_speed": float(df["Speed"].max()),
-            "avg_speed": float(df["Speed"].mean()),
-            "total_distance": float(df["Distance"].sum()),
         }
+        # The same file with the same parameters was analysed before: reuse it.
+        cache_key = analysis_cache.cache_key(
+            spooled.sha256, params, get_reference_data(DATA_ROOT).version, suffix=tmp_path.suffix,
+        )
+        with timing.span("analysis_cache.get"):
+            result = await _in_threadpool(analysis_cache.get, cache_key)
+        analysis_cached = result is not None
+        if result is None:
+            result = await _timed_analysis(analyse_upload, str(tmp_path), params, spooled.sha256)
+            try:
+                with timing.span("analysis_cache.put"):
+                    await _in_threadpool(analysis_cache.put, cache_key, result)
+            except Exception as cache_error:
+                logger.error("Could not cache analysis of %s: %s", file.filename, cache_error)
 
-        # Check if there's an existing run with same date+train+from+to
-        existing_run_id = find_existing_run(date_of_working, train_number, from_station, to_station)
-        existing_analysis_date = None
-        if existing_run_id:
-            existing_run = get_run(existing_run_id)
-            if existing_run and existing_run.get('analysis_date'):
-                # Convert UTC to IST (+05:30) for display
-                utc_date = existing_run['analysis_date']
-                if hasattr(utc_date, 'strftime'):
-                    ist_date = utc_date + timedelta(hours=5, minutes=30)
-                    existing_analysis_date = ist_date.strftime('%d-%m-%Y %H:%M')
-                else:
-                    existing_analysis_date = str(utc_date)
-
-        # Departure / arrival / running time.
-        #
-        # Computed HERE, before the run is stored, not just before the response.
-        # These three values feed the PDF's metadata grid, and the server has no
-        # other way to recover them once the request ends — the raw Time column is
-        # in the frame, but the midnight-crossing arithmetic is not repeated anywhere.
-        start_time = None
-        end_time = None
-        duration = None
-        if "Time" in df.columns and len(df) > 0:
-            first_time = df["Time"][0]
-            last_time = df["Time"][-1]
-            if first_time:
-                start_time = str(first_time)
-            if last_time:
-                end_time = str(last_time)
-
-            # Calculate duration with midnight crossing handling
-            if start_time and end_time:
-                try:
-                    from datetime import datetime as dt, timedelta as td
-                    fmt = "%H:%M:%S"
-                    # Try parsing with seconds
-                    try:
-                        t1 = dt.strptime(start_time, fmt)
-                        t2 = dt.strptime(end_time, fmt)
-                    except ValueError:
-                        # Try without seconds
-                        fmt = "%H:%M"
-                        t1 = dt.strptime(start_time[:5], fmt)
-                        t2 = dt.strptime(end_time[:5], fmt)
-
-                    diff = t2 - t1
-                    # Handle midnight crossing
-                    if diff.total_seconds() < 0:
-                        diff = diff + td(days=1)
-                    total_secs = int(diff.total_seconds())
-                    hours = total_secs // 3600
-                    mins = (total_secs % 3600) // 60
-                    secs = total_secs % 60
-                    duration = f"{hours:02d}:{mins:02d}:{secs:02d}"
-                except Exception as e:
-                    print(f"[DEBUG] Could not calculate duration: {e}")
-
-        station_window_rows = []
-        window_point_rows = []
-        if platform_entry_data:
-            distance_samples = list(halting_station_map.values())
-            if not distance_samples:
-                distance_samples = [
-                    float(row.get("cumulative_distance") or 0.0)
-                    for row in spm_rows
-                    if row.get("cumulative_distance") is not None
-                ]
-            calc_for_scale = entry_calculator or PlatformEntryCalculator()
-            use_meter_scale = calc_for_scale._is_meter_scale(distance_samples) if distance_samples else False
-            entry_calculator = calc_for_scale
-
-            for station_name, station_info in platform_entry_data.items():
-                halt_km = station_info.get("halt_distance")
-                halt_distance_raw = halting_station_map.get(station_name)
-                if halt_km is None or halt_distance_raw is None:
-                    continue
-
-                platform_length_km = station_info.get("platform_length_km")
-                platform_length_m = int(round(platform_length_km * 1000)) if platform_length_km is not None else None
-
-                station_window_rows.append((
-                    run_id,
-                    station_name,
-                    halt_km,
-                    platform_length_m,
-                    "isd",
-                    station_info.get("section"),
-                    station_info.get("entry_speed"),
-                    station_info.get("mid_platform_speed"),
-                    station_info.get("one_coach_speed"),
-                    station_info.get("entry_gap_m"),
-                    station_info.get("mid_gap_m"),
-                    station_info.get("one_coach_gap_m"),
-                    train_type
-                ))
-
-                entry_distance_km = station_info.get("entry_distance")
-                if entry_distance_km is None:
-                    continue
-
-                entry_distance_raw = entry_distance_km * (1000.0 if use_meter_scale else 1.0)
-                start_distance = min(entry_distance_raw, halt_distance_raw)
-                end_distance = max(entry_distance_raw, halt_distance_raw)
-                seq = 0
-                for row in spm_rows:
-                    cd_raw = row.get("cumulative_distance")
-                    if cd_raw is None:
-                        continue
-                    cd_val = float(cd_raw)
-                    if cd_val < start_distance:
-                        continue
-                    if cd_val > end_distance and seq > 0:
-                        break
-
-                    psr_val = row.get("PSR")
-                    if isinstance(psr_val, (list, tuple)):
-                        psr_val = next((v for v in psr_val if v is not None), None)
-                    psr_float = None if psr_val is None else float(psr_val)
-
-                    speed_val = float(row.get("Speed") or 0.0)
-                    time_val = row.get("Time")
-                    window_point_rows.append((
-                        run_id,
-                        station_name,
-                        seq,
-                        cd_val / 1000.0 if use_meter_scale else cd_val,
-                        speed_val,
-                        psr_float,
-                        str(time_val) if time_val is not None else ""
-                    ))
-                    seq += 1
-
-        # Store the run: frame to Parquet, everything else to a pickle sidecar.
-        # Nothing is written to the DB yet — that happens on Confirm & Save.
-        # `data` (the sample rows) is deliberately absent from meta; it IS the frame.
-        run_store.put_run(run_id, df, {
-            "run_id": run_id,
-            "confirmed": False,  # Not saved to DB yet
-            "existing_run_id": existing_run_id,  # For duplicate handling on confirm
-            "existing_analysis_date": existing_analysis_date,  # When the duplicate was analyzed
+        return await _store_analysed_run(run_id, result, params, {
             "filename": file.filename,
+            "file_sha256": spooled.sha256,
             "staff_id": staff_id,
-            "motorman_name": motorman_name,
-            "motorman_hq": motorman_hq,
-            "nominated_cli_name": nominated_cli_name,
-            "from_station": from_station,
-            "to_station": to_station,
-            "train_number": train_number,
             "date_of_working": date_of_working,
             "analysed_by": analysed_by,
-            "analysed_by_name": analysed_by_name,
             "unit_number": unit_number,
-            "train_type": train_type,
             "notes": notes,
-            "uploaded_at": datetime.now().isoformat(),
-            "corridor_info": corridor_info,
-            "halting_stations": halting_station_map,
-            "ordered_stations": ordered_stations if 'ordered_stations' in locals() else [],
-            "violations": violations,
-            "violation_count": len(violations),
-            "overspeed_events": overspeed_events,
-            "overspeed_summary": overspeed_summary,
-            "brake_tests": brake_tests,
-            "abnormality_text": abnormality_text,
-            "row_count": len(df),
-            "max_speed": float(df["Speed"].max()),
-            "total_distance": float(df["Distance"].sum()),
-            "platform_entry_data": platform_entry_data,
-            "run_row": run_row,  # Store for DB insert on confirm
-            "station_window_rows": station_window_rows,
-            "window_point_rows": window_point_rows,
-            # Needed by the PDF metadata grid; see the comment where these are computed.
-            "start_time": start_time,
-            "end_time": end_time,
-            "duration": duration,
-        })
-
-        # NOTE: DB insert moved to /api/confirm/{run_id} endpoint
-        # Data is only saved when user clicks "Confirm & Save"
+        }, analysis_cached=analysis_cached)
 
-        return {
-            "success": True,
-            "run_id": run_id,
-            "has_existing_duplicate": existing_run_id is not None,
-            "existing_analysis_date": existing_analysis_date,
-            "rows_processed": len(df),
-            "motorman_name": motorman_name,
-            "motorman_hq": motorman_hq,
-            "nominated_cli_name": nominated_cli_name,
-            "corridor_info": corridor_info,
-            "train_type": train_type,
-            "halts_detected": len(halting_station_map),
-            "halting_stations": list(halting_station_map.keys()),
-            "violation_count": len(violations),
-            "violations_summary": {
-                "critical": len([v for v in violations if v['severity'] == 'critical']),
-                "severe": len([v for v in violations if v['severity'] == 'severe']),
-                "moderate": len([v for v in violations if v['severity'] == 'moderate']),
-                "minor": len([v for v in violations if v['severity'] == 'minor']),
-            },
-            "summary": {
-                "max_speed": float(df["Speed"].max()),
-                "avg_speed": float(df["Speed"].mean()),
-                "total_distance": float(df["Distance"].sum()),
-                "psr_calculated": len(psr_values) > 0,
-            },
-            "start_time": start_time,
-            "end_time": end_time,
-            "duration": duration,
-            "overspeed_events": overspeed_events,
-            "overspeed_summary": overspeed_summary,
-            "abnormality_text": abnormality_text,
-        }
+    except AnalysisInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
@@ -1135,10 +720,86 @@ async def upload_spm_file(
         tmp_path.unlink(missing_ok=True)
 
 
+@app.post("/runs/{run_id}/reanalyze")
+async def reanalyze_run(
+    run_id: str,
+    train_number: Optional[str] = Body(None),
+    from_station: Optional[str] = Body(None),
+    to_station: Optional[str] = Body(None),
+):
+    """
+    Analyse a stored run again with a new train number or from/to station,
+    without uploading the file again. Fields left out keep the values the run
+    was analysed with; an empty string clears one.
+
+    Starts from the run's stored source frame and raw halts, so parsing and
+    halt detection are skipped: only corridor resolution, ISD matching, PSR
+    and what follows run again. The result is stored as a new run and the
+    response has the /upload shape; the old run is left as it is.
+    """
+    meta = await _in_threadpool(run_store.get_meta, run_id)
+    if meta is None:
+        raise HTTPException(status_code=410, detail="Run has expired; please re-upload the file")
+    try:
+        with timing.span("run_store.get_source_frame"):
+            source = await _in_threadpool(run_store.get_source_frame, run_id)
+    except KeyError:
+        raise HTTPException(status_code=409, detail="Run was stored without its source data; please re-upload the file")
+
+    params = dict(meta.get("analysis_params") or {
+        "train_number": meta.get("train_number"),
+        "from_station": meta.get("from_station"),
+        "to_station": meta.get("to_station"),
+    })
+    for name, value in (("train_number", train_number), ("from_station", from_station), ("to_station", to_station)):
+        if value is not None:
+            params[name] = value or None
+
+    new_run_id = _new_run_id()
+    try:
+        cache_key = None
+        result = None
+        if meta.get("file_sha256"):
+            cache_key = analysis_cache.cache_key(
+                meta["file_sha256"], params, get_reference_data(DATA_ROOT).version,
+                suffix=Path(meta.get("filename") or "").suffix,
+            )
+            with timing.span("analysis_cache.get"):
+                result = await _in_threadpool(analysis_cache.get, cache_key)
+        analysis_cached = result is not None
+        if result is None:
+            result = await _timed_analysis(
+                reanalyse_frame, source, params, meta.get("raw_halts"), meta.get("frame_key"),
+            )
+            result["source_df"] = source
+            if cache_key is not None:
+                try:
+                    with timing.span("analysis_cache.put"):
+                        await _in_threadpool(analysis_cache.put, cache_key, result)
+                except Exception as cache_error:
+                    logger.error("Could not cache re-analysis of %s: %s", run_id, cache_error)
+
+        return await _store_analysed_run(new_run_id, result, params, {
+            "filename": meta.get("filename"),
+            "file_sha256": meta.get("file_sha256"),
+            "staff_id": meta.get("staff_id"),
+            "date_of_working": meta.get("date_of_working"),
+            "analysed_by": meta.get("analysed_by"),
+            "unit_number": meta.get("unit_number"),
+            "notes": meta.get("notes"),
+        }, analysis_cached=analysis_cached)
+
+    except AnalysisInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error re-analysing run: {str(e)}")
+
+
 @app.get("/runs")
 async def list_runs():
     """List all uploaded runs"""
-    # Served entirely from the RAM index — no Parquet or sidecar reads.
+    # Served entirely from the run_store index — no Parquet or sidecar reads.
     return {
         "runs": [
             {
@@ -1252,6 +913,75 @@ async def export_daily_csv(date: Optional[str] = None):
     )
 
 
+@app.get("/api/analysis-cache")
+async def api_analysis_cache_stats():
+    """Hit/miss counters and size of the /upload analysis cache (analysis_cache.py)."""
+    return analysis_cache.stats()
+
+
+@app.get("/api/timings")
+async def api_timings():
+    """Recent stage durations per span name (timing.py): percentiles and buckets."""
+    return timing.histogram()
+
+
+def _store_metrics() -> List[str]:
+    """run_store and analysis_cache figures for /metrics, read at scrape time."""
+    runs = run_store.stats()
+    cache = analysis_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    return [
+        *metrics.sample_lines("spm_run_store_runs", "gauge", "Runs in the run_store index.", [({}, runs["runs"])]),
+        *metrics.sample_lines("spm_run_store_max_runs", "gauge", "run_store capacity (MAX_RUNS).", [({}, runs["max_runs"])]),
+        *metrics.sample_lines("spm_run_store_bytes", "gauge", "Bytes of run files in RUNS_DIR.", [({}, runs["bytes"])]),
+        *metrics.sample_lines(
+            "spm_run_store_evictions_total", "counter",
+            "Runs dropped: at capacity (evicted) or past the TTL (expired).",
+            [({"reason": "evicted"}, runs["evicted"]), ({"reason": "expired"}, runs["expired"])],
+        ),
+        *metrics.sample_lines(
+            "spm_analysis_cache_requests_total", "counter", "Upload analysis cache lookups by result.",
+            [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])],
+        ),
+        *metrics.sample_lines(
+            "spm_analysis_cache_hit_ratio", "gauge", "Upload analysis cache hits over lookups since start.",
+            [({}, cache["hits"] / lookups if lookups else 0)],
+        ),
+        *metrics.sample_lines("spm_analysis_cache_stores_total", "counter", "Analyses stored in the cache.", [({}, cache["stores"])]),
+        *metrics.sample_lines("spm_analysis_cache_evictions_total", "counter", "Cache entries evicted to stay within budget.", [({}, cache["evictions"])]),
+        *metrics.sample_lines("spm_analysis_cache_entries", "gauge", "Entries in the analysis cache.", [({}, cache["entries"])]),
+        *metrics.sample_lines("spm_analysis_cache_bytes", "gauge", "Bytes of analysis cache entries.", [({}, cache["bytes"])]),
+    ]
+
+
+metrics.register_collector(_store_metrics)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Service metrics in the Prometheus text format (metrics.py)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/profiles")
+async def api_profiles(request: Request):
+    """Stored request profiles (profiling.py), newest first."""
+    if not (profiling.ENABLED and profiling.authorized(request.headers)):
+        raise HTTPException(status_code=404, detail="Not found")
+    return profiling.list_profiles()
+
+
+@app.get("/api/profiles/{name}")
+async def download_profile(name: str, request: Request):
+    """Download one stored .prof file (pstats format)."""
+    if not (profiling.ENABLED and profiling.authorized(request.headers)):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
 @app.get("/runs/{run_id}")
 async def get_run_details(run_id: str):
     """Get metadata for a specific run (without the sample rows)."""
@@ -1262,22 +992,136 @@ async def get_run_details(run_id: str):
     return meta
 
 
+def _parse_offsets(offsets: str) -> List[float]:
+    """'0,3,5,10' -> [0, 3, 5, 10]; ints stay ints so thresholds read as before."""
+    values = []
+    for part in offsets.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        value = float(part)
+        values.append(int(value) if value.is_integer() else value)
+    return values
+
+
+@app.get("/runs/{run_id}/overspeed")
+async def get_run_overspeed(
+    run_id: str,
+    offsets: str = Query("0,3,5,10", description="Comma-separated km/h tolerances above PSR"),
+    min_duration: int = Query(7, ge=1, description="Minimum overspeed samples per event"),
+):
+    """
+    Overspeed events for several thresholds at once, from the stored run.
+
+    Re-runs detection over the run's Parquet frame, reusing the PSR column
+    saved at upload — no re-upload, no PSR recalculation. /upload itself still
+    reports PSR+3 with 7 samples.
+    """
+    try:
+        offset_list = _parse_offsets(offsets)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"offsets must be comma-separated numbers, got {offsets!r}")
+    if not offset_list or len(offset_list) > 20:
+        raise HTTPException(status_code=400, detail="Give between 1 and 20 offsets")
+
+    def sweep():
+        df = run_store.get_frame(run_id)  # KeyError when expired
+        if "PSR" not in df.columns:
+            return None
+        return detect_overspeed_events_multi(
+            df["Speed"].to_numpy(),
+            df["PSR"].to_list(),
+            df["cumulative_distance"].to_numpy(),
+            df["Time"].to_list() if "Time" in df.columns else [""] * len(df),
+            offset_list,
+            min_duration,
+        )
+
+    try:
+        results = await run_in_threadpool(sweep)
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Run has expired; please re-upload the file")
+    if results is None:
+        raise HTTPException(status_code=409, detail="No PSR was calculated for this run")
+    return {
+        "run_id": run_id,
+        "min_duration": min_duration,
+        "results": [
+            {
+                "offset": offset,
+                "events": events,
+                "summary": get_overspeed_summary(events),
+            }
+            for offset, events in results.items()
+        ],
+    }
+
+
 @app.post("/chart_data")
 async def get_chart_data(
+    request: Request,
     run_id: Optional[str] = Body(None),
     from_station_equals: Optional[str] = Body(None),
     to_station_equals: Optional[str] = Body(None),
+    format: Optional[str] = Body(None),
 ):
     """
     Get chart data for visualization
     If run_id is provided, return that specific run
     Otherwise return the latest run matching the criteria
+    format: rows (default), columnar or arrow — see chart_payload.FORMATS
     """
     if not run_id:
         raise HTTPException(status_code=400, detail="run_id is required")
 
+    return await _chart_payload_response(request, run_id, format or "rows")
+
+
+@app.get("/runs/{run_id}/chart_data")
+async def get_run_chart_data(run_id: str, request: Request, format: str = Query("rows")):
+    """The /chart_data payload as a cacheable GET (ETag / If-None-Match)."""
+    return await _chart_payload_response(request, run_id, format)
+
+
+@app.get("/runs/{run_id}/series")
+async def get_run_series(
+    run_id: str,
+    from_km: Optional[float] = Query(None, description="Window start, km of cumulative distance"),
+    to_km: Optional[float] = Query(None, description="Window end, km of cumulative distance"),
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=3, le=20000),
+):
+    """
+    LTTB-downsampled speed and PSR for a distance window of the run, for
+    zooming the speed chart without sending every sample. Overspeed peaks, BFT
+    indices, halts, station markers and PSR steps are always included.
+    """
+    if from_km is not None and to_km is not None and from_km > to_km:
+        raise HTTPException(status_code=400, detail="from_km must not be greater than to_km")
+
+    def window():
+        meta = run_store.get_meta(run_id)
+        if meta is None:
+            raise KeyError(run_id)
+        return series_window(run_store.get_frame(run_id), meta, from_km, to_km, max_points)
+
     try:
-        run_data = run_store.load_run(run_id)
+        return await run_in_threadpool(window)
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Run has expired; please re-upload the file")
+
+
+async def _chart_payload_response(request: Request, run_id: str, fmt: str = "rows") -> Response:
+    """
+    Serve the stored payload bytes as they are: gzipped JSON (or the Arrow IPC
+    stream for format=arrow) with an ETag. 304 when If-None-Match matches;
+    JSON is decompressed for clients without gzip.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(MEDIA_TYPES)}")
+    try:
+        data, etag = await _in_threadpool(get_chart_payload, run_id, fmt)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
     except KeyError:
         # There used to be a DB fallback here that read div_sub_spm_points. Nothing
         # ever writes that table — insert_points() has zero callers, and
@@ -1289,171 +1133,16 @@ async def get_chart_data(
             detail="Run data expired — re-upload the SPM file to view charts",
         )
 
-    return build_chart_payload(run_data)
-
-
-def build_chart_payload(run_data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Build the chart payload consumed by ui/spm.html and by the PDF renderer.
-
-    Extracted from the body of POST /chart_data so the on-screen report and the
-    generated PDF are provably fed from the same computation. `run_data` is a
-    run_store meta dict plus a "data" key holding the sample rows.
-    """
-    # Convert stored data to chart format
-    samples = []
-    entry_samples = []
-    first_halt_index = run_data.get("first_halt_index")
-    for idx, row in enumerate(run_data["data"]):
-        timestamp = f"{row.get('Time', '')}" if row.get('Time') else f"T+{idx}s"
-        raw_cumulative = float(row.get("cumulative_distance", 0) or 0)
-        raw_speed = float(row.get("Speed", 0) or 0)
-
-        sample = {
-            "timestamp": timestamp,
-            "distance": round(float(row.get("Distance", 0) or 0), 2),
-            "cumulative_distance": round(raw_cumulative, 2),
-            "speed": raw_speed,
-            "station": "",  # Could be enriched with station data from corridor_loader
-        }
-
-        # Add PSR/MPS if available
-        if "PSR" in row and row["PSR"] is not None:
-            # Handle both single values and potential list wrapping
-            psr_val = row["PSR"]
-            if isinstance(psr_val, (list, tuple)) and len(psr_val) > 0:
-                psr_val = psr_val[0]  # Unwrap if it's a list
-            if psr_val is not None:
-                sample["psr"] = float(psr_val)
-
-
-        samples.append(sample)
-        entry_samples.append({
-            "cumulative_distance": raw_cumulative,
-            "speed": raw_speed
-        })
-
-    # Detect brake feel tests (using per-sample speeds)
-    brake_tests = [
-        {
-            "start_index": test.start_index,
-            "end_index": test.end_index,
-            "max_speed_index": test.max_speed_index,
-            "lowest_speed_index": test.lowest_speed_index,
-            "recovery_index": test.recovery_index,
-            "braking_start_index": test.braking_start_index,
-            "start_speed": test.start_speed,
-            "max_speed": test.max_speed,
-            "braking_start_speed": test.braking_start_speed,
-            "lowest_speed": test.lowest_speed,
-            "recovery_speed": test.recovery_speed,
-            "speed_drop": test.speed_drop,
-            "duration": test.duration,
-        }
-        for test in brakefeel_detector.detect_from_samples(samples)
-    ][:1]
-
-    # Prepare station markers for chart visualization
-    # Map each station to its nearest sample index for chart positioning
-    halting_stations = run_data.get("halting_stations", {})
-    ordered_stations = run_data.get("ordered_stations", [])
-    train_type = run_data.get("train_type", "slow")
-    station_markers = []
-
-    # Calculate platform entry speeds
-    platform_entry_data = {}
-    if ordered_stations and halting_stations:
-        try:
-            entry_calculator = PlatformEntryCalculator()
-            platform_entry_data = entry_calculator.calculate_platform_entry_speeds(
-                halting_stations,
-                ordered_stations,
-                entry_samples if entry_samples else samples,
-                train_type
-            )
-        except Exception as e:
-            print(f"[ERROR] Could not calculate platform entry speeds: {e}")
-            import traceback
-            traceback.print_exc()
-
-    for station_name, halt_dist_km in halting_stations.items():
-        # Find the sample closest to this halt distance
-        closest_idx = 0
-        min_diff = float('inf')
-
-        for idx, sample in enumerate(samples):
-            diff = abs(sample["cumulative_distance"] - halt_dist_km)
-            if diff < min_diff:
-                min_diff = diff
-                closest_idx = idx
-
-        # Get platform entry speeds if available
-        entry_speed = None
-        mid_platform_speed = None
-        one_coach_speed = None
-        if station_name in platform_entry_data:
-            entry_speed = platform_entry_data[station_name].get('entry_speed')
-            mid_platform_speed = platform_entry_data[station_name].get('mid_platform_speed')
-            one_coach_speed = platform_entry_data[station_name].get('one_coach_speed')
-
-        station_markers.append({
-            "station": station_name,
-            "distance": round(halt_dist_km, 2),
-            "sample_index": closest_idx,
-            "platform_entry_speed": round(entry_speed, 1) if entry_speed is not None else None,
-            "mid_platform_speed": round(mid_platform_speed, 1) if mid_platform_speed is not None else None,
-            "one_coach_speed": round(one_coach_speed, 1) if one_coach_speed is not None else None
-        })
-        if first_halt_index is None or closest_idx < first_halt_index:
-            first_halt_index = closest_idx
-
-    # Ensure the chart shows the starting station even if no halt was detected there
-    start_station = run_data.get("from_station") or (ordered_stations[0] if ordered_stations else None)
-    if start_station and all(marker["station"] != start_station for marker in station_markers):
-        first_sample = samples[0] if samples else None
-        start_distance = first_sample["cumulative_distance"] if first_sample else 0.0
-        station_markers.insert(0, {
-            "station": start_station,
-            "distance": round(float(start_distance), 2),
-            "sample_index": 0,
-            "platform_entry_speed": 0.0,  # starting point speed is effectively 0 km/h
-            "mid_platform_speed": None,
-            "one_coach_speed": None
-        })
-
-    if first_halt_index is None:
-        for idx, sample in enumerate(samples):
-            if idx == 0:
-                continue
-            if (sample.get("speed") == 0 and
-                (sample.get("distance") == 0 or sample.get("cumulative_distance") == 0)):
-                first_halt_index = idx
-                break
-
-    return {
-        "samples": samples,
-        "run_id": run_data["run_id"],
-        "metadata": {
-            "staff_id": run_data.get("staff_id"),
-            "from_station": run_data.get("from_station"),
-            "to_station": run_data.get("to_station"),
-            "train_number": run_data.get("train_number"),
-            "train_type": run_data.get("train_type"),
-            "date_of_working": run_data.get("date_of_working"),
-            "analysed_by": run_data.get("analysed_by"),
-            "unit_number": run_data.get("unit_number"),
-            "notes": run_data.get("notes"),
-        },
-        "halting_stations": halting_stations,
-        "station_markers": station_markers,
-        "brake_tests": brake_tests,
-        "first_halt_index": first_halt_index,
-        "platform_entry_data": platform_entry_data,
-        "violations": run_data.get("violations", []),
-        "violation_count": run_data.get("violation_count", 0),
-        "overspeed_events": run_data.get("overspeed_events", []),
-        "overspeed_summary": run_data.get("overspeed_summary", {}),
-    }
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if fmt not in GZIPPED_FORMATS:
+        return Response(content=data, media_type=MEDIA_TYPES[fmt], headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=data, media_type=MEDIA_TYPES[fmt], headers=headers)
+    return Response(content=gzip.decompress(data), media_type=MEDIA_TYPES[fmt], headers=headers)
 
 
 @app.delete("/runs/{run_id}")
@@ -1471,6 +1160,7 @@ async def confirm_run(run_id: str):
     Confirm and save a run to the database.
     Data is only saved when user explicitly confirms after reviewing charts.
     """
+    log_config.bind_run_id(run_id)
     run_data = run_store.get_meta(run_id)
     if run_data is None:
         raise HTTPException(
@@ -1486,7 +1176,7 @@ async def confirm_run(run_id: str):
     existing_run_id = run_data.get("existing_run_id")
     replaced_existing = False
     if existing_run_id:
-        print(f"[DEBUG DB] Found existing run {existing_run_id}, replacing...")
+        logger.debug("Found existing run %s, replacing...", existing_run_id)
         _delete_pdf_for_run(existing_run_id)   # before the row goes, or the file leaks
         delete_run_cascade(existing_run_id)
         replaced_existing = True
@@ -1508,7 +1198,7 @@ async def confirm_run(run_id: str):
         # Mark as confirmed
         run_store.update_meta(run_id, confirmed=True)
 
-        print(f"[DEBUG DB] Run {run_id} confirmed and saved to database")
+        logger.debug("Run %s confirmed and saved to database", run_id)
 
         result = {
             "success": True,
@@ -1525,17 +1215,14 @@ async def confirm_run(run_id: str):
             result["pdf_saved"] = True
             result["pdf_filename"] = saved["filename"]
         except Exception as pdf_error:
-            import traceback
-            traceback.print_exc()
+            logger.exception("Could not generate PDF for run %s", run_id)
             result["pdf_saved"] = False
             result["pdf_error"] = str(pdf_error)
 
         return result
 
     except Exception as e:
-        print(f"[ERROR] Failed to save run {run_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to save run %s", run_id)
         raise HTTPException(status_code=500, detail=f"Failed to save: {str(e)}")
 
 
@@ -1957,7 +1644,7 @@ def _delete_pdf_for_run(run_id: str) -> None:
             if path.exists():
                 path.unlink()
     except Exception as exc:
-        print(f"[WARN] Could not remove PDF for run {run_id}: {exc}")
+        logger.warning("Could not remove PDF for run %s: %s", run_id, exc)
     finally:
         cn.close()
 
@@ -1977,17 +1664,32 @@ def _build_pdf_bytes(run_id: str) -> Tuple[bytes, Dict[str, Any]]:
     from report_model import build_report_model
     from pdf_report import build_report_pdf
 
-    run_data = run_store.load_run(run_id)          # KeyError when expired
-    payload = build_chart_payload(run_data)
+    run_data = run_store.get_meta(run_id)
+    if run_data is None:
+        raise KeyError(run_id)
+    with timing.span("pdf.chart_payload"):
+        payload = decode_payload(get_chart_payload(run_id)[0])
     analysis_dt = datetime.now(timezone(timedelta(hours=5, minutes=30)))
 
-    with _PDF_SEMAPHORE:
-        model = build_report_model(
-            run_data, payload,
-            analysis_dt=analysis_dt,
-            reference_data_dir=DATA_ROOT / "reference_data",
-        )
-        return build_report_pdf(model), run_data
+    metrics.PDF_WAITING.inc()
+    try:
+        with timing.span("pdf.wait"):
+            _PDF_SEMAPHORE.acquire()
+    finally:
+        metrics.PDF_WAITING.dec()
+    metrics.PDF_RENDERING.inc()
+    try:
+        with timing.span("pdf.report_model", rows=len(payload.get("samples", []))):
+            model = build_report_model(
+                run_data, payload,
+                analysis_dt=analysis_dt,
+                reference_data=get_reference_data(DATA_ROOT),
+            )
+        with timing.span("pdf.render"):
+            return build_report_pdf(model), run_data
+    finally:
+        metrics.PDF_RENDERING.dec()
+        _PDF_SEMAPHORE.release()
 
 
 def _generate_and_store_pdf(run_id: str) -> Dict[str, Any]:
@@ -2060,16 +1762,16 @@ async def save_motorman_report(run_id: str):
     Normally this happens automatically on Confirm & Save; this endpoint exists to
     regenerate a report without re-confirming.
     """
+    log_config.bind_run_id(run_id)
     try:
-        return await run_in_threadpool(_generate_and_store_pdf, run_id)
+        return await _in_threadpool(_generate_and_store_pdf, run_id)
     except KeyError:
         raise HTTPException(
             status_code=410,
             detail="Run data expired — re-upload the SPM file to regenerate the PDF",
         )
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Could not save PDF for run %s", run_id)
         raise HTTPException(status_code=500, detail=f"Failed to save PDF: {str(e)}")
 
 
@@ -2110,7 +1812,7 @@ async def preview_motorman_report(run_id: str):
     checking layout against the browser's print output.
     """
     try:
-        pdf_bytes, meta = await run_in_threadpool(_build_pdf_bytes, run_id)
+        pdf_bytes, meta = await _in_threadpool(_build_pdf_bytes, run_id)
     except KeyError:
         raise HTTPException(
             status_code=410,
@@ -0,0 +1,259 @@
+"""
+Service metrics in the Prometheus text format, for ``GET /metrics``.
+
+pm2 shows a process's CPU and memory and nothing else: not request rates,
+not where uploads spend their time, not how full run_store is or how long a
+request waits for a DB connection or a PDF slot. This module keeps counters,
+gauges and histograms in memory and ``render()`` writes them out in the text
+exposition format (0.0.4). There is no client library and no network
+involved; a scrape formats a few hundred lines from memory, so every 15 s
+is cheap.
+
+Instruments are module-level and updated where the work happens:
+
+====================================  ==========================================
+``spm_http_request_duration_seconds`` main.py middleware, per method/route/status
+``spm_stage_duration_seconds``        every timing.span / timing.record, per stage
+                                      (analysis.*, db.*, pdf.wait — the PDF
+                                      semaphore wait — chart_payload.*, ...)
+``spm_stage_memo_total``              the analysis stages' memo outcomes
+``spm_chart_payload_total``           stored payload served vs rebuilt
+``spm_db_checkout_seconds`` /         db_config.get_db_connection
+``spm_db_checkout_failures_total``
+``spm_pdf_waiting`` /                 _build_pdf_bytes: queued for and holding
+``spm_pdf_rendering``                 the PDF semaphore
+====================================  ==========================================
+
+Values owned by other modules (run_store occupancy and evictions, the analysis
+cache) are read at scrape time by the collectors ``register_collector`` adds.
+"""
+
+from __future__ import annotations
+
+import abc
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds. Covers a 1 ms cache hit up to a long fast-corridor analysis.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names: Sequence[str], values: Sequence[object]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abc.abstractmethod
+    def lines(self) -> List[str]:
+        """HELP, TYPE and the sample lines."""
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative ``le`` buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not math.isinf(self.buckets[-1]):
+            self.buckets += (math.inf,)
+        # label values -> [per-bucket counts (not cumulative)..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, **labels: object) -> int:
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return int(sum(counts[:-1])) if counts else 0
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        out = self.header()
+        names = self.labelnames + ("le",)
+        for key, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                out.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {_number(cumulative)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(cumulative)}")
+        return out
+
+
+# --- registry ----------------------------------------------------------------
+
+_REGISTRY: List[_Metric] = []
+_COLLECTORS: List[Callable[[], Iterable[str]]] = []
+
+
+def register_collector(collect: Callable[[], Iterable[str]]) -> None:
+    """Add a function that returns exposition lines (HELP/TYPE included) at scrape time."""
+    _COLLECTORS.append(collect)
+
+
+def sample_lines(name: str, kind: str, documentation: str, samples: Iterable[Tuple[Dict[str, object], float]]) -> List[str]:
+    """HELP, TYPE and one line per (labels, value) — for collectors."""
+    out = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        out.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+    return out
+
+
+def render() -> str:
+    """Every metric and collector, in the Prometheus text format."""
+    lines: List[str] = []
+    for metric in list(_REGISTRY):
+        lines.extend(metric.lines())
+    for collect in list(_COLLECTORS):
+        try:
+            lines.extend(collect())
+        except Exception:
+            # One broken collector must not take the whole scrape down
+            continue
+    return "\n".join(lines) + "\n"
+
+
+# --- instruments -------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "spm_http_request_duration_seconds",
+    "Request latency by method, route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_IN_PROGRESS = Gauge("spm_http_requests_in_progress", "Requests being handled now.")
+STAGE_SECONDS = Histogram(
+    "spm_stage_duration_seconds",
+    "Duration of timed stages (timing.py spans); pdf.wait is the PDF semaphore wait.",
+    ("stage",),
+)
+STAGE_MEMO = Counter(
+    "spm_stage_memo_total",
+    "Analysis stage memo outcomes (hit, miss, given) by stage.",
+    ("stage", "outcome"),
+)
+CHART_PAYLOAD = Counter(
+    "spm_chart_payload_total",
+    "Chart payload reads: served from the stored bytes (hit) or rebuilt (miss).",
+    ("result",),
+)
+DB_CHECKOUT_SECONDS = Histogram(
+    "spm_db_checkout_seconds",
+    "Time to get a MySQL connection from the pool.",
+)
+DB_CHECKOUT_FAILURES = Counter(
+    "spm_db_checkout_failures_total",
+    "Failed MySQL connection checkouts by exception type.",
+    ("error",),
+)
+PDF_WAITING = Gauge("spm_pdf_waiting", "PDF builds waiting for the PDF semaphore.")
+PDF_RENDERING = Gauge("spm_pdf_rendering", "PDF builds holding the PDF semaphore.")
@@ -59,7 +59,8 @@ except ImportError:  # pragma: no cover
     SimpleDocTemplate = None
     HAVE_RL = False
 
-from report_model import normalise_distances
+from downsample import downsample_indices, feature_indices
+from report_model import normalise_distances, samples_between
 
 # --- palette, lifted from the ECharts options so both stay in step ------------
 
@@ -90,6 +91,10 @@ PE_PALETTE = [
 
 STATION_LINE_SPEED_THRESHOLD = 45
 
+# The speed profile is 10 in at 150 dpi: 1500 px. More points than that only
+# overdraw, so the line is LTTB-downsampled to this first (downsample.py).
+SPEED_PROFILE_MAX_POINTS = 2000
+
 
 def _new_figure(width_in: float, height_in: float, dpi: int) -> Tuple[Any, Any]:
     fig = Figure(figsize=(width_in, height_in), dpi=dpi)
@@ -266,25 +271,35 @@ def render_speed_profile(
     station_markers: Sequence[Dict[str, Any]],
     brake_tests: Sequence[Dict[str, Any]],
     violations: Sequence[Dict[str, Any]],
+    overspeed_events: Sequence[Dict[str, Any]] = (),
 ) -> Optional[BytesIO]:
-    """Port of the #chart ECharts option (ui/spm.html:2366-2519)."""
+    """
+    Port of the #chart ECharts option (ui/spm.html:2366-2519).
+
+    The speed and PSR lines are drawn through downsample_indices' picks, which
+    keep every marker, BFT index, halt edge, overspeed peak and PSR step; the
+    x-axis is still the full sample index range.
+    """
     if not HAVE_MPL or not samples:
         return None
 
     fig, ax = _new_figure(10, 3.6, 150)
-    xs = list(range(len(samples)))
     speeds = [float(s.get("speed") or 0) for s in samples]
     distances_km, _ = normalise_distances(_sample_values(samples, "cumulative_distance"))
 
     psr = _psr_series(samples)
     handles: List[Any] = []
 
+    keep = feature_indices(speeds, psr, brake_tests=brake_tests, overspeed_events=overspeed_events,
+                           station_markers=station_markers, violations=violations)
+    xs = downsample_indices(speeds, SPEED_PROFILE_MAX_POINTS, keep).tolist()
+
     if psr:
-        _draw_psr_band(ax, xs, psr)
+        _draw_psr_band(ax, xs, [psr[i] for i in xs])
         handles.append(Patch(facecolor=PSR_GREEN, alpha=0.25, edgecolor=PSR_GREEN,
                              label="MPS/PSR"))
 
-    ax.plot(xs, speeds, color=SPEED_NAVY, linewidth=2, zorder=2)
+    ax.plot(xs, [speeds[i] for i in xs], color=SPEED_NAVY, linewidth=2, zorder=2)
     handles.append(Line2D([], [], color=SPEED_NAVY, linewidth=2, label="Actual Speed"))
 
     ax.set_ylim(bottom=0)
@@ -442,19 +457,20 @@ def render_platform_entry_charts(
     in_metres = max(distances) > 100
     scale = 1000.0 if in_metres else 1.0
 
-    series: List[Dict[str, Any]] = []
+    # (marker, entry, halt) in sample units; main.py:998 allows None distances
+    spans: List[Tuple[int, float, float]] = []
     for index, marker in enumerate(valid):
-        station = marker.get("station")
-        entry_data = platform_entry_data.get(station) or {}
+        entry_data = platform_entry_data.get(marker.get("station")) or {}
         halt_km = entry_data.get("halt_distance")
         entry_km = entry_data.get("entry_distance")
-        if halt_km is None or entry_km is None:      # main.py:998 allows None
-            continue
+        if halt_km is not None and entry_km is not None:
+            spans.append((index, entry_km * scale, halt_km * scale))
+    windows = samples_between(distances, [e for _, e, _ in spans], [h for _, _, h in spans])
 
-        halt = halt_km * scale
-        entry = entry_km * scale
-        window = [s for s in samples
-                  if entry <= (s.get("cumulative_distance") or 0) <= halt]
+    series: List[Dict[str, Any]] = []
+    for (index, entry, halt), rows in zip(spans, windows):
+        station = valid[index].get("station")
+        window = [samples[i] for i in rows.tolist()]
         if len(window) < 2:
             continue
 
@@ -907,7 +923,8 @@ def build_report_pdf(report: Dict[str, Any]) -> bytes:
         ]))
         story.append(Spacer(1, 8))
 
-    speed_png = render_speed_profile(samples, markers, brake_tests, report["violations"])
+    speed_png = render_speed_profile(samples, markers, brake_tests, report["violations"],
+                                     report.get("overspeed_events") or [])
     if speed_png:
         buffers.append(speed_png)
         story.append(KeepTogether([
@@ -8,21 +8,85 @@ Calculates the speed at which trains enter station platforms by:
 """
 
 import json
-from typing import Dict, List, Optional
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
 from pathlib import Path
 
+import numpy as np
+
+from spm_columns import as_columns
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from reference_data import ReferenceData
+
+
+class DistanceIndex:
+    """
+    One run's samples sorted by cumulative distance, for speed-at-distance lookups.
+
+    Built once per run (a stable argsort), then every lookup is a searchsorted
+    instead of a pass over all samples. The pick is the one find_speed_at_distance
+    has always made: the first sample at or after the target distance (smallest
+    distance; equal distances go to the earlier sample), else — target past the
+    last sample — the nearest one, which is the earliest sample at the maximum
+    distance.
+    """
+
+    def __init__(self, distances: np.ndarray, speeds: np.ndarray) -> None:
+        order = np.argsort(distances, kind="stable")
+        self.distances = np.asarray(distances, dtype=np.float64)[order]
+        self.speeds = np.asarray(speeds, dtype=np.float64)[order]
+        # Fallback position when every sample is before the target
+        self._last = int(np.searchsorted(self.distances, self.distances[-1], side="left")) if len(order) else 0
+
+    @classmethod
+    def from_columns(cls, spm_data) -> "DistanceIndex":
+        """Index over an SpmColumns, a polars frame or a list of SPM samples."""
+        if isinstance(spm_data, DistanceIndex):
+            return spm_data
+        columns = as_columns(spm_data)
+        return cls(columns.cumulative_distance, columns.speed)
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def positions(self, targets: Sequence[float]) -> np.ndarray:
+        """Sorted-array position picked for each target distance."""
+        pos = np.searchsorted(self.distances, np.asarray(targets, dtype=np.float64), side="left")
+        pos[pos == len(self.distances)] = self._last
+        return pos
+
+    def lookup(self, target_distance: float) -> Tuple[float, float]:
+        """(speed, sample distance) picked for one target distance."""
+        speeds, distances = self.lookup_many([target_distance])
+        return speeds[0], distances[0]
+
+    def lookup_many(self, targets: Sequence[float]) -> Tuple[List[float], List[float]]:
+        """(speeds, sample distances) picked for each target, in one searchsorted."""
+        pos = self.positions(targets)
+        return self.speeds[pos].tolist(), self.distances[pos].tolist()
+
 
 class PlatformEntryCalculator:
     """Calculate platform entry speeds for halting stations"""
 
-    def __init__(self, reference_data_dir: str = "reference_data"):
+    def __init__(
+        self,
+        reference_data_dir: str = "reference_data",
+        reference_data: Optional["ReferenceData"] = None,
+    ):
         """
         Initialize platform entry calculator.
 
         Args:
             reference_data_dir: Directory containing ISD JSON files
+            reference_data: Loaded registry; when given, ISD data comes from it
+                and no file is read
         """
         self.reference_data_dir = Path(reference_data_dir)
+        self.reference_data = reference_data
         self.isd_cache = {}
 
     def load_isd_data(self, train_type: str) -> Dict[str, Dict]:
@@ -45,6 +109,9 @@ class PlatformEntryCalculator:
                 }
             }
         """
+        if self.reference_data is not None:
+            return self.reference_data.isd_for(train_type)
+
         cache_key = train_type.lower()
 
         if cache_key in self.isd_cache:
@@ -72,7 +139,7 @@ class PlatformEntryCalculator:
                         if section not in isd_data:
                             isd_data[section] = data
 
-            print(f"[DEBUG ISD] Loaded {len(isd_data)} platform entries (fast + slow combined)")
+            logger.debug("Loaded %s platform entries (fast + slow combined)", len(isd_data))
 
         else:
             # For slow/thb/harbour trains, load only slow ISD
@@ -83,7 +150,7 @@ class PlatformEntryCalculator:
             with open(slow_file, 'r') as f:
                 isd_data = json.load(f)
 
-            print(f"[DEBUG ISD] Loaded {len(isd_data)} platform entries for {train_type} trains")
+            logger.debug("Loaded %s platform entries for %s trains", len(isd_data), train_type)
 
         self.isd_cache[cache_key] = isd_data
         return isd_data
@@ -142,26 +209,26 @@ class PlatformEntryCalculator:
             if platform_data['station'].strip() == station.strip():
                 return platform_data['platform_length_km']
             else:
-                print(f"[DEBUG ISD] Section '{section}' has platform for '{platform_data['station']}', not '{station}'")
+                logger.debug("Section '%s' has platform for '%s', not '%s'", section, platform_data['station'], station)
 
         # If exact match not found or station doesn't match, try SECTION_STATION variant
         variant_key = f"{section}_{station}"
         if variant_key in isd_data:
             platform_data = isd_data[variant_key]
             if platform_data['station'].strip() == station.strip():
-                print(f"[DEBUG ISD] Found {station} platform in variant key '{variant_key}'")
+                logger.debug("Found %s platform in variant key '%s'", station, variant_key)
                 return platform_data['platform_length_km']
 
         # Not found
         if section not in isd_data:
-            print(f"[DEBUG ISD] Section '{section}' not found in ISD data")
+            logger.debug("Section '%s' not found in ISD data", section)
 
         return None
 
     def find_speed_at_distance(
         self,
         target_distance: float,
-        spm_data: List[Dict],
+        spm_data,
         return_distance: bool = False
     ) -> Optional[float]:
         """
@@ -169,7 +236,9 @@ class PlatformEntryCalculator:
 
         Args:
             target_distance: Target cumulative distance (same unit as SPM data)
-            spm_data: List of SPM samples with 'cumulative_distance' and 'speed'
+            spm_data: DistanceIndex, SpmColumns, a polars frame, or a list of SPM
+                samples with 'cumulative_distance' and 'speed'. Pass a
+                DistanceIndex when looking up more than one distance.
 
         Returns:
             Speed in km/h at the entry point. Prefers the first sample whose
@@ -183,43 +252,14 @@ class PlatformEntryCalculator:
             requested distance. The actual_distance uses the same units as the SPM
             data (meters or kilometers).
         """
-        if not spm_data:
+        index = DistanceIndex.from_columns(spm_data)
+        if len(index) == 0:
             return (None, None) if return_distance else None
 
-        # Ensure samples are processed in order of cumulative distance
-        sorted_samples = sorted(spm_data, key=lambda s: s.get('cumulative_distance', 0.0))
-
-        best_following_sample = None
-        min_negative_diff = float('inf')
-        closest_sample = None
-        closest_diff = float('inf')
-
-        for sample in sorted_samples:
-            distance = sample.get('cumulative_distance', 0.0)
-            diff = target_distance - distance
-
-            # Track the closest sample overall
-            abs_diff = abs(diff)
-            if abs_diff < closest_diff:
-                closest_diff = abs_diff
-                closest_sample = sample
-
-            # Prefer the sample at or after the entry distance (closer to halt)
-            # This favors the driver and accounts for measurement errors
-            if diff <= 0 and abs(diff) < min_negative_diff:
-                min_negative_diff = abs(diff)
-                best_following_sample = sample
-
-        chosen_sample = best_following_sample or closest_sample
-        if chosen_sample:
-            speed_val = chosen_sample.get('speed')
-            if return_distance:
-                return speed_val, chosen_sample.get('cumulative_distance')
-            return speed_val
-
+        speed_val, sample_distance = index.lookup(target_distance)
         if return_distance:
-            return None, None
-        return None
+            return speed_val, sample_distance
+        return speed_val
 
     def _is_meter_scale(self, distances: List[float]) -> bool:
         """
@@ -244,7 +284,7 @@ class PlatformEntryCalculator:
         self,
         halting_stations: Dict[str, float],
         ordered_stations: List[str],
-        spm_data: List[Dict],
+        spm_data,
         train_type: str
     ) -> Dict[str, Dict]:
         """
@@ -253,7 +293,7 @@ class PlatformEntryCalculator:
         Args:
             halting_stations: Dict of {station_name: halt_cumulative_distance_km}
             ordered_stations: List of stations in travel order
-            spm_data: List of SPM samples
+            spm_data: SpmColumns, a polars frame, or a list of SPM samples
             train_type: "fast" or "slow"
 
         Returns:
@@ -285,15 +325,18 @@ class PlatformEntryCalculator:
         # Create section pairs to infer travel direction
         sections = self.create_section_pairs(ordered_stations)
         if not sections:
-            print("[DEBUG ISD] No sections created from ordered stations")
+            logger.debug("No sections created from ordered stations")
             return {}
 
-        print(f"[DEBUG ISD] Sections for this trip: {sections[:5]}...")  # Show first 5
+        logger.debug("Sections for this trip: %s...", sections[:5])  # Show first 5
+
+        # Sorted once per run; every entry/mid/one-coach lookup below uses it
+        distance_index = DistanceIndex.from_columns(spm_data)
 
         # Determine whether halting / SPM distances are recorded in meters
         distance_samples = list(halting_stations.values())
-        if not distance_samples and spm_data:
-            distance_samples = [sample.get('cumulative_distance', 0.0) for sample in spm_data]
+        if not distance_samples and len(distance_index):
+            distance_samples = distance_index.distances.tolist()
         use_meter_scale = self._is_meter_scale(distance_samples)
         distance_unit_label = "m" if use_meter_scale else "km"
 
@@ -322,8 +365,10 @@ class PlatformEntryCalculator:
                 # Section departing this station to next station
                 station_next_section[station] = f"{station}-{next_station}"
 
-        # Calculate entry speeds for each halt
+        # Calculate entry speeds for each halt: first resolve every station's
+        # three measurement points, then look them all up in one batch
         entry_speeds = {}
+        station_points = []
 
         def to_meters(value: Optional[float]) -> Optional[float]:
             if value is None:
@@ -342,7 +387,7 @@ class PlatformEntryCalculator:
             # Platform entry speed not applicable when train starts from station
             halt_distance_km = halt_distance / 1000.0 if use_meter_scale else halt_distance
             if halt_distance_km < 0.01:  # Less than 10 meters
-                print(f"[DEBUG ISD] Skipping {station} - starting station (halt={halt_distance_km:.3f}km)")
+                logger.debug("Skipping %s - starting station (halt=%.3fkm)", station, halt_distance_km)
                 continue
 
             # Determine direction-specific section to use for this station
@@ -375,7 +420,7 @@ class PlatformEntryCalculator:
                         break
 
             if not station_section:
-                print(f"[DEBUG ISD] Platform length not found for station '{station}' in ISD data")
+                logger.debug("Platform length not found for station '%s' in ISD data", station)
                 continue
 
             # Calculate platform entry distance
@@ -389,21 +434,26 @@ class PlatformEntryCalculator:
             # One coach: 20m from halt (length of one coach)
             one_coach_distance_raw = max(halt_distance - (20.0 if use_meter_scale else 0.020), 0.0)
 
-            # Find speeds at all three points
-            entry_speed, entry_sample_distance = self.find_speed_at_distance(
-                entry_distance_raw, spm_data, return_distance=True
-            )
-            mid_platform_speed, mid_sample_distance = self.find_speed_at_distance(
-                mid_platform_distance_raw, spm_data, return_distance=True
-            )
-            one_coach_speed, one_sample_distance = self.find_speed_at_distance(
-                one_coach_distance_raw, spm_data, return_distance=True
-            )
-
-            if entry_speed is None:
+            station_points.append((
+                station, station_section, platform_length, halt_distance,
+                entry_distance_raw, mid_platform_distance_raw, one_coach_distance_raw,
+            ))
+
+        if not station_points or len(distance_index) == 0:
+            for station, _, _, _, entry_distance_raw, _, _ in station_points:
                 display_distance = entry_distance_raw / 1000.0 if use_meter_scale else entry_distance_raw
-                print(f"[DEBUG ISD] No speed found at entry distance {display_distance:.3f} km for {station}")
-                continue
+                logger.debug("No speed found at entry distance %.3f km for %s", display_distance, station)
+            return entry_speeds
+
+        # Find speeds at all three points of every station
+        targets = [distance for point in station_points for distance in point[4:]]
+        speeds, sample_distances = distance_index.lookup_many(targets)
+
+        for idx, point in enumerate(station_points):
+            (station, station_section, platform_length, halt_distance,
+             entry_distance_raw, mid_platform_distance_raw, one_coach_distance_raw) = point
+            entry_speed, mid_platform_speed, one_coach_speed = speeds[3 * idx:3 * idx + 3]
+            entry_sample_distance, mid_sample_distance, one_sample_distance = sample_distances[3 * idx:3 * idx + 3]
 
             halt_distance_km = halt_distance / 1000.0 if use_meter_scale else halt_distance
             entry_distance_km = entry_distance_raw / 1000.0 if use_meter_scale else entry_distance_raw
@@ -425,13 +475,15 @@ class PlatformEntryCalculator:
                 'one_coach_gap_m': one_coach_gap_m
             }
 
-            mid_pf_str = f"{mid_platform_speed:.1f}" if mid_platform_speed is not None else "N/A"
-            one_coach_str = f"{one_coach_speed:.1f}" if one_coach_speed is not None else "N/A"
-            print(f"[DEBUG ISD] {station} ({station_section}): "
-                  f"PF Entry={entry_speed:.1f}km/h, "
-                  f"Mid PF(130m)={mid_pf_str}km/h, "
-                  f"1 Coach(20m)={one_coach_str}km/h "
-                  f"[halt={halt_distance_km:.3f}km, platform={platform_length:.3f}km]")
+            if logger.isEnabledFor(logging.DEBUG):
+                mid_pf_str = f"{mid_platform_speed:.1f}" if mid_platform_speed is not None else "N/A"
+                one_coach_str = f"{one_coach_speed:.1f}" if one_coach_speed is not None else "N/A"
+                logger.debug(
+                    "%s (%s): PF Entry=%.1fkm/h, Mid PF(130m)=%skm/h, 1 Coach(20m)=%skm/h "
+                    "[halt=%.3fkm, platform=%.3fkm]",
+                    station, station_section, entry_speed, mid_pf_str, one_coach_str,
+                    halt_distance_km, platform_length,
+                )
 
         return entry_speeds
 
@@ -0,0 +1,180 @@
+"""
+Opt-in cProfile of single requests, for the SPM file that is slow in production.
+
+Off unless configured, and then the middleware and the call sites skip it
+entirely (``ENABLED`` is read once at import). Two ways to switch it on:
+
+* ``SPM_PROFILE_TOKEN=<secret>``: a request sending ``X-SPM-Profile: <secret>``
+  is profiled.
+* ``SPM_PROFILE=1``: every request to a profiled route is (for a staging box;
+  with no token set, the list/download endpoints are open too).
+
+The middleware in main.py arms a ``RequestProfile`` in a ContextVar. The
+profiled endpoints (``ROUTES``: /upload and reanalyze, the chart payload
+routes and the PDF routes) run their blocking work through ``call``, which
+enables the request's ``cProfile.Profile`` in the threadpool thread doing
+it. cProfile only sees the thread it is enabled in, so this is what the
+profile covers: the analysis
+(run on the threadpool rather than the analysis pool while profiled, so it is
+in the profile), cache and run_store reads and writes, chart payload builds
+and PDF rendering, but not the async handler code between them.
+
+When the request finishes its stats are dumped as ``.prof`` (pstats format:
+``python -m pstats`` or snakeviz) into ``PROFILE_DIR``
+(``SPM_PROFILE_DIR``), keeping the newest ``MAX_FILES``
+(``SPM_PROFILE_MAX_FILES``, default 20). ``GET /api/profiles`` lists them and
+``GET /api/profiles/{name}`` downloads one; the response to a profiled
+request names its file in ``X-SPM-Profile-File``.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import hmac
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, TypeVar
+
+import log_config
+
+T = TypeVar("T")
+
+PROFILE_TOKEN = os.getenv("SPM_PROFILE_TOKEN") or None
+PROFILE_ALL = os.getenv("SPM_PROFILE", "").lower() in ("1", "true", "yes")
+ENABLED = bool(PROFILE_TOKEN or PROFILE_ALL)
+
+PROFILE_DIR = Path(os.getenv("SPM_PROFILE_DIR") or (Path(tempfile.gettempdir()) / "spm_profiles"))
+MAX_FILES = int(os.getenv("SPM_PROFILE_MAX_FILES", "20"))
+
+HEADER = "X-SPM-Profile"
+FILE_HEADER = "X-SPM-Profile-File"
+
+# Route templates (as matched by FastAPI) whose requests are profiled.
+ROUTES = frozenset({
+    "/upload",
+    "/runs/{run_id}/reanalyze",
+    "/chart_data",
+    "/runs/{run_id}/chart_data",
+    "/api/motorman-reports/save/{run_id}",
+    "/api/motorman-reports/preview/{run_id}",
+})
+
+_NAME = re.compile(r"^[A-Za-z0-9_.-]+\.prof$")
+
+
+@dataclass
+class RequestProfile:
+    """One request's profiler, and the run it turned out to be about."""
+
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    calls: int = 0
+    run_id: Optional[str] = None
+
+
+_CURRENT: ContextVar[Optional[RequestProfile]] = ContextVar("spm_profile", default=None)
+
+
+# --- arming ------------------------------------------------------------------
+
+def authorized(headers: Mapping[str, str]) -> bool:
+    """Whether a request may use the profiler: the token matches, or no token is needed."""
+    if PROFILE_TOKEN is None:
+        return PROFILE_ALL
+    sent = headers.get(HEADER) or ""
+    return hmac.compare_digest(sent.encode(), PROFILE_TOKEN.encode())
+
+
+@contextmanager
+def armed(headers: Mapping[str, str]) -> Iterator[Optional[RequestProfile]]:
+    """
+    A profile for the request inside the block when it asked for one, else
+    None. Only called when ENABLED.
+    """
+    current = RequestProfile() if PROFILE_ALL or authorized(headers) else None
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    finally:
+        _CURRENT.reset(token)
+
+
+def active() -> bool:
+    return _CURRENT.get() is not None
+
+
+def call(fn: Callable[..., T], *args: Any) -> T:
+    """
+    ``fn(*args)``, profiled into the current request's profile when there is
+    one. Meant for the threadpool: ``run_in_threadpool(profiling.call, fn, ...)``.
+    """
+    current = _CURRENT.get()
+    if current is None:
+        return fn(*args)
+    # One cProfile.Profile must not be enabled in two threads at once
+    with current.lock:
+        current.calls += 1
+        current.run_id = current.run_id or log_config.RUN_ID.get()
+        current.profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            current.profile.disable()
+
+
+# --- files -------------------------------------------------------------------
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "request"
+
+
+def finish(current: RequestProfile, route: Optional[str]) -> Optional[str]:
+    """
+    Write the request's profile if it was for a profiled route and something
+    ran under it; returns the file name, or None.
+    """
+    if route not in ROUTES or current.calls == 0:
+        return None
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    run = f"{_slug(current.run_id)}-" if current.run_id else ""
+    name = f"{stamp}-{_slug(route)}-{run}{uuid.uuid4().hex[:6]}.prof"
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    current.profile.dump_stats(str(PROFILE_DIR / name))
+    _prune()
+    return name
+
+
+def _prune() -> None:
+    files = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for path in files[: max(len(files) - MAX_FILES, 0)]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profiles, newest first: name, bytes and created (epoch seconds)."""
+    if not PROFILE_DIR.is_dir():
+        return []
+    found = []
+    for path in PROFILE_DIR.glob("*.prof"):
+        stat = path.stat()
+        found.append({"name": path.name, "bytes": stat.st_size, "created": stat.st_mtime})
+    return sorted(found, key=lambda entry: entry["created"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """The stored profile called ``name``, or None (also for names that are not ours)."""
+    if not _NAME.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
@@ -14,9 +14,231 @@ Based on: modifiedscripts.js (Google Apps Script implementation)
 """
 
 import json
-from typing import Dict, List, Tuple, Optional
+import logging
+import threading
+from typing import Dict, List, Tuple, Optional, Sequence
 from pathlib import Path
 
+import numpy as np
+import polars as pl
+
+from spm_columns import SpmColumns, as_columns
+
+logger = logging.getLogger(__name__)
+
+
+SEGMENT_FILES = {
+    "fast": "fast_segments.json",
+    "slow": "slow_segments.json",
+    "thb": "thb_segments.json",
+}
+
+
+class SegmentLimitsError(ValueError):
+    """A segments JSON file would leave part of a segment without a speed limit."""
+
+
+def _first_matching_limit(ranges: List[Dict], percentage: float):
+    """
+    The limit-range rule shared by get_speed_limit and SpeedLimitTable: the first
+    range with startPct <= p < endPct, else the last range's limit once p is at
+    or past its end, else None.
+    """
+    for limit_range in ranges:
+        start_pct = limit_range['startPct']
+        end_pct = limit_range['endPct']
+        limit = limit_range['limit']
+
+        # Check if percentage falls within this range
+        # Use >= for start and < for end to handle boundaries correctly
+        if start_pct <= percentage < end_pct:
+            return limit
+
+        # Special case: handle exactly at end of last range
+        if percentage >= end_pct and limit_range == ranges[-1]:
+            return limit
+
+    return None
+
+
+class SpeedLimitTable:
+    """
+    One segments JSON file, compiled for O(log k) lookups.
+
+    Segment names map to integer ids. Segment ``i`` owns
+    ``breakpoints[bp_offsets[i]:bp_offsets[i + 1]]`` (the sorted unique
+    startPct/endPct values) and one more limit than breakpoints, starting at
+    ``limits[bp_offsets[i] + i]``: the limit below the first breakpoint, then one
+    per interval. ``limits`` holds the original JSON values (int or float), or
+    None where no range covers the interval.
+
+    The limit can only change at a startPct or endPct, so each interval's value
+    is computed once at build time with the same rule get_speed_limit applies.
+    When a name appears more than once the first definition wins, as it does in
+    get_speed_limit.
+
+    Build-time checks: a malformed range, or any percentage in [0, 1] left
+    without a limit (a gap, or a first range not starting at 0), raises
+    SegmentLimitsError. Overlaps, ranges not ending at 1.0 and conflicting
+    duplicate definitions resolve deterministically, so they are recorded in
+    ``issues`` instead.
+    """
+
+    def __init__(self, segments: List[Dict], source: str = ""):
+        self.source = source
+        self.issues: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.definitions: List[Dict] = []
+
+        errors = []
+        for seg in segments:
+            name = seg.get('segment') if isinstance(seg, dict) else None
+            if not isinstance(name, str) or not isinstance(seg.get('limits'), list):
+                errors.append(f"malformed segment entry: {seg!r:.80}")
+                continue
+            if name in self.ids:
+                if seg != self.definitions[self.ids[name]]:
+                    self.issues.append(f"{name}: duplicate definition differs from the first; first is used")
+                continue
+            problems = self._check_ranges(name, seg['limits'])
+            if problems:
+                errors.extend(problems)
+                continue
+            self.ids[name] = len(self.definitions)
+            self.definitions.append(seg)
+
+        breakpoints, limits, bp_offsets = [], [], [0]
+        for seg in self.definitions:
+            name, ranges = seg['segment'], seg['limits']
+            points = sorted({float(r['startPct']) for r in ranges} | {float(r['endPct']) for r in ranges})
+            probes = [points[0] - 1.0] + points
+            values = [_first_matching_limit(ranges, p) for p in probes]
+
+            # Intervals overlapping [0, 1]: the probe interval [probes[k], next)
+            for k, value in enumerate(values):
+                lo = probes[k]
+                hi = points[k] if k < len(points) else float('inf')
+                if value is None and hi > 0.0 and lo <= 1.0:
+                    errors.append(f"{name}: no limit for {max(lo, 0.0):g} <= p < {min(hi, 1.0):g}")
+
+            breakpoints.extend(points)
+            limits.extend(values)
+            bp_offsets.append(len(breakpoints))
+
+        if errors:
+            where = f" in {source}" if source else ""
+            raise SegmentLimitsError(f"{len(errors)} problem(s){where}: " + "; ".join(errors))
+
+        self.breakpoints = np.array(breakpoints, dtype=np.float64)
+        self.bp_offsets = np.array(bp_offsets, dtype=np.int64)
+        self.limits = np.empty(len(limits), dtype=object)
+        self.limits[:] = limits
+        self.names = [seg['segment'] for seg in self.definitions]
+        self.variable = np.array([len(seg['limits']) > 1 for seg in self.definitions], dtype=bool)
+
+    def _check_ranges(self, name: str, ranges: List[Dict]) -> List[str]:
+        """Hard errors for one segment; softer findings go to self.issues."""
+        errors = []
+        for r in ranges:
+            try:
+                start, end = float(r['startPct']), float(r['endPct'])
+                r['limit']
+            except (KeyError, TypeError, ValueError):
+                errors.append(f"{name}: malformed range {r!r}")
+                continue
+            if not (0.0 <= start < end):
+                errors.append(f"{name}: range {start:g}-{end:g} is empty or negative")
+        if not ranges:
+            errors.append(f"{name}: no limit ranges")
+        if errors:
+            return errors
+
+        ordered = sorted(ranges, key=lambda r: (r['startPct'], r['endPct']))
+        if ordered != ranges:
+            self.issues.append(f"{name}: ranges not in startPct order")
+        for prev, cur in zip(ordered, ordered[1:]):
+            if cur['startPct'] < prev['endPct']:
+                self.issues.append(
+                    f"{name}: ranges {prev['startPct']:g}-{prev['endPct']:g} and "
+                    f"{cur['startPct']:g}-{cur['endPct']:g} overlap; the first listed wins"
+                )
+        last_end = max(r['endPct'] for r in ranges)
+        if last_end != 1.0:
+            self.issues.append(f"{name}: ranges end at {last_end:g}, not 1.0")
+        return errors
+
+    @classmethod
+    def from_file(cls, path: Path) -> "SpeedLimitTable":
+        path = Path(path)
+        try:
+            with open(path, 'r') as f:
+                segments = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise SegmentLimitsError(f"cannot read {path}: {e}") from e
+        if not isinstance(segments, list):
+            raise SegmentLimitsError(f"{path}: expected a list of segments")
+        return cls(segments, source=path.name)
+
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def segment_id(self, name: str) -> Optional[int]:
+        return self.ids.get(name)
+
+    def lookup(self, segment_id: int, percentage):
+        """Limits for one segment at ``percentage`` (scalar or array); NaN gives None."""
+        lo, hi = self.bp_offsets[segment_id], self.bp_offsets[segment_id + 1]
+        p = np.asarray(percentage, dtype=np.float64)
+        idx = np.searchsorted(self.breakpoints[lo:hi], p, side='right') + lo + segment_id
+        out = self.limits[idx]
+        nan = np.isnan(p)
+        if np.ndim(out) == 0:
+            return None if nan else out
+        out = out.copy()
+        out[nan] = None
+        return out
+
+    def limit_at(self, segment: str, percentage: float):
+        """get_speed_limit for one position, without the linear name scan."""
+        segment_id = self.ids.get(segment)
+        if segment_id is None:
+            return None
+        return self.lookup(segment_id, percentage)
+
+
+# Built once per process, shared by every PSRMPSCalculator. Keyed by resolved path.
+_TABLES: Dict[Path, SpeedLimitTable] = {}
+_TABLES_LOCK = threading.Lock()
+
+
+def get_speed_limit_table(path: Path) -> SpeedLimitTable:
+    """The compiled table for one segments file, built on first use."""
+    path = Path(path).resolve()
+    with _TABLES_LOCK:
+        table = _TABLES.get(path)
+        if table is None:
+            table = SpeedLimitTable.from_file(path)
+            logger.debug("Compiled %s segments from %s", len(table), path.name)
+            for issue in table.issues:
+                logger.warning("%s: %s", path.name, issue)
+            _TABLES[path] = table
+        return table
+
+
+def load_speed_limit_tables(reference_data_dir) -> Dict[str, SpeedLimitTable]:
+    """
+    Build the fast/slow/thb tables now. Call at startup so a bad reference file
+    stops the server instead of blanking the PSR of part of a run.
+    """
+    reference_data_dir = Path(reference_data_dir)
+    return {
+        train_type: get_speed_limit_table(reference_data_dir / filename)
+        for train_type, filename in SEGMENT_FILES.items()
+    }
+
 
 class PSRMPSCalculator:
     """
@@ -24,14 +246,17 @@ class PSRMPSCalculator:
     for train speed analysis.
     """
 
-    def __init__(self, reference_data_dir: str = "reference_data"):
+    def __init__(self, reference_data_dir: str = "reference_data", reference_data=None):
         """
         Initialize the PSR/MPS calculator.
 
         Args:
             reference_data_dir: Directory containing segment JSON files
+            reference_data: Loaded ReferenceData; when given, speed_limit_table
+                uses its compiled tables
         """
         self.reference_data_dir = Path(reference_data_dir)
+        self.reference_data = reference_data
         self.segment_limits_cache = {}
 
     def load_segment_limits(self, train_type: str, corridor: str = None) -> List[Dict]:
@@ -50,28 +275,32 @@ class PSRMPSCalculator:
         if cache_key in self.segment_limits_cache:
             return self.segment_limits_cache[cache_key]
 
-        # Map train type to JSON file
-        file_map = {
-            "fast": "fast_segments.json",
-            "slow": "slow_segments.json",
-            "thb": "thb_segments.json",
-        }
-
-        if train_type not in file_map:
-            raise ValueError(f"Unknown train type: {train_type}. Must be 'fast', 'slow', or 'thb'")
-
-        json_file = self.reference_data_dir / file_map[train_type]
+        json_file = self._segments_file(train_type)
 
         if not json_file.exists():
             raise FileNotFoundError(f"Segment limits file not found: {json_file}")
 
         with open(json_file, 'r') as f:
             limits = json.load(f)
-        print(f"[DEBUG PSR] Loaded {len(limits)} segments from {json_file.name}")
+        logger.debug("Loaded %s segments from %s", len(limits), json_file.name)
 
         self.segment_limits_cache[cache_key] = limits
         return limits
 
+    def _segments_file(self, train_type: str) -> Path:
+        if train_type not in SEGMENT_FILES:
+            raise ValueError(f"Unknown train type: {train_type}. Must be 'fast', 'slow', or 'thb'")
+        return self.reference_data_dir / SEGMENT_FILES[train_type]
+
+    def speed_limit_table(self, train_type: str) -> SpeedLimitTable:
+        """The compiled limits for a train type; shared with every other calculator in the process."""
+        if self.reference_data is not None:
+            return self.reference_data.speed_limit_table(train_type)
+        json_file = self._segments_file(train_type)
+        if not json_file.exists():
+            raise FileNotFoundError(f"Segment limits file not found: {json_file}")
+        return get_speed_limit_table(json_file)
+
     def calculate_directional_distances(
         self,
         ordered_stations: List[str],
@@ -281,21 +510,136 @@ class PSRMPSCalculator:
             debug_segments.add(segment_name)
 
         # Find applicable limit for this percentage
-        for limit_range in segment_def['limits']:
-            start_pct = limit_range['startPct']
-            end_pct = limit_range['endPct']
-            limit = limit_range['limit']
+        return _first_matching_limit(segment_def['limits'], percentage)
+
+    def locate_segments(
+        self,
+        cum_dist: np.ndarray,
+        enhanced_stations: List[Dict]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        normalize_position for a whole array of distances.
 
-            # Check if percentage falls within this range
-            # Use >= for start and < for end to handle boundaries correctly
-            if start_pct <= percentage < end_pct:
-                return limit
+        Returns (segment_index, percentage). segment_index[i] = k means the
+        segment from enhanced_stations[k] to enhanced_stations[k + 1]; -1 where
+        normalize_position would return None.
 
-            # Special case: handle exactly at end of last range
-            if percentage >= end_pct and limit_range == segment_def['limits'][-1]:
-                return limit
+        Station boundaries are normally non-decreasing, and then one
+        searchsorted finds every sample's segment. If they are not (an ISD
+        mismatch can put a halt out of order) the first-match scan is done per
+        station instead, still vectorised over samples.
+        """
+        x = np.asarray(cum_dist, dtype=np.float64)
+        n = len(enhanced_stations)
+        seg = np.full(len(x), -1, dtype=np.int64)
+        pct = np.full(len(x), np.nan, dtype=np.float64)
+        if n < 2:
+            return seg, pct
+
+        bounds = np.array([s['actualCumDist'] for s in enhanced_stations], dtype=np.float64)
+
+        if np.all(np.diff(bounds) >= 0):
+            # Last boundary <= x; empty (zero-length) segments are skipped for free
+            k = np.searchsorted(bounds, x, side='right') - 1
+            inside = (k >= 0) & (k < n - 1)
+            seg[inside] = k[inside]
+        else:
+            for k in range(n - 1):
+                hit = (seg == -1) & (bounds[k] <= x) & (x < bounds[k + 1])
+                seg[hit] = k
 
-        return None
+        inside = seg >= 0
+        k = seg[inside]
+        pct[inside] = (x[inside] - bounds[k]) / (bounds[k + 1] - bounds[k])
+
+        # At or past the last station: last segment at 100%
+        past_end = (seg == -1) & (x >= bounds[-1])
+        seg[past_end] = n - 2
+        pct[past_end] = 1.0
+        return seg, pct
+
+    def speed_limits_for_distances(
+        self,
+        cum_dist: np.ndarray,
+        ordered_stations: List[str],
+        station_km_map: Dict[str, float],
+        halting_station_map: Dict[str, float],
+        train_type: str,
+        start_distance: float = None,
+        end_distance: float = None,
+        semi_fast_info: Optional[Dict] = None
+    ) -> List[Optional[int]]:
+        """
+        PSR/MPS for every cumulative distance in ``cum_dist``.
+
+        Vectorised: one searchsorted over station boundaries to place each
+        sample in a segment, then one searchsorted per segment over its
+        breakpoints in the compiled SpeedLimitTable. Same result, value for value, as
+        normalize_position + get_speed_limit per sample — including the semi-fast
+        fallback to slow segments.
+        """
+        x = np.asarray(cum_dist, dtype=np.float64)
+        if len(x) == 0:
+            return []
+
+        primary = self.speed_limit_table(train_type)
+
+        # For semi-fast trains, also load slow segments as fallback
+        fallback = None
+        if semi_fast_info and train_type == 'fast':
+            try:
+                fallback = self.speed_limit_table('slow')
+                logger.debug("SEMI-FAST: Loaded slow segments as fallback (%s segments)", len(fallback))
+            except Exception as e:
+                logger.debug("Could not load slow segments fallback: %s", e)
+
+        # Get start and end distances
+        if start_distance is None:
+            start_distance = float(x[0])
+        if end_distance is None:
+            end_distance = float(x[-1])
+
+        # Calculate enhanced stations with scaling
+        enhanced_stations = self.calculate_directional_distances(
+            ordered_stations,
+            station_km_map,
+            halting_station_map,
+            start_distance,
+            end_distance
+        )
+
+        logger.debug("Processing %s stations from %s to %s", len(enhanced_stations), enhanced_stations[0]['name'], enhanced_stations[-1]['name'])
+
+        seg, pct = self.locate_segments(x, enhanced_stations)
+        psr = np.full(len(x), None, dtype=object)
+
+        variable_segments = set()
+        fallback_used = set()
+        present = np.unique(seg[seg >= 0])
+        for k in present:
+            name = f"{enhanced_stations[k]['name']}-{enhanced_stations[k + 1]['name']}"
+            rows = np.flatnonzero(seg == k)
+            p = pct[rows]
+
+            segment_id = primary.segment_id(name)
+            if segment_id is not None:
+                psr[rows] = primary.lookup(segment_id, p)
+                if primary.variable[segment_id]:
+                    variable_segments.add(name)
+
+            fallback_id = fallback.segment_id(name) if fallback is not None else None
+            if fallback_id is not None:
+                missing = rows[np.equal(psr[rows], None)]
+                if len(missing):
+                    psr[missing] = fallback.lookup(fallback_id, pct[missing])
+                    if any(v is not None for v in psr[missing]):
+                        fallback_used.add(name)
+
+        logger.debug("Found %s unique segments, %s with variable limits", len(present), len(variable_segments))
+        if fallback_used:
+            logger.debug("SEMI-FAST: Used slow segment fallback for: %s", ', '.join(fallback_used))
+
+        return psr.tolist()
 
     def process_train_speed_limits(
         self,
@@ -314,7 +658,8 @@ class PSRMPSCalculator:
         This is the main orchestrator function that ties everything together.
 
         Args:
-            spm_data: List of SPM data rows (each row is a dict with 'cumulative_distance', etc.)
+            spm_data: SpmColumns, a polars frame, or a list of SPM data rows
+                (each row is a dict with 'cumulative_distance', etc.)
             ordered_stations: List of station names in route order
             station_km_map: Official kilometer posts
             halting_station_map: Detected halt positions
@@ -328,134 +673,66 @@ class PSRMPSCalculator:
         Flow:
             1. Load segment speed limits for train type
             2. Calculate enhanced stations (with scaling)
-            3. For each SPM data point:
-               a. Find which segment it's in
-               b. Calculate percentage position in segment
-               c. Look up speed limit for that percentage
+            3. Locate every data point's segment and percentage (searchsorted)
+            4. Look up the speed limit per segment (searchsorted over breakpoints)
         """
-        if not spm_data:
+        if len(spm_data) == 0:
             return []
 
-        # Load segment limits
-        segment_limits = self.load_segment_limits(train_type)
-
-        # For semi-fast trains, also load slow segments as fallback
-        fallback_segment_limits = None
-        if semi_fast_info and train_type == 'fast':
-            try:
-                fallback_segment_limits = self.load_segment_limits('slow')
-                print(f"[DEBUG PSR] SEMI-FAST: Loaded slow segments as fallback ({len(fallback_segment_limits)} segments)")
-            except Exception as e:
-                print(f"[DEBUG PSR] Could not load slow segments fallback: {e}")
-
-        # Get start and end distances
-        if start_distance is None:
-            start_distance = spm_data[0].get('cumulative_distance', 0)
-        if end_distance is None:
-            end_distance = spm_data[-1].get('cumulative_distance', 0)
-
-        # Calculate enhanced stations with scaling
-        enhanced_stations = self.calculate_directional_distances(
+        if isinstance(spm_data, (SpmColumns, pl.DataFrame)):
+            cum_dist = as_columns(spm_data).cumulative_distance
+        else:
+            cum_dist = np.fromiter(
+                (row.get('cumulative_distance', 0) for row in spm_data),
+                dtype=np.float64, count=len(spm_data)
+            )
+        return self.speed_limits_for_distances(
+            cum_dist,
             ordered_stations,
             station_km_map,
             halting_station_map,
-            start_distance,
-            end_distance
+            train_type,
+            start_distance=start_distance,
+            end_distance=end_distance,
+            semi_fast_info=semi_fast_info
         )
 
-        print(f"[DEBUG PSR] Processing {len(enhanced_stations)} stations from {enhanced_stations[0]['name']} to {enhanced_stations[-1]['name']}")
-
-        # Process each data point
-        psr_values = []
-
-        # Debug: Track unique segments and their limits
-        segments_found = {}
-        debug_segments = set()
-        fallback_used = set()  # Track segments that used fallback
-
-        for i, row in enumerate(spm_data):
-            cum_dist = row.get('cumulative_distance', 0)
-
-            # Get position as percentage
-            position = self.normalize_position(cum_dist, enhanced_stations)
-
-            # Get speed limit
-            if position:
-                speed_limit = self.get_speed_limit(position, segment_limits, debug_segments)
-
-                # For semi-fast trains, try fallback if primary doesn't have the segment
-                if speed_limit is None and fallback_segment_limits:
-                    speed_limit = self.get_speed_limit(position, fallback_segment_limits, debug_segments)
-                    if speed_limit is not None:
-                        seg_name = position.get('segment')
-                        if seg_name not in fallback_used:
-                            fallback_used.add(seg_name)
-
-                # Debug: Log first occurrence of each segment
-                seg_name = position.get('segment')
-                if seg_name not in segments_found:
-                    segments_found[seg_name] = {
-                        'first_index': i,
-                        'percentage': position.get('percentage'),
-                        'limit': speed_limit,
-                        'used_fallback': seg_name in fallback_used
-                    }
-            else:
-                speed_limit = None
-
-            psr_values.append(speed_limit)
-
-        # Debug: Print segment summary
-        print(f"[DEBUG PSR] Found {len(segments_found)} unique segments, {len(debug_segments)} with variable limits")
-        if fallback_used:
-            print(f"[DEBUG PSR] SEMI-FAST: Used slow segment fallback for: {', '.join(fallback_used)}")
-
-        return psr_values
-
 
 # Utility functions
 
-def detect_violations(spm_data: List[Dict], psr_values: List[int]) -> List[Dict]:
+def detect_violations(spm_data, psr_values: List[int]) -> List[Dict]:
     """
     Detect speed violations where actual speed exceeds PSR/MPS.
 
     Args:
-        spm_data: SPM data with 'speed' and 'cumulative_distance' fields
+        spm_data: SpmColumns or a polars frame, or row dicts with 'speed' and
+            'cumulative_distance' fields
         psr_values: Calculated PSR/MPS values
 
     Returns:
         List of violation dictionaries
     """
-    violations = []
-
-    for i, (row, psr) in enumerate(zip(spm_data, psr_values)):
-        if psr is None:
-            continue
-
-        speed = row.get('speed', 0)
-        cum_dist = row.get('cumulative_distance', 0)
+    columns = as_columns(spm_data)
+    n = min(len(columns), len(psr_values))
+    if n == 0:
+        return []
 
-        if speed > psr:
-            overspeed = speed - psr
+    speed = columns.speed[:n]
+    psr = psr_array(psr_values, n)
+    excess = speed - psr
+    hits = np.flatnonzero(excess > 0)  # NaN (no PSR) compares False
 
-            # Determine severity
-            if overspeed < 5:
-                severity = 'minor'
-            elif overspeed < 10:
-                severity = 'moderate'
-            elif overspeed < 20:
-                severity = 'severe'
-            else:
-                severity = 'critical'
-
-            violations.append({
-                'index': i,
-                'location_km': cum_dist,
-                'speed_recorded': speed,
-                'speed_limit': psr,
-                'overspeed_amount': overspeed,
-                'severity': severity
-            })
+    violations = []
+    for i in hits.tolist():
+        overspeed = float(excess[i])
+        violations.append({
+            'index': i,
+            'location_km': float(columns.cumulative_distance[i]),
+            'speed_recorded': float(speed[i]),
+            'speed_limit': psr_values[i],
+            'overspeed_amount': overspeed,
+            'severity': _severity(overspeed)
+        })
 
     return violations
 
@@ -471,6 +748,192 @@ def get_severity_color(severity: str) -> str:
     return colors.get(severity, '#FF0000')
 
 
+# Compliant samples an overspeed event may dip for and still be one event.
+MOMENTARY_DROP_SAMPLES = 3
+
+
+def _severity(excess: float) -> str:
+    if excess < 5:
+        return 'minor'
+    elif excess < 10:
+        return 'moderate'
+    elif excess < 20:
+        return 'severe'
+    return 'critical'
+
+
+def psr_array(psr_values, length: Optional[int] = None) -> np.ndarray:
+    """PSR values as float64 with NaN for None, padded with NaN (or cut) to ``length``."""
+    psr = np.array(psr_values, dtype=np.float64)  # None becomes NaN
+    if length is None or length == len(psr):
+        return psr
+    if length < len(psr):
+        return psr[:length]
+    return np.concatenate([psr, np.full(length - len(psr), np.nan)])
+
+
+def overspeed_event_ranges(
+    over: np.ndarray,
+    compliant: np.ndarray,
+    min_duration: int = 7,
+    max_gap: int = MOMENTARY_DROP_SAMPLES
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Group overspeed samples into events: (start_index, end_index, end_row, duration).
+
+    ``over`` marks samples above PSR + offset, ``compliant`` samples at or
+    below it; a sample with no PSR is neither and is left out, so it neither
+    extends nor breaks an event. On the remaining samples the overspeed runs
+    are found from the diff of the mask, then runs separated by at most
+    ``max_gap`` compliant samples are merged (a momentary drop below the
+    threshold does not end the event) and events shorter than
+    ``min_duration`` samples, closed gaps included, are dropped.
+
+    ``start_index``/``end_index`` are the first and last overspeed samples,
+    ``end_row`` the first compliant sample after the event (the last sample
+    if the data ends mid-event) and ``duration`` the samples in the event.
+    """
+    n = len(over)
+    rows = np.flatnonzero(over | compliant)
+    edges = np.diff(np.concatenate([[0], over[rows].astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # exclusive, in ``rows`` positions
+    if len(starts) == 0:
+        return []
+
+    # A run starts a new event unless the gap before it is a momentary drop
+    opens = np.concatenate([[True], starts[1:] - ends[:-1] > max_gap])
+    closes = np.concatenate([opens[1:], [True]])
+    starts, ends = starts[opens], ends[closes]
+
+    keep = ends - starts >= min_duration
+    starts, ends = starts[keep], ends[keep]
+    end_rows = np.where(ends < len(rows), rows[np.minimum(ends, len(rows) - 1)], n - 1)
+    return [
+        (int(rows[s]), int(rows[e - 1]), int(r), int(e - s))
+        for s, e, r in zip(starts, ends, end_rows)
+    ]
+
+
+def describe_overspeed_events(
+    ranges: List[Tuple[int, int, int, int]],
+    speed: np.ndarray,
+    over: np.ndarray,
+    psr_values: List,
+    cumulative_distance: np.ndarray,
+    times: List,
+    threshold_offset: int = 3
+) -> List[Dict]:
+    """
+    Event dicts for ``overspeed_event_ranges`` output — (start_index,
+    end_index, end_row, duration) per event — in the shape the UI and the DB
+    rows expect. Max speed is a reduction over the event's overspeed
+    samples; max excess is measured against the PSR at the event start.
+    """
+    events = []
+    for number, (start, end, end_row, duration) in enumerate(ranges, start=1):
+        psr = psr_values[start]
+        window = speed[start:end_row + 1][over[start:end_row + 1]]
+        max_speed = float(window.max())
+        max_excess = max_speed - psr
+
+        # Convert km if in meters
+        start_km = cumulative_distance[start]
+        end_km = cumulative_distance[end_row]
+        if start_km > 200:  # Assume meters
+            start_km = start_km / 1000
+            end_km = end_km / 1000
+
+        events.append({
+            'event_number': number,
+            'start_time': times[start],
+            'end_time': times[end_row],
+            'start_km': round(float(start_km), 2),
+            'end_km': round(float(end_km), 2),
+            'duration': duration,
+            'max_speed': round(max_speed, 1),
+            'max_excess': round(max_excess, 1),
+            'psr_value': psr,
+            'threshold': psr + threshold_offset,
+            'severity': _severity(max_excess),
+            'start_index': start,
+            'end_index': end
+        })
+    return events
+
+
+def detect_overspeed_events_arrays(
+    speed: np.ndarray,
+    psr_values: List,
+    cumulative_distance: np.ndarray,
+    times: List,
+    threshold_offset: int = 3,
+    min_duration: int = 7
+) -> List[Dict]:
+    """
+    detect_overspeed_events over columns: speed and cumulative distance as
+    float arrays, the PSR list as returned by process_train_speed_limits
+    (None where unknown) and the Time strings.
+    """
+    speed = np.asarray(speed, dtype=np.float64)
+    if len(speed) == 0 or len(psr_values) == 0:
+        return []
+
+    psr = psr_array(psr_values, len(speed))
+    valid = ~np.isnan(psr)
+    over = valid & (speed > psr + threshold_offset)
+    ranges = overspeed_event_ranges(over, valid & ~over, min_duration)
+    if len(psr_values) < len(speed):
+        psr_values = list(psr_values) + [None] * (len(speed) - len(psr_values))
+    events = describe_overspeed_events(
+        ranges, speed, over, psr_values, np.asarray(cumulative_distance, dtype=np.float64),
+        times, threshold_offset
+    )
+
+    logger.debug("Detected %s overspeed events (threshold: PSR+%s, min samples: %s)", len(events), threshold_offset, min_duration)
+
+    return events
+
+
+def detect_overspeed_events_multi(
+    speed: np.ndarray,
+    psr_values: List,
+    cumulative_distance: np.ndarray,
+    times: List,
+    threshold_offsets: Sequence[float] = (0, 3, 5, 10),
+    min_duration: int = 7
+) -> Dict[float, List[Dict]]:
+    """
+    detect_overspeed_events_arrays for several offsets at once.
+
+    The overspeed masks for every offset come from one broadcast comparison
+    (offsets x samples); grouping then runs per offset over its mask row.
+    Returns {offset: events}, in the order the offsets were given. Each event
+    list is identical to a single-offset call with that offset.
+    """
+    offsets = list(dict.fromkeys(threshold_offsets))
+    speed = np.asarray(speed, dtype=np.float64)
+    if len(speed) == 0 or len(psr_values) == 0:
+        return {offset: [] for offset in offsets}
+
+    psr = psr_array(psr_values, len(speed))
+    valid = ~np.isnan(psr)
+    over = valid & (speed > psr + np.asarray(offsets, dtype=np.float64)[:, None])
+    compliant = valid & ~over
+
+    if len(psr_values) < len(speed):
+        psr_values = list(psr_values) + [None] * (len(speed) - len(psr_values))
+    cumulative_distance = np.asarray(cumulative_distance, dtype=np.float64)
+
+    results = {}
+    for row, offset in enumerate(offsets):
+        ranges = overspeed_event_ranges(over[row], compliant[row], min_duration)
+        results[offset] = describe_overspeed_events(
+            ranges, speed, over[row], psr_values, cumulative_distance, times, offset
+        )
+    return results
+
+
 def detect_overspeed_events(
     spm_data: List[Dict],
     psr_values: List[int],
@@ -486,10 +949,14 @@ def detect_overspeed_events(
     - Groups consecutive overspeed samples into single events
     - Uses threshold = PSR/MPS + offset (default 3 km/h tolerance)
     - Requires minimum consecutive samples to count as event
-    - Handles momentary drops (brief compliance within 3 samples)
+    - Closes momentary drops (up to 3 compliant samples) inside an event
+
+    Adapter over detect_overspeed_events_arrays; see overspeed_event_ranges
+    for the exact grouping rule.
 
     Args:
-        spm_data: SPM data with 'speed', 'cumulative_distance', 'Time' fields
+        spm_data: SpmColumns or a polars frame, or row dicts with 'speed',
+            'cumulative_distance', 'Time' fields
         psr_values: Calculated PSR/MPS values for each data point
         threshold_offset: Tolerance above PSR/MPS (default 3 km/h)
         min_duration: Minimum consecutive samples for an event (default 7)
@@ -506,131 +973,16 @@ def detect_overspeed_events(
         - threshold: Actual threshold used (PSR + offset)
         - severity: minor/moderate/severe/critical
     """
-    if not spm_data or not psr_values:
+    if len(spm_data) == 0 or len(psr_values) == 0:
         return []
 
-    overspeed_events = []
-    current_event = None
-
-    def create_new_event(row, psr, threshold, index):
-        """Start tracking a new overspeed event."""
-        return {
-            'start_index': index,
-            'start_time': row.get('Time', ''),
-            'start_km': row.get('cumulative_distance', 0),
-            'overspeed_values': [row.get('speed', 0)],
-            'psr_value': psr,
-            'threshold': threshold,
-            'times': [row.get('Time', '')],
-            'kms': [row.get('cumulative_distance', 0)]
-        }
-
-    def extend_event(event, row):
-        """Add a sample to the current event."""
-        event['overspeed_values'].append(row.get('speed', 0))
-        event['times'].append(row.get('Time', ''))
-        event['kms'].append(row.get('cumulative_distance', 0))
-
-    def check_for_momentary_drop(data, psr_values, current_index, threshold_offset):
-        """Check if overspeed resumes within next 3 samples."""
-        check_rows = min(3, len(data) - current_index - 1)
-        for j in range(1, check_rows + 1):
-            next_psr = psr_values[current_index + j] if current_index + j < len(psr_values) else None
-            if next_psr is None:
-                continue
-            next_threshold = next_psr + threshold_offset
-            next_speed = data[current_index + j].get('speed', 0)
-            if next_speed > next_threshold:
-                return True
-        return False
-
-    def finalize_event(event, end_row, event_number):
-        """Calculate final stats for a completed event."""
-        max_speed = max(event['overspeed_values'])
-        excess_speeds = [s - event['psr_value'] for s in event['overspeed_values']]
-        max_excess = max(excess_speeds)
-
-        # Determine severity based on max excess
-        if max_excess < 5:
-            severity = 'minor'
-        elif max_excess < 10:
-            severity = 'moderate'
-        elif max_excess < 20:
-            severity = 'severe'
-        else:
-            severity = 'critical'
-
-        # Convert km if in meters
-        start_km = event['start_km']
-        end_km = end_row.get('cumulative_distance', 0)
-        if start_km > 200:  # Assume meters
-            start_km = start_km / 1000
-            end_km = end_km / 1000
-
-        return {
-            'event_number': event_number,
-            'start_time': event['start_time'],
-            'end_time': end_row.get('Time', ''),
-            'start_km': round(start_km, 2),
-            'end_km': round(end_km, 2),
-            'duration': len(event['overspeed_values']),
-            'max_speed': round(max_speed, 1),
-            'max_excess': round(max_excess, 1),
-            'psr_value': event['psr_value'],
-            'threshold': event['threshold'],
-            'severity': severity,
-            'start_index': event['start_index'],
-            'end_index': event['start_index'] + len(event['overspeed_values']) - 1
-        }
-
-    # Main detection loop
-    i = 0
-    while i < len(spm_data):
-        row = spm_data[i]
-        speed = row.get('speed', 0)
-        psr = psr_values[i] if i < len(psr_values) else None
-
-        if psr is None:
-            i += 1
-            continue
-
-        threshold = psr + threshold_offset
-
-        if speed > threshold:
-            if current_event is None:
-                # Start new event
-                current_event = create_new_event(row, psr, threshold, i)
-            else:
-                # Extend current event
-                extend_event(current_event, row)
-        else:
-            # Speed is within limits
-            if current_event is not None:
-                # Check if event meets minimum duration
-                if len(current_event['overspeed_values']) >= min_duration:
-                    # Check for momentary drop
-                    if not check_for_momentary_drop(spm_data, psr_values, i, threshold_offset):
-                        # Finalize event
-                        event = finalize_event(current_event, row, len(overspeed_events) + 1)
-                        overspeed_events.append(event)
-                    else:
-                        # Extend through momentary drop
-                        for j in range(1, 4):
-                            if i + j < len(spm_data):
-                                extend_event(current_event, spm_data[i + j])
-                        i += 2  # Skip checked rows
-                # Reset current event
-                current_event = None
-        i += 1
-
-    # Handle event at end of data
-    if current_event is not None and len(current_event['overspeed_values']) >= min_duration:
-        event = finalize_event(current_event, spm_data[-1], len(overspeed_events) + 1)
-        overspeed_events.append(event)
-
-    print(f"[DEBUG OVERSPEED] Detected {len(overspeed_events)} overspeed events (threshold: PSR+{threshold_offset}, min samples: {min_duration})")
-
-    return overspeed_events
+    columns = as_columns(spm_data)
+    times = columns.time
+    if not isinstance(spm_data, (SpmColumns, pl.DataFrame)):
+        times = ['' if t is None else t for t in times]  # row.get('Time', '')
+    return detect_overspeed_events_arrays(
+        columns.speed, psr_values, columns.cumulative_distance, times, threshold_offset, min_duration
+    )
 
 
 def get_overspeed_summary(events: List[Dict]) -> Dict:
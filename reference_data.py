@@ -0,0 +1,189 @@
+"""
+Process-wide reference data, loaded once at startup.
+
+Before this, the same files were read in several places and at request time:
+``build_chart_payload`` made a fresh ``PlatformEntryCalculator`` per
+``/chart_data`` and PDF, re-reading and re-merging ``fast_isd.json`` and
+``slow_isd.json`` each time; ``spm_db`` parsed its own copy of
+``train_corridor_map.csv``; corridors, segment limits and sheds each had their
+own loader.
+
+``ReferenceData`` owns all of it: corridors and the train lookups (through a
+loaded ``CorridorManager``), the compiled segment speed-limit tables, ISD
+platform lengths, sheds, station KM maps and the train corridor map rows. The
+calculators take it by injection (``reference_data=``). The JSON and CSV
+mappings are frozen (``MappingProxyType``/tuples), so a caller cannot edit
+what every other request sees.
+
+``version`` is a short hash over every source file's bytes and the station KM
+maps; anything cached from an analysis can key on it.
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from corridor_loader import CorridorManager
+from psr_mps import SEGMENT_FILES, SpeedLimitTable, load_speed_limit_tables
+from station_km_maps import get_station_km_map_for_train_type
+
+logger = logging.getLogger(__name__)
+
+DATA_ROOT = Path(__file__).parent
+
+ISD_FILES = {"fast": "fast_isd.json", "slow": "slow_isd.json"}
+SHEDS_FILE = "sheds.json"
+TRAIN_CORRIDOR_MAP_FILE = "train_corridor_map.csv"
+STATION_KM_MAP_TYPES = ("fast", "slow", "thb")
+
+
+def _freeze(value: Any) -> Any:
+    """Read-only copy of parsed JSON: dicts become mapping proxies, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """Everything the analysis reads from disk, loaded once. Treat as read-only."""
+
+    data_root: Path
+    version: str
+    corridor_manager: CorridorManager
+    segment_tables: Mapping[str, SpeedLimitTable]
+    isd: Mapping[str, Mapping[str, Mapping[str, Any]]]
+    sheds: Mapping[str, Any]
+    station_km_maps: Mapping[str, Mapping[str, float]]
+    train_corridor_rows: Tuple[Mapping[str, str], ...]
+
+    def isd_for(self, train_type: str) -> Mapping[str, Mapping[str, Any]]:
+        """ISD sections for a train type: fast (fast + slow merged) or slow."""
+        return self.isd["fast" if (train_type or "").lower() == "fast" else "slow"]
+
+    def station_km_map(self, train_type: str) -> Mapping[str, float]:
+        """get_station_km_map_for_train_type, without rebuilding the dict."""
+        return self.station_km_maps[train_type if train_type in ("fast", "thb") else "slow"]
+
+    def speed_limit_table(self, train_type: str) -> SpeedLimitTable:
+        if train_type not in self.segment_tables:
+            raise ValueError(f"Unknown train type: {train_type}. Must be 'fast', 'slow', or 'thb'")
+        return self.segment_tables[train_type]
+
+
+def _read_json(path: Path, digest, default=None) -> Any:
+    """Parse one JSON file, folding its bytes into the version digest."""
+    digest.update(path.name.encode())
+    if not path.exists():
+        digest.update(b"<missing>")
+        if default is None:
+            raise FileNotFoundError(f"Reference file not found: {path}")
+        return default
+    raw = path.read_bytes()
+    digest.update(raw)
+    return json.loads(raw)
+
+
+def _merge_isd(fast: Dict, slow: Dict) -> Dict:
+    """Fast sections first, then slow sections not already present (load_isd_data's rule)."""
+    merged = dict(fast)
+    for section, data in slow.items():
+        if section not in merged:
+            merged[section] = data
+    return merged
+
+
+def _read_csv_rows(path: Path, digest) -> Tuple[Mapping[str, str], ...]:
+    digest.update(path.name.encode())
+    if not path.exists():
+        digest.update(b"<missing>")
+        logger.warning("%s not found at %s", path.name, path)
+        return ()
+    raw = path.read_bytes()
+    digest.update(raw)
+    reader = csv.DictReader(io.StringIO(raw.decode("utf-8"), newline=""))
+    return tuple(MappingProxyType(dict(row)) for row in reader)
+
+
+def _digest_files(paths: Iterable[Path], digest) -> None:
+    for path in sorted(paths):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes() if path.exists() else b"<missing>")
+
+
+def load_reference_data(data_root: Path = DATA_ROOT) -> ReferenceData:
+    """
+    Read every reference file under ``data_root`` and build the registry.
+
+    Raises like the loaders it replaces: a missing slow ISD or segments file, or
+    a bad segments file (SegmentLimitsError), stops startup. Missing sheds.json
+    and train_corridor_map.csv degrade to empty, as before.
+    """
+    data_root = Path(data_root)
+    reference_dir = data_root / "reference_data"
+    digest = hashlib.sha256()
+
+    corridor_manager = CorridorManager(data_root)
+    corridor_manager.load_default_corridors()
+    corridor_manager.load_train_lookup()
+    corridor_manager.load_fast_halts("Fast Locals.csv")
+    train_corridor_rows = _read_csv_rows(data_root / TRAIN_CORRIDOR_MAP_FILE, digest)
+    corridor_manager.load_train_corridor_map(rows=train_corridor_rows)
+    _digest_files(
+        [data_root / "data" / name for name in CorridorManager.DEFAULT_FILES.values()]
+        + [data_root / "Sub  SPM Data Analysis - All Locals.csv", data_root / "Fast Locals.csv"],
+        digest,
+    )
+
+    _digest_files([reference_dir / name for name in SEGMENT_FILES.values()], digest)
+    segment_tables = load_speed_limit_tables(reference_dir)
+
+    slow_isd = _read_json(reference_dir / ISD_FILES["slow"], digest)
+    fast_isd = _read_json(reference_dir / ISD_FILES["fast"], digest, default={})
+    isd = {"fast": _merge_isd(fast_isd, slow_isd), "slow": slow_isd}
+
+    sheds = _read_json(reference_dir / SHEDS_FILE, digest, default={})
+
+    station_km_maps = {t: get_station_km_map_for_train_type(t) for t in STATION_KM_MAP_TYPES}
+    digest.update(json.dumps(station_km_maps, sort_keys=True).encode())
+
+    reference = ReferenceData(
+        data_root=data_root,
+        version=digest.hexdigest()[:12],
+        corridor_manager=corridor_manager,
+        segment_tables=MappingProxyType(dict(segment_tables)),
+        isd=_freeze(isd),
+        sheds=_freeze(sheds),
+        station_km_maps=_freeze(station_km_maps),
+        train_corridor_rows=train_corridor_rows,
+    )
+    logger.debug(
+        "Reference data %s: %s corridors, %s ISD sections, %s train map rows",
+        reference.version, len(corridor_manager.corridors), len(isd['fast']), len(train_corridor_rows),
+    )
+    return reference
+
+
+_REFERENCE: Optional[ReferenceData] = None
+_REFERENCE_LOCK = threading.Lock()
+
+
+def get_reference_data(data_root: Path = DATA_ROOT) -> ReferenceData:
+    """The process-wide registry for ``data_root``; loaded on first use."""
+    global _REFERENCE
+    data_root = Path(data_root)
+    with _REFERENCE_LOCK:
+        if _REFERENCE is None or _REFERENCE.data_root != data_root:
+            _REFERENCE = load_reference_data(data_root)
+        return _REFERENCE
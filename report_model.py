@@ -17,6 +17,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
+
 # Thresholds for the platform-entry exception table (ui/spm.html:1080-1089).
 PF_ENTRY_LIMIT = 45
 MID_PF_LIMIT = 30
@@ -143,6 +145,67 @@ def normalise_distances(
     return [float(v or 0.0) / divisor for v in values], in_metres
 
 
+# --- sample lookups by distance ------------------------------------------------
+
+def _sorted_distances(cumulative_distance: Sequence[Any]) -> Tuple[np.ndarray, bool]:
+    """The column as floats (None as 0) and whether searchsorted may be used on it."""
+    if isinstance(cumulative_distance, np.ndarray):
+        cum = cumulative_distance.astype(np.float64, copy=False)
+    else:
+        cum = np.asarray([0.0 if v is None else v for v in cumulative_distance], dtype=np.float64)
+    ok = not np.isnan(cum).any() and not (np.diff(cum) < 0).any()
+    return cum, ok
+
+
+def nearest_sample_indices(
+    cumulative_distance: Sequence[Any], targets: Sequence[float]
+) -> List[int]:
+    """
+    For each target distance, the index of the sample whose cumulative
+    distance is closest — the first such sample on a tie, which is what
+    ``np.argmin(np.abs(cum - target))`` gives. Used to place station markers.
+
+    Cumulative distance only grows, so this is one searchsorted for all
+    targets instead of a scan per target. A column that does go backwards
+    (or holds NaN) gets the scan.
+    """
+    cum, is_sorted = _sorted_distances(cumulative_distance)
+    targets = np.asarray(targets, dtype=np.float64)
+    n = len(cum)
+    if n == 0:
+        return [0] * len(targets)
+    if not is_sorted:
+        return [int(np.argmin(np.abs(cum - t))) if not np.isnan(t) else 0 for t in targets]
+
+    above = np.searchsorted(cum, targets, side="left")     # first sample >= target
+    below = np.clip(above - 1, 0, n - 1)
+    above_c = np.clip(above, 0, n - 1)
+    # The earlier candidate wins a tie, as argmin's first-occurrence rule does.
+    take_below = (above > 0) & ((above == n) | (targets - cum[below] <= cum[above_c] - targets))
+    nearest = np.where(take_below, cum[below], cum[above_c])
+    # Within a run of equal distances (a halt), the first sample of the run.
+    indices = np.searchsorted(cum, nearest, side="left")
+    return np.where(np.isnan(targets), 0, indices).tolist()
+
+
+def samples_between(
+    cumulative_distance: Sequence[Any], lows: Sequence[float], highs: Sequence[float]
+) -> List[np.ndarray]:
+    """
+    For each (low, high) pair, the indices of samples with
+    low <= cumulative distance <= high (None counting as 0), in order.
+    A contiguous slice found with searchsorted when the column only grows.
+    """
+    cum, is_sorted = _sorted_distances(cumulative_distance)
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    if not is_sorted:
+        return [np.flatnonzero((cum >= lo) & (cum <= hi)) for lo, hi in zip(lows, highs)]
+    starts = np.searchsorted(cum, lows, side="left")
+    stops = np.searchsorted(cum, highs, side="right")
+    return [np.arange(a, max(a, b)) for a, b in zip(starts.tolist(), stops.tolist())]
+
+
 # --- report assembly ---------------------------------------------------------
 
 def build_pf_exceptions(station_markers: List[Dict[str, Any]]) -> Dict[str, List[str]]:
@@ -261,17 +324,20 @@ def build_report_model(
     payload: Dict[str, Any],
     *,
     analysis_dt: datetime,
-    reference_data_dir: Path,
+    reference_data_dir: Optional[Path] = None,
+    reference_data=None,
 ) -> Dict[str, Any]:
     """
     Combine a run_store meta dict and a build_chart_payload result into the flat
     structure pdf_report.build_report_pdf consumes.
 
     `analysis_dt` must already be in IST — the caller owns timezone conversion.
+    Sheds come from `reference_data` (a ReferenceData) when given, otherwise
+    from sheds.json under `reference_data_dir`.
     """
     samples = payload.get("samples") or []
     station_markers = payload.get("station_markers") or []
-    sheds = load_sheds(reference_data_dir)
+    sheds = reference_data.sheds if reference_data is not None else load_sheds(reference_data_dir)
 
     total_distance = meta.get("total_distance")
     if total_distance is not None:
@@ -7,21 +7,33 @@ shrank when the user clicked Discard, so a long-lived process grew without bound
 the cause of ``sub-spm`` sitting at 1.3 GB RSS in production.
 
 This mirrors the approach already proven in the sibling RTIS app
-(``~/Desktop/rail-data-app/app.py:60-190``): keep a tiny index in RAM and push the
-bulk to disk, with a TTL and a hard cap on concurrent runs.
+(``~/Desktop/rail-data-app/app.py:60-190``): keep a tiny index and push the bulk
+to disk, with a TTL and a hard cap on concurrent runs.
 
 Layout per run, in ``RUNS_DIR``:
 
 ===========================  =========================================================
 ``{run_id}.parquet``         the polars frame (Date, Time, Speed, Distance,
                              cumulative_distance, PSR?)
+``{run_id}.source.parquet``  the parsed upload before trimming and PSR, for
+                             POST /runs/{run_id}/reanalyze; optional
 ``{run_id}.meta.pkl``        everything else — scalars plus violations,
                              overspeed_events, platform_entry_data,
                              station_window_rows, window_point_rows
-RAM index                    ~300 bytes per run: enough to answer ``GET /runs``
-                             without touching disk
+``{run_id}.chart-{tag}.gz``  the /chart_data payload, gzipped JSON (chart_payload.py);
+                             optional, deleted by ``update_meta``
+``index.sqlite3``            the index: ~300 bytes per run, enough to answer
+                             ``GET /runs`` without reading any run's files
+``index.lock``               serializes index writes across processes
 ===========================  =========================================================
 
+The index is shared by every process using ``RUNS_DIR``, so uvicorn can run
+several workers: a run uploaded through one is listed, served and expired by
+all of them. It is a ``sqlite_index.SqliteIndex``. A write that spans the
+index and the files — evicting at ``MAX_RUNS``, bumping a run's generation
+with its sidecar, storing a chart payload against a generation — holds its
+``write_lock``.
+
 The sidecar uses **pickle, not JSON**, deliberately. ``station_window_rows`` and
 ``window_point_rows`` are lists of *tuples* handed straight to ``cur.executemany()``
 in ``spm_db.insert_station_windows`` / ``insert_window_points``; JSON would silently
@@ -33,17 +45,19 @@ deletes anything older than the TTL on startup).
 
 from __future__ import annotations
 
+import json
 import os
 import pickle
-import shutil
+import sqlite3
 import tempfile
-import threading
 import time
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import polars as pl
 
+from sqlite_index import SqliteIndex, bump_counter, unlink_quietly, write_atomic
+
 # --- configuration -----------------------------------------------------------
 
 # Mirrors RTIS app.py:70-71. One hour is long enough to analyse, review the charts
@@ -55,8 +69,8 @@ RUNS_DIR = Path(
     os.getenv("SPM_RUNS_DIR") or (Path(tempfile.gettempdir()) / "spm_runs")
 )
 
-# Index fields kept in RAM. Anything needed by GET /runs must be listed here,
-# otherwise that endpoint has to unpickle every sidecar to answer.
+# Index fields kept in the index database. Anything needed by GET /runs must be
+# listed here, otherwise that endpoint has to unpickle every sidecar to answer.
 _INDEX_FIELDS = (
     "run_id",
     "confirmed",
@@ -72,8 +86,49 @@ _INDEX_FIELDS = (
     "uploaded_at",
 )
 
-_INDEX: Dict[str, Dict[str, Any]] = {}
-_LOCK = threading.RLock()
+INDEX_NAME = "index.sqlite3"
+LOCK_NAME = "index.lock"
+# Files in RUNS_DIR that belong to the index rather than to a run.
+_INDEX_FILES = (INDEX_NAME, INDEX_NAME + "-wal", INDEX_NAME + "-shm", LOCK_NAME)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    entry      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('evicted', 0), ('expired', 0);
+"""
+
+_INDEX = SqliteIndex(RUNS_DIR / INDEX_NAME, RUNS_DIR / LOCK_NAME, _SCHEMA)
+_db = _INDEX.connect
+_write_lock = _INDEX.write_lock
+_transaction = _INDEX.transaction
+
+
+# --- index database ----------------------------------------------------------
+
+def _entry(row: Any) -> Dict[str, Any]:
+    """An index row as the dict callers get: the fields plus created_at and generation."""
+    run_id, created_at, generation, fields = row
+    entry = json.loads(fields)
+    entry.update(run_id=run_id, created_at=created_at, generation=generation)
+    return entry
+
+
+def _insert(db: sqlite3.Connection, run_id: str, meta: Dict[str, Any], created_at: float) -> None:
+    fields = {k: meta.get(k) for k in _INDEX_FIELDS}
+    fields["run_id"] = run_id
+    db.execute(
+        "INSERT OR REPLACE INTO runs (run_id, created_at, generation, entry) VALUES (?, ?, 0, ?)",
+        (run_id, created_at, json.dumps(fields, default=str)),
+    )
 
 
 # --- paths -------------------------------------------------------------------
@@ -82,36 +137,43 @@ def _parquet_path(run_id: str) -> Path:
     return RUNS_DIR / f"{run_id}.parquet"
 
 
+def _source_path(run_id: str) -> Path:
+    return RUNS_DIR / f"{run_id}.source.parquet"
+
+
 def _meta_path(run_id: str) -> Path:
     return RUNS_DIR / f"{run_id}.meta.pkl"
 
 
-def _unlink_quietly(path: Path) -> None:
-    try:
-        path.unlink()
-    except FileNotFoundError:
-        pass
-    except OSError:
-        pass
+def _chart_path(run_id: str, tag: str) -> Path:
+    return RUNS_DIR / f"{run_id}.chart-{tag}.gz"
+
+
+def _remove_chart_payloads(run_id: str) -> None:
+    for path in RUNS_DIR.glob(f"{run_id}.chart-*.gz"):
+        unlink_quietly(path)
 
 
 def _remove_files(run_id: str) -> None:
-    _unlink_quietly(_parquet_path(run_id))
-    _unlink_quietly(_meta_path(run_id))
+    unlink_quietly(_parquet_path(run_id))
+    unlink_quietly(_source_path(run_id))
+    unlink_quietly(_meta_path(run_id))
+    _remove_chart_payloads(run_id)
 
 
 # --- housekeeping ------------------------------------------------------------
 
 def purge_expired() -> None:
     """Drop runs older than the TTL from the index and delete their files."""
-    now = time.time()
-    with _LOCK:
-        expired = [
-            rid for rid, entry in _INDEX.items()
-            if now - entry.get("created_at", 0) > RUN_TTL_SECONDS
-        ]
+    cutoff = time.time() - RUN_TTL_SECONDS
+    with _write_lock():
+        with _transaction() as db:
+            expired = [
+                rid for (rid,) in db.execute("SELECT run_id FROM runs WHERE created_at < ?", (cutoff,))
+            ]
+            db.executemany("DELETE FROM runs WHERE run_id = ?", [(rid,) for rid in expired])
+            bump_counter(db, "expired", len(expired))
         for rid in expired:
-            _INDEX.pop(rid, None)
             _remove_files(rid)
 
 
@@ -120,17 +182,18 @@ def cleanup_orphans() -> None:
     Delete files on disk older than the TTL.
 
     Covers the crash case: if the process dies between writing a run and expiring
-    it, the index is gone but the files remain. Mirrors RTIS ``_cleanup_orphan_files``.
+    it, the index entry and its files can outlive the run. Mirrors RTIS
+    ``_cleanup_orphan_files``. The index's own files are left alone.
     """
     now = time.time()
     try:
         RUNS_DIR.mkdir(parents=True, exist_ok=True)
         for path in RUNS_DIR.iterdir():
-            if not path.is_file():
+            if not path.is_file() or path.name in _INDEX_FILES:
                 continue
             try:
                 if now - path.stat().st_mtime > RUN_TTL_SECONDS:
-                    _unlink_quietly(path)
+                    unlink_quietly(path)
             except OSError:
                 continue
     except OSError:
@@ -139,122 +202,188 @@ def cleanup_orphans() -> None:
 
 def rehydrate() -> int:
     """
-    Rebuild the RAM index from sidecars still on disk.
+    Reconcile the index with the files on disk.
 
-    Lets an analysis survive a process restart within its TTL, so ``/chart_data``
-    keeps working instead of 410-ing on every in-flight run after a ``pm2 restart``.
-    Corrupt or unreadable sidecars are dropped rather than raised — they are
-    disposable temp files.
+    The index database survives a restart by itself; this covers it being lost
+    or older than the files (deleted, or a run written by a version that kept
+    the index in RAM), so ``/chart_data`` keeps working instead of 410-ing on
+    every in-flight run after a ``pm2 restart``. Index entries whose files are
+    gone are dropped. Corrupt or unreadable sidecars are deleted rather than
+    raised — they are disposable temp files.
 
     Returns the number of runs recovered.
     """
     recovered = 0
     try:
         RUNS_DIR.mkdir(parents=True, exist_ok=True)
-        for path in sorted(RUNS_DIR.glob("*.meta.pkl")):
-            run_id = path.name[: -len(".meta.pkl")]
-            if not _parquet_path(run_id).exists():
-                _unlink_quietly(path)
-                continue
-            try:
-                with path.open("rb") as fh:
-                    meta = pickle.load(fh)
-            except Exception:
-                _remove_files(run_id)
-                continue
-            entry = {k: meta.get(k) for k in _INDEX_FIELDS}
-            entry["run_id"] = run_id
-            try:
-                entry["created_at"] = path.stat().st_mtime
-            except OSError:
-                entry["created_at"] = time.time()
-            with _LOCK:
-                _INDEX[run_id] = entry
-            recovered += 1
-    except OSError:
+        with _write_lock():
+            indexed = {rid for (rid,) in _db().execute("SELECT run_id FROM runs")}
+            for run_id in indexed:
+                if not (_meta_path(run_id).exists() and _parquet_path(run_id).exists()):
+                    _db().execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                    _remove_files(run_id)
+            for path in sorted(RUNS_DIR.glob("*.meta.pkl")):
+                run_id = path.name[: -len(".meta.pkl")]
+                if run_id in indexed:
+                    continue
+                if not _parquet_path(run_id).exists():
+                    unlink_quietly(path)
+                    continue
+                try:
+                    with path.open("rb") as fh:
+                        meta = pickle.load(fh)
+                    created_at = path.stat().st_mtime
+                except Exception:
+                    _remove_files(run_id)
+                    continue
+                _remove_chart_payloads(run_id)  # no generation to check them against
+                _insert(_db(), run_id, meta, created_at)
+                recovered += 1
+    except (OSError, sqlite3.Error):
         pass
     return recovered
 
 
 # --- writing -----------------------------------------------------------------
 
-def _write_atomic(path: Path, write: Any) -> None:
-    """Write via a temp file + rename so a reader never sees a partial file."""
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    try:
-        write(tmp)
-        os.replace(tmp, path)
-    except Exception:
-        _unlink_quietly(tmp)
-        raise
-
-
-def put_run(run_id: str, df: pl.DataFrame, meta: Dict[str, Any]) -> None:
+def put_run(
+    run_id: str, df: pl.DataFrame, meta: Dict[str, Any], source_df: Optional[pl.DataFrame] = None
+) -> None:
     """
     Store a run: frame to Parquet, everything else to a pickle sidecar.
 
     ``meta`` must NOT contain the sample rows — that is what ``df`` is for.
-    Evicts the oldest run when at ``MAX_RUNS``.
+    ``source_df``, when given, is the untrimmed parsed upload (see
+    ``get_source_frame``). Evicts the oldest run when at ``MAX_RUNS``.
     """
     RUNS_DIR.mkdir(parents=True, exist_ok=True)
     purge_expired()
 
-    with _LOCK:
-        # Evict oldest by creation time when at capacity (RTIS app.py:133-141).
-        while len(_INDEX) >= MAX_RUNS:
-            oldest = min(_INDEX.items(), key=lambda kv: kv[1].get("created_at", 0))[0]
-            _INDEX.pop(oldest, None)
-            _remove_files(oldest)
-
-    _write_atomic(_parquet_path(run_id), lambda p: df.write_parquet(p))
-    _write_atomic(
+    # The files are this run's alone; only the eviction and the index entry
+    # need the lock.
+    write_atomic(_parquet_path(run_id), lambda p: df.write_parquet(p))
+    if source_df is not None:
+        write_atomic(_source_path(run_id), lambda p: source_df.write_parquet(p))
+    write_atomic(
         _meta_path(run_id),
         lambda p: p.write_bytes(pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)),
     )
 
-    entry = {k: meta.get(k) for k in _INDEX_FIELDS}
-    entry["run_id"] = run_id
-    entry["created_at"] = time.time()
-    with _LOCK:
-        _INDEX[run_id] = entry
+    with _write_lock():
+        with _transaction() as db:
+            # Evict oldest by creation time when at capacity (RTIS app.py:133-141).
+            (count,) = db.execute("SELECT COUNT(*) FROM runs WHERE run_id != ?", (run_id,)).fetchone()
+            evicted = [
+                rid for (rid,) in db.execute(
+                    "SELECT run_id FROM runs WHERE run_id != ? ORDER BY created_at LIMIT ?",
+                    (run_id, max(count - MAX_RUNS + 1, 0)),
+                )
+            ]
+            db.executemany("DELETE FROM runs WHERE run_id = ?", [(rid,) for rid in evicted])
+            bump_counter(db, "evicted", len(evicted))
+            _insert(db, run_id, meta, time.time())
+        for rid in evicted:
+            _remove_files(rid)
 
 
 def update_meta(run_id: str, **fields: Any) -> None:
-    """Merge ``fields`` into a stored run's sidecar (read-modify-write)."""
-    with _LOCK:
+    """
+    Merge ``fields`` into a stored run's sidecar (read-modify-write).
+
+    Deletes the stored chart payload, which embeds the metadata, and bumps the
+    run's generation so a payload built from the old meta is not stored after.
+    """
+    with _write_lock():
         meta = get_meta(run_id)
         if meta is None:
             raise KeyError(run_id)
         meta.update(fields)
-        _write_atomic(
+        write_atomic(
             _meta_path(run_id),
             lambda p: p.write_bytes(pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)),
         )
-        entry = _INDEX.get(run_id)
-        if entry is not None:
-            for key in _INDEX_FIELDS:
-                if key in fields:
-                    entry[key] = fields[key]
+        _remove_chart_payloads(run_id)
+        with _transaction() as db:
+            row = db.execute("SELECT entry FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is not None:
+                entry = json.loads(row[0])
+                entry.update({key: fields[key] for key in _INDEX_FIELDS if key in fields})
+                db.execute(
+                    "UPDATE runs SET generation = generation + 1, entry = ? WHERE run_id = ?",
+                    (json.dumps(entry, default=str), run_id),
+                )
+
+
+def put_chart_payload(run_id: str, tag: str, data: bytes, generation: int) -> bool:
+    """
+    Store a run's encoded chart payload. ``generation`` is ``meta_generation``
+    as read before the payload was built; if the meta changed since (or the run
+    is gone) nothing is written and False is returned.
+    """
+    with _write_lock():
+        if meta_generation(run_id) != generation:
+            return False
+        write_atomic(_chart_path(run_id, tag), lambda p: p.write_bytes(data))
+        return True
 
 
 # --- reading -----------------------------------------------------------------
 
 def has_run(run_id: str) -> bool:
-    with _LOCK:
-        if run_id in _INDEX:
-            return True
+    if _db().execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone():
+        return True
     return _meta_path(run_id).exists() and _parquet_path(run_id).exists()
 
 
 def get_index(run_id: str) -> Optional[Dict[str, Any]]:
-    with _LOCK:
-        entry = _INDEX.get(run_id)
-        return dict(entry) if entry else None
+    row = _db().execute(
+        "SELECT run_id, created_at, generation, entry FROM runs WHERE run_id = ?", (run_id,)
+    ).fetchone()
+    return _entry(row) if row else None
 
 
 def list_index() -> List[Dict[str, Any]]:
-    with _LOCK:
-        return [dict(entry) for entry in _INDEX.values()]
+    """Every indexed run, oldest first."""
+    rows = _db().execute("SELECT run_id, created_at, generation, entry FROM runs ORDER BY created_at")
+    return [_entry(row) for row in rows]
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Runs in the index, the bytes of their files on disk, and runs dropped since
+    the index was made: ``evicted`` at MAX_RUNS, ``expired`` past the TTL.
+    Shared by every process using RUNS_DIR.
+    """
+    db = _db()
+    (runs,) = db.execute("SELECT COUNT(*) FROM runs").fetchone()
+    counters = dict(db.execute("SELECT name, value FROM counters"))
+    size = 0
+    try:
+        with os.scandir(RUNS_DIR) as entries:
+            for item in entries:
+                if item.name in _INDEX_FILES:
+                    continue
+                try:
+                    size += item.stat().st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return {"runs": runs, "max_runs": MAX_RUNS, "bytes": size, **counters}
+
+
+def meta_generation(run_id: str) -> Optional[int]:
+    """How many times update_meta has run on this run; None if it is not indexed."""
+    row = _db().execute("SELECT generation FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return row[0] if row else None
+
+
+def get_chart_payload(run_id: str, tag: str) -> Optional[bytes]:
+    """The stored chart payload bytes, or None if not stored (or since invalidated)."""
+    try:
+        return _chart_path(run_id, tag).read_bytes()
+    except OSError:
+        return None
 
 
 def get_meta(run_id: str) -> Optional[Dict[str, Any]]:
@@ -277,6 +406,17 @@ def get_frame(run_id: str) -> pl.DataFrame:
     return pl.read_parquet(path)
 
 
+def get_source_frame(run_id: str) -> pl.DataFrame:
+    """
+    The run's parsed upload, before halt trimming and PSR. Raises KeyError if
+    the run is gone or was stored without one.
+    """
+    path = _source_path(run_id)
+    if not path.exists():
+        raise KeyError(run_id)
+    return pl.read_parquet(path)
+
+
 def get_rows(run_id: str) -> List[Dict[str, Any]]:
     """
     Return the sample rows.
@@ -302,22 +442,29 @@ def load_run(run_id: str) -> Dict[str, Any]:
     return run
 
 
+def load_run_frame(run_id: str) -> Dict[str, Any]:
+    """
+    Like ``load_run`` but with the polars frame under ``"frame"`` instead of
+    row dicts under ``"data"``. Raises KeyError the same way.
+    """
+    meta = get_meta(run_id)
+    if meta is None:
+        raise KeyError(run_id)
+    run = dict(meta)
+    run["frame"] = get_frame(run_id)
+    return run
+
+
 def drop_run(run_id: str) -> None:
-    """Remove a run from the index and delete both files. Safe if absent."""
-    with _LOCK:
-        _INDEX.pop(run_id, None)
-    _remove_files(run_id)
+    """Remove a run from the index and delete its files. Safe if absent."""
+    with _write_lock():
+        _db().execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+        _remove_files(run_id)
 
 
 def clear_all() -> None:
-    """Wipe the index and the directory. Tests only."""
-    with _LOCK:
-        _INDEX.clear()
-    try:
-        shutil.rmtree(RUNS_DIR)
-    except FileNotFoundError:
-        pass
-    RUNS_DIR.mkdir(parents=True, exist_ok=True)
+    """Wipe the index, the counters and the directory. Tests only."""
+    _INDEX.reset(RUNS_DIR)
 
 
 # Mirrors RTIS app.py:188 — sweep stale files, then recover anything still valid.
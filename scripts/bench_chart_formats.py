@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Size and client-side parse time of the /chart_data formats on the large report fixture.
+
+    ./venv/bin/python scripts/bench_chart_formats.py
+    ./venv/bin/python scripts/bench_chart_formats.py --repeat 50
+
+The fixture keeps only the payload, so the frame that format=arrow streams is
+rebuilt from its samples (Date/Time/Speed/Distance/cumulative_distance/PSR, the
+columns an upload stores). For each format: raw bytes, the bytes sent (gzipped
+JSON, the IPC stream itself for arrow), then the time to parse the raw body with
+json (pyarrow's IPC reader for arrow). Best of --repeat.
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+import polars as pl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from chart_payload import GZIPPED_FORMATS, HAVE_PYARROW, encode_arrow, encode_payload, to_columnar  # noqa: E402
+
+FIXTURE = ROOT / "tests" / "fixtures" / "report_fixture_large.json.gz"
+
+
+def frame_from_samples(samples) -> pl.DataFrame:
+    return pl.DataFrame({
+        "Date": [""] * len(samples),
+        "Time": [s["timestamp"] for s in samples],
+        "Speed": [s["speed"] for s in samples],
+        "Distance": [s["distance"] for s in samples],
+        "cumulative_distance": [s["cumulative_distance"] for s in samples],
+        "PSR": [s.get("psr") for s in samples],
+    })
+
+
+def best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with gzip.open(FIXTURE, "rt", encoding="utf-8") as fh:
+        payload = json.load(fh)["payload"]
+    frame = frame_from_samples(payload["samples"])
+    print(f"{len(payload['samples'])} samples")
+
+    bodies = {
+        "rows": encode_payload(payload),
+        "columnar": encode_payload(to_columnar(payload)),
+    }
+    if HAVE_PYARROW:
+        bodies["arrow"] = encode_arrow(frame, payload)
+
+    print(f"{'format':<10} {'raw KB':>9} {'sent KB':>9} {'json ms':>9} {'ipc ms':>8}")
+    for fmt, body in bodies.items():
+        raw = gzip.decompress(body) if fmt in GZIPPED_FORMATS else body
+        json_ms = ipc_ms = "-"
+        if fmt == "arrow":
+            import pyarrow as pa
+            ipc_ms = f"{best_ms(lambda: pa.ipc.open_stream(raw).read_all(), args.repeat):.2f}"
+        else:
+            json_ms = f"{best_ms(lambda: json.loads(raw), args.repeat):.2f}"
+        print(f"{fmt:<10} {len(raw) / 1024:>9.1f} {len(body) / 1024:>9.1f} {json_ms:>9} {ipc_ms:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Excel ingest time: spm_ingest.read_spm_excel against the previous read path.
+
+    ./venv/bin/python scripts/bench_excel_ingest.py
+    ./venv/bin/python scripts/bench_excel_ingest.py --rows 30000 --repeat 3
+
+Writes synthetic Date,Time,Speed,Distance workbooks with openpyxl: one with the
+header on the first row, one with two metadata rows above it, and one with no
+header at all, which the previous path read seven times (header rows 0-5, then
+header=None). The previous path is inlined below. Best of --repeat, in seconds.
+"""
+
+import argparse
+import datetime as dt
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import polars as pl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from spm_ingest import HAVE_CALAMINE, read_spm_excel  # noqa: E402
+
+
+def previous_read(path: Path) -> pl.DataFrame:
+    pandas_df = None
+    for header_row in [0, 1, 2, 3, 4, 5]:
+        try:
+            test_df = pd.read_excel(path, header=header_row)
+            cols_lower = [str(c).lower() for c in test_df.columns]
+            if any('date' in c for c in cols_lower) or any('speed' in c for c in cols_lower):
+                pandas_df = test_df
+                break
+        except Exception:
+            continue
+    if pandas_df is None:
+        pandas_df = pd.read_excel(path, header=None)
+        try:
+            float(pandas_df.iloc[0, 1])
+            pandas_df.columns = ['Date', 'Speed', 'Distance'] + list(pandas_df.columns[3:])
+        except (ValueError, TypeError):
+            pandas_df.columns = ['Date', 'Time', 'Speed', 'Distance'] + list(pandas_df.columns[4:])
+    return pl.from_pandas(pandas_df)
+
+
+def write_workbook(path: Path, rows: int, preamble, header: bool, seed: int = 0) -> None:
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for line in preamble:
+        ws.append(line)
+    if header:
+        ws.append(["Date", "Time", "Speed", "Distance"])
+    day = dt.date(2025, 1, 10)
+    speed = 0.0
+    for i in range(rows):
+        speed = max(0.0, min(105.0, speed + rng.uniform(-2.5, 2.5)))
+        ws.append([day, dt.time(i // 3600 % 24, i // 60 % 60, i % 60), round(speed, 1), round(speed / 3.6)])
+    wb.save(path)
+
+
+def best_s(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=30000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"engine: {'calamine' if HAVE_CALAMINE else 'openpyxl'}; {args.rows} rows")
+    print(f"{'layout':<16} {'previous s':>11} {'spm_ingest s':>13} {'speedup':>8}")
+    layouts = {
+        "header": ([], True),
+        "metadata+header": ([["SPM download"], ["Loco", "12345"]], True),
+        "no header": ([], False),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (preamble, header) in layouts.items():
+            path = Path(tmp) / f"{name.replace(' ', '_').replace('+', '_')}.xlsx"
+            write_workbook(path, args.rows, preamble, header)
+            old_s = best_s(lambda: previous_read(path), args.repeat)
+            new_s = best_s(lambda: read_spm_excel(path), args.repeat)
+            print(f"{name:<16} {old_s:>11.2f} {new_s:>13.2f} {old_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+CSV ingest throughput: spm_ingest.read_spm_csv against the previous read path.
+
+    ./venv/bin/python scripts/bench_ingest.py
+    ./venv/bin/python scripts/bench_ingest.py --rows 30000 200000 1000000 --repeat 5
+
+Writes a synthetic Date,Time,Speed,Distance export per size (1 Hz samples, a
+header line) to a temp dir. The files are clean: the previous path fails
+outright on a stray header row past polars' 100-row inference window, which
+read_spm_csv simply drops. The previous path — ``n_rows=1`` sniff, full
+``read_csv`` with inference, regex filter, cast back to Float64 — is inlined
+below so the comparison survives it being gone from analysis_pipeline. Both
+produce the same Speed/Distance; best of --repeat, in MB/s of file.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import polars as pl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from spm_ingest import read_spm_csv  # noqa: E402
+
+NUMBER = r"^\d+\.?\d*$"
+
+
+def previous_read(path: Path) -> pl.DataFrame:
+    first_row = pl.read_csv(path, n_rows=1).row(0)
+    has_headers = True
+    try:
+        float(str(first_row[1]))
+        float(str(first_row[2]))
+        has_headers = False
+    except (ValueError, TypeError):
+        pass
+    if has_headers:
+        df = pl.read_csv(path)
+    else:
+        df = pl.read_csv(path, has_header=False, new_columns=['Date', 'Speed', 'Distance'])
+    return df.filter(
+        pl.col("Speed").cast(pl.Utf8).str.contains(NUMBER) &
+        pl.col("Distance").cast(pl.Utf8).str.contains(NUMBER)
+    ).with_columns(pl.col("Speed").cast(pl.Float64), pl.col("Distance").cast(pl.Float64))
+
+
+def write_run(path: Path, rows: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    speed = 0.0
+    with open(path, "w") as f:
+        f.write("Date,Time,Speed,Distance\n")
+        for i in range(rows):
+            speed = max(0.0, min(105.0, speed + rng.uniform(-2.5, 2.5)))
+            f.write(f"2025-01-10,{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d},"
+                    f"{speed:.1f},{round(speed / 3.6)}\n")
+
+
+def best_s(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[30000, 200000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'MB':>7} {'previous MB/s':>14} {'spm_ingest MB/s':>16} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = Path(tmp) / f"run_{rows}.csv"
+            write_run(path, rows)
+            mb = path.stat().st_size / 1e6
+
+            old, new = previous_read(path), read_spm_csv(path)
+            assert old["Speed"].to_list() == new["Speed"].to_list()
+            assert old["Distance"].to_list() == new["Distance"].to_list()
+
+            old_s = best_s(lambda: previous_read(path), args.repeat)
+            new_s = best_s(lambda: read_spm_csv(path), args.repeat)
+            print(f"{rows:>9} {mb:>7.1f} {mb / old_s:>14.1f} {mb / new_s:>16.1f} {old_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
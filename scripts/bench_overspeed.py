@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Overspeed event detection: the run-based detector over row dicts and over columns.
+
+    ./venv/bin/python scripts/bench_overspeed.py               # 50k samples
+    ./venv/bin/python scripts/bench_overspeed.py --samples 200000 --repeat 3
+
+A synthetic 1 Hz run with a stepped PSR profile and a few hundred overspeed
+excursions, some long, some with momentary drops. Reports the best wall time
+and tracemalloc peak of each entry point and checks they agree: "rows" is
+detect_overspeed_events with the row-dict adapter, "columns" the same
+detector fed arrays directly.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from psr_mps import detect_overspeed_events, detect_overspeed_events_arrays  # noqa: E402
+
+
+def synth(samples: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    psr = np.repeat(rng.choice([30, 45, 70, 80, 105], size=samples // 500 + 1), 500)[:samples]
+    speed = psr - 8 + rng.normal(0, 2, samples)
+    for start in rng.integers(0, samples - 200, size=samples // 150):
+        length = int(rng.integers(3, 120))
+        speed[start:start + length] = psr[start:start + length] + rng.uniform(4, 25)
+    speed = np.clip(speed, 0, None)
+    psr_values = [int(p) for p in psr]
+    for gap in rng.integers(0, samples, size=samples // 1000):
+        psr_values[gap] = None
+    rows = [
+        {"speed": float(s), "cumulative_distance": i * 20.0, "Time": f"{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"}
+        for i, s in enumerate(speed)
+    ]
+    return rows, psr_values
+
+
+def measure(fn, rows, psr_values, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(rows, psr_values, 3, 7)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn(rows, psr_values, 3, 7)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--samples", type=int, default=50_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    rows, psr_values = synth(args.samples)
+    vector, t_vector, m_vector = measure(detect_overspeed_events, rows, psr_values, args.repeat)
+
+    speed = np.array([r["speed"] for r in rows])
+    cum_dist = np.array([r["cumulative_distance"] for r in rows])
+    times = [r["Time"] for r in rows]
+    columns, t_columns, m_columns = measure(
+        lambda _rows, psr, off, md: detect_overspeed_events_arrays(speed, psr, cum_dist, times, off, md),
+        rows, psr_values, args.repeat,
+    )
+
+    print(f"\n{args.samples:,} samples, {len(vector)} events")
+    print(f"  rows        {t_vector * 1000:8.1f} ms   peak {m_vector / 1024:8.0f} KiB")
+    print(f"  columns     {t_columns * 1000:8.1f} ms   peak {m_columns / 1024:8.0f} KiB")
+    same = vector == columns
+    print(f"  identical: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Memory and allocations of the per-upload detectors: row dicts vs SpmColumns.
+
+    ./venv/bin/python scripts/bench_pipeline_memory.py              # 20k rows
+    ./venv/bin/python scripts/bench_pipeline_memory.py --rows 60000
+
+Runs the stages analyse_frame runs after PSR — violations, overspeed events,
+platform entry speeds, brake feel — plus the chart's sample build, once the old
+way (df.to_dicts() and the per-stage dict lists built from it) and once from a
+single SpmColumns. Reports wall time, tracemalloc peak, and gen-0 GC
+collections as an allocation count (one per ~700 net container allocations,
+which is what the dicts are).
+
+Needs tests/reference_data for the ISD platform lengths.
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from brakefeel_detector import BrakeFeelDetector  # noqa: E402
+from platform_entry_speed import PlatformEntryCalculator  # noqa: E402
+from psr_mps import detect_overspeed_events, detect_violations  # noqa: E402
+from spm_columns import SpmColumns  # noqa: E402
+
+STATIONS = ["MNKD", "VSH", "SNPD"]
+
+
+def synth(rows: int) -> pl.DataFrame:
+    """Stop-start run, 1 Hz, 120 s cycles, with a stepped PSR."""
+    t = np.arange(rows) % 120
+    speed = np.select([t < 30, t < 70, t < 90], [t * 2.5, 75.0, 75.0 - (t - 70) * 3.75], 0.0)
+    distance = speed / 3.6
+    secs = np.arange(rows) % 86400
+    psr = np.repeat([45, 70, 80, 70], rows // 4 + 1)[:rows]
+    return pl.DataFrame({
+        "Time": [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in secs],
+        "Speed": speed,
+        "Distance": distance,
+        "cumulative_distance": np.cumsum(distance),
+        "PSR": psr,
+    })
+
+
+def halts_for(df: pl.DataFrame) -> dict:
+    stops = df.filter(pl.col("Speed") == 0)["cumulative_distance"].unique().sort().to_list()
+    picks = stops[1:4] if len(stops) >= 4 else stops
+    return dict(zip(STATIONS, picks))
+
+
+def via_dicts(df, halts, entry, brake):
+    rows = df.to_dicts()
+    psr = df["PSR"].to_list()
+    # What the detectors expect from row dicts (lower-case keys)
+    samples = [{"speed": float(r["Speed"] or 0), "cumulative_distance": r["cumulative_distance"],
+                "distance": r["Distance"], "Time": r["Time"]} for r in rows]
+    detect_violations(samples, psr)
+    detect_overspeed_events(samples, psr, threshold_offset=3, min_duration=7)
+    entry_samples = [{"cumulative_distance": float(r["cumulative_distance"] or 0.0),
+                      "speed": float(r["Speed"] or 0.0)} for r in rows]
+    entry.calculate_platform_entry_speeds(halts, STATIONS, entry_samples, "slow")
+    brake_samples = [{"speed": float(r["Speed"] or 0), "timestamp": r.get("Time", "")} for r in rows]
+    brake.detect_from_samples(brake_samples)
+
+
+def via_columns(df, halts, entry, brake):
+    cols = SpmColumns.from_frame(df)
+    detect_violations(cols, cols.psr)
+    detect_overspeed_events(cols, cols.psr, threshold_offset=3, min_duration=7)
+    entry.calculate_platform_entry_speeds(halts, STATIONS, cols, "slow")
+    brake.detect_from_columns(cols)
+
+
+def measure(fn, *args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+
+    gc.collect()
+    before = gc.get_stats()[0]["collections"]
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    collections = gc.get_stats()[0]["collections"] - before
+    return best, peak, collections
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    df = synth(args.rows)
+    halts = halts_for(df)
+    entry = PlatformEntryCalculator(reference_data_dir=str(ROOT / "tests" / "reference_data"))
+    entry.load_isd_data("slow")
+    brake = BrakeFeelDetector()
+
+    print(f"\n{args.rows:,} rows")
+    for label, fn in (("row dicts", via_dicts), ("columns", via_columns)):
+        best, peak, collections = measure(fn, df, halts, entry, brake, repeat=args.repeat)
+        print(f"  {label:<10} {best * 1000:8.1f} ms   peak {peak / 1024:8.0f} KiB   gen0 GCs {collections:>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
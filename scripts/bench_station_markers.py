@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Station marker placement: a nearest-sample scan per station vs one searchsorted.
+
+    ./venv/bin/python scripts/bench_station_markers.py                  # 40 x 30k
+    ./venv/bin/python scripts/bench_station_markers.py --stations 80 --samples 60000
+
+Times, best of --repeat:
+  markers   per-station np.argmin(|cum - d|) (chart_payload before) vs
+            report_model.nearest_sample_indices
+  windows   per-station list filter over the sample dicts (pdf_report's
+            platform entry windows before) vs report_model.samples_between
+Both pairs are checked to agree before timing.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from report_model import nearest_sample_indices, samples_between  # noqa: E402
+
+
+def synth(samples: int, seed: int = 0) -> np.ndarray:
+    """Cumulative metres at 1 Hz with ~20% stationary samples."""
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(samples) < 0.2, 0.0, rng.uniform(0, 25, samples))
+    return np.round(np.cumsum(steps), 2)
+
+
+def best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--samples", type=int, default=30_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cum = synth(args.samples)
+    halts = np.sort(np.random.default_rng(1).uniform(0, cum[-1], args.stations))
+    entries = halts - 250.0
+    sample_dicts = [{"cumulative_distance": c} for c in cum.tolist()]
+
+    def markers_scan():
+        return [int(np.argmin(np.abs(cum - d))) for d in halts]
+
+    def markers_sorted():
+        return nearest_sample_indices(cum, halts)
+
+    def windows_scan():
+        return [[i for i, s in enumerate(sample_dicts)
+                 if lo <= (s.get("cumulative_distance") or 0) <= hi]
+                for lo, hi in zip(entries, halts)]
+
+    def windows_sorted():
+        return samples_between([s.get("cumulative_distance") or 0 for s in sample_dicts],
+                               entries, halts)
+
+    assert markers_scan() == markers_sorted()
+    assert windows_scan() == [rows.tolist() for rows in windows_sorted()]
+
+    print(f"{args.stations} stations x {args.samples} samples")
+    for name, before, after in (("markers", markers_scan, markers_sorted),
+                                ("windows", windows_scan, windows_sorted)):
+        a, b = best_ms(before, args.repeat), best_ms(after, args.repeat)
+        print(f"  {name:<8} scan {a:8.2f} ms   searchsorted {b:7.2f} ms   x{a / b:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Latency of the cheap endpoints while several uploads are being analysed.
+
+Start the server first (it needs the DB, like any other run), then:
+
+    ./venv/bin/python scripts/bench_upload_concurrency.py
+    ./venv/bin/python scripts/bench_upload_concurrency.py --file run.csv --train 95001
+    ./venv/bin/python scripts/bench_upload_concurrency.py --uploads 4 --rows 60000
+
+One warm-up upload gives /chart_data a run to fetch. Then N uploads are fired at
+once and, until the last one returns, a prober hits /, /runs and /chart_data in a
+loop. p50/p95 of the probes are reported against an idle baseline. Compare
+SPM_ANALYSIS_WORKERS=0 (threadpool) with the default pool: with the threadpool
+the probes queue behind the GIL-bound analysis.
+
+Without --file a synthetic CSV is generated (--rows samples at 1 Hz).
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+
+def synth_csv(rows: int) -> Path:
+    """A stop-start run: 90 s accelerate/cruise/brake, 30 s halt, repeated."""
+    lines = ["Date,Time,Speed,Distance"]
+    for i in range(rows):
+        t = i % 120
+        if t < 30:
+            speed = t * 2.5
+        elif t < 70:
+            speed = 75.0
+        elif t < 90:
+            speed = 75.0 - (t - 70) * 3.75
+        else:
+            speed = 0.0
+        secs = i % 86400
+        lines.append(
+            f"2025-01-10,{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d},"
+            f"{speed:.1f},{speed / 3.6:.2f}"
+        )
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+    tmp.write("\n".join(lines))
+    tmp.close()
+    return Path(tmp.name)
+
+
+def upload(base: str, path: Path, train: str) -> dict:
+    with path.open("rb") as fh:
+        resp = requests.post(
+            f"{base}/upload",
+            files={"file": (path.name, fh, "text/csv")},
+            data={"train_number": train} if train else {},
+            timeout=600,
+        )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def probe_once(base: str, run_id: str) -> dict:
+    timings = {}
+    for name, call in (
+        ("/", lambda: requests.get(f"{base}/", timeout=120)),
+        ("/runs", lambda: requests.get(f"{base}/runs", timeout=120)),
+        ("/chart_data", lambda: requests.post(f"{base}/chart_data", json={"run_id": run_id}, timeout=120)),
+    ):
+        started = time.perf_counter()
+        call().raise_for_status()
+        timings[name] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def pct(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def report(label: str, samples: dict) -> None:
+    print(f"\n{label}")
+    for name, values in samples.items():
+        print(f"  {name:<12} n={len(values):<4} p50={pct(values, 50):8.1f} ms  p95={pct(values, 95):8.1f} ms")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base", default="http://127.0.0.1:8000")
+    ap.add_argument("--file", type=Path, help="SPM file to upload (default: synthetic CSV)")
+    ap.add_argument("--rows", type=int, default=30000, help="rows in the synthetic CSV")
+    ap.add_argument("--train", default="", help="train number, to exercise the full corridor analysis")
+    ap.add_argument("--uploads", type=int, default=4)
+    ap.add_argument("--idle-probes", type=int, default=20)
+    args = ap.parse_args()
+
+    path = args.file or synth_csv(args.rows)
+    run_id = upload(args.base, path, args.train)["run_id"]
+
+    idle = {"/": [], "/runs": [], "/chart_data": []}
+    for _ in range(args.idle_probes):
+        for name, ms in probe_once(args.base, run_id).items():
+            idle[name].append(ms)
+    report("idle", idle)
+
+    busy = {"/": [], "/runs": [], "/chart_data": []}
+    upload_ms = []
+    done = threading.Event()
+
+    def one_upload():
+        started = time.perf_counter()
+        upload(args.base, path, args.train)
+        upload_ms.append((time.perf_counter() - started) * 1000)
+
+    uploaders = [threading.Thread(target=one_upload) for _ in range(args.uploads)]
+    started = time.perf_counter()
+    for t in uploaders:
+        t.start()
+    threading.Thread(target=lambda: ([t.join() for t in uploaders], done.set()), daemon=True).start()
+    while not done.is_set():
+        for name, ms in probe_once(args.base, run_id).items():
+            busy[name].append(ms)
+    wall = time.perf_counter() - started
+
+    report(f"during {args.uploads} concurrent uploads ({wall:.1f} s wall)", busy)
+    print(f"\n  uploads      p50={pct(upload_ms, 50):8.1f} ms  max={max(upload_ms):8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
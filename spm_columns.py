@@ -0,0 +1,169 @@
+"""
+Columnar SPM samples, passed between the analysis modules instead of row dicts.
+
+An upload used to turn the polars frame into a list of dicts several times over
+(``spm_data_dicts`` for PSR, ``spm_rows`` for platform entry and the station
+windows, then ``entry_samples_for_calc`` and ``samples_for_brake`` built from
+those), and ``/chart_data`` did it again through ``run_store.get_rows``: about
+100k short-lived dicts per request on a 20k-row file. ``SpmColumns`` holds the
+same data as a handful of arrays.
+
+``psr_mps``, ``platform_entry_speed``, ``brakefeel_detector`` and
+``halt_detection`` accept an ``SpmColumns`` (or a polars frame, via
+``as_columns``). Their row-dict signatures still work; they convert with
+``from_dicts`` and carry on.
+
+Time strings are parsed once, at ingest, by ``with_time_seconds``: the
+``time_s`` column holds integer seconds since midnight of the first sample,
+increasing past midnight. Anything that needs times as numbers reads that
+column instead of calling strptime per sample.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import polars as pl
+
+TIME_SECONDS_COL = "time_s"
+DAY_SECONDS = 86_400
+# A clock that goes back by more than this from one sample to the next has
+# passed midnight; smaller steps back are logger jitter and are left alone.
+MIDNIGHT_ROLLOVER_GAP = 12 * 3600
+# Tried in order; the first that parses a value wins.
+TIME_FORMATS = ("%H:%M:%S", "%H:%M:%S%.f", "%H:%M")
+
+
+def with_time_seconds(df: pl.DataFrame, time_col: str = "Time") -> pl.DataFrame:
+    """
+    ``df`` with a ``time_s`` (Int64) column parsed from ``time_col``: seconds
+    since midnight, plus a day for every midnight crossed. Null where the time
+    is missing or does not parse. Accepts Time strings or polars Time/Datetime
+    columns (what an Excel sheet gives).
+    """
+    if time_col not in df.columns:
+        return df.with_columns(pl.lit(None, dtype=pl.Int64).alias(TIME_SECONDS_COL))
+
+    dtype = df.schema[time_col]
+    if dtype == pl.Time:
+        clock = pl.col(time_col)
+    elif isinstance(dtype, pl.Datetime):
+        clock = pl.col(time_col).dt.time()
+    else:
+        text = pl.col(time_col).cast(pl.Utf8).str.strip_chars()
+        clock = pl.coalesce([text.str.strptime(pl.Time, fmt, strict=False) for fmt in TIME_FORMATS])
+
+    seconds = clock.cast(pl.Int64) // 1_000_000_000  # pl.Time is ns since midnight
+    previous = seconds.forward_fill().shift(1)
+    days = ((seconds - previous) < -MIDNIGHT_ROLLOVER_GAP).fill_null(False).cast(pl.Int64).cum_sum()
+    return df.with_columns((seconds + days * DAY_SECONDS).alias(TIME_SECONDS_COL))
+
+
+def format_time_seconds(seconds: float) -> str:
+    """HH:MM:SS of a ``time_s`` value (the clock time, whatever the day)."""
+    seconds = int(seconds) % DAY_SECONDS
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+@dataclass(frozen=True)
+class SpmColumns:
+    """
+    One run's samples, column by column.
+
+    speed, distance and cumulative_distance are float64 arrays; a missing value
+    is 0.0, as ``row.get(...) or 0`` made it in the dict code. ``time`` keeps
+    the raw Time strings (None where absent). ``psr`` is the PSR list exactly as
+    process_train_speed_limits returned it — original int/float values, None
+    where unknown — because those values are copied verbatim into events, the
+    abnormality text and the DB rows; ``psr_float`` is the same as float64/NaN.
+    ``time_s`` is the frame's ``time_s`` column as float64, NaN where unknown;
+    None when the frame has none (runs stored before it existed).
+    """
+
+    speed: np.ndarray
+    distance: np.ndarray
+    cumulative_distance: np.ndarray
+    time: List[Optional[str]]
+    psr: Optional[List[Any]] = None
+    time_s: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.speed)
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pl.DataFrame,
+        speed_col: str = "Speed",
+        distance_col: str = "Distance",
+        cum_dist_col: str = "cumulative_distance",
+        time_col: str = "Time",
+        psr_col: str = "PSR",
+    ) -> "SpmColumns":
+        """Columns from an analysis frame (the shape run_store stores)."""
+        n = len(df)
+
+        def floats(name: str) -> np.ndarray:
+            if name not in df.columns:
+                return np.zeros(n, dtype=np.float64)
+            return df[name].cast(pl.Float64).fill_null(0.0).to_numpy()
+
+        return cls(
+            speed=floats(speed_col),
+            distance=floats(distance_col),
+            cumulative_distance=floats(cum_dist_col),
+            time=df[time_col].cast(pl.Utf8).to_list() if time_col in df.columns else [None] * n,
+            psr=df[psr_col].to_list() if psr_col in df.columns else None,
+            time_s=(
+                df[TIME_SECONDS_COL].cast(pl.Float64).fill_null(np.nan).to_numpy()
+                if TIME_SECONDS_COL in df.columns else None
+            ),
+        )
+
+    @classmethod
+    def from_dicts(
+        cls,
+        rows: Sequence[Dict[str, Any]],
+        speed_key: str = "speed",
+        distance_key: str = "distance",
+        cum_dist_key: str = "cumulative_distance",
+        time_key: str = "Time",
+        psr_values: Optional[List[Any]] = None,
+    ) -> "SpmColumns":
+        """
+        Columns from row dicts, for the dict-based signatures. The key names
+        differ between callers (chart samples use 'speed'/'timestamp', frame
+        rows 'Speed'/'Time'), so each adapter passes its own.
+        """
+        n = len(rows)
+
+        def floats(key: str) -> np.ndarray:
+            return np.fromiter((float(row.get(key, 0) or 0) for row in rows), dtype=np.float64, count=n)
+
+        return cls(
+            speed=floats(speed_key),
+            distance=floats(distance_key),
+            cumulative_distance=floats(cum_dist_key),
+            time=[row.get(time_key) for row in rows],
+            psr=psr_values,
+        )
+
+    def with_psr(self, psr_values: List[Any]) -> "SpmColumns":
+        return replace(self, psr=psr_values)
+
+    def psr_float(self) -> np.ndarray:
+        """PSR as float64, NaN where unknown (or everywhere if there is no PSR)."""
+        if self.psr is None:
+            return np.full(len(self), np.nan)
+        return np.array(self.psr, dtype=np.float64)  # None becomes NaN
+
+
+def as_columns(data, **from_dicts_keys) -> SpmColumns:
+    """SpmColumns from an SpmColumns, a polars frame, or a list of row dicts."""
+    if isinstance(data, SpmColumns):
+        return data
+    if isinstance(data, pl.DataFrame):
+        return SpmColumns.from_frame(data)
+    return SpmColumns.from_dicts(data, **from_dicts_keys)
@@ -379,43 +379,37 @@ def get_staff_by_hrms(hrms_id: str) -> Optional[Dict[str, Any]]:
         cn.close()
 
 
-def _load_train_corridor_map() -> Dict[str, Dict[str, str]]:
+def _train_corridor_map_from_rows(rows) -> Dict[str, Dict[str, str]]:
     """
-    Load train_corridor_map.csv and return a dict mapping train code to its info.
+    Map train code to its info from train_corridor_map.csv rows.
     Returns: {train_code: {'direction': 'UP'/'DN', 'route': 'HARBOUR'/'SE'/etc, 'type': '0'/'1'/'2', 'to_station': 'TNA'/etc}}
     """
-    import csv
-    from pathlib import Path
-
-    map_path = Path(__file__).parent / "train_corridor_map.csv"
     result = {}
-
-    try:
-        with open(map_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                train_code = row.get('Train', '').strip()
-                if train_code:
-                    result[train_code] = {
-                        'direction': row.get('Direction', '').strip(),
-                        'route': row.get('Route', '').strip(),
-                        'type': row.get('Type', '').strip(),
-                        'to_station': row.get('ToExpected', '').strip(),
-                    }
-    except Exception as e:
-        print(f"[WARNING] Could not load train_corridor_map.csv: {e}")
-
+    for row in rows:
+        train_code = (row.get('Train') or '').strip()
+        if train_code:
+            result[train_code] = {
+                'direction': (row.get('Direction') or '').strip(),
+                'route': (row.get('Route') or '').strip(),
+                'type': (row.get('Type') or '').strip(),
+                'to_station': (row.get('ToExpected') or '').strip(),
+            }
     return result
 
 
-# Cache the train corridor map
+# Cache the train corridor map, per reference data version
 _TRAIN_CORRIDOR_MAP: Optional[Dict[str, Dict[str, str]]] = None
+_TRAIN_CORRIDOR_MAP_VERSION: Optional[str] = None
 
 def get_train_corridor_map() -> Dict[str, Dict[str, str]]:
-    """Get cached train corridor map."""
-    global _TRAIN_CORRIDOR_MAP
-    if _TRAIN_CORRIDOR_MAP is None:
-        _TRAIN_CORRIDOR_MAP = _load_train_corridor_map()
+    """Get cached train corridor map, built from the rows reference_data already read."""
+    global _TRAIN_CORRIDOR_MAP, _TRAIN_CORRIDOR_MAP_VERSION
+    from reference_data import get_reference_data
+
+    reference = get_reference_data()
+    if _TRAIN_CORRIDOR_MAP is None or _TRAIN_CORRIDOR_MAP_VERSION != reference.version:
+        _TRAIN_CORRIDOR_MAP = _train_corridor_map_from_rows(reference.train_corridor_rows)
+        _TRAIN_CORRIDOR_MAP_VERSION = reference.version
     return _TRAIN_CORRIDOR_MAP
 
 
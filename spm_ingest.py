@@ -0,0 +1,267 @@
+"""
+CSV ingest for SPM exports.
+
+``read_spm_file`` used to read a CSV twice — ``n_rows=1`` to guess whether the
+first line was a header, then the whole file with inferred dtypes — and then
+drop non-numeric rows by casting Speed and Distance to strings and running a
+regex over every value before casting back to Float64.
+
+Here the layout is sniffed from the first bytes of the file (separator, header
+or not, which columns are Date/Time/Speed/Distance), and the file is read once
+through a lazy ``scan_csv`` plan: every column as a string (no dtype
+inference), only the four needed columns projected, Speed and Distance cast
+with ``strict=False`` so anything that is not a number becomes null, then
+``drop_nulls`` and a filter. Projection and the filter are pushed into the
+scan.
+
+Speed and Distance stay Float64. Float32 was tried: speeds come back from it
+as 45.29999923706055 in the chart payload, and the cumulative distance sums
+30k of them, so neither column is safe to narrow.
+
+Excel workbooks used to go through ``pd.read_excel`` once per candidate
+header row (0-5) and again with ``header=None``, each call re-parsing the
+whole workbook. ``read_spm_excel`` loads the first sheet once as a grid of
+cells and finds the header row among those rows in memory. With ``fastexcel``
+installed polars reads it through calamine (also for .xls); otherwise pandas
+with openpyxl, as before. Rows are counted the way ``header=N`` counted them,
+blank rows included. ``clean_numeric`` does the CSV's numeric cleaning for it.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+try:
+    import fastexcel  # noqa: F401  (polars' calamine engine)
+    HAVE_CALAMINE = True
+except ImportError:
+    HAVE_CALAMINE = False
+
+SNIFF_BYTES = 64 * 1024
+SEPARATORS = (",", ";", "\t", "|")
+NUMERIC_COLUMNS = ("Speed", "Distance")
+
+# Rows searched for an Excel header (one with a date or speed column).
+EXCEL_HEADER_ROWS = 6
+
+# Column names for files without a header line: DateTime/Speed/Distance, or
+# Date/Time/Speed/Distance when the second field is not a number.
+HEADERLESS_COMBINED = ("Date", "Speed", "Distance")
+HEADERLESS_SPLIT = ("Date", "Time", "Speed", "Distance")
+
+
+@dataclass(frozen=True)
+class CsvLayout:
+    """What ``sniff_csv`` found in the first bytes of a file."""
+
+    separator: str
+    has_header: bool
+    columns: Tuple[str, ...]
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def find_spm_columns(names: Sequence[str]) -> Dict[str, str]:
+    """
+    Map standard names (Date, Time, Speed, Distance) to the matching column
+    in ``names``, case-insensitively. Columns that are not found are left out.
+    """
+    lower = {str(name).lower(): name for name in names}
+    found = {
+        "Date": next((v for k, v in lower.items() if "date" in k), None),
+        "Time": next((v for k, v in lower.items() if "time" in k and "date" not in k), None),
+        "Speed": next((v for k, v in lower.items() if "speed" in k), None),
+        "Distance": next((v for k, v in lower.items() if "distance" in k or "dist" in k), None),
+    }
+    return {std: name for std, name in found.items() if name is not None}
+
+
+def sniff_csv(source: Union[str, Path, bytes]) -> CsvLayout:
+    """
+    Separator, header and column names of an SPM CSV, from its first
+    ``SNIFF_BYTES``. ``source`` is a path or the leading bytes themselves.
+
+    The first line is a header unless its Speed field (the second, or the
+    third when the second is a time) parses as a number. Headerless files get
+    HEADERLESS_COMBINED or HEADERLESS_SPLIT names, extra fields column_N.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        head = bytes(source[:SNIFF_BYTES])
+    else:
+        with open(source, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    text = head.decode("utf-8-sig", errors="replace")
+    first_line = text.splitlines()[0] if text else ""
+
+    separator = max(SEPARATORS, key=first_line.count) if first_line else ","
+    if first_line.count(separator) == 0:
+        separator = ","
+    fields = next(csv.reader(io.StringIO(first_line), delimiter=separator), [])
+    fields = [f.strip() for f in fields]
+
+    if len(fields) >= 3 and _is_number(fields[1]) and _is_number(fields[2]):
+        names: Sequence[str] = HEADERLESS_COMBINED
+    elif len(fields) >= 4 and _is_number(fields[2]) and _is_number(fields[3]):
+        names = HEADERLESS_SPLIT
+    else:
+        return CsvLayout(separator=separator, has_header=True, columns=tuple(fields))
+
+    extra = [f"column_{i + 1}" for i in range(len(names), len(fields))]
+    return CsvLayout(separator=separator, has_header=False, columns=tuple(names) + tuple(extra))
+
+
+def clean_numeric(frame: Union[pl.DataFrame, pl.LazyFrame], columns: Sequence[str] = NUMERIC_COLUMNS):
+    """
+    ``columns`` as Float64, dropping rows where any of them is not a plain
+    non-negative number. ``strict=False`` turns unparseable text into null and
+    ``drop_nulls`` drops those rows; the filter keeps out what the old
+    ``^\\d+\\.?\\d*$`` regex also refused (negatives, nan, inf). Works on a
+    DataFrame or a LazyFrame and returns the same kind.
+    """
+    columns = list(columns)
+    return (
+        frame.with_columns(pl.col(columns).cast(pl.Float64, strict=False))
+        .drop_nulls(columns)
+        .filter(pl.all_horizontal([pl.col(c).is_finite() & (pl.col(c) >= 0) for c in columns]))
+    )
+
+
+def scan_spm_csv(path: Union[str, Path], layout: Optional[CsvLayout] = None) -> pl.LazyFrame:
+    """
+    Lazy plan for an SPM CSV. When Date, Speed and Distance are all found the
+    plan projects them (and Time, if present) under their standard names —
+    Date becomes DateTime when there is no Time column — and cleans Speed and
+    Distance; otherwise it is every column, as strings, untouched, so the
+    caller can report what it did find.
+    """
+    layout = layout or sniff_csv(path)
+    lf = pl.scan_csv(
+        path,
+        separator=layout.separator,
+        has_header=layout.has_header,
+        new_columns=None if layout.has_header else list(layout.columns),
+        infer_schema=False,
+    )
+
+    found = find_spm_columns(lf.collect_schema().names())
+    if not {"Date", "Speed", "Distance"} <= found.keys():
+        return lf
+
+    if "Time" not in found:
+        found = {"DateTime": found["Date"], "Speed": found["Speed"], "Distance": found["Distance"]}
+    lf = lf.select([pl.col(name).alias(std) for std, name in found.items()])
+    return clean_numeric(lf)
+
+
+def read_spm_csv(path: Union[str, Path]) -> pl.DataFrame:
+    """``scan_spm_csv(path)``, collected."""
+    return scan_spm_csv(path).collect()
+
+
+def read_excel_grid(path: Union[str, Path]) -> pd.DataFrame:
+    """
+    The workbook's first sheet as a grid of cells, no header, from a single
+    load: calamine when available, else pandas' default engine. Blank rows
+    are kept, leading ones too: row N of the grid is the row ``header=N`` read.
+    """
+    if HAVE_CALAMINE:
+        grid = pl.read_excel(
+            path, engine="calamine", has_header=False, drop_empty_rows=False,
+            read_options={"skip_rows": 0},
+        ).to_pandas()
+        grid.columns = range(grid.shape[1])
+        return grid.apply(_typed_cells)
+    return pd.read_excel(path, header=None)
+
+
+# How calamine renders numbers and date-times as text.
+_NUMBER = r"^-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?$"
+_DATETIME = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?$"
+# Excel's day zero: calamine's date for a time-only cell.
+_EXCEL_DAY_ZERO = pd.Timestamp("1899-12-31")
+
+
+def _typed_cells(column: pd.Series) -> pd.Series:
+    """
+    One column of calamine's grid with its cells typed the way openpyxl types
+    them. A column mixing a header with values comes back from Arrow as text,
+    so numbers become int/float, date-times Timestamps (time-only cells
+    datetime.time) and blanks NaN. Text that looks like a number is read as
+    one; it is not a header either way.
+    """
+    text = column.astype("string")
+    out = column.astype(object).where(text.notna(), np.nan)
+    numbers = text.str.fullmatch(_NUMBER).fillna(False).astype(bool)
+    if numbers.any():
+        values = text[numbers]
+        integral = ~values.str.contains(r"[.eE]")
+        out[numbers] = [int(v) if whole else float(v) for v, whole in zip(values, integral)]
+    stamps = text.str.fullmatch(_DATETIME).fillna(False).astype(bool)
+    if stamps.any():
+        values = pd.to_datetime(text[stamps], format="ISO8601")
+        time_only = values.dt.normalize() == _EXCEL_DAY_ZERO
+        out[stamps] = [v.time() if t else v for v, t in zip(values, time_only)]
+    return out
+
+
+def _header_names(cells: Sequence) -> list:
+    """Header cells as column names, the way pandas would name them."""
+    names, seen = [], {}
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if pd.isna(cell) else str(cell)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def frame_from_excel_grid(grid: pd.DataFrame) -> pd.DataFrame:
+    """
+    The SPM table in ``grid``: the first of the top EXCEL_HEADER_ROWS rows
+    with a date or speed cell is the header (rows above it are metadata). With
+    no such row the sheet has no header, and the columns are named
+    Date/Speed/Distance, or Date/Time/Speed/Distance when the second cell of
+    the first row is not a number.
+    """
+    for header_row in range(min(EXCEL_HEADER_ROWS, len(grid))):
+        names = _header_names(grid.iloc[header_row].tolist())
+        lower = [n.lower() for n in names]
+        if any('date' in c for c in lower) or any('speed' in c for c in lower):
+            data = grid.iloc[header_row + 1:].reset_index(drop=True).infer_objects()
+            data.columns = names
+            return data
+
+    data = grid.infer_objects()
+    width = len(data.columns)
+    if width >= 4:
+        try:
+            float(data.iloc[0, 1])
+            names = list(HEADERLESS_COMBINED)
+        except (ValueError, TypeError):
+            names = list(HEADERLESS_SPLIT)
+    else:
+        names = list(HEADERLESS_COMBINED[:width])
+    data.columns = names + [f"column_{i + 1}" for i in range(len(names), width)]
+    return data
+
+
+def read_spm_excel(path: Union[str, Path]) -> pl.DataFrame:
+    """An SPM workbook as a polars frame, from one load; see frame_from_excel_grid."""
+    return pl.from_pandas(frame_from_excel_grid(read_excel_grid(path)))
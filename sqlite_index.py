@@ -0,0 +1,122 @@
+"""
+The on-disk index shared by ``run_store`` and ``analysis_cache``.
+
+Each keeps its bulk in files and a small SQLite index beside them, shared by
+every process using the directory so uvicorn can run several workers. The
+database is in WAL mode (readers do not wait for the writer), one connection
+per thread. A write that spans the index and the files holds ``write_lock``:
+the process's thread lock plus an ``fcntl.flock`` on the lock file. Without
+fcntl (Windows) only the thread lock is taken, which is enough for one process.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+    HAVE_FCNTL = True
+except ImportError:
+    HAVE_FCNTL = False
+
+
+class SqliteIndex:
+    """An index database at ``db_path``, its writes serialized on ``lock_path``."""
+
+    def __init__(self, db_path: Path, lock_path: Path, schema: str) -> None:
+        self.db_path = db_path
+        self.lock_path = lock_path
+        self.schema = schema
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        # Bumped by reset so threads reopen the database it deleted.
+        self._epoch = 0
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """This thread's connection, opened (and the schema made) on first use."""
+        key = (os.getpid(), self._epoch)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.key == key:
+            return conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; writes open their own transaction (see transaction).
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.schema)
+        self._local.conn, self._local.key = conn, key
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next ``connect`` reopens it."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @contextmanager
+    def write_lock(self) -> Iterator[None]:
+        """Hold the index for a multi-step write, against threads and other processes."""
+        with self._lock:
+            handle = None
+            if self._lock_depth == 0 and HAVE_FCNTL:
+                self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+                handle = open(self.lock_path, "a+b")
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if handle is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                    handle.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self.connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def reset(self, directory: Path) -> None:
+        """Delete ``directory`` with the index in it and make it again empty. Tests only."""
+        with self._lock:
+            self.close()
+            self._epoch += 1
+            shutil.rmtree(directory, ignore_errors=True)
+            directory.mkdir(parents=True, exist_ok=True)
+
+
+def bump_counter(db: sqlite3.Connection, name: str, amount: int = 1) -> None:
+    """Add ``amount`` to a row of the index's ``counters`` table."""
+    db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+
+def unlink_quietly(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def write_atomic(path: Path, write: Any) -> None:
+    """Write via a temp file + rename so a reader never sees a partial file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        unlink_quietly(tmp)
+        raise
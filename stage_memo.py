@@ -0,0 +1,130 @@
+"""
+Memoized stages for analysis_pipeline.
+
+The analysis is a chain of stages — parse, cumulative distance, raw halts, ISD
+match, PSR, overspeed, platform entry, brake feel test, window points — and a
+change to one input (a different to_station, say) used to rerun all of them.
+Each stage's output is now kept under a key that hashes its inputs, so only
+the stages downstream of the change run again.
+
+Keys are chained rather than computed from the data: a stage's key hashes the
+key of the frame it reads (``stage_key("halts", frame_key)``) plus its own
+parameters, and a frame derived from another (trimmed, PSR added) gets a key
+derived the same way. Only the root frame is hashed — from the file's SHA-256
+for an upload, ``frame_fingerprint`` for a stored frame.
+
+``StageMemo`` is an in-process LRU of ``max_entries`` outputs
+(``SPM_STAGE_CACHE_ENTRIES``, default 64; 0 turns memoizing off). With the
+analysis pool each worker has its own, so a repeat is only a hit when it lands
+on the same worker. Outputs are deep-copied in and out, so a caller mutating
+a result cannot change what the next analysis gets. Hits, misses and seconds
+per stage accumulate in ``stats()``; ``StageTrace`` collects one analysis's
+stages for its log line.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import polars as pl
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("SPM_STAGE_CACHE_ENTRIES", "64"))
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def stage_key(stage: str, *parts: Any) -> str:
+    """A key for ``stage`` over ``parts`` (keys, strings, numbers, lists, dicts)."""
+    blob = json.dumps([stage, parts], sort_keys=True, default=_jsonable)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def frame_fingerprint(df: pl.DataFrame) -> str:
+    """A key for a frame from its schema and row hashes (about 1 ms per 30k rows)."""
+    digest = hashlib.sha1(str(df.schema).encode())
+    digest.update(df.hash_rows(seed=0).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class StageTrace:
+    """The stages one analysis ran: (stage, "hit" | "miss" | "given", ms)."""
+
+    def __init__(self) -> None:
+        self.steps: List[Tuple[str, str, float]] = []
+
+    def add(self, stage: str, outcome: str, ms: float = 0.0) -> None:
+        self.steps.append((stage, outcome, ms))
+
+    def summary(self) -> str:
+        return " | ".join(f"{stage} {outcome} {ms:.1f}ms" for stage, outcome, ms in self.steps)
+
+    __str__ = summary  # so a logger formats it only when the line is emitted
+
+
+class StageMemo:
+    """LRU of stage outputs by key, with per-stage hit/miss/time counters."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def run(
+        self,
+        stage: str,
+        key: str,
+        compute: Callable[[], T],
+        trace: Optional[StageTrace] = None,
+    ) -> T:
+        """``compute()``'s output for ``key``, from the memo when it is there."""
+        started = time.perf_counter()
+        with self._lock:
+            counters = self._stats.setdefault(stage, {"hits": 0, "misses": 0, "seconds": 0.0})
+            found = key in self._entries
+            if found:
+                self._entries.move_to_end(key)
+                value = copy.deepcopy(self._entries[key])
+                counters["hits"] += 1
+        if not found:
+            value = compute()
+            if self.max_entries > 0:
+                stored = copy.deepcopy(value)
+                with self._lock:
+                    self._entries[key] = stored
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            with self._lock:
+                counters["misses"] += 1
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            counters["seconds"] += elapsed
+        if trace is not None:
+            trace.add(stage, "hit" if found else "miss", elapsed * 1000)
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per stage: hits, misses and total seconds (hits included) since start."""
+        with self._lock:
+            return {stage: dict(counters) for stage, counters in self._stats.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
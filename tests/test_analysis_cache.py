@@ -0,0 +1,152 @@
+"""Tests for analysis_cache — the content-addressed /upload analysis cache."""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+# Point the cache at a scratch dir BEFORE importing it (CACHE_DIR is read at import).
+os.environ["SPM_ANALYSIS_CACHE_DIR"] = tempfile.mkdtemp(prefix="spm_cache_test_")
+
+import analysis_cache  # noqa: E402
+
+PARAMS = {"train_number": "95001", "from_station": "CSMT", "to_station": "KYN"}
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    analysis_cache.clear_all()
+    yield
+    analysis_cache.clear_all()
+
+
+def _result(n=50):
+    return {
+        "df": pl.DataFrame({"Speed": [float(i) for i in range(n)], "Distance": [1.0] * n}),
+        "station_window_rows": [("CSMT", 1.5, float("nan"))],
+        "train_type": "slow",
+    }
+
+
+def test_cache_key_covers_params_and_reference_version():
+    key = analysis_cache.cache_key("abc", PARAMS, "v1", ".csv")
+    assert key == analysis_cache.cache_key("abc", dict(PARAMS, from_station=" CSMT "), "v1", ".CSV")
+    assert key != analysis_cache.cache_key("abd", PARAMS, "v1", ".csv")
+    assert key != analysis_cache.cache_key("abc", dict(PARAMS, to_station="TNA"), "v1", ".csv")
+    assert key != analysis_cache.cache_key("abc", PARAMS, "v2", ".csv")
+    assert analysis_cache.cache_key("abc", {"from_station": ""}, "v1") == analysis_cache.cache_key("abc", {}, "v1")
+
+
+def test_put_then_get_round_trips_and_counts():
+    assert analysis_cache.get("k") is None
+    assert analysis_cache.put("k", _result())
+    cached = analysis_cache.get("k")
+    assert cached["df"].equals(_result()["df"])
+    assert cached["train_type"] == "slow"
+    assert cached["station_window_rows"][0][:2] == ("CSMT", 1.5)
+    stats = analysis_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+
+
+def test_lru_eviction_keeps_recently_used(monkeypatch):
+    analysis_cache.put("a", _result())
+    size = analysis_cache.stats()["bytes"]
+    monkeypatch.setattr(analysis_cache, "CACHE_MAX_BYTES", size * 2 + size // 2)
+    analysis_cache.put("b", _result())
+    analysis_cache.get("a")  # a is now more recent than b
+    analysis_cache.put("c", _result())
+    assert analysis_cache.get("b") is None
+    assert analysis_cache.get("a") is not None and analysis_cache.get("c") is not None
+    assert analysis_cache.stats()["evictions"] == 1
+    assert not analysis_cache._parquet_path("b").exists()
+
+
+def test_entry_over_budget_or_disabled_is_not_stored(monkeypatch):
+    monkeypatch.setattr(analysis_cache, "CACHE_MAX_BYTES", 10)
+    assert not analysis_cache.put("big", _result())
+    assert not analysis_cache._result_path("big").exists()
+    monkeypatch.setattr(analysis_cache, "CACHE_MAX_BYTES", 0)
+    assert not analysis_cache.put("off", _result())
+
+
+def _keys_by_use():
+    return [key for (key,) in analysis_cache._db().execute("SELECT key FROM entries ORDER BY used_at")]
+
+
+def test_rehydrate_indexes_entries_from_disk_in_mtime_order():
+    analysis_cache.put("old", _result())
+    analysis_cache.put("new", _result())
+    analysis_cache.put("half", _result())
+    analysis_cache._db().execute("DELETE FROM entries")  # the index is lost; the files are not
+    os.utime(analysis_cache._result_path("old"), (1, 1))
+    analysis_cache._parquet_path("half").rename(analysis_cache.CACHE_DIR / "stray.parquet")
+
+    assert analysis_cache.rehydrate() == 2
+    assert _keys_by_use() == ["old", "new"]
+    assert not analysis_cache._result_path("half").exists()
+    assert not (analysis_cache.CACHE_DIR / "stray.parquet").exists()
+
+
+def test_rehydrate_drops_entries_whose_files_are_gone():
+    analysis_cache.put("k", _result())
+    analysis_cache._result_path("k").unlink()
+    assert analysis_cache.rehydrate() == 0
+    assert analysis_cache.stats()["entries"] == 0
+
+
+def test_index_survives_a_restart_without_rehydrating():
+    analysis_cache.put("k", _result())
+    analysis_cache._INDEX.close()  # as a new process would: reopen the database
+    assert analysis_cache.get("k") is not None
+    assert analysis_cache.stats()["entries"] == 1
+
+
+def test_entry_evicted_during_a_read_is_a_miss():
+    analysis_cache.put("k", _result())
+    analysis_cache._parquet_path("k").unlink()  # another worker's eviction, mid-read
+    assert analysis_cache.get("k") is None
+    assert analysis_cache.stats()["entries"] == 0
+    assert not analysis_cache._result_path("k").exists()
+
+
+def _in_worker(code):
+    """Run ``code`` in a separate interpreter sharing CACHE_DIR, as another uvicorn worker would."""
+    root = Path(__file__).resolve().parents[1]
+    script = (
+        f"import sys; sys.path.insert(0, {str(root)!r}); import analysis_cache, polars as pl; "
+        f"result = lambda: {{'df': pl.DataFrame({{'Speed': [float(i) for i in range(50)]}})}}; {code}"
+    )
+    env = dict(os.environ, SPM_ANALYSIS_CACHE_DIR=str(analysis_cache.CACHE_DIR),
+               SPM_ANALYSIS_CACHE_MB=str(analysis_cache.CACHE_MAX_BYTES / 1024 / 1024))
+    return subprocess.Popen([sys.executable, "-c", script], env=env, cwd=root)
+
+
+def test_entries_are_shared_across_processes():
+    worker = _in_worker("analysis_cache.put('w', result())")
+    assert worker.wait(timeout=60) == 0
+    assert analysis_cache.get("w")["df"]["Speed"].to_list()[:2] == [0.0, 1.0]
+
+    worker = _in_worker("assert analysis_cache.get('w') is not None")
+    assert worker.wait(timeout=60) == 0
+    assert analysis_cache.stats()["hits"] == 2
+
+
+def test_concurrent_writers_share_one_budget(monkeypatch):
+    analysis_cache.put("probe", {"df": pl.DataFrame({"Speed": [float(i) for i in range(50)]})})
+    size = analysis_cache.stats()["bytes"]
+    monkeypatch.setattr(analysis_cache, "CACHE_MAX_BYTES", size * 5 + size // 2)  # room for five
+    workers = [
+        _in_worker(f"[analysis_cache.put(f'{name}{{i}}', result()) for i in range(10)]")
+        for name in ("a", "b")
+    ]
+    assert [worker.wait(timeout=120) for worker in workers] == [0, 0]
+
+    stats = analysis_cache.stats()
+    assert stats["entries"] == 5 and stats["bytes"] <= analysis_cache.CACHE_MAX_BYTES
+    assert stats["evictions"] == 21 - 5
+    on_disk = {path.name.split(".")[0] for path in analysis_cache.CACHE_DIR.glob("*.result.pkl")}
+    assert on_disk == set(_keys_by_use())
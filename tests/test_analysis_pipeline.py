@@ -0,0 +1,152 @@
+"""Tests for analysis_pipeline — the /upload analysis that runs in a worker process."""
+
+import gzip
+import json
+import pickle
+from pathlib import Path
+
+import pytest
+
+import analysis_pipeline as ap
+from corridor_loader import CorridorData, CorridorRecord
+
+
+FIXTURE = Path(__file__).parent / "fixtures" / "report_fixture_large.json.gz"
+
+CSV = (
+    "Date,Time,Speed,Distance\n"
+    "2025-01-10,23:59:58,0,0\n"
+    "2025-01-10,23:59:59,12,3\n"
+    "2025-01-11,00:00:00,25,7\n"
+    "2025-01-11,00:00:01,0,4\n"
+)
+
+
+@pytest.fixture
+def spm_csv(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(CSV)
+    return path
+
+
+def test_read_spm_file_cleans_and_accumulates(spm_csv):
+    df = ap.read_spm_file(spm_csv)
+    assert df.columns == ["Date", "Time", "Speed", "Distance", "time_s", "cumulative_distance"]
+    # Distance is forced to 0 where Speed is 0
+    assert df["Distance"].to_list() == [0.0, 3.0, 7.0, 0.0]
+    assert df["cumulative_distance"].to_list() == [0.0, 3.0, 10.0, 10.0]
+    # Parsed once at ingest, counting on past midnight
+    assert df["time_s"].to_list() == [86398, 86399, 86400, 86401]
+
+
+def test_read_spm_file_splits_a_combined_datetime_column(tmp_path):
+    path = tmp_path / "combined.csv"
+    path.write_text(
+        "30/11/2025 23:59:59,10,2\n"
+        "01/12/2025 00:00:00,12,3\n"
+        "01/12/2025 00:00:02,0,0\n"
+    )
+    df = ap.read_spm_file(path)
+    assert df["Date"].to_list() == ["2025-11-30", "2025-12-01", "2025-12-01"]
+    assert df["Time"].to_list() == ["23:59:59", "00:00:00", "00:00:02"]
+    assert df["time_s"].to_list() == [86399, 86400, 86402]
+
+
+def test_read_spm_file_without_required_columns_is_an_input_error(tmp_path):
+    path = tmp_path / "bad.csv"
+    path.write_text("Foo,Bar\nx,y\n")
+    with pytest.raises(ap.AnalysisInputError, match="Could not find required columns"):
+        ap.read_spm_file(path)
+
+
+def test_analyse_upload_without_train_number(spm_csv):
+    result = ap.analyse_upload(str(spm_csv), {"train_number": None})
+    assert len(result["df"]) == 4
+    assert result["train_type"] is None
+    assert result["psr_calculated"] is False
+    assert result["overspeed_summary"] == ap.EMPTY_OVERSPEED_SUMMARY
+    # Midnight crossing
+    assert (result["start_time"], result["end_time"], result["duration"]) == ("23:59:58", "00:00:01", "00:00:03")
+    assert result["abnormality_text"] == "NO BRAKE FEEL TEST DONE"
+    assert result["station_window_rows"] == [] and result["window_point_rows"] == []
+
+
+def test_analyse_upload_result_pickles(spm_csv):
+    """It crosses a process boundary, so everything in it must pickle."""
+    result = ap.analyse_upload(str(spm_csv), {})
+    back = pickle.loads(pickle.dumps(result))
+    assert back["df"].equals(result["df"])
+
+
+@pytest.fixture
+def fixture_run(tmp_path, monkeypatch):
+    """The large fixture's samples as a CSV, with a corridor registered for its train."""
+    # The tree ships no corridor files; register one for the fixture's train.
+    corridor = CorridorData(
+        name="DNFULLNE_FAST",
+        stations=["CSMT", "BY", "DR", "TNA", "KYN", "KSRA"],
+        records=[CorridorRecord("1", [0, 5.0, 4.0, 24.0, 20.0, 67.0], [0, 5.0, 9.0, 33.0, 53.0, 120.0])],
+    )
+    monkeypatch.setitem(ap.get_context().corridor_manager.corridors, corridor.name, corridor)
+    samples = json.loads(gzip.decompress(FIXTURE.read_bytes()))["payload"]["samples"]
+    path = tmp_path / "run.csv"
+    path.write_text("Date,Time,Speed,Distance\n" + "".join(
+        f"2025-12-17,{s['timestamp']},{s['speed']},{s['distance']}\n" for s in samples
+    ))
+    return path
+
+
+def test_analyse_upload_keeps_source_frame_and_raw_halts(fixture_run, monkeypatch):
+    path = fixture_run
+    result = ap.analyse_upload(str(path), {"train_number": "A 59", "from_station": "CSMT", "to_station": "TNA"})
+    assert result["source_df"].equals(ap.read_spm_file(path))
+    assert result["raw_halts"]
+
+    params = {"train_number": "A 59", "from_station": "CSMT", "to_station": "KSRA"}
+    fresh = ap.reanalyse_frame(result["source_df"], params)
+    detector = ap.get_context().halt_detector
+    monkeypatch.setattr(detector, "detect_halts", None)  # must not be called with halts given
+    again = ap.reanalyse_frame(result["source_df"], params, result["raw_halts"])
+    assert again["df"].equals(fresh["df"])
+    volatile = ("df", "stage_timings")
+    assert {k: v for k, v in again.items() if k not in volatile} == {k: v for k, v in fresh.items() if k not in volatile}
+
+
+def test_changing_to_station_reuses_upstream_stages(fixture_run, monkeypatch):
+    monkeypatch.setattr(ap, "STAGES", ap.StageMemo())
+    params = {"train_number": "A 59", "from_station": "CSMT", "to_station": "TNA"}
+    first = ap.analyse_upload(str(fixture_run), params)
+    first_df = first["df"].clone()
+    first["halting_stations"].clear()  # callers mutating a result must not reach the memo
+
+    changed = ap.analyse_upload(str(fixture_run), dict(params, to_station="KSRA"))
+    stats = ap.STAGES.stats()
+    for stage in ("parse", "cumulative_distance", "halts"):
+        assert stats[stage] == dict(stats[stage], hits=1, misses=1)
+    assert stats["overspeed"]["hits"] == 0
+    assert changed["frame_key"] == first["frame_key"]
+
+    again = ap.analyse_upload(str(fixture_run), params)
+    assert again["df"].equals(first_df)
+    assert again["halting_stations"]
+    assert all(counters["hits"] >= 1 for counters in ap.STAGES.stats().values())
+
+
+def test_executor_disabled_with_zero_workers():
+    assert ap.create_executor(0) is None
+
+
+def test_analyse_upload_in_a_worker_process(spm_csv):
+    executor = ap.create_executor(1)
+    try:
+        result = executor.submit(ap.analyse_upload, str(spm_csv), {}).result(timeout=120)
+    finally:
+        executor.shutdown()
+    assert result["df"]["cumulative_distance"].to_list() == [0.0, 3.0, 10.0, 10.0]
+
+
+def test_abnormality_text_summarises_many_stations():
+    entry = {f"S{i}": {"entry_speed": 50} for i in range(6)}
+    text = ap.generate_abnormality_text([], entry, [{"start_index": 0}])
+    assert text == "PF ENTRY SPEED MORE THAN 45 KMPH AT MANY STN"
+    assert ap.generate_abnormality_text([], {}, [{"start_index": 0}]) == "NO ABNORMALITY"
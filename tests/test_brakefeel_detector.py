@@ -1,4 +1,9 @@
-from brakefeel_detector import BrakeFeelDetector
+import gzip
+import json
+import random
+from pathlib import Path
+
+from brakefeel_detector import BrakeFeelDetector, BrakeFeelTest
 
 
 def build_sequence():
@@ -46,3 +51,272 @@ def test_brakefeel_no_detection_without_braking():
     ]
 
     assert detector.detect_from_samples(samples) == []
+
+
+def _detect_scalar(detector, speeds, times, distances, cumulative):
+    """
+    BrakeFeelDetector's original sample-by-sample scan, the reference for
+    ``detect``: it must return exactly what this returns.
+    """
+    if not speeds:
+        return []
+
+    end_idx = _find_analysis_end_index_scalar(detector, speeds, distances, cumulative)
+    sliced_speeds = list(map(float, speeds[:end_idx]))
+    sliced_times = list(times[:end_idx])
+    times_sec = detector._convert_times_to_seconds(sliced_times)
+    cleaned = detector._clean_speed_data(sliced_speeds, times_sec)
+
+    if not cleaned["speeds"]:
+        return []
+
+    tests = []
+    speeds_clean = cleaned["speeds"]
+    times_clean = cleaned["times"]
+    original_idx = cleaned["indices"]
+
+    # Scan for BFT pattern: find where speed drops significantly within a short window
+    # BFT characteristics:
+    # 1. Speed is in valid range (15-40 kmph) before braking
+    # 2. Rapid drop of >= 5 kmph within ~15 seconds
+    # 3. Recovery after the drop
+
+    i = 0
+    bft_window_passed = False  # Track if we've passed the BFT window (speed exceeded 40)
+
+    while i < len(speeds_clean) - 20:
+        current_speed = speeds_clean[i]
+
+        # Skip if speed not in valid range (below 15)
+        if current_speed < detector.min_speed_for_test:
+            i += 1
+            continue
+
+        # If speed exceeds max (40 kmph), BFT window has passed
+        # Once speed crosses 40, BFT should have been done - stop searching entirely
+        if current_speed > detector.max_speed_for_test:
+            if not bft_window_passed:
+                bft_window_passed = True
+                # BFT not done before 40 kmph - no valid BFT in this run
+                break
+            i += 1
+            continue
+
+        # Look ahead for a rapid speed drop pattern
+        # Follow the rising trend until speed actually starts dropping (find true peak)
+        peak_speed = current_speed
+        peak_index = i
+        exceeded_max = False
+        found_peak = False
+
+        # Follow speed until it stops rising (no artificial limit - follow until drop detected)
+        drop_start_index = i
+        for j in range(i, len(speeds_clean) - 15):  # Need 15 samples after for braking check
+            if speeds_clean[j] > detector.max_speed_for_test:
+                # Speed exceeded max limit - BFT should have happened before this
+                exceeded_max = True
+                break
+            if speeds_clean[j] > peak_speed:
+                peak_speed = speeds_clean[j]
+                peak_index = j
+            elif speeds_clean[j] < peak_speed - 2:
+                # Speed dropped by more than 2 kmph from peak, we found the peak
+                found_peak = True
+                drop_start_index = j  # Remember where the drop started
+                break
+
+        # Skip if speed exceeded max (BFT didn't happen in time)
+        if exceeded_max:
+            i += 1
+            continue
+
+        # Skip if no clear peak found (still rising at end of data)
+        if not found_peak:
+            i += 1
+            continue
+
+        # Now follow the drop from where it started until speed recovers
+        # Start from drop_start_index (where we detected the drop), not peak_index
+        lowest_speed = speeds_clean[drop_start_index]
+        lowest_index = drop_start_index
+        max_braking_window = 30  # Safety limit
+
+        for j in range(drop_start_index, min(drop_start_index + max_braking_window, len(speeds_clean))):
+            if speeds_clean[j] < lowest_speed:
+                lowest_speed = speeds_clean[j]
+                lowest_index = j
+            elif speeds_clean[j] > lowest_speed + 2:
+                # Speed started recovering (increased by more than 2 kmph), stop tracking
+                break
+
+        speed_drop = peak_speed - lowest_speed
+
+        # Check if this is a valid BFT drop
+        if speed_drop < detector.min_speed_drop:
+            i += 1
+            continue
+
+        # Verify it's a real braking event (not just noise)
+        # Check that drop happened continuously, not scattered
+        drop_duration = lowest_index - peak_index
+        if drop_duration < 3:  # Too fast, might be noise
+            i += 1
+            continue
+
+        # Look for recovery after braking OR train came to halt
+        recovery = detector._find_recovery_phase(speeds_clean, lowest_index, lowest_speed)
+
+        # Check if train came to halt (speed = 0) after braking
+        came_to_halt = False
+        halt_index = lowest_index
+        if not recovery:
+            # Look for halt within a few samples after lowest point
+            for j in range(lowest_index, min(lowest_index + 10, len(speeds_clean))):
+                if speeds_clean[j] == 0:
+                    came_to_halt = True
+                    halt_index = j
+                    break
+
+        # Valid BFT if either recovery or halt
+        if not recovery and not came_to_halt:
+            i = lowest_index + 1
+            continue
+
+        # Find the start of this BFT sequence
+        start_index = peak_index
+        for j in range(peak_index - 1, max(-1, peak_index - 30), -1):
+            if speeds_clean[j] < speeds_clean[start_index]:
+                start_index = j
+            if speeds_clean[j] <= 0:
+                break
+
+        start_idx = original_idx[start_index]
+
+        # End index and recovery speed depend on whether recovery or halt
+        if recovery:
+            end_idx_final = original_idx[recovery.end_index]
+            recovery_speed = recovery.end_speed
+            duration = times_clean[recovery.end_index] - times_clean[start_index]
+        else:
+            # Came to halt
+            end_idx_final = original_idx[halt_index]
+            recovery_speed = 0.0
+            duration = times_clean[halt_index] - times_clean[start_index]
+
+        tests.append(
+            BrakeFeelTest(
+                start_index=start_idx,
+                end_index=end_idx_final,
+                max_speed_index=original_idx[peak_index],
+                braking_start_index=original_idx[peak_index],
+                lowest_speed_index=original_idx[lowest_index],
+                recovery_index=end_idx_final,
+                start_speed=speeds_clean[start_index],
+                max_speed=peak_speed,
+                braking_start_speed=peak_speed,
+                lowest_speed=lowest_speed,
+                recovery_speed=recovery_speed,
+                speed_drop=speed_drop,
+                duration=duration,
+            )
+        )
+
+        # Only detect first BFT
+        break
+
+    return tests
+
+def _find_analysis_end_index_scalar(detector, speeds, distances, cumulative):
+    min_distance = 0.7
+    use_meters = max(cumulative or [0]) > 100
+    threshold = 700.0 if use_meters else min_distance
+    last_cum = None
+
+    padding = max(10, detector.braking_noise_tolerance + int(detector.stabilization_period) + 5)
+    total_len = len(speeds)
+
+    for idx, (speed, distance, cum) in enumerate(zip(speeds, distances, cumulative)):
+        speed = float(speed or 0)
+        distance = float(distance or 0)
+        cum = float(cum or 0)
+        if speed == 0 and distance == 0:
+            if (use_meters and cum >= threshold) or (not use_meters and cum >= threshold):
+                if last_cum is None or abs(cum - last_cum) > (200 if use_meters else 0.2):
+                    return min(total_len, idx + 1 + padding)
+                last_cum = cum
+    return total_len
+
+
+def _detect_both(detector, speeds, timestamps=None, distances=None, cumulative=None):
+    n = len(speeds)
+    timestamps = timestamps or [f"10:{idx // 60 % 60:02d}:{idx % 60:02d}" for idx in range(n)]
+    distances = distances or [0.0 if speed == 0 else 0.01 for speed in speeds]
+    cumulative = cumulative or [round(0.01 * idx, 2) for idx in range(n)]
+    args = (speeds, timestamps, distances, cumulative)
+    return _detect_scalar(detector, *args), detector.detect(*args)
+
+
+def _random_run(rng, n):
+    speed, speeds = 0.0, []
+    capped = rng.random() < 0.3
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.05:
+            speed -= rng.uniform(3, 8)
+        elif r < 0.5:
+            speed += rng.uniform(0, 2.5)
+        elif r < 0.8:
+            speed -= rng.uniform(0, 2.5)
+        speed = max(0.0, min(speed, 38.0) if capped else speed)
+        if rng.random() < 0.02:
+            speed = 0.0
+        speeds.append(round(speed, 1))
+    return speeds
+
+
+def test_vectorized_detect_matches_scalar_on_test_cases():
+    detector = BrakeFeelDetector()
+    for speeds in (build_sequence(), list(range(0, 50, 2)), [], [20.0] * 10):
+        scalar, vectorized = _detect_both(detector, [float(s) for s in speeds])
+        assert vectorized == scalar
+
+
+def test_vectorized_detect_matches_scalar_on_random_runs():
+    detector = BrakeFeelDetector()
+    rng = random.Random(7)
+    found = 0
+    for _ in range(500):
+        speeds = _random_run(rng, rng.randint(0, 400))
+        scalar, vectorized = _detect_both(detector, speeds)
+        assert vectorized == scalar
+        found += bool(scalar)
+    assert found > 50
+
+
+def test_vectorized_detect_matches_scalar_on_report_fixtures():
+    detector = BrakeFeelDetector()
+    fixtures = sorted((Path(__file__).parent / "fixtures").glob("report_fixture_*.json.gz"))
+    assert fixtures
+    for path in fixtures:
+        samples = json.loads(gzip.decompress(path.read_bytes()))["payload"]["samples"]
+        speeds = [float(s.get("speed") or 0) for s in samples]
+        times = [s.get("timestamp") for s in samples]
+        distances = [float(s.get("distance") or 0) for s in samples]
+        cumulative = [float(s.get("cumulative_distance") or 0) for s in samples]
+        scalar, vectorized = _detect_both(detector, speeds, times, distances, cumulative)
+        assert vectorized == scalar
+        assert scalar
+
+
+def test_vectorized_detect_drops_nan_speeds_like_scalar():
+    detector = BrakeFeelDetector()
+    rng = random.Random(11)
+    found = 0
+    for _ in range(200):
+        speeds = _random_run(rng, rng.randint(50, 400))
+        for idx in rng.sample(range(len(speeds)), 5):
+            speeds[idx] = float("nan")
+        scalar, vectorized = _detect_both(detector, speeds)
+        assert vectorized == scalar
+        found += bool(scalar)
+    assert found > 20
@@ -0,0 +1,142 @@
+"""Tests for chart_payload — the stored, gzipped /chart_data payload."""
+
+import os
+import tempfile
+
+import polars as pl
+import pytest
+
+os.environ.setdefault("SPM_RUNS_DIR", tempfile.mkdtemp(prefix="spm_runs_test_"))
+
+import chart_payload  # noqa: E402
+import run_store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    run_store.clear_all()
+    yield
+    run_store.clear_all()
+
+
+def _frame(n=60):
+    speeds = [float(min(i, 30)) for i in range(n)]
+    return pl.DataFrame({
+        "Date": ["2025-11-30"] * n,
+        "Time": [f"10:{i // 60:02d}:{i % 60:02d}" for i in range(n)],
+        "Speed": speeds,
+        "Distance": [s / 3.6 for s in speeds],
+        "cumulative_distance": [float(i * 5) for i in range(n)],
+        "PSR": [45 if i % 7 else None for i in range(n)],
+    })
+
+
+def _meta(**over):
+    meta = {
+        "run_id": "RUN_1",
+        "staff_id": "H123",
+        "train_number": "95101",
+        "train_type": "slow",
+        "halting_stations": {},
+        "ordered_stations": [],
+        "overspeed_events": [{"event_number": 1, "max_speed": 88.0}],
+    }
+    meta.update(over)
+    return meta
+
+
+def _store():
+    df, meta = _frame(), _meta()
+    run_store.put_run("RUN_1", df, meta)
+    return chart_payload.store_chart_payload("RUN_1", meta, df)
+
+
+def test_stored_payload_is_what_build_chart_payload_returns():
+    stored = _store()
+    assert stored is not None
+    expected = chart_payload.build_chart_payload(run_store.load_run_frame("RUN_1"))
+    assert chart_payload.decode_payload(stored) == expected
+
+    data, etag = chart_payload.get_chart_payload("RUN_1")
+    assert data == stored
+    assert etag == chart_payload.payload_etag(stored)
+
+
+def test_update_meta_invalidates_and_rebuilds():
+    stored = _store()
+    run_store.update_meta("RUN_1", staff_id="H999")
+    data, etag = chart_payload.get_chart_payload("RUN_1")
+    assert etag != chart_payload.payload_etag(stored)
+    assert chart_payload.decode_payload(data)["metadata"]["staff_id"] == "H999"
+
+
+def test_payload_built_from_old_meta_is_not_stored():
+    df, meta = _frame(), _meta()
+    run_store.put_run("RUN_1", df, meta)
+    generation = run_store.meta_generation("RUN_1")
+    run_store.update_meta("RUN_1", staff_id="H999")
+    assert chart_payload.store_chart_payload("RUN_1", meta, df, generation) is None
+    assert run_store.get_chart_payload("RUN_1", chart_payload._tag("rows")) is None
+
+
+def test_expired_run_raises_key_error():
+    with pytest.raises(KeyError):
+        chart_payload.get_chart_payload("NOPE")
+
+
+def test_drop_run_removes_the_payload():
+    _store()
+    run_store.drop_run("RUN_1")
+    assert list(run_store.RUNS_DIR.glob("RUN_1.*")) == []
+
+
+def test_encoding_is_deterministic_and_nan_safe():
+    payload = {"samples": [{"psr": float("nan"), "speed": 1.5}], "n": 1}
+    assert chart_payload.encode_payload(payload) == chart_payload.encode_payload(payload)
+    assert chart_payload.decode_payload(chart_payload.encode_payload(payload))["samples"][0]["psr"] is None
+
+
+def test_upload_stores_only_rows_and_other_formats_are_cached_on_first_read(monkeypatch):
+    _store()
+    assert run_store.get_chart_payload("RUN_1", chart_payload._tag("columnar")) is None
+    assert run_store.get_chart_payload("RUN_1", chart_payload._tag("arrow")) is None
+
+    data, etag = chart_payload.get_chart_payload("RUN_1", "columnar")
+    assert run_store.get_chart_payload("RUN_1", chart_payload._tag("columnar")) == data
+    # Derived from the stored rows payload, never rebuilt from the frame
+    monkeypatch.setattr(chart_payload, "build_chart_payload", lambda run_data: pytest.fail("rebuilt"))
+    assert chart_payload.get_chart_payload("RUN_1", "columnar") == (data, etag)
+
+
+def test_columnar_format_matches_rows():
+    _store()
+    rows = chart_payload.decode_payload(chart_payload.get_chart_payload("RUN_1")[0])
+    columnar = chart_payload.decode_payload(chart_payload.get_chart_payload("RUN_1", "columnar")[0])
+
+    assert columnar["format"] == "columnar"
+    assert columnar["overspeed_events"] == rows["overspeed_events"]
+    series = columnar["series"]
+    for key in ("timestamp", "distance", "cumulative_distance", "speed"):
+        assert series[key] == [s[key] for s in rows["samples"]]
+    assert series["psr"] == [s.get("psr") for s in rows["samples"]]
+
+
+def test_arrow_format_is_the_stored_frame():
+    pa = pytest.importorskip("pyarrow")
+    import json
+
+    _store()
+    data, etag = chart_payload.get_chart_payload("RUN_1", "arrow")
+    table = pa.ipc.open_stream(data).read_all()
+
+    assert pl.from_arrow(table).equals(run_store.load_run_frame("RUN_1")["frame"])
+    rest = json.loads(table.schema.metadata[b"spm.chart_payload"])
+    assert rest["overspeed_events"] == [{"event_number": 1, "max_speed": 88.0}]
+    assert etag != chart_payload.get_chart_payload("RUN_1")[1]
+    assert run_store.get_chart_payload("RUN_1", chart_payload._tag("arrow")) == data
+
+
+def test_unknown_format_is_rejected():
+    _store()
+    with pytest.raises(ValueError):
+        chart_payload.get_chart_payload("RUN_1", "csv")
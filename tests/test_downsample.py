@@ -0,0 +1,93 @@
+"""Tests for downsample — LTTB with must-keep feature indices."""
+
+import numpy as np
+import polars as pl
+
+from downsample import downsample_indices, feature_indices, lttb_indices, series_window
+
+
+def _run(n=5000):
+    """A stored run as series_window reads it: the run_store frame and meta."""
+    speed = [float(abs((i % 400) - 200) // 3) for i in range(n)]
+    for i in range(1100, 1140):
+        speed[i] = 0.0                                   # a halt
+    speed[2500] = 99.0                                   # a one-sample spike
+    frame = pl.DataFrame({
+        "Time": [f"10:{i // 60 % 60:02d}:{i % 60:02d}" for i in range(n)],
+        "Speed": speed,
+        "Distance": [10.0] * n,
+        "cumulative_distance": [float(i * 10) for i in range(n)],   # metres
+        "PSR": [60 if i < 3000 else 45 for i in range(n)],
+    })
+    meta = {
+        "run_id": "RUN_1",
+        "brake_tests": [{"start_index": 120, "max_speed": 50.0}],
+        "overspeed_events": [{"start_index": 2490, "end_index": 2510}],
+        "halting_stations": {"A": 11200.0},
+        "violations": [{"index": 4321}],
+    }
+    return frame, meta
+
+
+def _features(frame, meta):
+    return feature_indices(frame["Speed"].to_list(), frame["PSR"].to_list(),
+                           brake_tests=meta["brake_tests"],
+                           overspeed_events=meta["overspeed_events"],
+                           station_markers=[{"sample_index": 1120}],
+                           violations=meta["violations"])
+
+
+def test_lttb_keeps_both_ends_and_the_budget():
+    y = np.sin(np.linspace(0, 20, 10_000))
+    picks = lttb_indices(y, 500)
+    assert len(picks) == 500
+    assert picks[0] == 0 and picks[-1] == 9_999
+    assert np.all(np.diff(picks) > 0)
+
+
+def test_short_series_is_returned_whole():
+    assert downsample_indices([1.0, 2.0, 3.0], 10).tolist() == [0, 1, 2]
+
+
+def test_features_survive_downsampling():
+    frame, meta = _run()
+    speed = frame["Speed"].to_list()
+    keep = _features(frame, meta)
+    for index in (120, 2490, 2500, 2510, 1100, 1139, 1120, 4321, 2999, 3000):
+        assert index in keep
+
+    picks = downsample_indices(speed, 300, keep)
+    assert len(picks) <= 300
+    assert set(keep.tolist()) <= set(picks.tolist())
+
+
+def test_series_window_selects_by_km_and_keeps_peaks():
+    result = series_window(*_run(), from_km=20, to_km=30, max_points=100)
+    series = result["series"]
+    assert result["total_points"] == 1001
+    assert result["returned_points"] == len(series["index"]) <= 100
+    assert min(series["cumulative_km"]) >= 20 and max(series["cumulative_km"]) <= 30
+    assert series["index"][0] == 2000 and series["index"][-1] == 3000
+    assert 99.0 in series["speed"]
+    assert series["psr"][-1] == 45.0
+
+
+def test_series_window_outside_the_run_is_empty():
+    result = series_window(*_run(), from_km=500, to_km=600)
+    assert result["total_points"] == 0 and result["series"]["index"] == []
+
+
+def test_series_window_keeps_the_meta_features_inside_the_window():
+    frame, meta = _run()
+    result = series_window(frame, meta, from_km=10, to_km=45, max_points=60)
+    picked = set(result["series"]["index"])
+    assert {1100, 1120, 1139, 2490, 2500, 2510, 4321} <= picked
+    assert 120 not in picked                              # before the window
+    assert result["series"]["timestamp"][0] == "10:16:40"
+
+
+def test_series_window_open_ends_cover_the_run():
+    frame, meta = _run()
+    result = series_window(frame.head(50), meta)
+    assert result["total_points"] == result["returned_points"] == 50
+    assert result["series"]["cumulative_km"][-1] == 0.49
@@ -0,0 +1,82 @@
+"""Tests for log_config — queued JSON logging with the run_id on every line."""
+
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import log_config
+
+
+@pytest.fixture
+def captured():
+    """A StringIO for setup_logging to write to; the root logger is restored afterwards."""
+    out = io.StringIO()
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    yield out
+    log_config.stop_logging()
+    root.handlers[:], level = saved
+    root.setLevel(level)
+
+
+def _lines(out):
+    log_config.stop_logging()  # flushes the queue
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_json_lines_carry_the_bound_run_id(captured):
+    log_config.setup_logging(level="DEBUG", fmt="json", stream=captured)
+    logger = logging.getLogger("analysis_pipeline")
+    log_config.bind_run_id("RUN_1")
+    try:
+        logger.debug("Matched %s/%s halts", 8, 9)
+    finally:
+        log_config.bind_run_id(None)
+    logger.info("no run")
+    first, second = _lines(captured)
+    assert (first["level"], first["logger"], first["run_id"], first["msg"]) == (
+        "DEBUG", "analysis_pipeline", "RUN_1", "Matched 8/9 halts",
+    )
+    assert second["run_id"] is None
+
+
+def test_debug_arguments_are_not_formatted_when_disabled(captured):
+    log_config.setup_logging(level="INFO", fmt="json", stream=captured)
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted a disabled debug line")
+
+    logging.getLogger("psr_mps").debug("segments: %s", Expensive())
+    assert _lines(captured) == []
+
+
+def test_exceptions_are_rendered_once(captured):
+    log_config.setup_logging(level="INFO", fmt="json", stream=captured)
+    try:
+        raise ValueError("bad segment")
+    except ValueError:
+        logging.getLogger("main").exception("Could not calculate PSR/MPS")
+    (line,) = _lines(captured)
+    assert line["msg"] == "Could not calculate PSR/MPS"
+    assert line["exc"].startswith("Traceback") and "ValueError: bad segment" in line["exc"]
+
+
+def test_writes_happen_on_the_listener_thread(captured, monkeypatch):
+    log_config.setup_logging(level="INFO", fmt="text", stream=captured)
+    handler = log_config._LISTENER.handlers[0]
+    threads = []
+    monkeypatch.setattr(handler, "emit", lambda record: threads.append(threading.current_thread()))
+    log_config.bind_run_id("RUN_2")
+    logging.getLogger("main").info("stored")
+    log_config.bind_run_id(None)
+    log_config.stop_logging()
+    assert threads and threads[0] is not threading.current_thread()
+
+
+def test_run_with_run_id_binds_for_the_call_only():
+    assert log_config.run_with_run_id("RUN_3", log_config.RUN_ID.get) == "RUN_3"
+    assert log_config.RUN_ID.get() is None
@@ -0,0 +1,85 @@
+"""Tests for metrics — counters, gauges, histograms and the text exposition."""
+
+import math
+
+import pytest
+
+import metrics
+import timing
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry, so instruments made in a test do not leak into others."""
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    monkeypatch.setattr(metrics, "_COLLECTORS", [])
+
+
+def test_counter_and_gauge_lines(registry):
+    requests = metrics.Counter("spm_test_total", "Things counted.", ("result",))
+    requests.inc(result="hit")
+    requests.inc(2, result="hit")
+    requests.inc(result="miss")
+    depth = metrics.Gauge("spm_test_depth", "Things waiting.")
+    depth.inc()
+    depth.inc()
+    depth.dec()
+
+    assert metrics.render().splitlines() == [
+        "# HELP spm_test_total Things counted.",
+        "# TYPE spm_test_total counter",
+        'spm_test_total{result="hit"} 3',
+        'spm_test_total{result="miss"} 1',
+        "# HELP spm_test_depth Things waiting.",
+        "# TYPE spm_test_depth gauge",
+        "spm_test_depth 1",
+    ]
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = metrics.Histogram("spm_test_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    assert latency.buckets == (0.1, 1.0, math.inf)
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(seconds, route="/runs/{run_id}")
+
+    lines = latency.lines()
+    assert lines[2:] == [
+        'spm_test_seconds_bucket{route="/runs/{run_id}",le="0.1"} 2',
+        'spm_test_seconds_bucket{route="/runs/{run_id}",le="1"} 3',
+        'spm_test_seconds_bucket{route="/runs/{run_id}",le="+Inf"} 4',
+        'spm_test_seconds_sum{route="/runs/{run_id}"} 3.65',
+        'spm_test_seconds_count{route="/runs/{run_id}"} 4',
+    ]
+    assert latency.count(route="/runs/{run_id}") == 4
+
+
+def test_label_values_are_escaped(registry):
+    counter = metrics.Counter("spm_test_total", "Escapes.", ("name",))
+    counter.inc(name='a"b\\c\nd')
+    assert metrics.render().splitlines()[-1] == 'spm_test_total{name="a\\"b\\\\c\\nd"} 1'
+
+
+def test_collectors_are_read_at_scrape_time_and_may_fail(registry):
+    size = {"bytes": 10}
+    metrics.register_collector(
+        lambda: metrics.sample_lines("spm_test_bytes", "gauge", "Bytes.", [({}, size["bytes"])])
+    )
+    metrics.register_collector(lambda: 1 / 0)
+
+    assert "spm_test_bytes 10" in metrics.render()
+    size["bytes"] = 2048
+    assert "spm_test_bytes 2048" in metrics.render()
+
+
+def test_timing_spans_feed_the_stage_histogram():
+    before = metrics.STAGE_SECONDS.count(stage="test.stage")
+    with timing.span("test.stage"):
+        pass
+    timing.record("test.stage", 0.25)
+    assert metrics.STAGE_SECONDS.count(stage="test.stage") == before + 2
+    assert 'spm_stage_duration_seconds_bucket{stage="test.stage",le="0.25"}' in metrics.render()
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("spm_test_total", "Abstract.")
@@ -1,8 +1,9 @@
 from pathlib import Path
 
+import numpy as np
 import pytest
 
-from platform_entry_speed import PlatformEntryCalculator
+from platform_entry_speed import DistanceIndex, PlatformEntryCalculator
 
 REFERENCE_DIR = Path(__file__).parent / "reference_data"
 
@@ -61,3 +62,41 @@ def test_entry_speed_handles_kilometer_scale():
         12.5 - 0.268, rel=1e-3
     )
     assert vsh_data["section"] == "VSH-SNPD"
+
+
+def test_distance_index_tie_breaking():
+    # Unsorted, with repeated distances: (distance, speed)
+    samples = [(5.0, 50.0), (3.0, 30.0), (5.0, 51.0), (9.0, 90.0), (9.0, 91.0), (1.0, 10.0)]
+    index = DistanceIndex(np.array([d for d, _ in samples]), np.array([s for _, s in samples]))
+
+    assert index.lookup(4.0) == (50.0, 5.0)    # first at/after, earlier of the two 5.0s
+    assert index.lookup(5.0) == (50.0, 5.0)
+    assert index.lookup(0.0) == (10.0, 1.0)
+    assert index.lookup(12.0) == (90.0, 9.0)   # past the end: nearest, earlier of the 9.0s
+    assert index.lookup_many([4.0, 12.0, 3.0]) == ([50.0, 90.0, 30.0], [5.0, 9.0, 3.0])
+
+
+def _brute_force_lookup(target, distances, speeds):
+    """find_speed_at_distance's pick by a pass over the samples in upload order."""
+    at_or_after = [i for i, d in enumerate(distances) if d >= target]
+    if at_or_after:
+        # Smallest distance at or after the target; the earlier sample on a tie
+        pick = min(at_or_after, key=lambda i: (distances[i], i))
+    else:
+        # Past the last sample: the nearest one, the earlier sample on a tie
+        pick = min(range(len(distances)), key=lambda i: (target - distances[i], i))
+    return speeds[pick], distances[pick]
+
+
+@pytest.mark.parametrize("seed", [3, 11, 29])
+def test_batch_lookup_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    # Unsorted, few distinct values: plenty of duplicate distances
+    distances = rng.integers(0, 60, size=400).astype(float).tolist()
+    speeds = rng.uniform(0, 90, size=400).tolist()
+    index = DistanceIndex(np.array(distances), np.array(speeds))
+
+    targets = rng.uniform(-5, 65, size=300).tolist() + [0.0, 30.0, 59.0, 60.0]
+    batch_speeds, batch_distances = index.lookup_many(targets)
+    for target, speed, distance in zip(targets, batch_speeds, batch_distances):
+        assert _brute_force_lookup(target, distances, speeds) == (speed, distance)
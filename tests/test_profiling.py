@@ -0,0 +1,82 @@
+"""Tests for profiling — opt-in per-request cProfile dumps."""
+
+import pstats
+
+import pytest
+
+import log_config
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def _profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_ALL", False)
+    monkeypatch.setattr(profiling, "ENABLED", True)
+
+
+def _work(n):
+    return sum(i * i for i in range(n))
+
+
+def test_only_requests_with_the_token_are_armed():
+    with profiling.armed({}) as profile:
+        assert profile is None and not profiling.active()
+    with profiling.armed({profiling.HEADER: "wrong"}) as profile:
+        assert profile is None
+    with profiling.armed({profiling.HEADER: "s3cret"}) as profile:
+        assert profile is not None and profiling.active()
+    assert not profiling.active()
+
+
+def test_profile_all_arms_every_request(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+    monkeypatch.setattr(profiling, "PROFILE_ALL", True)
+    with profiling.armed({}) as profile:
+        assert profile is not None
+    assert profiling.authorized({})
+
+
+def test_call_is_plain_outside_a_profiled_request():
+    assert profiling.call(_work, 10) == 285
+
+
+def test_profiled_calls_are_written_for_profiled_routes():
+    with profiling.armed({profiling.HEADER: "s3cret"}) as profile:
+        log_config.bind_run_id("RUN_1")
+        try:
+            assert profiling.call(_work, 1000) == _work(1000)
+        finally:
+            log_config.bind_run_id(None)
+    assert profiling.finish(profile, "/runs") is None
+
+    name = profiling.finish(profile, "/upload")
+    assert name.endswith(".prof") and "-upload-RUN_1-" in name
+    stats = pstats.Stats(str(profiling.profile_path(name)))
+    assert any(func[2] == "_work" for func in stats.stats)
+    assert [entry["name"] for entry in profiling.list_profiles()] == [name]
+
+
+def test_request_without_profiled_work_writes_nothing():
+    with profiling.armed({profiling.HEADER: "s3cret"}) as profile:
+        pass
+    assert profiling.finish(profile, "/upload") is None
+    assert profiling.list_profiles() == []
+
+
+def test_directory_keeps_the_newest_files(monkeypatch):
+    monkeypatch.setattr(profiling, "MAX_FILES", 2)
+    names = []
+    for _ in range(3):
+        with profiling.armed({profiling.HEADER: "s3cret"}) as profile:
+            profiling.call(_work, 10)
+        names.append(profiling.finish(profile, "/chart_data"))
+    kept = {entry["name"] for entry in profiling.list_profiles()}
+    assert len(kept) == 2 and names[-1] in kept
+
+
+def test_profile_path_rejects_foreign_names(tmp_path):
+    assert profiling.profile_path("../secret.prof") is None
+    assert profiling.profile_path("missing.prof") is None
+    assert profiling.profile_path("notes.txt") is None
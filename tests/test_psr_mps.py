@@ -173,3 +173,449 @@ print("1. Integrate with halt detection logic")
 print("2. Add PSR column to analysis results in main.py")
 print("3. Update ECharts config to show green PSR/MPS area")
 print("4. Test with real SPM data from sample files")
+
+
+# --- Vectorised engine vs the per-sample implementation ----------------------
+
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from station_km_maps import get_station_km_map_for_train_type
+
+FIXTURES = Path(__file__).parent / "fixtures"
+REFERENCE_DIR = Path(__file__).parent.parent / "reference_data"
+
+
+def _fixture(name):
+    path = FIXTURES / f"report_fixture_{name}.json.gz"
+    if not path.exists():
+        pytest.skip(f"{path.name} not present")
+    return json.loads(gzip.decompress(path.read_bytes()))
+
+
+def _scalar_speed_limits(
+    calc, spm_data, ordered_stations, station_km_map, halting_station_map, train_type,
+    start_distance=None, end_distance=None, semi_fast_info=None,
+):
+    """
+    The original per-sample PSR: a linear station scan (normalize_position) and
+    a linear segment-name scan (get_speed_limit) for every row. The oracle the
+    vectorised process_train_speed_limits is checked against.
+    """
+    if not spm_data:
+        return []
+    segment_limits = calc.load_segment_limits(train_type)
+    fallback_limits = None
+    if semi_fast_info and train_type == "fast":
+        fallback_limits = calc.load_segment_limits("slow")
+    if start_distance is None:
+        start_distance = spm_data[0].get("cumulative_distance", 0)
+    if end_distance is None:
+        end_distance = spm_data[-1].get("cumulative_distance", 0)
+    stations = calc.calculate_directional_distances(
+        ordered_stations, station_km_map, halting_station_map, start_distance, end_distance
+    )
+
+    psr_values = []
+    for row in spm_data:
+        position = calc.normalize_position(row.get("cumulative_distance", 0), stations)
+        limit = None
+        if position:
+            limit = calc.get_speed_limit(position, segment_limits)
+            if limit is None and fallback_limits:
+                limit = calc.get_speed_limit(position, fallback_limits)
+        psr_values.append(limit)
+    return psr_values
+
+
+def _both(calc, rows, *args, **kwargs):
+    scalar = _scalar_speed_limits(calc, rows, *args, **kwargs)
+    vector = calc.process_train_speed_limits(rows, *args, **kwargs)
+    return scalar, vector
+
+
+@pytest.mark.parametrize("name", ["small", "large"])
+@pytest.mark.parametrize("semi_fast", [None, {"change_point": "TNA"}])
+def test_vectorised_psr_matches_scalar_on_fixtures(name, semi_fast):
+    data = _fixture(name)
+    meta = data["meta"]
+    rows = [{"cumulative_distance": s["cumulative_distance"]} for s in data["payload"]["samples"]]
+    calc = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+
+    for train_type in ("fast", "slow"):
+        scalar, vector = _both(
+            calc, rows, meta["ordered_stations"],
+            get_station_km_map_for_train_type(train_type),
+            meta["halting_stations"], train_type, semi_fast_info=semi_fast,
+        )
+        assert vector == scalar
+        # Same Python types too: ints stay ints, gaps stay None
+        assert [type(v) for v in vector] == [type(v) for v in scalar]
+
+
+def test_vectorised_psr_matches_scalar_on_every_segment_and_boundary():
+    """Every fast/slow segment, probed at all its breakpoints and in between."""
+    calc = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+    for train_type in ("fast", "slow", "thb"):
+        for seg in calc.load_segment_limits(train_type):
+            a, b = seg["segment"].split("-", 1)
+            edges = sorted({r["startPct"] for r in seg["limits"]} | {r["endPct"] for r in seg["limits"]})
+            pcts = sorted(set(edges) | {(x + y) / 2 for x, y in zip(edges, edges[1:])} | {1.0})
+            rows = [{"cumulative_distance": p * 1000.0} for p in pcts]
+            scalar, vector = _both(calc, rows, [a, b], {a: 0, b: 1000}, {a: 0.0, b: 1000.0}, train_type)
+            assert vector == scalar, seg["segment"]
+
+
+def test_vectorised_psr_with_out_of_order_and_tied_stations():
+    calc = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+    stations = ["CSMT", "BY", "DR", "CLA", "GC"]
+    km = {"CSMT": 0, "BY": 4000, "DR": 9000, "CLA": 15000, "GC": 19000}
+    rng = np.random.default_rng(7)
+    rows = [{"cumulative_distance": float(x)} for x in rng.uniform(-500, 21000, 3000)]
+    rows += [{"cumulative_distance": x} for x in (0.0, 4100.0, 9000.0, 19000.0, float("nan"))]
+    for halts in (
+        {"CSMT": 0.0, "BY": 4100.0, "GC": 19000.0},
+        {"CSMT": 0.0, "BY": 9500.0, "DR": 9000.0, "GC": 19000.0},   # out of order
+        {"CSMT": 0.0, "BY": 9000.0, "DR": 9000.0, "GC": 19000.0},   # zero-length segment
+    ):
+        scalar, vector = _both(calc, rows, stations, km, halts, "fast")
+        assert vector == scalar
+
+
+# --- SpeedLimitTable ---------------------------------------------------------
+
+from psr_mps import SegmentLimitsError, SpeedLimitTable, load_speed_limit_tables
+
+
+def test_speed_limit_table_matches_get_speed_limit():
+    calc = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+    for train_type in ("fast", "slow", "thb"):
+        segments = calc.load_segment_limits(train_type)
+        table = calc.speed_limit_table(train_type)
+        for seg in segments:
+            for p in (0.0, 0.05, 0.31, 0.32, 0.42, 0.5, 0.61, 0.815, 0.99, 1.0, 1.5):
+                expected = calc.get_speed_limit({"segment": seg["segment"], "percentage": p}, segments)
+                assert table.limit_at(seg["segment"], p) == expected, (seg["segment"], p)
+    assert table.limit_at("NOPE-NADA", 0.5) is None
+
+
+def test_speed_limit_table_is_shared_between_calculators():
+    a = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+    b = PSRMPSCalculator(reference_data_dir=str(REFERENCE_DIR))
+    assert a.speed_limit_table("fast") is b.speed_limit_table("fast")
+    assert load_speed_limit_tables(REFERENCE_DIR)["slow"] is a.speed_limit_table("slow")
+
+
+def test_speed_limit_table_reports_overlaps_and_short_ranges():
+    table = SpeedLimitTable([
+        {"segment": "A-B", "limits": [
+            {"startPct": 0, "endPct": 0.6, "limit": 80},
+            {"startPct": 0.5, "endPct": 0.9, "limit": 60},
+        ]},
+        {"segment": "A-B", "limits": [{"startPct": 0, "endPct": 1, "limit": 10}]},
+    ])
+    assert table.limit_at("A-B", 0.55) == 80      # first listed wins
+    assert table.limit_at("A-B", 0.95) == 60      # past the last range's end
+    assert table.limit_at("A-B", 1.0) == 60
+    assert len(table) == 1
+    assert any("overlap" in i for i in table.issues)
+    assert any("not 1.0" in i for i in table.issues)
+    assert any("duplicate" in i for i in table.issues)
+
+
+@pytest.mark.parametrize("limits, message", [
+    ([{"startPct": 0, "endPct": 0.4, "limit": 80}, {"startPct": 0.5, "endPct": 1, "limit": 60}],
+     "no limit for 0.4 <= p < 0.5"),
+    ([{"startPct": 0.1, "endPct": 1, "limit": 80}], "no limit for 0 <= p < 0.1"),
+    ([{"startPct": 0.5, "endPct": 0.5, "limit": 80}], "empty or negative"),
+    ([{"startPct": 0, "limit": 80}], "malformed range"),
+    ([], "no limit ranges"),
+])
+def test_speed_limit_table_rejects_uncovered_percentages(limits, message):
+    with pytest.raises(SegmentLimitsError, match=message):
+        SpeedLimitTable([{"segment": "A-B", "limits": limits}], source="bad.json")
+
+
+def test_speed_limit_table_lookup_is_vectorised():
+    table = SpeedLimitTable([{"segment": "A-B", "limits": [
+        {"startPct": 0, "endPct": 0.5, "limit": 30},
+        {"startPct": 0.5, "endPct": 1, "limit": 70.5},
+    ]}])
+    out = table.lookup(table.segment_id("A-B"), np.array([0.0, 0.49, 0.5, 1.0, np.nan]))
+    assert out.tolist() == [30, 30, 70.5, 70.5, None]
+
+
+# --- Overspeed events: run-based detector -----------------------------------
+
+from typing import Dict, List
+
+from psr_mps import detect_overspeed_events, overspeed_event_ranges
+
+
+def _legacy_overspeed_events(
+    spm_data: List[Dict],
+    psr_values: List[int],
+    threshold_offset: int = 3,
+    min_duration: int = 7
+) -> List[Dict]:
+    """
+    Detect overspeed events by grouping consecutive violations.
+
+    Ported from GAS overspeed.js - detectOverspeedingEvents(): the per-sample
+    loop detect_overspeed_events replaced. On the report fixtures its events
+    are the gap-closing detector's, value for value.
+
+    Key features:
+    - Groups consecutive overspeed samples into single events
+    - Uses threshold = PSR/MPS + offset (default 3 km/h tolerance)
+    - Requires minimum consecutive samples to count as event
+    - Handles momentary drops (brief compliance within 3 samples)
+
+    Args:
+        spm_data: SPM data with 'speed', 'cumulative_distance', 'Time' fields
+        psr_values: Calculated PSR/MPS values for each data point
+        threshold_offset: Tolerance above PSR/MPS (default 3 km/h)
+        min_duration: Minimum consecutive samples for an event (default 7)
+
+    Returns:
+        List of overspeed event dictionaries with:
+        - event_number: Sequential event number
+        - start_time, end_time: Time range of violation
+        - start_km, end_km: Distance range of violation
+        - duration: Number of samples in event
+        - max_speed: Peak speed reached
+        - max_excess: Maximum amount over limit
+        - psr_value: The speed limit that was exceeded
+        - threshold: Actual threshold used (PSR + offset)
+        - severity: minor/moderate/severe/critical
+    """
+    if not spm_data or not psr_values:
+        return []
+
+    overspeed_events = []
+    current_event = None
+
+    def create_new_event(row, psr, threshold, index):
+        """Start tracking a new overspeed event."""
+        return {
+            'start_index': index,
+            'start_time': row.get('Time', ''),
+            'start_km': row.get('cumulative_distance', 0),
+            'overspeed_values': [row.get('speed', 0)],
+            'psr_value': psr,
+            'threshold': threshold,
+            'times': [row.get('Time', '')],
+            'kms': [row.get('cumulative_distance', 0)]
+        }
+
+    def extend_event(event, row):
+        """Add a sample to the current event."""
+        event['overspeed_values'].append(row.get('speed', 0))
+        event['times'].append(row.get('Time', ''))
+        event['kms'].append(row.get('cumulative_distance', 0))
+
+    def check_for_momentary_drop(data, psr_values, current_index, threshold_offset):
+        """Check if overspeed resumes within next 3 samples."""
+        check_rows = min(3, len(data) - current_index - 1)
+        for j in range(1, check_rows + 1):
+            next_psr = psr_values[current_index + j] if current_index + j < len(psr_values) else None
+            if next_psr is None:
+                continue
+            next_threshold = next_psr + threshold_offset
+            next_speed = data[current_index + j].get('speed', 0)
+            if next_speed > next_threshold:
+                return True
+        return False
+
+    def finalize_event(event, end_row, event_number):
+        """Calculate final stats for a completed event."""
+        max_speed = max(event['overspeed_values'])
+        excess_speeds = [s - event['psr_value'] for s in event['overspeed_values']]
+        max_excess = max(excess_speeds)
+
+        # Determine severity based on max excess
+        if max_excess < 5:
+            severity = 'minor'
+        elif max_excess < 10:
+            severity = 'moderate'
+        elif max_excess < 20:
+            severity = 'severe'
+        else:
+            severity = 'critical'
+
+        # Convert km if in meters
+        start_km = event['start_km']
+        end_km = end_row.get('cumulative_distance', 0)
+        if start_km > 200:  # Assume meters
+            start_km = start_km / 1000
+            end_km = end_km / 1000
+
+        return {
+            'event_number': event_number,
+            'start_time': event['start_time'],
+            'end_time': end_row.get('Time', ''),
+            'start_km': round(start_km, 2),
+            'end_km': round(end_km, 2),
+            'duration': len(event['overspeed_values']),
+            'max_speed': round(max_speed, 1),
+            'max_excess': round(max_excess, 1),
+            'psr_value': event['psr_value'],
+            'threshold': event['threshold'],
+            'severity': severity,
+            'start_index': event['start_index'],
+            'end_index': event['start_index'] + len(event['overspeed_values']) - 1
+        }
+
+    # Main detection loop
+    i = 0
+    while i < len(spm_data):
+        row = spm_data[i]
+        speed = row.get('speed', 0)
+        psr = psr_values[i] if i < len(psr_values) else None
+
+        if psr is None:
+            i += 1
+            continue
+
+        threshold = psr + threshold_offset
+
+        if speed > threshold:
+            if current_event is None:
+                # Start new event
+                current_event = create_new_event(row, psr, threshold, i)
+            else:
+                # Extend current event
+                extend_event(current_event, row)
+        else:
+            # Speed is within limits
+            if current_event is not None:
+                # Check if event meets minimum duration
+                if len(current_event['overspeed_values']) >= min_duration:
+                    # Check for momentary drop
+                    if not check_for_momentary_drop(spm_data, psr_values, i, threshold_offset):
+                        # Finalize event
+                        event = finalize_event(current_event, row, len(overspeed_events) + 1)
+                        overspeed_events.append(event)
+                    else:
+                        # Extend through momentary drop
+                        for j in range(1, 4):
+                            if i + j < len(spm_data):
+                                extend_event(current_event, spm_data[i + j])
+                        i += 2  # Skip checked rows
+                # Reset current event
+                current_event = None
+        i += 1
+
+    # Handle event at end of data
+    if current_event is not None and len(current_event['overspeed_values']) >= min_duration:
+        event = finalize_event(current_event, spm_data[-1], len(overspeed_events) + 1)
+        overspeed_events.append(event)
+
+    return overspeed_events
+
+
+def _gap_closing_ranges(over, compliant, min_duration, max_gap=3):
+    """Brute-force overspeed_event_ranges: walk the samples that have a PSR, one at a time."""
+    rows = [i for i in range(len(over)) if over[i] or compliant[i]]
+    events, current = [], None  # current: [first, last] positions in rows
+
+    def close():
+        first, last = current
+        if last - first + 1 >= min_duration:
+            end_row = rows[last + 1] if last + 1 < len(rows) else len(over) - 1
+            events.append((rows[first], rows[last], end_row, last - first + 1))
+
+    for pos, i in enumerate(rows):
+        if not over[i]:
+            continue
+        if current is not None and pos - current[1] - 1 <= max_gap:
+            current[1] = pos
+        else:
+            if current is not None:
+                close()
+            current = [pos, pos]
+    if current is not None:
+        close()
+    return events
+
+
+@pytest.mark.parametrize("name", ["small", "large"])
+@pytest.mark.parametrize("offset", [0, 3, 5, 10])
+@pytest.mark.parametrize("min_duration", [1, 3, 7])
+def test_overspeed_events_match_the_legacy_port_on_fixtures(name, offset, min_duration):
+    samples = _fixture(name)["payload"]["samples"]
+    rows = [dict(s, Time=s["timestamp"]) for s in samples]
+    psr = [s["psr"] for s in samples]
+    expected = _legacy_overspeed_events(rows, psr, offset, min_duration)
+    assert detect_overspeed_events(rows, psr, offset, min_duration) == expected
+
+
+def test_overspeed_ranges_match_brute_force_on_random_masks():
+    """Short noisy runs hit every branch: gaps in PSR, drops of 1-5 samples, runs at the edges."""
+    rng = np.random.default_rng(20240611)
+    for _ in range(3000):
+        n = int(rng.integers(0, 60))
+        state = rng.choice([0, 1, 2], size=n, p=[0.35, 0.5, 0.15])  # compliant, over, no PSR
+        over, compliant = state == 1, state == 0
+        min_duration = int(rng.integers(1, 8))
+        max_gap = int(rng.integers(0, 5))
+        expected = _gap_closing_ranges(over, compliant, min_duration, max_gap)
+        assert overspeed_event_ranges(over, compliant, min_duration, max_gap) == expected
+
+
+def test_overspeed_momentary_drop_closes_the_gap():
+    over = np.array([1, 1, 1, 0, 1, 1, 1, 1, 0, 0, 0, 0], dtype=bool)
+    compliant = ~over
+    # One dip of a sample is closed: a single event of 8 samples, ending at index 7
+    assert overspeed_event_ranges(over, compliant, min_duration=3) == [(0, 7, 8, 8)]
+    # A gap of 4 compliant samples ends the event
+    over = np.array([1, 1, 1, 0, 0, 0, 0, 1, 1, 1, 0], dtype=bool)
+    assert overspeed_event_ranges(over, ~over, min_duration=3) == [(0, 2, 3, 3), (7, 9, 10, 3)]
+    # Closed gaps count towards min_duration
+    assert overspeed_event_ranges(np.array([1, 0, 0, 1], dtype=bool), np.array([0, 1, 1, 0], dtype=bool), 4) == [
+        (0, 3, 3, 4)
+    ]
+    # Samples with no PSR neither extend nor break an event
+    over = np.array([1, 1, 0, 1, 0, 0, 0], dtype=bool)
+    compliant = np.array([0, 0, 0, 0, 1, 1, 1], dtype=bool)
+    assert overspeed_event_ranges(over, compliant, min_duration=3) == [(0, 3, 4, 3)]
+
+
+def test_overspeed_event_spans_the_drop():
+    speed = [80.0] * 8 + [50.0] + [81.0, 85.0] * 2 + [50.0] * 5
+    rows = [{"speed": v, "cumulative_distance": i * 100.0, "Time": f"10:00:{i:02d}"} for i, v in enumerate(speed)]
+    events = detect_overspeed_events(rows, [70] * len(rows), 3, 7)
+    assert len(events) == 1
+    event = events[0]
+    assert (event["start_index"], event["end_index"], event["duration"]) == (0, 12, 13)
+    assert (event["end_time"], event["max_speed"], event["max_excess"]) == ("10:00:13", 85.0, 15.0)
+
+
+def test_overspeed_events_accept_a_psr_array():
+    rows = [{"speed": 90.0, "cumulative_distance": i * 100.0, "Time": ""} for i in range(10)]
+    psr = np.full(10, 70.0)
+    assert len(detect_overspeed_events(rows, psr, 3, 7)) == 1
+    assert detect_overspeed_events(rows, np.array([]), 3, 7) == []
+
+
+def test_overspeed_multi_matches_single_offset_calls():
+    from psr_mps import detect_overspeed_events_arrays, detect_overspeed_events_multi
+
+    samples = _fixture("large")["payload"]["samples"]
+    speed = np.array([s["speed"] for s in samples])
+    # Push a stretch over the limit so every offset has something to find
+    speed[2000:2040] += 12
+    psr = [s["psr"] for s in samples]
+    cum = np.array([s["cumulative_distance"] for s in samples])
+    times = [s["timestamp"] for s in samples]
+
+    offsets = [0, 3, 5, 10, 3]
+    multi = detect_overspeed_events_multi(speed, psr, cum, times, offsets, min_duration=5)
+    assert list(multi) == [0, 3, 5, 10]
+    for offset, events in multi.items():
+        assert events == detect_overspeed_events_arrays(speed, psr, cum, times, offset, 5)
+    assert len(multi[0]) >= len(multi[10]) > 0
@@ -0,0 +1,65 @@
+"""Tests for reference_data — the registry loaded once at startup."""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from platform_entry_speed import PlatformEntryCalculator
+from psr_mps import PSRMPSCalculator
+from reference_data import load_reference_data
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    shutil.copytree(ROOT / "reference_data", tmp_path / "reference_data")
+    (tmp_path / "train_corridor_map.csv").write_text(
+        "Train,TrainCode,FromExpected,ToExpected,Direction,Route,Type\n"
+        "95001,K1,csmt,kyn,up,main,2\n"
+    )
+    return tmp_path
+
+
+def test_version_is_stable_and_tracks_file_contents(data_root):
+    first = load_reference_data(data_root)
+    assert load_reference_data(data_root).version == first.version
+
+    sheds = data_root / "reference_data" / "sheds.json"
+    sheds.write_text(sheds.read_text().rstrip() + "\n\n")
+    assert load_reference_data(data_root).version != first.version
+
+
+def test_mappings_are_read_only(data_root):
+    reference = load_reference_data(data_root)
+    with pytest.raises(TypeError):
+        reference.sheds["X"] = {}
+    section = next(iter(reference.isd_for("slow").values()))
+    with pytest.raises(TypeError):
+        section["platform_length_km"] = 0.0
+    with pytest.raises(TypeError):
+        reference.station_km_map("fast")["CSMT"] = 0.0
+
+
+def test_isd_matches_the_file_loader(data_root):
+    reference = load_reference_data(data_root)
+    from_files = PlatformEntryCalculator(reference_data_dir=str(data_root / "reference_data"))
+    for train_type in ("fast", "slow", "thb"):
+        assert dict(reference.isd_for(train_type)) == from_files.load_isd_data(train_type)
+
+
+def test_injected_calculators_do_not_read_files(data_root):
+    reference = load_reference_data(data_root)
+    missing = str(data_root / "nowhere")
+    entry = PlatformEntryCalculator(reference_data_dir=missing, reference_data=reference)
+    psr = PSRMPSCalculator(reference_data_dir=missing, reference_data=reference)
+    assert entry.load_isd_data("fast") is reference.isd_for("fast")
+    assert psr.speed_limit_table("thb") is reference.segment_tables["thb"]
+
+
+def test_train_corridor_map_is_shared(data_root):
+    reference = load_reference_data(data_root)
+    assert reference.train_corridor_rows[0]["Train"] == "95001"
+    entry = reference.corridor_manager.lookup_train("K1")
+    assert (entry["from_station"], entry["to_station"], entry["type"]) == ("CSMT", "KYN", 2)
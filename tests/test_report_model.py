@@ -3,6 +3,7 @@
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 import report_model as rm
@@ -200,6 +201,39 @@ def test_station_line_falls_back_to_sample_speed():
     assert line[1] == {"station": "KYN", "distance": 500.0, "speed": 38.0}
 
 
+# --- nearest_sample_indices / samples_between --------------------------------
+
+def _run_distances(seed, n=3000):
+    """Monotonic cumulative distance with halts (repeated values)."""
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(n) < 0.2, 0.0, rng.integers(0, 30, n).astype(float))
+    return np.round(np.cumsum(steps), 2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nearest_sample_matches_argmin(seed):
+    cum = _run_distances(seed)
+    targets = np.random.default_rng(seed + 100).uniform(-50, cum[-1] + 50, 60)
+    targets = np.append(targets, cum[[0, 17, -1]])
+    targets = np.append(targets, (cum[40] + cum[41]) / 2)     # exact tie
+    expected = [int(np.argmin(np.abs(cum - t))) for t in targets]
+    assert rm.nearest_sample_indices(cum, targets) == expected
+
+
+def test_nearest_sample_scans_a_column_that_goes_backwards():
+    cum = [0.0, 10.0, 5.0, 20.0]
+    assert rm.nearest_sample_indices(cum, [6.0, 19.0]) == [2, 3]
+    assert rm.nearest_sample_indices([], [1.0]) == [0]
+
+
+def test_samples_between_matches_a_filter():
+    cum = _run_distances(7).tolist()
+    lows, highs = [0.0, 100.0, 5000.0, 60.0], [50.0, 100.0, 9e9, 10.0]
+    got = rm.samples_between(cum, lows, highs)
+    for lo, hi, rows in zip(lows, highs, got):
+        assert rows.tolist() == [i for i, c in enumerate(cum) if lo <= c <= hi]
+
+
 # --- build_report_model ------------------------------------------------------
 
 def _minimal(meta_over=None, payload_over=None):
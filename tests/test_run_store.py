@@ -1,6 +1,8 @@
 """Tests for run_store — the Parquet-on-disk replacement for runs_storage."""
 
 import os
+import subprocess
+import sys
 import tempfile
 import time
 from pathlib import Path
@@ -21,6 +23,10 @@ def _clean():
     run_store.clear_all()
 
 
+def _lose_index():
+    run_store._db().execute("DELETE FROM runs")
+
+
 def _frame(n=5):
     return pl.DataFrame({
         "Date": ["2025-11-30"] * n,
@@ -101,6 +107,16 @@ def test_drop_run_deletes_both_files():
     assert list(Path(run_store.RUNS_DIR).glob("RUN_1.*")) == []
 
 
+def test_source_frame_round_trips_and_is_dropped_with_the_run():
+    run_store.put_run("R1", _frame(), {"run_id": "R1"}, source_df=_frame(8))
+    assert run_store.get_source_frame("R1").equals(_frame(8))
+    run_store.put_run("R2", _frame(), {"run_id": "R2"})
+    with pytest.raises(KeyError):
+        run_store.get_source_frame("R2")
+    run_store.drop_run("R1")
+    assert not (run_store.RUNS_DIR / "R1.source.parquet").exists()
+
+
 def test_drop_run_is_safe_when_absent():
     run_store.drop_run("NEVER_EXISTED")  # must not raise
 
@@ -131,10 +147,27 @@ def test_ttl_expiry_removes_run(monkeypatch):
     assert list(Path(run_store.RUNS_DIR).glob("RUN_1.*")) == []
 
 
+def test_stats_count_runs_bytes_and_drops(monkeypatch):
+    monkeypatch.setattr(run_store, "MAX_RUNS", 2)
+    for i in range(3):
+        run_store.put_run(f"RUN_{i}", _frame(), _meta(run_id=f"RUN_{i}"))
+        time.sleep(0.01)
+
+    stats = run_store.stats()
+    on_disk = sum(p.stat().st_size for p in Path(run_store.RUNS_DIR).glob("RUN_*"))
+    assert (stats["runs"], stats["max_runs"], stats["bytes"]) == (2, 2, on_disk)
+    assert (stats["evicted"], stats["expired"]) == (1, 0)
+
+    monkeypatch.setattr(run_store, "RUN_TTL_SECONDS", -1)
+    run_store.purge_expired()
+    stats = run_store.stats()
+    assert (stats["runs"], stats["bytes"], stats["expired"]) == (0, 0, 2)
+
+
 def test_rehydrate_recovers_runs_after_index_loss():
-    """Simulates a process restart: files remain, RAM index does not."""
+    """Simulates losing the index database: files remain, index entries do not."""
     run_store.put_run("RUN_1", _frame(), _meta())
-    run_store._INDEX.clear()
+    _lose_index()
 
     assert run_store.get_index("RUN_1") is None
     recovered = run_store.rehydrate()
@@ -146,7 +179,7 @@ def test_rehydrate_recovers_runs_after_index_loss():
 
 def test_rehydrate_discards_corrupt_sidecar():
     run_store.put_run("RUN_1", _frame(), _meta())
-    run_store._INDEX.clear()
+    _lose_index()
     (Path(run_store.RUNS_DIR) / "RUN_1.meta.pkl").write_bytes(b"not a pickle")
 
     assert run_store.rehydrate() == 0
@@ -155,7 +188,7 @@ def test_rehydrate_discards_corrupt_sidecar():
 
 def test_parquet_without_sidecar_is_ignored():
     run_store.put_run("RUN_1", _frame(), _meta())
-    run_store._INDEX.clear()
+    _lose_index()
     (Path(run_store.RUNS_DIR) / "RUN_1.meta.pkl").unlink()
 
     assert run_store.rehydrate() == 0
@@ -168,3 +201,57 @@ def test_optional_psr_column_round_trips():
     rows = run_store.load_run("RUN_1")["data"]
     assert rows[0]["PSR"] == 50
     assert rows[4]["PSR"] == 60
+
+
+def test_index_survives_a_restart_without_rehydrating():
+    run_store.put_run("RUN_1", _frame(), _meta())
+    run_store.update_meta("RUN_1", confirmed=True)
+    run_store._INDEX.close()  # as a new process would: reopen the database
+
+    entry = run_store.get_index("RUN_1")
+    assert entry["confirmed"] is True and entry["generation"] == 1
+
+
+def test_index_drops_entries_whose_files_are_gone():
+    run_store.put_run("RUN_1", _frame(), _meta())
+    (Path(run_store.RUNS_DIR) / "RUN_1.parquet").unlink()
+
+    assert run_store.rehydrate() == 0
+    assert run_store.get_index("RUN_1") is None
+
+
+def _in_worker(code):
+    """Run ``code`` in a separate interpreter sharing RUNS_DIR, as another uvicorn worker would."""
+    root = Path(__file__).resolve().parents[1]
+    script = f"import sys; sys.path.insert(0, {str(root)!r}); import run_store, polars as pl; {code}"
+    env = dict(os.environ, SPM_RUNS_DIR=str(run_store.RUNS_DIR))
+    return subprocess.Popen([sys.executable, "-c", script], env=env, cwd=root)
+
+
+def test_runs_are_shared_across_processes():
+    worker = _in_worker(
+        "run_store.put_run('RUN_W', pl.DataFrame({'Speed': [1.0, 2.0]}), {'train_number': '95101'})"
+    )
+    assert worker.wait(timeout=60) == 0
+
+    assert run_store.get_index("RUN_W")["train_number"] == "95101"
+    assert run_store.get_frame("RUN_W")["Speed"].to_list() == [1.0, 2.0]
+
+    run_store.drop_run("RUN_W")
+    worker = _in_worker("assert not run_store.has_run('RUN_W')")
+    assert worker.wait(timeout=60) == 0
+
+
+def test_concurrent_writers_respect_the_cap():
+    workers = [
+        _in_worker(
+            f"[run_store.put_run(f'RUN_{name}_{{i}}', pl.DataFrame({{'Speed': [1.0]}}), {{}}) for i in range(15)]"
+        )
+        for name in ("A", "B")
+    ]
+    assert [worker.wait(timeout=120) for worker in workers] == [0, 0]
+
+    stats = run_store.stats()
+    assert (stats["runs"], stats["evicted"]) == (run_store.MAX_RUNS, 30 - run_store.MAX_RUNS)
+    on_disk = {path.name.split(".")[0] for path in Path(run_store.RUNS_DIR).glob("*.meta.pkl")}
+    assert on_disk == {entry["run_id"] for entry in run_store.list_index()}
@@ -0,0 +1,117 @@
+"""Tests for spm_columns and the column entry points of the detectors."""
+
+import numpy as np
+import polars as pl
+
+from brakefeel_detector import BrakeFeelDetector
+from halt_detection import HaltDetector
+from platform_entry_speed import PlatformEntryCalculator
+from spm_columns import SpmColumns, as_columns, format_time_seconds, with_time_seconds
+
+
+FRAME = pl.DataFrame({
+    "Time": ["10:00:00", None, "10:00:02", "10:00:03"],
+    "Speed": [0.0, 12.5, None, 0.0],
+    "Distance": [0.0, 3.5, 2.0, 0.0],
+    "cumulative_distance": [0.0, 3.5, 5.5, 5.5],
+    "PSR": [30, None, 45, 45],
+})
+
+
+def test_from_frame_fills_missing_numbers_with_zero():
+    cols = SpmColumns.from_frame(FRAME)
+    assert len(cols) == 4
+    assert cols.speed.dtype == np.float64
+    assert cols.speed.tolist() == [0.0, 12.5, 0.0, 0.0]
+    assert cols.time == ["10:00:00", None, "10:00:02", "10:00:03"]
+    # PSR keeps its original values; psr_float is the NaN view
+    assert cols.psr == [30, None, 45, 45]
+    assert np.isnan(cols.psr_float()[1]) and cols.psr_float()[2] == 45.0
+
+
+def test_from_dicts_matches_from_frame():
+    rows = [
+        {"speed": r["Speed"], "distance": r["Distance"],
+         "cumulative_distance": r["cumulative_distance"], "Time": r["Time"]}
+        for r in FRAME.to_dicts()
+    ]
+    a = as_columns(rows)
+    b = as_columns(FRAME)
+    for name in ("speed", "distance", "cumulative_distance"):
+        assert getattr(a, name).tolist() == getattr(b, name).tolist()
+    assert a.time == b.time
+    assert as_columns(b) is b
+
+
+def test_frame_without_optional_columns():
+    cols = SpmColumns.from_frame(pl.DataFrame({"Speed": [1.0, 2.0]}))
+    assert cols.cumulative_distance.tolist() == [0.0, 0.0]
+    assert cols.time == [None, None]
+    assert cols.psr is None and np.isnan(cols.psr_float()).all()
+
+
+def test_halts_from_columns_match_frame():
+    detector = HaltDetector()
+    assert detector.detect_halts(SpmColumns.from_frame(FRAME)) == detector.detect_halts(FRAME)
+
+
+def test_brake_detection_from_columns_matches_samples():
+    rng = np.random.default_rng(3)
+    speed = np.concatenate([np.linspace(0, 30, 40), np.linspace(30, 20, 10),
+                            np.linspace(20, 60, 60), np.zeros(20)]) + rng.normal(0, 0.3, 130)
+    speed = np.clip(speed, 0, None).round(1)
+    samples = [
+        {"speed": float(s), "timestamp": f"10:{i // 60:02d}:{i % 60:02d}",
+         "distance": float(s) / 3.6, "cumulative_distance": float(i * 5)}
+        for i, s in enumerate(speed)
+    ]
+    cols = SpmColumns(
+        speed=speed,
+        distance=np.array([s["distance"] for s in samples]),
+        cumulative_distance=np.array([s["cumulative_distance"] for s in samples]),
+        time=[s["timestamp"] for s in samples],
+    )
+    detector = BrakeFeelDetector()
+    assert detector.detect_from_columns(cols) == detector.detect_from_samples(samples)
+
+
+def _old_speed_at_distance(target, samples):
+    """The loop find_speed_at_distance used before it took columns."""
+    best_following, min_negative, closest, closest_diff = None, float("inf"), None, float("inf")
+    for sample in sorted(samples, key=lambda s: s["cumulative_distance"]):
+        diff = target - sample["cumulative_distance"]
+        if abs(diff) < closest_diff:
+            closest_diff, closest = abs(diff), sample
+        if diff <= 0 and abs(diff) < min_negative:
+            min_negative, best_following = abs(diff), sample
+    chosen = best_following or closest
+    return chosen["speed"], chosen["cumulative_distance"]
+
+
+def test_speed_at_distance_matches_sorted_loop():
+    calculator = PlatformEntryCalculator()
+    rng = np.random.default_rng(7)
+    for _ in range(200):
+        n = int(rng.integers(1, 40))
+        # Coarse values so ties and repeated distances are common
+        samples = [
+            {"cumulative_distance": float(rng.integers(0, 20)), "speed": float(rng.integers(0, 90))}
+            for _ in range(n)
+        ]
+        target = float(rng.integers(-2, 23)) + rng.choice([0.0, 0.5])
+        assert calculator.find_speed_at_distance(target, samples, return_distance=True) == \
+            _old_speed_at_distance(target, samples)
+
+
+def test_time_seconds_roll_over_at_midnight():
+    df = with_time_seconds(pl.DataFrame({
+        "Time": ["23:59:58", None, "bad", "00:00:01", "00:00:00", "9:05"],
+    }))
+    # A null or unparseable time stays null and does not break the day count;
+    # a one-second step back is jitter, not another midnight
+    assert df["time_s"].to_list() == [86398, None, None, 86401, 86400, 86400 + 9 * 3600 + 300]
+    assert format_time_seconds(86401) == "00:00:01"
+
+    cols = SpmColumns.from_frame(df)
+    assert np.isnan(cols.time_s[1]) and cols.time_s[3] == 86401.0
+    assert SpmColumns.from_frame(FRAME).time_s is None
@@ -0,0 +1,159 @@
+"""Tests for spm_ingest — the single-read CSV and Excel paths of read_spm_file."""
+
+import datetime as dt
+
+import pandas as pd
+import polars as pl
+import pytest
+
+import analysis_pipeline as ap
+import spm_ingest
+from spm_ingest import (
+    HAVE_CALAMINE, HEADERLESS_COMBINED, HEADERLESS_SPLIT,
+    clean_numeric, frame_from_excel_grid, read_excel_grid, read_spm_csv, sniff_csv,
+)
+
+
+@pytest.mark.parametrize("head, has_header, columns", [
+    (b"Date,Time,Speed,Distance\n2025-01-10,10:00:00,0,0\n", True, ("Date", "Time", "Speed", "Distance")),
+    (b"\xef\xbb\xbfDateTime;Speed;Distance\n", True, ("DateTime", "Speed", "Distance")),
+    (b"30/11/2025 23:59:59,10,2\n", False, HEADERLESS_COMBINED),
+    (b"2025-01-10,10:00:00,12.5,3\n", False, HEADERLESS_SPLIT),
+    (b"2025-01-10,10:00:00,12.5,3,x\n", False, HEADERLESS_SPLIT + ("column_5",)),
+])
+def test_sniff_csv_layouts(head, has_header, columns):
+    layout = sniff_csv(head)
+    assert layout.has_header is has_header
+    assert layout.columns == columns
+
+
+def test_sniff_csv_separator():
+    assert sniff_csv(b"Date;Time;Speed;Distance\n").separator == ";"
+    assert sniff_csv(b"Date\tTime\tSpeed\tDistance\n").separator == "\t"
+    assert sniff_csv(b"").separator == ","
+
+
+def test_read_spm_csv_projects_and_drops_non_numeric_rows(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(
+        "date,TIME,Speed (kmph),Dist,Notes\n"
+        "2025-01-10,10:00:00,12,3,a\n"
+        "Date,Time,Speed,Distance,Notes\n"
+        "2025-01-10,10:00:01,-1,3,b\n"
+        "2025-01-10,10:00:02,14.5,,c\n"
+        "2025-01-10,10:00:03,nan,2,d\n"
+        "2025-01-10,10:00:04,15.,4,e\n"
+    )
+    df = read_spm_csv(path)
+    assert df.columns == ["Date", "Time", "Speed", "Distance"]
+    assert df.schema["Speed"] == pl.Float64
+    assert df["Time"].to_list() == ["10:00:00", "10:00:04"]
+    assert df["Speed"].to_list() == [12.0, 15.0]
+
+
+def test_read_spm_csv_headerless_combined_is_datetime(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text("30/11/2025 23:59:59,10,2\n01/12/2025 00:00:00,12,3\n")
+    df = read_spm_csv(path)
+    assert df.columns == ["DateTime", "Speed", "Distance"]
+    assert df["Distance"].to_list() == [2.0, 3.0]
+
+
+def test_read_spm_csv_without_required_columns_returns_everything(tmp_path):
+    path = tmp_path / "bad.csv"
+    path.write_text("Foo,Bar\nx,y\n")
+    assert read_spm_csv(path).columns == ["Foo", "Bar"]
+
+
+def test_clean_numeric_on_an_excel_style_frame():
+    df = pl.DataFrame({"Speed": ["12", "Speed", "3.5"], "Distance": [1, 2, 3]})
+    out = clean_numeric(df)
+    assert out["Speed"].to_list() == [12.0, 3.5]
+    assert out["Distance"].to_list() == [1.0, 3.0]
+
+
+def test_excel_header_found_below_metadata_rows():
+    grid = pd.DataFrame([
+        ["SPM download", None, None, None],
+        ["Speed", "Speed", None, "Distance"],
+        ["2025-01-10", "10:00:00", 12.5, 3],
+    ])
+    frame = frame_from_excel_grid(grid)
+    assert list(frame.columns) == ["Speed", "Speed.1", "Unnamed: 2", "Distance"]
+    assert frame["Distance"].tolist() == [3]
+
+
+@pytest.mark.parametrize("row, columns", [
+    (["2025-01-10 10:00:00", 12.5, 3, "x"], ["Date", "Speed", "Distance", "column_4"]),
+    (["2025-01-10", "10:00:00", 12.5, 3], list(HEADERLESS_SPLIT)),
+])
+def test_excel_without_header(row, columns):
+    assert list(frame_from_excel_grid(pd.DataFrame([row])).columns) == columns
+
+
+def test_read_spm_file_reads_a_workbook_once(tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "run.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Loco 12345"])
+    ws.append(["Date", "Time", "Speed", "Distance"])
+    for i, speed in enumerate([0, 12.5, 20, 0]):
+        ws.append([dt.date(2025, 1, 10), dt.time(10, 0, i), speed, 3 if speed else 1])
+    wb.save(path)
+
+    calls = []
+    read_excel = pd.read_excel
+    monkeypatch.setattr(pd, "read_excel", lambda *a, **k: calls.append(k) or read_excel(*a, **k))
+    df = ap.read_spm_file(path)
+    assert len(calls) == (0 if HAVE_CALAMINE else 1)
+    assert df["Distance"].to_list() == [0.0, 3.0, 3.0, 0.0]
+    assert df["time_s"].to_list() == [36000, 36001, 36002, 36003]
+
+
+def test_excel_header_row_counts_blank_rows_like_pandas(tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip("openpyxl")
+    monkeypatch.setattr(spm_ingest, "HAVE_CALAMINE", False)
+    path = tmp_path / "run.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A3"] = "SPM download"
+    for col, name in enumerate(["Date", "Time", "Speed", "Distance"], start=1):
+        ws.cell(row=5, column=col, value=name)
+    ws.append(["2025-01-10", "10:00:00", 12.5, 3])
+    ws.append([])
+    ws.append(["2025-01-10", "10:00:01", 20, 4])
+    wb.save(path)
+
+    frame = frame_from_excel_grid(read_excel_grid(path))
+    # The header search used to be pd.read_excel(header=N) for N in 0..5
+    expected = pd.read_excel(path, header=4)
+    pd.testing.assert_frame_equal(frame, expected)
+
+
+def test_calamine_grid_matches_pandas_grid(tmp_path, monkeypatch):
+    pytest.importorskip("fastexcel")
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "run.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A2"] = "Loco 12345"
+    ws["B2"] = "2025-01-10"
+    for col, name in enumerate(["Date", "Time", "Speed", "Distance"], start=1):
+        ws.cell(row=4, column=col, value=name)
+    ws.append([dt.datetime(2025, 1, 10), dt.time(10, 0, 0), 0, 1])
+    ws.append([])
+    ws.append([dt.datetime(2025, 1, 10, 10, 0, 1, 500000), dt.time(10, 0, 1), 12.5, -3])
+    ws.append([dt.datetime(2025, 1, 10), dt.time(10, 0, 2), 20, 4.25])
+    wb.save(path)
+
+    monkeypatch.setattr(spm_ingest, "HAVE_CALAMINE", True)
+    calamine = read_excel_grid(path)
+    calamine_df = ap.read_spm_file(path)
+    monkeypatch.setattr(spm_ingest, "HAVE_CALAMINE", False)
+    expected = read_excel_grid(path)
+
+    assert calamine.shape == expected.shape
+    assert calamine.isna().equals(expected.isna())
+    assert calamine.fillna("").values.tolist() == expected.fillna("").values.tolist()
+    assert calamine_df.equals(ap.read_spm_file(path))
@@ -0,0 +1,62 @@
+"""Tests for sqlite_index — the index database behind run_store and analysis_cache."""
+
+import pytest
+
+from sqlite_index import SqliteIndex, bump_counter, write_atomic
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('n', 0);
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SqliteIndex(tmp_path / "idx" / "index.sqlite3", tmp_path / "idx" / "index.lock", _SCHEMA)
+
+
+def _counter(index):
+    return index.connect().execute("SELECT value FROM counters WHERE name = 'n'").fetchone()[0]
+
+
+def test_transaction_commits_or_rolls_back(index):
+    with index.transaction() as db:
+        bump_counter(db, "n", 2)
+    with pytest.raises(RuntimeError):
+        with index.transaction() as db:
+            bump_counter(db, "n")
+            raise RuntimeError
+    assert _counter(index) == 2
+
+
+def test_write_lock_is_reentrant_and_locks_the_lock_file(index):
+    with index.write_lock():
+        with index.write_lock():
+            with index.transaction() as db:
+                bump_counter(db, "n")
+    assert _counter(index) == 1
+    assert index.lock_path.exists()
+
+
+def test_reset_empties_the_directory_and_reopens_the_database(index):
+    with index.transaction() as db:
+        bump_counter(db, "n")
+    directory = index.db_path.parent
+    (directory / "stray").write_bytes(b"x")
+    index.reset(directory)
+    assert list(directory.iterdir()) == []
+    assert _counter(index) == 0
+
+
+def test_write_atomic_leaves_no_partial_file(tmp_path):
+    path = tmp_path / "out.bin"
+
+    def fail(tmp):
+        tmp.write_bytes(b"half")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_atomic(path, fail)
+    assert list(tmp_path.iterdir()) == []
+    write_atomic(path, lambda p: p.write_bytes(b"whole"))
+    assert path.read_bytes() == b"whole"
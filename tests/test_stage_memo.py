@@ -0,0 +1,66 @@
+"""Tests for stage_memo — keyed, memoized analysis stages."""
+
+import numpy as np
+import polars as pl
+
+from stage_memo import StageMemo, StageTrace, frame_fingerprint, stage_key
+
+
+def test_stage_key_depends_on_stage_and_parts():
+    key = stage_key("psr", "frame", {"b": 1, "a": [1, 2]})
+    assert key == stage_key("psr", "frame", {"a": [1, 2], "b": 1})
+    assert key != stage_key("bft", "frame", {"b": 1, "a": [1, 2]})
+    assert key != stage_key("psr", "frame", {"b": 2, "a": [1, 2]})
+    assert stage_key("s", np.array([1.0, 2.0]), {"X", "Y"}) == stage_key("s", [1.0, 2.0], ["X", "Y"])
+
+
+def test_frame_fingerprint_follows_content():
+    df = pl.DataFrame({"Speed": [1.0, 2.0], "Distance": [0.0, 3.0]})
+    assert frame_fingerprint(df) == frame_fingerprint(df.clone())
+    assert frame_fingerprint(df) != frame_fingerprint(df.with_columns(pl.col("Speed") * 2))
+    assert frame_fingerprint(df) != frame_fingerprint(df.select("Distance", "Speed"))
+
+
+def test_run_memoizes_and_counts():
+    memo = StageMemo()
+    calls = []
+    trace = StageTrace()
+
+    def compute():
+        calls.append(1)
+        return {"halts": [1, 2]}
+
+    assert memo.run("halts", "k", compute, trace) == {"halts": [1, 2]}
+    assert memo.run("halts", "k", compute, trace) == {"halts": [1, 2]}
+    assert len(calls) == 1
+    stats = memo.stats()["halts"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert [outcome for _, outcome, _ in trace.steps] == ["miss", "hit"]
+    assert trace.summary().startswith("halts miss ")
+
+
+def test_outputs_are_copied_in_and_out():
+    memo = StageMemo()
+    first = memo.run("s", "k", lambda: {"rows": [1]})
+    first["rows"].append(2)
+    second = memo.run("s", "k", lambda: None)
+    second["rows"].append(3)
+    assert memo.run("s", "k", lambda: None) == {"rows": [1]}
+
+
+def test_lru_evicts_least_recently_used():
+    memo = StageMemo(max_entries=2)
+    memo.run("s", "a", lambda: "a")
+    memo.run("s", "b", lambda: "b")
+    memo.run("s", "a", lambda: "stale")  # a is now more recent than b
+    memo.run("s", "c", lambda: "c")
+    assert memo.run("s", "a", lambda: "stale") == "a"
+    assert memo.run("s", "b", lambda: "recomputed") == "recomputed"
+
+
+def test_zero_entries_disables_memoizing():
+    memo = StageMemo(max_entries=0)
+    memo.run("s", "k", lambda: 1)
+    assert memo.run("s", "k", lambda: 2) == 2
+    memo.clear()
+    assert memo.stats() == {}
@@ -0,0 +1,80 @@
+"""Tests for timing — request spans, Server-Timing and the rolling histogram."""
+
+import asyncio
+
+import pytest
+from fastapi.concurrency import run_in_threadpool
+
+import timing
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    timing.reset()
+    yield
+    timing.reset()
+
+
+def test_spans_are_collected_and_summed_by_name():
+    with timing.collect() as spans:
+        with timing.span("db.get_run"):
+            pass
+        with timing.span("analysis", rows=10) as entry:
+            entry.rows = 30000
+        timing.record("db.get_run", 0.002)
+        timing.record("analysis.parse", 0.0125, desc="miss")
+    assert [s.name for s in spans] == ["db.get_run", "analysis", "db.get_run", "analysis.parse"]
+
+    header = timing.server_timing(spans, total=0.5)
+    parts = header.split(", ")
+    assert parts[0].startswith("db.get_run;dur=")
+    assert parts[1].startswith("analysis;dur=") and parts[1].endswith(';desc="rows=30000"')
+    assert parts[2] == 'analysis.parse;dur=12.5;desc="miss"'
+    assert parts[3] == "total;dur=500.0"
+    assert timing.histogram()["db.get_run"]["count"] == 2
+
+
+def test_no_collection_outside_a_request():
+    with timing.span("startup"):
+        pass
+    with timing.collect() as spans:
+        pass
+    assert spans == []
+    assert timing.histogram()["startup"]["count"] == 1
+
+
+def test_spans_from_the_threadpool_reach_the_request():
+    def work():
+        with timing.span("threaded"):
+            return 1
+
+    async def request():
+        with timing.collect() as spans:
+            await run_in_threadpool(work)
+        return spans
+
+    assert [s.name for s in asyncio.run(request())] == ["threaded"]
+
+
+def test_span_is_recorded_when_the_block_raises():
+    with timing.collect() as spans, pytest.raises(KeyError):
+        with timing.span("run_store.get_source_frame"):
+            raise KeyError("gone")
+    assert spans[0].name == "run_store.get_source_frame"
+
+
+def test_header_names_are_tokens():
+    assert timing.server_timing([timing.Span("pdf render/1", 0.001)]).startswith("pdf_render_1;dur=1.0")
+
+
+def test_histogram_window_and_buckets(monkeypatch):
+    monkeypatch.setattr(timing, "WINDOW", 4)
+    for ms in (1, 2, 3, 40, 20000):
+        timing.record("stage", ms / 1000)
+    stats = timing.histogram()["stage"]
+    assert (stats["count"], stats["window"]) == (5, 4)
+    assert stats["total_seconds"] == pytest.approx(20.046)
+    assert stats["max_ms"] == 20000
+    assert stats["p50_ms"] == 40
+    assert stats["buckets"]["5"] == 2 and stats["buckets"]["50"] == 1 and stats["buckets"]["+Inf"] == 1
+    assert sum(stats["buckets"].values()) == 4
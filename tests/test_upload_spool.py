@@ -0,0 +1,57 @@
+"""Tests for upload_spool — chunked upload spooling with a size limit."""
+
+import asyncio
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+import upload_spool
+from upload_spool import UploadTooLarge, spool_upload
+
+CONTENT = b"Date,Time,Speed,Distance\n" + b"2025-01-10,10:00:00,12.5,3\n" * 5000
+
+
+def _upload(content=CONTENT, size=None):
+    return UploadFile(file=BytesIO(content), filename="run.csv", size=size)
+
+
+def test_spool_writes_content_and_hash():
+    spooled = asyncio.run(spool_upload(_upload(), suffix=".csv", chunk_size=4096))
+    try:
+        assert spooled.path.suffix == ".csv"
+        assert spooled.path.read_bytes() == CONTENT
+        assert spooled.size == len(CONTENT)
+        assert spooled.sha256 == hashlib.sha256(CONTENT).hexdigest()
+    finally:
+        spooled.path.unlink()
+
+
+def test_spool_reads_in_chunks():
+    reads = []
+
+    class Recording(BytesIO):
+        def read(self, n=-1):
+            reads.append(n)
+            return super().read(n)
+
+    upload = UploadFile(file=Recording(CONTENT), filename="run.csv")
+    spooled = asyncio.run(spool_upload(upload, chunk_size=4096))
+    spooled.path.unlink()
+    assert set(reads) == {4096}
+
+
+@pytest.mark.parametrize("declared_size", [None, len(CONTENT)])
+def test_spool_over_the_limit_leaves_no_file(tmp_path, monkeypatch, declared_size):
+    monkeypatch.setattr(upload_spool.tempfile, "tempdir", str(tmp_path))
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(_upload(size=declared_size), max_bytes=len(CONTENT) - 1, chunk_size=4096))
+    assert os.listdir(tmp_path) == []
+
+
+def test_default_limit_is_read_at_call_time(monkeypatch):
+    monkeypatch.setattr(upload_spool, "MAX_UPLOAD_BYTES", 10)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(_upload()))
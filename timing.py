@@ -0,0 +1,187 @@
+"""
+Per-request stage timings: Server-Timing headers and a rolling histogram.
+
+When an upload was slow nothing said whether the time went on parsing, the
+analysis stages, the DB lookups or the chart payload. Code wraps a stage in
+``span``::
+
+    with timing.span("db.find_existing_run"):
+        existing_run_id = find_existing_run(...)
+
+    with timing.span("run_store.put", rows=len(df)):
+        ...
+
+Each span goes to two places:
+
+* the current request's list, when ``collect`` started one. The middleware
+  in main.py does for every request and sends the list as a ``Server-Timing``
+  header (``server_timing``), so the browser's network panel shows where the
+  time went. The list lives in a ContextVar; ``run_in_threadpool`` copies the
+  context, so spans from the threadpool land in the same list. Stages run in
+  the analysis pool come back as the result's ``stage_timings`` and are added
+  with ``record``.
+* ``histogram()``: per span name, the last ``WINDOW`` durations
+  (``SPM_TIMING_WINDOW``, default 500) as bucket counts and percentiles, plus
+  lifetime count and total. ``GET /api/timings`` serves it.
+
+Every span is also observed into ``metrics.STAGE_SECONDS`` for ``/metrics``.
+
+Spans cost a ``perf_counter`` pair and a lock; they are meant for stages, not
+for per-sample loops.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import metrics
+
+WINDOW = int(os.getenv("SPM_TIMING_WINDOW", "500"))
+
+# Upper bounds in milliseconds; the last bucket takes everything above.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+
+@dataclass
+class Span:
+    """One timed stage. ``rows`` and ``desc`` may be set inside the ``with``."""
+
+    name: str
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    desc: Optional[str] = None
+
+
+_SPANS: ContextVar[Optional[List[Span]]] = ContextVar("spm_timing_spans", default=None)
+
+# name -> recent durations in seconds, and lifetime [count, total seconds].
+_WINDOWS: Dict[str, Deque[float]] = {}
+_TOTALS: Dict[str, List[float]] = {}
+_LOCK = threading.Lock()
+
+
+# --- recording ---------------------------------------------------------------
+
+def record(name: str, seconds: float, rows: Optional[int] = None, desc: Optional[str] = None) -> Span:
+    """Add a stage timed elsewhere (e.g. in the analysis pool) to the request and histogram."""
+    entry = Span(name, seconds, rows, desc)
+    spans = _SPANS.get()
+    if spans is not None:
+        spans.append(entry)
+    with _LOCK:
+        window = _WINDOWS.get(name)
+        if window is None:
+            window = _WINDOWS[name] = deque(maxlen=max(WINDOW, 1))
+            _TOTALS[name] = [0, 0.0]
+        window.append(seconds)
+        _TOTALS[name][0] += 1
+        _TOTALS[name][1] += seconds
+    metrics.STAGE_SECONDS.observe(seconds, stage=name)
+    return entry
+
+
+@contextmanager
+def span(name: str, rows: Optional[int] = None) -> Iterator[Span]:
+    """Time the block as stage ``name``; recorded even when the block raises."""
+    entry = Span(name, rows=rows)
+    started = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        record(name, time.perf_counter() - started, entry.rows, entry.desc)
+
+
+@contextmanager
+def collect() -> Iterator[List[Span]]:
+    """Collect the spans recorded inside the block (this context and its copies)."""
+    spans: List[Span] = []
+    token = _SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        _SPANS.reset(token)
+
+
+# --- reporting ---------------------------------------------------------------
+
+def _token(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name) or "_"
+
+
+def server_timing(spans: List[Span], total: Optional[float] = None) -> str:
+    """
+    A Server-Timing header value for ``spans``. Spans sharing a name are summed,
+    in first-seen order; ``total`` (seconds) is added as ``total``.
+    """
+    merged: Dict[str, Span] = {}
+    for entry in spans:
+        seen = merged.get(entry.name)
+        if seen is None:
+            merged[entry.name] = Span(entry.name, entry.seconds, entry.rows, entry.desc)
+            continue
+        seen.seconds += entry.seconds
+        if entry.rows is not None:
+            seen.rows = (seen.rows or 0) + entry.rows
+        seen.desc = seen.desc or entry.desc
+    if total is not None:
+        merged.setdefault("total", Span("total", total))
+
+    parts = []
+    for entry in merged.values():
+        part = f"{_token(entry.name)};dur={entry.seconds * 1000:.1f}"
+        desc = " ".join(
+            text for text in (f"rows={entry.rows}" if entry.rows is not None else None, entry.desc) if text
+        )
+        if desc:
+            part += f';desc="{desc.replace(chr(34), chr(39))}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram() -> Dict[str, Dict[str, Any]]:
+    """
+    Per span name: lifetime ``count`` and ``total_seconds``; over the last
+    WINDOW durations, ``p50_ms``/``p90_ms``/``p99_ms``/``max_ms`` and ``buckets``
+    (upper bound in ms -> count, non-cumulative; "+Inf" for the last).
+    """
+    with _LOCK:
+        snapshot = {name: (sorted(window), list(_TOTALS[name])) for name, window in _WINDOWS.items()}
+
+    out = {}
+    for name, (ordered, (count, total)) in sorted(snapshot.items()):
+        ms = [s * 1000 for s in ordered]
+        buckets = {("+Inf" if math.isinf(bound) else str(bound)): 0 for bound in BUCKETS_MS}
+        for value in ms:
+            bound = next(b for b in BUCKETS_MS if value <= b)
+            buckets["+Inf" if math.isinf(bound) else str(bound)] += 1
+        out[name] = {
+            "count": int(count),
+            "total_seconds": round(total, 6),
+            "window": len(ms),
+            "p50_ms": round(_percentile(ms, 0.50), 3),
+            "p90_ms": round(_percentile(ms, 0.90), 3),
+            "p99_ms": round(_percentile(ms, 0.99), 3),
+            "max_ms": round(ms[-1], 3),
+            "buckets": buckets,
+        }
+    return out
+
+
+def reset() -> None:
+    """Forget every recorded duration. Tests only."""
+    with _LOCK:
+        _WINDOWS.clear()
+        _TOTALS.clear()
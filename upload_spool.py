@@ -0,0 +1,76 @@
+"""
+Spooling uploaded SPM files to disk.
+
+``/upload`` used to ``await file.read()`` the whole upload and then write it
+to a NamedTemporaryFile, so every upload in flight was resident in full. At
+shift change a dozen large Excel exports arrive together.
+
+``spool_upload`` copies the upload to a temp file ``CHUNK_SIZE`` bytes at a
+time, hashing it (SHA-256) as it goes and giving up with ``UploadTooLarge``
+once it passes the limit. The parser then works from the path: polars scans
+and memory-maps the CSV itself, and the Excel readers open the file.
+
+``SPM_MAX_UPLOAD_MB`` sets the limit (default 100).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("SPM_MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+
+
+class UploadTooLarge(ValueError):
+    """The upload is over the size limit. The handler maps this to a 413."""
+
+
+@dataclass(frozen=True)
+class SpooledUpload:
+    """An upload written to ``path``; the caller deletes the file."""
+
+    path: Path
+    size: int
+    sha256: str
+
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_bytes: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> SpooledUpload:
+    """
+    Write ``file`` to a temp file in ``chunk_size`` pieces. Raises
+    UploadTooLarge (and leaves no file behind) when it is over ``max_bytes``,
+    MAX_UPLOAD_BYTES by default.
+    """
+    limit = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    too_large = f"File is larger than the {limit / (1024 * 1024):g} MB upload limit"
+    if file.size is not None and file.size > limit:
+        raise UploadTooLarge(too_large)
+
+    digest = hashlib.sha256()
+    size = 0
+    out = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    path = Path(out.name)
+    try:
+        with out:
+            while chunk := await file.read(chunk_size):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(too_large)
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())